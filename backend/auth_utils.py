@@ -1,8 +1,13 @@
 from fastapi import HTTPException, Request, status
+from starlette.requests import HTTPConnection
+from typing import Optional
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache
 import os
-from database import user_sessions_collection, users_collection
+import secrets
+import time
+from database import stream_tickets_collection, user_sessions_collection, users_collection
 from models import User
 
 # Fallback secret key for development - CHANGE THIS IN PRODUCTION!
@@ -10,6 +15,56 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "healmedy_super_secret_key_2024_dev
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_DAYS", 7))
 
+# WebSocket/SSE bileti: oturum token'ı URL'ye (ve erişim loglarına) yazılmasın diye
+# tarayıcı bağlanmadan hemen önce tek kullanımlık, kısa ömürlü bir bilet alır
+STREAM_TICKET_TTL_SECONDS = int(os.getenv("STREAM_TICKET_TTL_SECONDS", 30))
+
+# Auth cache ayarları - token -> user_id ve user_id -> User (process bazlı, TTL + LRU)
+# Birden fazla worker varsa diğer worker'lardaki değişiklikler en geç TTL sonunda yansır
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", 5000))
+
+# Auth için gereksiz ve büyük alanları okuma
+AUTH_USER_PROJECTION = {
+    "password_hash": 0,
+    "profile_photo": 0,
+    "fcm_tokens": 0,
+    "otp_secret": 0
+}
+
+_token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)  # token -> (user_id, expires_ts)
+_user_cache = TTLCache(maxsize=AUTH_CACHE_MAX_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)  # user_id -> User
+
+
+def invalidate_user_cache(user_id: str):
+    """Kullanıcı güncellendiğinde/silindiğinde cache'den çıkar"""
+    _user_cache.pop(user_id, None)
+
+
+def invalidate_session_token(session_token: str):
+    """Logout sonrası token'ı cache'den çıkar"""
+    if session_token:
+        _token_cache.pop(session_token, None)
+
+
+def clear_auth_cache():
+    """Tüm auth cache'ini temizle (toplu kullanıcı işlemleri için)"""
+    _token_cache.clear()
+    _user_cache.clear()
+
+
+async def get_full_user(user_id: str) -> User:
+    """Profil fotoğrafı dahil kullanıcıyı oku (cache'lenmez; /auth/me gibi profil uçları için)"""
+    user_doc = await users_collection.find_one(
+        {"_id": user_id},
+        {"password_hash": 0, "fcm_tokens": 0, "otp_secret": 0}
+    )
+    if not user_doc:
+        return None
+    user_doc["id"] = user_doc.pop("_id")
+    return User(**user_doc)
+
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=JWT_ACCESS_TOKEN_EXPIRE_DAYS)
@@ -17,70 +72,166 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(request: Request) -> User:
+
+def _get_session_token(request: HTTPConnection) -> str:
     # Try to get token from cookie first
     session_token = request.cookies.get("session_token")
-    
+
     # If not in cookie, try Authorization header
     if not session_token:
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             session_token = auth_header.replace("Bearer ", "")
-    
-    if not session_token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated"
-        )
-    
+
+    return session_token
+
+
+async def _resolve_user_id(session_token: str) -> str:
+    """Token'ı user_id'ye çevir (önce cache, sonra session tablosu, sonra JWT)"""
+    cached = _token_cache.get(session_token)
+    if cached:
+        user_id, expires_ts = cached
+        if expires_ts is None or expires_ts > time.time():
+            return user_id
+        _token_cache.pop(session_token, None)
+
     # Check if it's an Emergent session token (from session storage)
-    session = await user_sessions_collection.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
-    
+    session = await user_sessions_collection.find_one(
+        {
+            "session_token": session_token,
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
+        },
+        {"user_id": 1, "expires_at": 1}
+    )
+
     if session:
-        # Find user by session
-        user_doc = await users_collection.find_one({"_id": session["user_id"]})
-        if user_doc:
-            user_doc["id"] = user_doc.pop("_id")
-            return User(**user_doc)
-    
+        expires_at = session.get("expires_at")
+        if isinstance(expires_at, datetime):
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            expires_ts = expires_at.timestamp()
+        else:
+            expires_ts = None
+        _token_cache[session_token] = (session["user_id"], expires_ts)
+        return session["user_id"]
+
     # If not Emergent session, try JWT token
     try:
         payload = jwt.decode(session_token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials"
-            )
-        
-        user_doc = await users_collection.find_one({"_id": user_id})
-        if user_doc:
-            user_doc["id"] = user_doc.pop("_id")
-            return User(**user_doc)
     except JWTError:
-        pass
-    
+        return None
+
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials"
+        )
+
+    _token_cache[session_token] = (user_id, payload.get("exp"))
+    return user_id
+
+
+async def _load_user(user_id: str) -> User:
+    """user_id -> User (önce cache, sonra hafif projection ile Mongo)"""
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user.model_copy()
+
+    user_doc = await users_collection.find_one({"_id": user_id}, AUTH_USER_PROJECTION)
+    if not user_doc:
+        return None
+
+    user_doc["id"] = user_doc.pop("_id")
+    user = User(**user_doc)
+    _user_cache[user_id] = user
+    return user.model_copy()
+
+
+async def get_current_user(request: Request) -> User:
+    # Aynı istek içinde tekrar çağrılırsa (require_roles + get_current_user) tekrar sorgulama
+    cached_user = getattr(request.state, "current_user", None)
+    if cached_user is not None:
+        return cached_user
+
+    session_token = _get_session_token(request)
+
+    if not session_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+
+    user_id = await _resolve_user_id(session_token)
+    if user_id:
+        user = await _load_user(user_id)
+        if user:
+            request.state.current_user = user
+            return user
+        # Kullanıcı silinmiş - token cache'ini de temizle
+        invalidate_session_token(session_token)
+
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials"
     )
 
+async def issue_stream_ticket(user_id: str) -> str:
+    """WebSocket/SSE bağlantısı için tek kullanımlık bilet (STREAM_TICKET_TTL_SECONDS geçerli)"""
+    ticket = secrets.token_urlsafe(32)
+    await stream_tickets_collection.insert_one({
+        "_id": ticket,
+        "user_id": user_id,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_TTL_SECONDS)
+    })
+    return ticket
+
+
+async def _redeem_stream_ticket(ticket: str) -> Optional[str]:
+    """Bileti tüket (tüm worker'larda tek kullanım) ve user_id döndür; süresi dolmuşsa None"""
+    ticket_doc = await stream_tickets_collection.find_one_and_delete(
+        {"_id": ticket, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+    )
+    return ticket_doc["user_id"] if ticket_doc else None
+
+
+async def get_connection_user(connection: HTTPConnection) -> Optional[User]:
+    """
+    WebSocket / SSE bağlantıları için kullanıcı (geçersizse None, exception atmaz)
+    Tarayıcı WebSocket ve EventSource header gönderemediğinden cookie yoksa ?ticket= kabul edilir
+    (POST /auth/stream-ticket). Oturum token'ı query string'de kabul edilmez.
+    """
+    session_token = _get_session_token(connection)
+    if not session_token:
+        ticket = connection.query_params.get("ticket")
+        user_id = await _redeem_stream_ticket(ticket) if ticket else None
+        return await _load_user(user_id) if user_id else None
+
+    try:
+        user_id = await _resolve_user_id(session_token)
+    except HTTPException:
+        return None
+    if not user_id:
+        return None
+
+    user = await _load_user(user_id)
+    if user is None:
+        invalidate_session_token(session_token)
+    return user
+
 def require_roles(allowed_roles: list):
     async def role_checker(request: Request) -> User:
         user = await get_current_user(request)
-        
+
         # Check if user has the required role (including temp roles)
         all_roles = [user.role] + user.temp_roles if user.role else user.temp_roles
-        
+
         if not any(role in allowed_roles for role in all_roles):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="You don't have permission to access this resource"
             )
-        
+
         return user
-    
+
     return role_checker
@@ -1,5 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
 import os
+import logging
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -14,9 +17,12 @@ db_name = os.environ.get('DB_NAME', 'healmedy_hbys')
 client = AsyncIOMotorClient(mongo_url)
 db = client[db_name]
 
+logger = logging.getLogger(__name__)
+
 # Collections
 users_collection = db.users
 user_sessions_collection = db.user_sessions
+stream_tickets_collection = db.stream_tickets  # WebSocket/SSE için tek kullanımlık biletler
 cases_collection = db.cases
 vehicles_collection = db.vehicles
 stock_collection = db.stock
@@ -49,4 +55,228 @@ vehicle_current_locations_collection = db.vehicle_current_locations  # Araçlar
 pdf_templates_collection = db.pdf_templates  # PDF şablonları
 
 # YENİ: Firma Yönetimi
-firms_collection = db.firms  # Firmalar
\ No newline at end of file
+firms_collection = db.firms  # Firmalar
+
+# GPS geçmişi
+vehicle_gps_history_collection = db.vehicle_gps_history  # Araç GPS ping geçmişi
+
+# Dashboard sayaçları (materyalize, tek belge)
+dashboard_stats_collection = db.dashboard_stats
+
+# Personel performans günlük özetleri (kullanıcı, gün, kaynak)
+staff_daily_stats_collection = db.staff_daily_stats
+
+# Bildirim giden kutusu (push bildirimleri arka planda gönderilir)
+notification_outbox_collection = db.notification_outbox
+
+
+# ============================================================================
+# INDEX REGISTRY
+# Koleksiyon adı -> IndexModel listesi. Startup'ta ve scripts/ensure_indexes.py
+# ile idempotent olarak uygulanır. Yeni bir sorgu şekli eklerken buraya da ekleyin.
+# ============================================================================
+
+COLLECTION_INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True,
+                   partialFilterExpression={"email": {"$type": "string"}}),
+        IndexModel([("tc_no", ASCENDING)], name="tc_no", sparse=True),
+        IndexModel([("role", ASCENDING), ("is_active", ASCENDING)], name="role_active"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "stream_tickets": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "cases": [
+        IndexModel([("case_number", DESCENDING)], name="case_number"),
+        IndexModel([("case_number", DESCENDING), ("_id", DESCENDING)], name="case_number_id"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("status", ASCENDING), ("case_number", DESCENDING)], name="status_case_number"),
+        IndexModel([("created_by", ASCENDING)], name="created_by"),
+        IndexModel([("updated_at", DESCENDING)], name="updated_at"),  # staff_rollups geç değişiklikler
+        IndexModel([("assigned_team.vehicle_id", ASCENDING)], name="assigned_team_vehicle"),
+        IndexModel([("assigned_teams.vehicle_id", ASCENDING)], name="assigned_teams_vehicle"),
+    ],
+    "vehicles": [
+        IndexModel([("plate", ASCENDING)], name="plate"),
+        IndexModel([("qr_code", ASCENDING)], name="qr_code", sparse=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("type", ASCENDING)], name="type"),
+    ],
+    "shift_assignments": [
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("shift_date", ASCENDING)], name="user_status_date"),
+        IndexModel([("vehicle_id", ASCENDING), ("status", ASCENDING), ("shift_date", ASCENDING)], name="vehicle_status_date"),
+        IndexModel([("status", ASCENDING), ("shift_date", ASCENDING)], name="status_date"),
+        IndexModel([("status", ASCENDING), ("end_date", ASCENDING)], name="status_end_date"),
+        IndexModel([("shift_date", ASCENDING)], name="shift_date"),
+    ],
+    "shifts": [
+        IndexModel([("user_id", ASCENDING), ("end_time", ASCENDING)], name="user_end_time"),
+        IndexModel([("vehicle_id", ASCENDING), ("end_time", ASCENDING)], name="vehicle_end_time"),
+        IndexModel([("start_time", DESCENDING)], name="start_time"),
+        IndexModel([("end_time", DESCENDING)], name="end_time"),  # staff_rollups geç kapanan vardiyalar
+    ],
+    "barcode_stock": [
+        IndexModel([("serial_number", ASCENDING), ("gtin", ASCENDING)], name="serial_gtin_unique", unique=True),
+        IndexModel([("location", ASCENDING), ("status", ASCENDING)], name="location_status"),
+        IndexModel([("gtin", ASCENDING), ("status", ASCENDING)], name="gtin_status"),
+        IndexModel([("status", ASCENDING), ("expiry_date", ASCENDING)], name="status_expiry"),
+    ],
+    "its_drugs": [
+        IndexModel([("gtin", ASCENDING)], name="gtin"),
+    ],
+    "stock": [
+        IndexModel([("location", ASCENDING), ("location_detail", ASCENDING)], name="location_detail"),
+        IndexModel([("qr_code", ASCENDING)], name="qr_code", sparse=True),
+        IndexModel([("expiry_date", ASCENDING)], name="expiry_date"),
+    ],
+    "medication_usage": [
+        IndexModel([("case_id", ASCENDING)], name="case_id"),
+        IndexModel([("serial_number", ASCENDING)], name="serial_number", sparse=True),
+    ],
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING)], name="user_read"),
+    ],
+    "approvals": [
+        IndexModel([("code", ASCENDING), ("status", ASCENDING)], name="code_status"),
+        IndexModel([("requester_id", ASCENDING), ("status", ASCENDING)], name="requester_status"),
+    ],
+    "shift_start_approvals": [
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"),
+        IndexModel([("vehicle_id", ASCENDING), ("status", ASCENDING)], name="vehicle_status"),
+    ],
+    "shift_end_approvals": [
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"),
+    ],
+    "handover_sessions": [
+        IndexModel([("status", ASCENDING), ("form_opened_at", DESCENDING)], name="status_opened"),
+        IndexModel([("vehicle_id", ASCENDING), ("status", ASCENDING)], name="vehicle_status"),
+    ],
+    "patients": [
+        IndexModel([("tc_no", ASCENDING)], name="tc_no_unique", unique=True,
+                   partialFilterExpression={"tc_no": {"$type": "string"}}),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "patient_access_logs": [
+        IndexModel([("patient_id", ASCENDING), ("created_at", DESCENDING)], name="patient_created"),
+    ],
+    "forms": [
+        IndexModel([("form_type", ASCENDING), ("created_at", DESCENDING)], name="type_created"),
+        IndexModel([("vehicle_id", ASCENDING), ("form_type", ASCENDING)], name="vehicle_type"),
+        IndexModel([("submitted_by", ASCENDING), ("created_at", DESCENDING)], name="submitted_by_created"),
+        IndexModel([("case_id", ASCENDING)], name="case_id", sparse=True),
+    ],
+    "material_requests": [
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"),
+    ],
+    "vehicle_current_locations": [
+        IndexModel([("vehicle_id", ASCENDING)], name="vehicle_id_unique", unique=True),
+        IndexModel([("current_location_id", ASCENDING)], name="current_location_id"),
+    ],
+    "vehicle_gps_history": [
+        # GPS_HISTORY_TIMESERIES açıksa time-series koleksiyonunda ikincil index olarak kurulur
+        IndexModel([("vehicle_id", ASCENDING), ("created_at", DESCENDING)], name="vehicle_created"),
+        IndexModel([("vehicle_id", ASCENDING), ("recorded_at", ASCENDING)], name="vehicle_recorded"),  # Rota (cihaz zamanı)
+    ],
+    "staff_daily_stats": [
+        IndexModel([("day", ASCENDING), ("user_id", ASCENDING)], name="day_user"),
+        IndexModel([("source", ASCENDING), ("day", ASCENDING)], name="source_day"),
+    ],
+    "notification_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        # Tamamlanan kayıtlar 7 gün sonra silinir (pending/sending kayıtlarda finished_at yok)
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "location_stocks_v2": [
+        IndexModel([("location_id", ASCENDING)], name="location_id_unique", unique=True),
+        IndexModel([("location_type", ASCENDING)], name="location_type"),
+    ],
+}
+
+
+# Time-series olarak oluşturulacak koleksiyonlar (MongoDB 5.0+)
+# Koleksiyon zaten normal koleksiyon olarak varsa ya da sunucu desteklemiyorsa olduğu gibi kullanılır.
+# vehicle_gps_history varsayılan olarak normal koleksiyondur: tekrar gönderilen offline noktalar
+# _id (gps_{araç}_{cihaz zamanı}) tekilliğiyle ayıklanır. Time-series'te _id tekil değildir;
+# GPS_HISTORY_TIMESERIES=true ile açılırsa tekrarlar gps_ingest'te ayıklanır (aynı tampon +
+# GPS_DEDUP_WINDOW_SECONDS içinde yazılmış kayıtlar), pencereden eski tekrarlar ikinci kez yazılır.
+GPS_HISTORY_TIMESERIES = os.getenv("GPS_HISTORY_TIMESERIES", "false").lower() == "true"
+
+TIMESERIES_COLLECTIONS = {}
+if GPS_HISTORY_TIMESERIES:
+    TIMESERIES_COLLECTIONS["vehicle_gps_history"] = {
+        "timeField": "created_at", "metaField": "vehicle_id", "granularity": "seconds"
+    }
+
+
+async def ensure_timeseries_collections(database=None) -> dict:
+    """
+    Henüz var olmayan time-series koleksiyonlarını oluştur (idempotent)
+    
+    Returns:
+        {koleksiyon: "created" | "exists" | "fallback"}
+    """
+    database = database if database is not None else db
+    existing = set(await database.list_collection_names())
+    report = {}
+    
+    for collection_name, options in TIMESERIES_COLLECTIONS.items():
+        if collection_name in existing:
+            report[collection_name] = "exists"
+            continue
+        try:
+            await database.create_collection(collection_name, timeseries=options)
+            report[collection_name] = "created"
+            logger.info(f"Time-series koleksiyonu oluşturuldu: {collection_name}")
+        except OperationFailure as e:
+            # Eski sunucu sürümü: index'ler normal koleksiyon üzerinde kurulur
+            report[collection_name] = "fallback"
+            logger.warning(f"Time-series koleksiyonu oluşturulamadı, normal koleksiyon kullanılacak: {collection_name} - {e}")
+    
+    return report
+
+
+async def ensure_indexes(database=None) -> dict:
+    """
+    Registry'deki tüm index'leri oluştur (idempotent)
+    
+    Var olan index'ler tekrar oluşturulmaz. Mevcut veride tekrar eden kayıtlar
+    yüzünden unique index oluşturulamazsa hata loglanır, diğer index'ler devam eder.
+    
+    Returns:
+        {koleksiyon: {"created": [...], "failed": {index_adı: hata}}}
+    """
+    database = database if database is not None else db
+    report = {}
+    
+    # Time-series koleksiyonları index'lerden önce oluşturulmalı (index oluşturma koleksiyonu normal açar)
+    try:
+        await ensure_timeseries_collections(database)
+    except Exception as e:
+        logger.warning(f"Time-series koleksiyon kontrolü başarısız: {e}")
+    
+    for collection_name, models in COLLECTION_INDEXES.items():
+        collection = database[collection_name]
+        result = {"created": [], "failed": {}}
+        
+        # Toplu oluşturma; çakışma olursa tek tek dene ki sağlam olanlar kurulsun
+        try:
+            result["created"] = await collection.create_indexes(models)
+        except OperationFailure:
+            for model in models:
+                name = model.document["name"]
+                try:
+                    result["created"].extend(await collection.create_indexes([model]))
+                except OperationFailure as e:
+                    result["failed"][name] = str(e.details.get("errmsg", e) if e.details else e)
+                    logger.warning(f"Index oluşturulamadı: {collection_name}.{name} - {result['failed'][name]}")
+        
+        report[collection_name] = result
+    
+    total_failed = sum(len(r["failed"]) for r in report.values())
+    logger.info(f"Index bootstrap tamamlandı: {len(report)} koleksiyon, {total_failed} hata")
+    return report
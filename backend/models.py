@@ -210,6 +210,28 @@ class Case(BaseModel):
     created_at: datetime = Field(default_factory=get_turkey_time)
     updated_at: datetime = Field(default_factory=get_turkey_time)
 
+class CaseListItem(BaseModel):
+    """
+    Vaka listesi görünümü - medical_form, status_history vb. ağır alanlar olmadan
+    GET /cases?fields=... ile istenen ek Case alanları da (extra) döner.
+    """
+    model_config = ConfigDict(populate_by_name=True, extra="allow")
+    
+    id: str = Field(alias="_id")
+    case_number: str
+    patient: PatientInfo
+    location: LocationInfo
+    priority: CasePriority
+    status: CaseStatus = "acildi"
+    assigned_team: Optional[AssignedTeam] = None
+    source: Optional[str] = None
+    created_by: str
+    created_by_name: Optional[str] = None
+    created_by_role: Optional[str] = None
+    created_location: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
 class CaseTimestamps(BaseModel):
     """Vaka zaman damgaları"""
     call_received: Optional[datetime] = None  # Çağrı alındı
@@ -5,7 +5,11 @@ import aiohttp
 import os
 from database import users_collection, user_sessions_collection
 from models import User, UserRole
-from auth_utils import create_access_token, get_current_user
+from services.token_directory import token_directory
+from auth_utils import (
+    create_access_token, get_current_user, get_full_user, invalidate_session_token,
+    issue_stream_ticket, STREAM_TICKET_TTL_SECONDS
+)
 import bcrypt
 
 router = APIRouter()
@@ -64,6 +68,7 @@ async def process_session(request: Request, response: Response):
         )
         user_dict = new_user.model_dump(by_alias=True)
         await users_collection.insert_one(user_dict)
+        token_directory.put_user(user_dict)
         user_id = new_user.id
         user = new_user
     
@@ -195,6 +200,8 @@ async def login(data: LoginRequest, response: Response, request: Request):
 async def get_me(request: Request, response: Response):
     """Get current authenticated user"""
     user = await get_current_user(request)
+    # Auth cache'indeki kullanıcıda profil fotoğrafı yok, /me için tam kaydı oku
+    user = await get_full_user(user.id) or user
     
     # Add CORS headers to response
     origin = request.headers.get("origin", "")
@@ -208,6 +215,16 @@ async def get_me(request: Request, response: Response):
     
     return user
 
+# WebSocket/SSE bileti
+@router.post("/stream-ticket")
+async def create_stream_ticket(request: Request):
+    """
+    Canlı akış uçları (/cases/{id}/live, /locations/fleet/live) için tek kullanımlık bilet
+    Bağlantı ?ticket= ile açılır; her (yeniden) bağlanmada yeni bilet alınmalıdır.
+    """
+    user = await get_current_user(request)
+    return {"ticket": await issue_stream_ticket(user.id), "expires_in": STREAM_TICKET_TTL_SECONDS}
+
 # Logout
 @router.post("/logout")
 async def logout(request: Request, response: Response):
@@ -217,6 +234,7 @@ async def logout(request: Request, response: Response):
     if session_token:
         # Delete session from database
         await user_sessions_collection.delete_many({"session_token": session_token})
+        invalidate_session_token(session_token)
     
     # Clear cookie
     response.delete_cookie(key="session_token", path="/")
@@ -1,15 +1,23 @@
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks, WebSocket
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Any
-from database import cases_collection, vehicles_collection, users_collection, shift_assignments_collection, medication_usage_collection
-from models import Case, CaseCreate, CaseAssignTeam, CaseUpdateStatus, CaseStatusUpdate, MedicalFormData, DoctorApproval, CaseParticipant
-from auth_utils import get_current_user, require_roles
+from database import cases_collection, vehicles_collection, users_collection, shift_assignments_collection
+from models import Case, CaseListItem, CaseCreate, CaseAssignTeam, CaseUpdateStatus, CaseStatusUpdate, MedicalFormData, DoctorApproval, CaseParticipant
+from auth_utils import get_current_user, get_connection_user, require_roles
 from datetime import datetime, timedelta
 from utils.timezone import get_turkey_time
 from email_service import send_case_notifications
+from services import dashboard_stats
+from services.case_hub import case_hub, encode_event
 from pydantic import BaseModel
 import uuid
+import asyncio
 import os
 import logging
+import base64
+import hashlib
+import json
+from pymongo import ReturnDocument
 
 # Bildirim servisi
 try:
@@ -18,9 +26,9 @@ try:
 except ImportError:
     NOTIFICATIONS_ENABLED = False
 
-# FCM Bildirim servisi
+# FCM Bildirim servisi (push'lar outbox'a yazılır, arka planda gönderilir)
 try:
-    from services.firebase_service import send_fcm_to_multiple, send_case_notification_fcm
+    from services.notification_outbox import enqueue_push
     FCM_ENABLED = True
 except ImportError:
     FCM_ENABLED = False
@@ -36,6 +44,10 @@ CASE_NUMBER_START = 1
 from database import db
 counters_collection = db["counters"]
 
+# Dashboard sayaçları için vaka/araç yazmalarında önceki değerler bu alanlarla okunur
+CASE_STATS_PROJECTION = {"status": 1, "priority": 1}
+
+
 async def peek_next_case_sequence() -> int:
     """Günlük sıralı vaka numarasını ÖNİZLE - Counter'ı ARTIRMAZ"""
     # Türkiye saati (UTC+3)
@@ -155,23 +167,16 @@ async def create_case(data: CaseCreate, request: Request):
     
     case_dict = new_case.model_dump(by_alias=True)
     await cases_collection.insert_one(case_dict)
+    await dashboard_stats.record_case_transition(None, case_dict)
     
     # Vaka oluşturma bildirimi gönder (arka planda)
     if NOTIFICATIONS_ENABLED:
         try:
-            from services.notification_service import get_users_by_role
+            from services.token_directory import token_directory
             
-            # İlgili rollere bildirim gönder
-            managers = await get_users_by_role(["merkez_ofis", "operasyon_muduru"])
-            recipients = []
-            for manager in managers:
-                recipients.append({
-                    "user_id": manager["id"],
-                    "phone": manager.get("phone"),
-                    "push_subscriptions": manager.get("push_subscriptions", []),
-                    "fcm_token": manager.get("fcm_token"),
-                    "notification_preferences": manager.get("notification_preferences", {})
-                })
+            # İlgili rollere bildirim gönder (alıcılar ve token'lar bellek içi dizinden)
+            manager_ids = await token_directory.users_in_roles(["merkez_ofis", "operasyon_muduru"])
+            recipients = [{"user_id": manager_id} for manager_id in manager_ids]
             
             if recipients:
                 patient_info = case_dict.get("patient", {})
@@ -197,9 +202,79 @@ async def create_case(data: CaseCreate, request: Request):
     case_dict["id"] = case_dict.pop("_id")
     return case_dict
 
-@router.get("", response_model=List[Case])
+# Vaka listesi sıralaması: en yeni vaka en üstte, eşitlikte _id (keyset sayfalama için tekil)
+CASE_LIST_SORT = [("case_number", -1), ("_id", -1)]
+
+# Medical form'da hastaneye sevk sayılan nakil seçenekleri
+HOSPITAL_TRANSFER_KEYS = ("Hastaneye Nakil", "Hastaneler Arası Nakil")
+
+
+# Liste görünümünde dönen alanlar (source, case_details.type'tan hesaplanır)
+CASE_LIST_PROJECTION = {
+    **{field.alias or name: 1 for name, field in CaseListItem.model_fields.items() if name not in ("id", "source")},
+    "case_details.type": 1
+}
+CASE_FIELDS = {field.alias or name for name, field in Case.model_fields.items()}
+
+
+def case_list_projection(fields: Optional[str]) -> Optional[dict]:
+    """fields=medical_form,status_history -> liste projeksiyonuna ek alanlar; fields=all -> tüm belge"""
+    if not fields:
+        return CASE_LIST_PROJECTION
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    if "all" in requested:
+        return None
+    unknown = [f for f in requested if f not in CASE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Bilinmeyen alan(lar): {', '.join(unknown)}")
+    projection = {**CASE_LIST_PROJECTION, **{f: 1 for f in requested}}
+    if "case_details" in projection:
+        projection.pop("case_details.type")  # Yol çakışması
+    return projection
+
+
+def case_list_etag(cases: List[dict], projection: Optional[dict]) -> str:
+    """Sayfadaki vakaların (_id, updated_at) filigranı ve istenen alanlardan ETag üret"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps(sorted(projection) if projection else "all").encode())
+    for case in cases:
+        watermark = case.get("updated_at") or case.get("created_at")
+        digest.update(f"|{case['_id']}:{watermark.isoformat() if watermark else ''}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match başlığı ETag'i kapsıyor mu (virgüllü liste, W/ zayıf etiketler ve * dahil)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def encode_case_cursor(case: dict) -> str:
+    """Keyset sayfalama belirteci: sayfadaki son vakanın (case_number, _id) değeri"""
+    raw = json.dumps([case.get("case_number"), case["_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_case_cursor(cursor: str) -> dict:
+    """Belirteçten sonraki vakaları seçen sorgu koşulu"""
+    try:
+        case_number, case_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Geçersiz sayfalama belirteci")
+    return {"$or": [
+        {"case_number": {"$lt": case_number}},
+        {"case_number": case_number, "_id": {"$lt": case_id}}
+    ]}
+
+
+@router.get("", response_model=List[CaseListItem])
 async def get_cases(
     request: Request,
+    response: Response,
     status: Optional[str] = None,
     priority: Optional[str] = None,
     search: Optional[str] = None,
@@ -211,10 +286,20 @@ async def get_cases(
     medication_name: Optional[str] = None,  # Hangi ilaç kullanılmış
     has_hospital_transfer: Optional[bool] = None,  # Hastaneye sevk var mı
     page: Optional[int] = 1,
-    limit: Optional[int] = 30
+    limit: Optional[int] = 30,
+    cursor: Optional[str] = None,  # Keyset sayfalama (X-Next-Cursor başlığından)
+    fields: Optional[str] = None  # Liste görünümüne eklenecek alanlar (virgülle) veya "all"
 ):
-    """Get all cases with filters"""
+    """
+    Get all cases with filters
+    Sonraki sayfa için X-Next-Cursor başlığındaki değer cursor parametresiyle gönderilir;
+    page (skip) geriye uyumluluk için desteklenir ancak derin sayfalarda yavaştır.
+    
+    Varsayılan olarak liste görünümü (CaseListItem) döner; ağır alanlar fields= ile istenir.
+    ETag/If-None-Match desteklenir: sayfadaki vakaların updated_at değerleri değişmediyse 304 döner.
+    """
     user = await get_current_user(request)
+    projection = case_list_projection(fields)
     
     # Build query
     query = {}
@@ -328,26 +413,10 @@ async def get_cases(
             except:
                 pass
     
-    # Combine all filters with $and
-    if filters:
-        query = {"$and": filters} if len(filters) > 1 else filters[0]
-    
-    # Pagination
-    skip = (page - 1) * limit if page > 0 else 0
-    
-    # Get cases - vaka numarasına göre azalan sıralama (en yeni vaka en üstte)
-    cases_cursor = cases_collection.find(query).sort("case_number", -1).skip(skip).limit(limit)
-    cases = await cases_cursor.to_list(limit)
-    
-    # Advanced filters (user_id, medication_name, has_hospital_transfer)
-    # These require additional lookups
-    if user_id or medication_name is not None or has_hospital_transfer is not None:
-        # Get case IDs that match advanced filters
-        advanced_query = {}
-        if user_id:
-            # Kullanıcının işlem yaptığı vakalar
-            # Status history'de veya medication usage'da veya participants'da
-            advanced_query["$or"] = [
+    # Kullanıcının işlem yaptığı vakalar (status history, katılımcı veya ekip)
+    if user_id:
+        filters.append({
+            "$or": [
                 {"status_history.updated_by": user_id},
                 {"participants.user_id": user_id},
                 {"assigned_team.driver_id": user_id},
@@ -355,58 +424,75 @@ async def get_cases(
                 {"assigned_team.att_id": user_id},
                 {"assigned_team.nurse_id": user_id}
             ]
-        
-        if medication_name:
-            # Medication usage'dan ilaç adına göre vakaları bul
-            med_cases = await medication_usage_collection.find({
-                "name": {"$regex": medication_name, "$options": "i"}
-            }).to_list(1000)
-            med_case_ids = [m.get("case_id") for m in med_cases if m.get("case_id")]
-            if med_case_ids:
-                if "$or" in advanced_query:
-                    advanced_query["$or"].append({"_id": {"$in": med_case_ids}})
-                else:
-                    advanced_query["_id"] = {"$in": med_case_ids}
-            else:
-                # Eğer ilaç bulunamazsa boş liste döndür
-                return []
-        
-        if has_hospital_transfer is not None:
-            # Transfer sekmesinde "Hastaneye Nakil" veya "Hastaneler Arası Nakil" var mı?
-            if has_hospital_transfer:
-                # Medical form'da transfer bilgisi var mı kontrol et
-                # Bu durumda medical_form.transfers array'inde "Hastaneye Nakil" veya "Hastaneler Arası Nakil" olmalı
-                pass  # Bu filtreyi case query'ye ekleyemeyiz çünkü medical_form nested, sonra filtreleyeceğiz
-        
-        # Apply advanced filters to cases
-        if advanced_query:
-            advanced_cases = await cases_collection.find(advanced_query).to_list(1000)
-            advanced_case_ids = [c["_id"] for c in advanced_cases]
-            cases = [c for c in cases if c["_id"] in advanced_case_ids]
-        
-        # Hospital transfer filter
-        if has_hospital_transfer is not None:
-            filtered_cases = []
-            for case in cases:
-                medical_form = case.get("medical_form", {})
-                transfers = medical_form.get("transfers", {})
-                has_transfer = (
-                    transfers.get("Hastaneye Nakil") or 
-                    transfers.get("Hastaneler Arası Nakil")
-                )
-                if has_hospital_transfer == has_transfer:
-                    filtered_cases.append(case)
-            cases = filtered_cases
+        })
+    
+    # Transfer sekmesinde "Hastaneye Nakil" veya "Hastaneler Arası Nakil" işaretli mi?
+    if has_hospital_transfer is not None:
+        transfer_conditions = [
+            {f"medical_form.transfers.{key}": {"$nin": [None, False, "", 0]}}
+            for key in HOSPITAL_TRANSFER_KEYS
+        ]
+        filters.append({"$or": transfer_conditions} if has_hospital_transfer else {"$nor": transfer_conditions})
+    
+    if cursor:
+        filters.append(decode_case_cursor(cursor))
+    
+    # Combine all filters with $and
+    if filters:
+        query = {"$and": filters} if len(filters) > 1 else filters[0]
+    
+    # Pagination (cursor varsa skip kullanılmaz)
+    skip = (page - 1) * limit if page > 0 and not cursor else 0
+    
+    if medication_name:
+        # Hangi ilaç kullanılmış: sıralı vaka akışında medication_usage'a (case_id index'i) bak,
+        # sayfa dolunca dur
+        pipeline = [
+            {"$match": query},
+            {"$sort": dict(CASE_LIST_SORT)},
+            {"$lookup": {
+                "from": "medication_usage",
+                "let": {"case_id": "$_id"},
+                "pipeline": [
+                    {"$match": {
+                        "$expr": {"$eq": ["$case_id", "$$case_id"]},
+                        "name": {"$regex": medication_name, "$options": "i"}
+                    }},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "_medication_match"
+            }},
+            {"$match": {"_medication_match": {"$ne": []}}},
+            *([{"$skip": skip}] if skip else []),
+            {"$limit": limit},
+            {"$project": projection} if projection else {"$unset": "_medication_match"}
+        ]
+        cases = await cases_collection.aggregate(pipeline).to_list(limit)
+    else:
+        # Get cases - vaka numarasına göre azalan sıralama (en yeni vaka en üstte)
+        cases_cursor = cases_collection.find(query, projection).sort(CASE_LIST_SORT).skip(skip).limit(limit)
+        cases = await cases_cursor.to_list(limit)
+    
+    headers = {"ETag": case_list_etag(cases, projection), "Cache-Control": "private, no-cache"}
+    if len(cases) == limit:
+        headers["X-Next-Cursor"] = encode_case_cursor(cases[-1])
+    
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     
     for case in cases:
         case["id"] = case.pop("_id")
         
         # Add source info for frontend
-        case_details = case.get("case_details", {})
+        case_details = case.get("case_details") or {}
         if case_details.get("type") == "ayaktan_basvuru":
             case["source"] = "registration"
         else:
             case["source"] = "call_center"
+        if projection and "case_details" not in projection:
+            case.pop("case_details", None)
     
     return cases
 
@@ -748,7 +834,7 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
         updated_by_role=user.role
     )
     
-    await cases_collection.update_one(
+    case_before = await cases_collection.find_one_and_update(
         {"_id": case_id},
         {
             "$set": {
@@ -757,20 +843,18 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
                 "updated_at": get_turkey_time()
             },
             "$push": {"status_history": status_update.model_dump()}
-        }
+        },
+        projection=CASE_STATS_PROJECTION
     )
+    if case_before:
+        await dashboard_stats.record_case_transition(case_before, {**case_before, "status": "ekip_bilgilendirildi"})
     
     # Update vehicle status
-    await vehicles_collection.update_one(
-        {"_id": data.vehicle_id},
-        {
-            "$set": {
-                "status": "gorevde",
-                "current_case_id": case_id,
-                "updated_at": get_turkey_time()
-            }
-        }
-    )
+    await dashboard_stats.set_vehicle_status(data.vehicle_id, {
+        "status": "gorevde",
+        "current_case_id": case_id,
+        "updated_at": get_turkey_time()
+    })
     
     # Bildirim gönder (arka planda)
     if NOTIFICATIONS_ENABLED:
@@ -787,29 +871,17 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
                     recipient_ids.append(assigned_team[key])
             
             # Doktor ve operasyon müdürü ekle
-            managers = await users_collection.find({
-                "role": {"$in": ["doktor", "operasyon_muduru", "merkez_ofis"]},
-                "is_active": True
-            }).to_list(50)
+            from services.token_directory import token_directory
+            managers = await token_directory.users_in_roles(["doktor", "operasyon_muduru", "merkez_ofis"])
             
-            for mgr in managers:
-                if mgr["_id"] not in recipient_ids:
-                    recipient_ids.append(mgr["_id"])
+            for mgr_id in managers:
+                if mgr_id not in recipient_ids:
+                    recipient_ids.append(mgr_id)
             
-            # Alıcı bilgilerini topla
-            recipients = []
-            for rid in recipient_ids:
-                user_doc = await users_collection.find_one({"_id": rid})
-                if user_doc:
-                    recipients.append({
-                        "user_id": rid,
-                        "phone": user_doc.get("phone"),
-                        "push_subscriptions": user_doc.get("push_subscriptions", []),
-                        "fcm_token": user_doc.get("fcm_token"),
-                        "notification_preferences": user_doc.get("notification_preferences", {})
-                    })
+            # Token'lar outbox dağıtıcısında bellek içi dizinden çözülür
+            recipients = [{"user_id": rid} for rid in recipient_ids]
             
-            # Vaka oluşturma bildirimi gönder
+            # Vaka atama bildirimi (push kuyruğa yazılır + in-app)
             if recipients:
                 patient_info = case_doc.get("patient", {})
                 location_info = case_doc.get("location", {})
@@ -826,7 +898,7 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
                         "url": f"/dashboard/cases/{case_id}"
                     }
                 )
-                logger.info(f"Sent notifications to {len(recipients)} recipients for case {case_id}")
+                logger.info(f"Queued notifications for {len(recipients)} recipients for case {case_id}")
         except Exception as e:
             logger.error(f"Error sending case notifications: {e}")
     
@@ -838,39 +910,16 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
             patient_info = case_doc.get("patient", {})
             location_info = case_doc.get("location", {})
             
-            # Saha personelinin FCM token'larını topla (şoför, att, paramedik, hemşire)
+            # Saha personeli (şoför, att, paramedik, hemşire) - token'lar gönderimde çözülür
             # NOT: Doktor hariç - doktorlar web üzerinden takip ediyor
-            field_personnel_ids = []
-            for key in ["driver_id", "paramedic_id", "att_id", "nurse_id"]:
-                if assigned_team.get(key):
-                    field_personnel_ids.append(assigned_team[key])
-                    logger.info(f"[FCM] Field personnel {key}: {assigned_team[key]}")
+            field_personnel_ids = [
+                assigned_team[key] for key in ["driver_id", "paramedic_id", "att_id", "nurse_id"]
+                if assigned_team.get(key)
+            ]
             
             logger.info(f"[FCM] Field personnel IDs: {field_personnel_ids}")
             
-            fcm_tokens = []
-            for user_id in field_personnel_ids:
-                user_doc = await users_collection.find_one({"_id": user_id})
-                if user_doc:
-                    user_fcm_tokens = user_doc.get("fcm_tokens", [])
-                    logger.info(f"[FCM] User {user_doc.get('name')} ({user_id}) has {len(user_fcm_tokens)} FCM tokens")
-                    if user_fcm_tokens:
-                        # Token objelerinden sadece token string'lerini çıkar
-                        for token_obj in user_fcm_tokens:
-                            if isinstance(token_obj, dict) and token_obj.get("token"):
-                                fcm_tokens.append(token_obj["token"])
-                                logger.info(f"[FCM] Added token: ...{token_obj['token'][-20:]}")
-                            elif isinstance(token_obj, str):
-                                fcm_tokens.append(token_obj)
-                                logger.info(f"[FCM] Added token (string): ...{token_obj[-20:]}")
-                    else:
-                        logger.warning(f"[FCM] User {user_doc.get('name')} has NO FCM tokens!")
-                else:
-                    logger.warning(f"[FCM] User {user_id} not found in database!")
-            
-            logger.info(f"[FCM] Total FCM tokens collected: {len(fcm_tokens)}")
-            
-            if fcm_tokens:
+            if field_personnel_ids:
                 patient_name = f"{patient_info.get('name', '')} {patient_info.get('surname', '')}".strip() or "Belirtilmemiş"
                 patient_phone = patient_info.get("phone") or case_doc.get("caller", {}).get("phone", "Belirtilmemiş")
                 patient_complaint = patient_info.get("complaint", "Belirtilmemiş")
@@ -880,8 +929,8 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
                 # Acil/Kritik vakalar için emergency channel kullan
                 notification_type = "new_case"  # Android'de emergency alarm tetikler
                 
-                result = await send_fcm_to_multiple(
-                    tokens=fcm_tokens,
+                outbox_id = await enqueue_push(
+                    user_ids=field_personnel_ids,
                     title=f"🚨 YENİ VAKA - {priority.upper()}",
                     body=f"{patient_name}\n📍 {address}",
                     data={
@@ -897,9 +946,9 @@ async def assign_team(case_id: str, data: CaseAssignTeam, request: Request):
                     notification_type=notification_type,
                     priority="high"
                 )
-                logger.info(f"FCM emergency sent to {len(fcm_tokens)} tokens: {result}")
+                logger.info(f"FCM emergency queued for {len(field_personnel_ids)} users: {outbox_id}")
             else:
-                logger.warning(f"[FCM] No FCM tokens found for any field personnel! Notifications NOT sent.")
+                logger.warning(f"[FCM] No field personnel assigned! Notifications NOT sent.")
         except Exception as e:
             logger.error(f"Error sending FCM notification: {e}", exc_info=True)
     else:
@@ -1039,16 +1088,11 @@ async def assign_multiple_teams(case_id: str, request: Request):
         assigned_teams.append(team_data)
         
         # Araç durumunu güncelle
-        await vehicles_collection.update_one(
-            {"_id": vehicle_id},
-            {
-                "$set": {
-                    "status": "gorevde",
-                    "current_case_id": case_id,
-                    "updated_at": get_turkey_time()
-                }
-            }
-        )
+        await dashboard_stats.set_vehicle_status(vehicle_id, {
+            "status": "gorevde",
+            "current_case_id": case_id,
+            "updated_at": get_turkey_time()
+        })
     
     if not assigned_teams:
         raise HTTPException(status_code=400, detail="Hiçbir araç atanamadı")
@@ -1070,13 +1114,16 @@ async def assign_multiple_teams(case_id: str, request: Request):
         "updated_at": get_turkey_time()
     }
     
-    await cases_collection.update_one(
+    case_before = await cases_collection.find_one_and_update(
         {"_id": case_id},
         {
             "$set": update_data,
             "$push": {"status_history": status_update.model_dump()}
-        }
+        },
+        projection=CASE_STATS_PROJECTION
     )
+    if case_before:
+        await dashboard_stats.record_case_transition(case_before, {**case_before, "status": update_data["status"]})
     
     # Bildirimleri gönder (OneSignal)
     if NOTIFICATIONS_ENABLED and all_recipient_ids:
@@ -1104,53 +1151,32 @@ async def assign_multiple_teams(case_id: str, request: Request):
             patient_info = case_doc.get("patient", {})
             location_info = case_doc.get("location", {})
             
-            # Saha personelinin FCM token'larını topla
-            fcm_tokens = []
-            for user_id in all_recipient_ids:
-                user_doc = await users_collection.find_one({"_id": user_id})
-                if user_doc:
-                    # Sadece saha personeli için alarm gönder
-                    user_role = user_doc.get("role", "")
-                    if user_role in ["sofor", "bas_sofor", "att", "paramedik"]:
-                        user_fcm_tokens = user_doc.get("fcm_tokens", [])
-                        logger.info(f"[FCM-MultiTeam] User {user_doc.get('name')} ({user_role}) has {len(user_fcm_tokens)} FCM tokens")
-                        for token_obj in user_fcm_tokens:
-                            if isinstance(token_obj, dict) and token_obj.get("token"):
-                                fcm_tokens.append(token_obj["token"])
-                                logger.info(f"[FCM-MultiTeam] Added token: ...{token_obj['token'][-20:]}")
-                            elif isinstance(token_obj, str):
-                                fcm_tokens.append(token_obj)
-                                logger.info(f"[FCM-MultiTeam] Added token (string): ...{token_obj[-20:]}")
-            
-            logger.info(f"[FCM-MultiTeam] Total FCM tokens collected: {len(fcm_tokens)}")
+            # Sadece saha personeli için alarm - token'lar gönderimde (rol filtresiyle) çözülür
+            patient_name = f"{patient_info.get('name', '')} {patient_info.get('surname', '')}".strip() or "Belirtilmemiş"
+            patient_phone = patient_info.get("phone") or case_doc.get("caller", {}).get("phone", "Belirtilmemiş")
+            patient_complaint = patient_info.get("complaint", "Belirtilmemiş")
+            address = location_info.get("address", "Belirtilmemiş")
+            priority = case_doc.get("priority", "Normal")
             
-            if fcm_tokens:
-                patient_name = f"{patient_info.get('name', '')} {patient_info.get('surname', '')}".strip() or "Belirtilmemiş"
-                patient_phone = patient_info.get("phone") or case_doc.get("caller", {}).get("phone", "Belirtilmemiş")
-                patient_complaint = patient_info.get("complaint", "Belirtilmemiş")
-                address = location_info.get("address", "Belirtilmemiş")
-                priority = case_doc.get("priority", "Normal")
-                
-                result = await send_fcm_to_multiple(
-                    tokens=fcm_tokens,
-                    title=f"🚨 YENİ VAKA - {priority.upper()}",
-                    body=f"{patient_name}\n📍 {address}",
-                    data={
-                        "case_id": case_id,
-                        "case_number": case_doc.get("case_number", ""),
-                        "patient_name": patient_name,
-                        "patient_phone": patient_phone,
-                        "patient_complaint": patient_complaint,
-                        "address": address,
-                        "navigate_to": f"/dashboard/cases/{case_id}",
-                        "target_roles": "att,paramedik,sofor"
-                    },
-                    notification_type="new_case",
-                    priority="high"
-                )
-                logger.info(f"[FCM-MultiTeam] Emergency sent to {len(fcm_tokens)} tokens: {result}")
-            else:
-                logger.warning(f"[FCM-MultiTeam] No FCM tokens found for field personnel!")
+            outbox_id = await enqueue_push(
+                user_ids=all_recipient_ids,
+                roles=["sofor", "bas_sofor", "att", "paramedik"],
+                title=f"🚨 YENİ VAKA - {priority.upper()}",
+                body=f"{patient_name}\n📍 {address}",
+                data={
+                    "case_id": case_id,
+                    "case_number": case_doc.get("case_number", ""),
+                    "patient_name": patient_name,
+                    "patient_phone": patient_phone,
+                    "patient_complaint": patient_complaint,
+                    "address": address,
+                    "navigate_to": f"/dashboard/cases/{case_id}",
+                    "target_roles": "att,paramedik,sofor"
+                },
+                notification_type="new_case",
+                priority="high"
+            )
+            logger.info(f"[FCM-MultiTeam] Emergency queued for {len(all_recipient_ids)} users: {outbox_id}")
         except Exception as e:
             logger.error(f"[FCM-MultiTeam] Error sending FCM: {e}", exc_info=True)
     else:
@@ -1192,53 +1218,33 @@ async def update_case_status(case_id: str, data: CaseUpdateStatus, request: Requ
     if data.status in ["tamamlandi", "iptal"]:
         if case_doc.get("assigned_team"):
             vehicle_id = case_doc["assigned_team"]["vehicle_id"]
-            await vehicles_collection.update_one(
-                {"_id": vehicle_id},
-                {
-                    "$set": {
-                        "status": "musait",
-                        "current_case_id": None,
-                        "updated_at": get_turkey_time()
-                    }
-                }
-            )
+            await dashboard_stats.set_vehicle_status(vehicle_id, {
+                "status": "musait",
+                "current_case_id": None,
+                "updated_at": get_turkey_time()
+            })
     
-    await cases_collection.update_one(
+    case_before = await cases_collection.find_one_and_update(
         {"_id": case_id},
         {
             "$set": update_data,
             "$push": {"status_history": status_update.model_dump()}
-        }
+        },
+        projection=CASE_STATS_PROJECTION
     )
+    if case_before:
+        await dashboard_stats.record_case_transition(case_before, {**case_before, "status": update_data["status"]})
     
     return {"message": "Case status updated successfully"}
 
 @router.get("/stats/dashboard")
 async def get_dashboard_stats(request: Request):
-    """Get dashboard statistics"""
+    """
+    Get dashboard statistics
+    Materyalize sayaç belgesinden okunur; updated_at/reconciled_at verinin tazeliğini gösterir.
+    """
     await get_current_user(request)
-    
-    # Active cases
-    active_cases = await cases_collection.count_documents({
-        "status": {"$nin": ["tamamlandi", "iptal"]}
-    })
-    
-    # Available vehicles
-    available_vehicles = await vehicles_collection.count_documents({
-        "status": "musait"
-    })
-    
-    # Priority breakdown
-    high_priority = await cases_collection.count_documents({
-        "priority": "yuksek",
-        "status": {"$nin": ["tamamlandi", "iptal"]}
-    })
-    
-    return {
-        "active_cases": active_cases,
-        "available_vehicles": available_vehicles,
-        "high_priority_cases": high_priority
-    }
+    return await dashboard_stats.get_dashboard_stats()
 
 @router.post("/{case_id}/send-notification")
 async def send_notification(case_id: str, vehicle_id: Optional[str] = None, request: Request = None):
@@ -1285,31 +1291,34 @@ class MedicalFormUpdate(BaseModel):
     field: str
     value: Any
 
+# Vakaya ortak düzenleme için katılabilen roller (atanmış ekip üyeleri her zaman katılabilir)
+CASE_COLLABORATOR_ROLES = ("merkez_ofis", "operasyon_muduru", "doktor", "hemsire", "att", "paramedik", "sofor", "bas_sofor")
+
+
+def can_collaborate_on_case(user, case_doc: dict) -> bool:
+    """Kullanıcı vakaya katılabilir / canlı yayını dinleyebilir mi"""
+    if user.role in CASE_COLLABORATOR_ROLES:
+        return True
+    assigned_team = case_doc.get("assigned_team") or {}
+    return user.id in [
+        assigned_team.get("driver_id"),
+        assigned_team.get("paramedic_id"),
+        assigned_team.get("att_id"),
+        assigned_team.get("nurse_id")
+    ]
+
 @router.post("/{case_id}/join")
 async def join_case(case_id: str, request: Request):
     """Join case as participant (real-time collaboration)"""
     try:
         user = await get_current_user(request)
         
-        case_doc = await cases_collection.find_one({"_id": case_id})
+        case_doc = await cases_collection.find_one({"_id": case_id}, {"assigned_team": 1})
         if not case_doc:
             raise HTTPException(status_code=404, detail="Vaka bulunamadı")
         
         # Check if user is authorized (assigned to case or doctor/nurse/admin)
-        is_authorized = False
-        assigned_team = case_doc.get("assigned_team") or {}
-        
-        if user.role in ["merkez_ofis", "operasyon_muduru", "doktor", "hemsire", "att", "paramedik", "sofor", "bas_sofor"]:
-            is_authorized = True
-        elif user.id in [
-            assigned_team.get("driver_id"),
-            assigned_team.get("paramedic_id"),
-            assigned_team.get("att_id"),
-            assigned_team.get("nurse_id")
-        ]:
-            is_authorized = True
-        
-        if not is_authorized:
+        if not can_collaborate_on_case(user, case_doc):
             raise HTTPException(status_code=403, detail="Bu vakaya erişim yetkiniz yok")
         
         # Add or update participant
@@ -1328,8 +1337,12 @@ async def join_case(case_id: str, request: Request):
         )
         await cases_collection.update_one(
             {"_id": case_id},
-            {"$push": {"participants": participant.model_dump()}}
+            {
+                "$push": {"participants": participant.model_dump()},
+                "$set": {"updated_at": get_turkey_time()}
+            }
         )
+        await case_hub.publish(case_id, {"type": "presence", "action": "join", "participant": participant.model_dump()})
         
         return {"message": "Vakaya katıldınız", "participant": participant.model_dump()}
     except HTTPException:
@@ -1345,8 +1358,15 @@ async def leave_case(case_id: str, request: Request):
     
     await cases_collection.update_one(
         {"_id": case_id},
-        {"$pull": {"participants": {"user_id": user.id}}}
+        {
+            "$pull": {"participants": {"user_id": user.id}},
+            "$set": {"updated_at": get_turkey_time()}
+        }
     )
+    await case_hub.publish(case_id, {
+        "type": "presence", "action": "leave",
+        "participant": {"user_id": user.id, "user_name": user.name, "user_role": user.role}
+    })
     
     return {"message": "Vakadan ayrıldınız"}
 
@@ -1379,96 +1399,150 @@ async def get_participants(case_id: str, request: Request):
     
     return {"participants": active_participants}
 
-def deep_merge(base: dict, updates: dict) -> dict:
+MEDICAL_FORM_SKIP_KEYS = ("_id", "id")
+
+
+def _form_leaf_value(path: str, value):
     """
-    İç içe dictionary'leri birleştirir (deep merge).
-    Özellikle offline sync için önemli - farklı kullanıcıların farklı alanları
-    güncellediğinde verilerin kaybolmasını önler.
-    
-    Örnek:
-    base = {"inline_consents": {"a": 1, "b": 2}, "vital_signs": [...]}
-    updates = {"inline_consents": {"c": 3}}
-    result = {"inline_consents": {"a": 1, "b": 2, "c": 3}, "vital_signs": [...]}
+    Tek bir form alanının birleştirme ifadesi (eski deep merge kuralları):
+    - Boş olmayan liste: yeni değer; boş liste: mevcut liste korunur
+    - None veya boş string: alan varsa korunur, yoksa yazılır
+    - Diğer değerler: doğrudan yazılır
     """
-    result = base.copy()
-    
-    for key, value in updates.items():
-        if key in ["_id", "id"]:
-            continue
-            
-        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            # Her iki değer de dict ise, derin birleştirme yap
-            result[key] = deep_merge(result[key], value)
-        elif key in result and isinstance(result[key], list) and isinstance(value, list):
-            # Liste birleştirme - yeni değer boş değilse kullan
-            # (vital_signs gibi listeler için son gönderilen geçerli olsun)
-            if value:  # Boş olmayan listeyi al
-                result[key] = value
-            # Yeni değer boşsa mevcut değeri koru
-        else:
-            # Diğer durumlarda: yeni değer None veya boş string değilse güncelle
-            # None veya boş string ise mevcut değeri koru
-            if value is not None and value != "":
-                result[key] = value
-            elif key not in result:
-                result[key] = value
+    field = f"${path}"
+    if isinstance(value, list):
+        if value:
+            return {"$literal": value}
+        return {"$cond": [{"$isArray": field}, field, {"$literal": []}]}
+    if value is None or value == "":
+        return {"$cond": [{"$eq": [{"$type": field}, "missing"]}, {"$literal": value}, field]}
+    return {"$literal": value}
+
+
+def medical_form_patch_stages(form_data: dict):
+    """
+    Gelen form yamasını noktalı yollarla $set eden update pipeline aşamalarına çevir
+    Tüm formu okuyup yeniden yazmadan deep merge ile aynı sonucu verir: yamadaki her
+    dict için hedef alan dict değilse önce {} yapılır (derinlik sırasıyla), sonra yapraklar yazılır.
+    Returns: (aşamalar, yazılan yaprak yolları) - yollar canlı yayındaki alan farkı için kullanılır
+    """
+    guards = []  # derinlik -> {yol: ifade}
+    leaves = {}
+    
+    def walk(path: str, node: dict, depth: int):
+        field = f"${path}"
+        if len(guards) <= depth:
+            guards.append({})
+        guards[depth][path] = {"$cond": [{"$eq": [{"$type": field}, "object"]}, field, {"$literal": {}}]}
+        for key, value in node.items():
+            if key in MEDICAL_FORM_SKIP_KEYS:
+                continue
+            if not isinstance(key, str) or not key or "." in key or key.startswith("$"):
+                raise HTTPException(status_code=400, detail=f"Geçersiz form alanı: {key}")
+            child = f"{path}.{key}"
+            if isinstance(value, dict):
+                walk(child, value, depth + 1)
+            else:
+                leaves[child] = _form_leaf_value(child, value)
     
-    return result
+    walk("medical_form", form_data, 0)
+    stages = [{"$set": level} for level in guards]
+    if leaves:
+        stages.append({"$set": leaves})
+    return stages, list(leaves)
+
+
+def _path_value(doc: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
 
 
 @router.patch("/{case_id}/medical-form")
-async def update_medical_form(case_id: str, request: Request):
+async def update_medical_form(case_id: str, request: Request, form_version: Optional[int] = None):
     """
     Update medical form (real-time collaboration)
     DEEP MERGE: Farklı kullanıcıların farklı alanları offline güncellemesi desteklenir.
     - İmzalar ayrı, vital signs ayrı, clinical_obs ayrı birleştirilir
     - Hiçbir veri kaybolmaz
+    
+    Yama tek bir update ile noktalı yollara yazılır (form okunmaz, tamamı yeniden yazılmaz).
+    form_version verilirse iyimser eşzamanlılık: vaka o sürümde değilse 409 döner.
     """
     user = await get_current_user(request)
     
-    case_doc = await cases_collection.find_one({"_id": case_id})
-    if not case_doc:
-        raise HTTPException(status_code=404, detail="Vaka bulunamadı")
-    
     # Get form data from request body
     form_data = await request.json()
+    if not isinstance(form_data, dict):
+        raise HTTPException(status_code=400, detail="Form verisi bir nesne olmalı")
     
-    # Update medical form - DEEP MERGE
-    current_form = case_doc.get("medical_form") or {}
-    
-    # Derin birleştirme yap - farklı kullanıcıların verileri korunur
-    merged_form = deep_merge(current_form, form_data)
+    logger.info(f"[MedicalForm] Patch for case {case_id} by {user.name} ({user.role}), keys: {list(form_data.keys())}")
     
-    logger.info(f"[MedicalForm] Deep merge for case {case_id} by {user.name} ({user.role})")
-    logger.info(f"[MedicalForm] Incoming keys: {list(form_data.keys())}")
-    
-    # Update case
-    await cases_collection.update_one(
-        {"_id": case_id},
-        {
-            "$set": {
-                "medical_form": merged_form,
-                "last_form_update": get_turkey_time(),
-                "last_form_updater": user.id,
-                "last_form_updater_name": user.name,
-                "last_form_updater_role": user.role,
-                "updated_at": get_turkey_time()
-            }
-        }
+    now = get_turkey_time()
+    pipeline, changed_paths = medical_form_patch_stages(form_data)
+    pipeline.append({"$set": {
+        "last_form_update": now,
+        "last_form_updater": user.id,
+        "last_form_updater_name": user.name,
+        "last_form_updater_role": user.role,
+        "updated_at": now,
+        "form_version": {"$add": [{"$ifNull": ["$form_version", 0]}, 1]},
+        # Katılımcının son aktivitesi (aynı update içinde)
+        "participants": {"$cond": [
+            {"$isArray": "$participants"},
+            {"$map": {
+                "input": "$participants",
+                "as": "p",
+                "in": {"$cond": [
+                    {"$eq": ["$$p.user_id", user.id]},
+                    {"$mergeObjects": ["$$p", {"last_activity": now}]},
+                    "$$p"
+                ]}
+            }},
+            "$participants"
+        ]}
+    }})
+    
+    query = {"_id": case_id}
+    if form_version is not None:
+        # Alan hiç yoksa sürüm 0 kabul edilir
+        query["form_version"] = form_version if form_version else {"$in": [0, None]}
+    
+    # Sadece yazılan alanlar geri okunur (abonelere giden fark; boş string/liste kuralı sonrası değer)
+    updated = await cases_collection.find_one_and_update(
+        query,
+        pipeline,
+        projection={"form_version": 1, **{path: 1 for path in changed_paths}},
+        return_document=ReturnDocument.AFTER
     )
     
-    # Update participant's last activity
-    await cases_collection.update_one(
-        {"_id": case_id, "participants.user_id": user.id},
-        {"$set": {"participants.$.last_activity": get_turkey_time()}}
-    )
+    if not updated:
+        current = await cases_collection.find_one({"_id": case_id}, {"form_version": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Vaka bulunamadı")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Form başka bir kullanıcı tarafından güncellendi (güncel sürüm: {current.get('form_version', 0)})"
+        )
+    
+    prefix = len("medical_form.")
+    await case_hub.publish(case_id, {
+        "type": "form_patch",
+        "form_version": updated["form_version"],
+        "changes": {path[prefix:]: _path_value(updated, path) for path in changed_paths},
+        "by": {"id": user.id, "name": user.name, "role": user.role},
+        "at": now
+    })
     
     return {
         "message": "Form güncellendi",
         "updated_by": user.name,
         "updated_by_role": user.role,
-        "updated_at": get_turkey_time().isoformat(),
-        "merged_keys": list(form_data.keys())
+        "updated_at": now.isoformat(),
+        "merged_keys": list(form_data.keys()),
+        "form_version": updated["form_version"]
     }
 
 @router.get("/{case_id}/medical-form")
@@ -1484,10 +1558,81 @@ async def get_medical_form(case_id: str, request: Request):
         "medical_form": case_doc.get("medical_form"),
         "last_update": case_doc.get("last_form_update"),
         "last_updater": case_doc.get("last_form_updater"),
+        "form_version": case_doc.get("form_version", 0),
         "doctor_approval": case_doc.get("doctor_approval"),
         "participants": case_doc.get("participants", [])
     }
 
+# ============================================================================
+# CANLI FORM YAYINI (WebSocket / SSE)
+# İlk mesaj "snapshot" (form + sürüm + katılımcılar), sonrasında "form_patch" ve "presence".
+# "resync" gelirse istemci olay kaçırmıştır ve formu yeniden almalıdır; "ping" bağlantı canlılığıdır.
+# ============================================================================
+
+async def _check_live_access(case_id: str, user):
+    case_doc = await cases_collection.find_one({"_id": case_id}, {"participants": 1, "assigned_team": 1})
+    if not case_doc:
+        raise HTTPException(status_code=404, detail="Vaka bulunamadı")
+    if not can_collaborate_on_case(user, case_doc):
+        raise HTTPException(status_code=403, detail="Bu vakaya erişim yetkiniz yok")
+
+
+def _skip_stale_patches(form_version: int):
+    """Snapshot'ın zaten içerdiği sürümlerin form_patch olaylarını atla"""
+    def skip(message: str) -> bool:
+        event = json.loads(message)
+        return event.get("type") == "form_patch" and event.get("form_version", 0) <= form_version
+    return skip
+
+
+def _live_snapshot(case_id: str):
+    """
+    İlk mesaj: abone olduktan sonra okunur; okuma sırasında yayınlanan yamalar kuyrukta kalır,
+    snapshot'ın sürümüne kadar olanlar atlanır
+    """
+    async def first_message(subscription) -> str:
+        case_doc = await cases_collection.find_one(
+            {"_id": case_id}, {"medical_form": 1, "form_version": 1, "participants": 1}
+        ) or {}
+        form_version = case_doc.get("form_version", 0)
+        subscription.skip = _skip_stale_patches(form_version)
+        return encode_event({
+            "type": "snapshot",
+            "case_id": case_id,
+            "medical_form": case_doc.get("medical_form") or {},
+            "form_version": form_version,
+            "participants": case_doc.get("participants", [])
+        })
+    return first_message
+
+
+@router.websocket("/{case_id}/live")
+async def case_live_socket(websocket: WebSocket, case_id: str):
+    """Vaka formunun canlı yayını (WebSocket; ?ticket= (POST /auth/stream-ticket) veya session_token cookie)"""
+    # Önce kabul et: el sıkışmada reddedilen bağlantı istemciye sebep (kapanış kodu) iletemez
+    await websocket.accept()
+    user = await get_connection_user(websocket)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    try:
+        await _check_live_access(case_id, user)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=e.detail)
+        return
+    
+    await case_hub.serve_websocket(websocket, case_hub.subscribe(case_id, user.id), _live_snapshot(case_id))
+
+
+@router.get("/{case_id}/live/stream")
+async def case_live_stream(case_id: str, request: Request):
+    """Vaka formunun canlı yayını (Server-Sent Events; WebSocket kullanamayan istemciler için)"""
+    user = await get_connection_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await _check_live_access(case_id, user)
+    return case_hub.event_stream(request, case_hub.subscribe(case_id, user.id), _live_snapshot(case_id))
+
 # ============================================================================
 # DOCTOR APPROVAL ENDPOINTS
 # ============================================================================
@@ -1545,7 +1690,10 @@ async def doctor_approval(case_id: str, data: DoctorApprovalRequest, request: Re
     
     await cases_collection.update_one(
         {"_id": case_id},
-        {"$push": {"status_history": status_update.model_dump()}}
+        {
+            "$push": {"status_history": status_update.model_dump()},
+            "$set": {"updated_at": get_turkey_time()}
+        }
     )
     
     return {
@@ -1584,7 +1732,8 @@ async def start_video_call(case_id: str, request: Request):
         {"$set": {
             "video_room_id": video_room_id, 
             "video_call_active": True,
-            "jitsi_domain": jitsi_domain
+            "jitsi_domain": jitsi_domain,
+            "updated_at": get_turkey_time()
         }}
     )
     
@@ -1604,7 +1753,6 @@ async def start_video_call(case_id: str, request: Request):
 # EXCEL EXPORT ENDPOINT
 # ============================================================================
 
-from fastapi.responses import StreamingResponse
 from services.excel_export_service import export_case_to_excel
 
 @router.get("/{case_id}/export-excel")
@@ -1992,6 +2140,59 @@ def build_export_case_data(case_doc: dict, medical_form: dict = None) -> dict:
         "crash_vehicles": extended_form.get("crashVehicles", []),
     }
 
+# İmza alanı -> inline_consents anahtarı
+VAKA_FORM_SIGNATURE_KEYS = {
+    'sig.hekim_prm_imza': 'doctor_paramedic_signature',
+    'sig.saglik_per_imza': 'health_personnel_signature',
+    'sig.sofor_teknisyen_imza': 'driver_pilot_signature',
+    'sig.teslim_alan_imza': 'receiver_signature',
+    'sig.hasta_yakin_imza': 'patient_info_consent_signature',
+    'sig.hasta_reddi_imza': 'patient_rejection_signature',
+    'sig.hastane_reddi_imza': 'hospital_rejection_doctor_signature',
+}
+
+
+def resolve_vaka_form_cells(flat_mappings: dict, case_data: dict, for_pdf: bool = False):
+    """
+    Mapping'deki hücrelerin değerleri ve imza görüntüleri
+    Döner: ({hücre: değer}, {hücre: imza görüntüsü baytları})
+    PDF'te alan değeri alınamazsa hücre boş kalır, Excel'de hata yükseltilir.
+    """
+    from services.vaka_form_template import load_signature_image
+    import re
+    
+    values, images = {}, {}
+    for cell_address, field_key in flat_mappings.items():
+        if field_key == "__LOGO__" or not re.match(r'^([A-Z]+)(\d+)$', cell_address.upper()):
+            continue
+        
+        if for_pdf:
+            try:
+                value = get_case_field_value(case_data, field_key)
+            except Exception as field_err:
+                logger.warning(f"Alan değeri alınamadı: {field_key} -> {cell_address}: {field_err}")
+                value = ""
+        else:
+            value = get_case_field_value(case_data, field_key)
+        
+        # İmza alanı: base64 görüntü varsa hücreye görüntü olarak eklenir, eklenemezse ✓ yazılır
+        inline_key = VAKA_FORM_SIGNATURE_KEYS.get(field_key)
+        if inline_key:
+            sig_data = case_data.get('inline_consents', {}).get(inline_key)
+            is_image = isinstance(sig_data, str) and sig_data.startswith('data:image')
+            if is_image and sig_data.partition(",")[2]:
+                image = load_signature_image(sig_data)
+                if image:
+                    images[cell_address] = image
+                    continue
+                value = '✓'
+            elif sig_data and (for_pdf or is_image):
+                value = '✓'
+        
+        values[cell_address] = value
+    return values, images
+
+
 @router.get("/{case_id}/export-excel-mapped")
 async def export_case_with_vaka_form_mapping(case_id: str, request: Request):
     """Vakayı Vaka Form Mapping kullanarak Excel'e export et (şablon formatıyla)"""
@@ -2006,7 +2207,6 @@ async def export_case_with_vaka_form_mapping(case_id: str, request: Request):
         raise HTTPException(status_code=404, detail="Vaka form mapping bulunamadı. Önce mapping oluşturun.")
     
     flat_mappings = mapping_doc.get("flat_mappings", {})
-    logo_info = mapping_doc.get("logo", {})
     
     # Medical form verilerini al (CaseDetail'de kaydedilen)
     medical_form = case_doc.get("medical_form", {})
@@ -2014,138 +2214,19 @@ async def export_case_with_vaka_form_mapping(case_id: str, request: Request):
     case_data = build_export_case_data(case_doc, medical_form)
     
     try:
-        from openpyxl import load_workbook
-        from openpyxl.drawing.image import Image as XLImage
-        import base64
-        import re
-        import os
-        
-        # VAKA FORMU ŞABLONUNU YÜKLE
-        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(backend_dir, "templates", "VAKA_FORMU_TEMPLATE.xlsx")
-        
-        if os.path.exists(template_path):
-            wb = load_workbook(template_path)
-            ws = wb.active
-            logger.info(f"Şablon yüklendi: {template_path}")
-        else:
-            # Şablon yoksa boş workbook
-            from openpyxl import Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Vaka Formu"
-            logger.warning(f"Şablon bulunamadı, boş oluşturuluyor: {template_path}")
-        
-        # Logo - #VALUE! hatasını temizle ve logoyu düzgün ekle
-        # Logo - Önce dosyadan, yoksa mapping'den yükle
-        logo_cell = logo_info.get("cell", "A1") if logo_info else "A1"
-        
-        # Logo hücrelerindeki içeriği temizle (A1:C6 arası - sadece logo alanı)
-        # D sütunundan başlayan metinlere dokunma
-        for row in range(1, 7):
-            for col in range(1, 4):  # A-C sütunları (D dahil değil)
-                try:
-                    cell = ws.cell(row=row, column=col)
-                    cell.value = None
-                except:
-                    pass
-        
-        # Önce dosyadan logo yükle
-        logo_path = os.path.join(backend_dir, "templates", "healmedy_logo.png")
-        logo_added = False
-        
-        if os.path.exists(logo_path):
-            try:
-                img = XLImage(logo_path)
-                img.width = 200   # Daha büyük ve net
-                img.height = 75   # Orantılı
-                img.anchor = logo_cell
-                ws.add_image(img, logo_cell)
-                logo_added = True
-            except Exception as e:
-                logger.warning(f"Logo dosyadan eklenemedi: {e}")
-        
-        # Dosyadan eklenemezse mapping'deki base64'ü dene
-        if not logo_added and logo_info and logo_info.get("url"):
-            try:
-                logo_url = logo_info["url"]
-                if logo_url.startswith("data:image"):
-                    header, encoded = logo_url.split(",", 1)
-                    logo_data = base64.b64decode(encoded)
-                    from io import BytesIO
-                    img_buffer = BytesIO(logo_data)
-                    img = XLImage(img_buffer)
-                    img.width = 200   # Daha büyük ve net
-                    img.height = 75   # Orantılı
-                    img.anchor = logo_cell
-                    ws.add_image(img, logo_cell)
-            except Exception as e:
-                logger.warning(f"Logo base64'ten eklenemedi: {e}")
-        
-        # Mapping'leri uygula - şablondaki hücrelere değer yaz
-        for cell_address, field_key in flat_mappings.items():
-            if field_key == "__LOGO__":
-                # Logo hücresini de temizle
-                match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
-                if match:
-                    try:
-                        ws[cell_address] = None
-                    except:
-                        pass
-                continue
-            
-            value = get_case_field_value(case_data, field_key)
-            
-            # İmza alanı ise ve base64 görüntü varsa, görüntü olarak ekle
-            if '_imza' in field_key or '_signature' in field_key:
-                # inline_consents'tan gerçek imza verisini al
-                sig_key_map = {
-                    'sig.hekim_prm_imza': 'doctor_paramedic_signature',
-                    'sig.saglik_per_imza': 'health_personnel_signature',
-                    'sig.sofor_teknisyen_imza': 'driver_pilot_signature',
-                    'sig.teslim_alan_imza': 'receiver_signature',
-                    'sig.hasta_yakin_imza': 'patient_info_consent_signature',
-                    'sig.hasta_reddi_imza': 'patient_rejection_signature',
-                    'sig.hastane_reddi_imza': 'hospital_rejection_doctor_signature',
-                }
-                
-                inline_key = sig_key_map.get(field_key)
-                if inline_key:
-                    sig_data = case_data.get('inline_consents', {}).get(inline_key)
-                    if sig_data and isinstance(sig_data, str) and sig_data.startswith('data:image'):
-                        try:
-                            # Base64'ü görüntüye çevir
-                            header, encoded = sig_data.split(",", 1)
-                            sig_bytes = base64.b64decode(encoded)
-                            sig_buffer = BytesIO(sig_bytes)
-                            sig_img = XLImage(sig_buffer)
-                            sig_img.width = 150   # Büyütüldü
-                            sig_img.height = 55   # Büyütüldü
-                            ws.add_image(sig_img, cell_address)
-                            continue  # Görüntü eklendi, metin ekleme
-                        except Exception as e:
-                            logger.warning(f"İmza görüntüsü eklenemedi {cell_address}: {e}")
-                            # Fallback: ✓ yaz
-                            value = '✓'
-            
-            match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
-            if match:
-                try:
-                    ws[cell_address] = value
-                except Exception as e:
-                    logger.warning(f"Hücre yazma hatası {cell_address}: {e}")
-        
+        from services.vaka_form_template import vaka_form_templates
         from io import BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        
+        # Derlenmiş VAKA FORMU şablonuna değerleri yaz (şablon mapping sürümü başına bir kez açılır)
+        values, images = resolve_vaka_form_cells(flat_mappings, case_data)
+        content = await vaka_form_templates.render("excel", mapping_doc, values, images)
         
         case_number = case_doc.get("case_number", case_id[:8])
         date_str = get_turkey_time().strftime("%Y-%m-%d")
         filename = f"VAKA_FORMU_{case_number}_{date_str}.xlsx"
         
         return StreamingResponse(
-            output,
+            BytesIO(content),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
@@ -2240,16 +2321,13 @@ async def export_case_pdf_debug(case_id: str, request: Request):
 @router.get("/{case_id}/export-pdf-mapped")
 async def export_case_pdf_with_mapping(case_id: str, request: Request):
     """Vakayı Vaka Form Mapping kullanarak PDF olarak export et (Tek Sayfa)"""
-    from openpyxl import load_workbook
-    from openpyxl.drawing.image import Image as XLImage
-    from openpyxl.styles import Alignment
     from io import BytesIO
-    import base64
-    import re
     import os
-    import subprocess
-    import tempfile
-    import uuid as uuid_module
+    from services.libreoffice_pool import (
+        libreoffice_pool, create_job_dir, remove_job_dir,
+        ConversionError, ConversionTimeout, OfficeNotInstalled
+    )
+    from services.vaka_form_template import vaka_form_templates, fix_ods_page_styles
     
     user = await get_current_user(request)
     logger.info(f"PDF export başlıyor: case_id={case_id}")
@@ -2265,7 +2343,6 @@ async def export_case_pdf_with_mapping(case_id: str, request: Request):
     logger.info(f"Mapping bulundu: {len(mapping_doc.get('flat_mappings', {}))} hücre")
     
     flat_mappings = mapping_doc.get("flat_mappings", {})
-    logo_info = mapping_doc.get("logo", {})
     
     # Medical form verilerini al
     medical_form = case_doc.get("medical_form", {})
@@ -2273,344 +2350,83 @@ async def export_case_pdf_with_mapping(case_id: str, request: Request):
     logger.info("Case data hazırlandı")
     
     try:
-        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(backend_dir, "templates", "VAKA_FORMU_TEMPLATE.xlsx")
-        logger.info(f"Template path: {template_path}, exists: {os.path.exists(template_path)}")
-        
-        if os.path.exists(template_path):
-            wb = load_workbook(template_path)
-            ws = wb.active
-        else:
-            from openpyxl import Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Vaka Formu"
-        
-        # Logo - Önce dosyadan, yoksa mapping'den yükle
-        logo_cell = logo_info.get("cell", "A1") if logo_info else "A1"
-        
-        # Logo hücrelerindeki tüm içeriği temizle (A1:C6 arası - sadece logo alanı)
-        # D sütunundan başlayan metinlere dokunma
-        for row in range(1, 7):  # 1-6 satırları
-            for col in range(1, 4):  # A-C sütunları (D dahil değil)
-                try:
-                    cell = ws.cell(row=row, column=col)
-                    cell.value = None
-                except:
-                    pass
-        
-        # Önce dosyadan logo yükle
-        logo_path = os.path.join(backend_dir, "templates", "healmedy_logo.png")
-        logo_added = False
-        
-        if os.path.exists(logo_path):
-            try:
-                img = XLImage(logo_path)
-                # Logo boyutları - orantılı ve görünür (A1:C5 alanına sığacak)
-                # A4 Portrait için uygun boyut
-                img.width = 200   # ~4 sütun genişliği (daha büyük ve net)
-                img.height = 75   # ~5 satır yüksekliği (orantılı)
-                
-                # Anchor ile konumlandır - sol üst köşeye sabitle
-                from openpyxl.drawing.spreadsheet_drawing import AnchorMarker, TwoCellAnchor
-                img.anchor = 'A1'  # A1 hücresine sabitle
-                
-                ws.add_image(img, "A1")  # Sol üst köşeye sabitle
-                logger.info(f"Logo dosyadan eklendi: A1, {img.width}x{img.height}")
-                logo_added = True
-            except Exception as e:
-                logger.warning(f"Logo dosyadan eklenemedi: {e}")
-        
-        # Dosyadan eklenemezse mapping'deki base64'ü dene
-        if not logo_added and logo_info and logo_info.get("url"):
-            try:
-                logo_url = logo_info["url"]
-                if logo_url.startswith("data:image"):
-                    header, encoded = logo_url.split(",", 1)
-                    logo_data = base64.b64decode(encoded)
-                    img_buffer = BytesIO(logo_data)
-                    img = XLImage(img_buffer)
-                    img.width = 200   # Daha büyük ve net
-                    img.height = 75   # Orantılı
-                    img.anchor = 'A1'
-                    ws.add_image(img, "A1")
-                    logger.info(f"Logo base64'ten eklendi: A1, {img.width}x{img.height}")
-            except Exception as e:
-                logger.warning(f"Logo base64'ten eklenemedi: {e}")
-        
-        # Mapping'leri uygula
-        logger.info(f"Mapping uygulanıyor: {len(flat_mappings)} hücre")
-        for cell_address, field_key in flat_mappings.items():
-            try:
-                if field_key == "__LOGO__":
-                    # Logo hücresini de temizle
-                    match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
-                    if match:
-                        try:
-                            ws[cell_address] = None
-                        except:
-                            pass
-                    continue
-                
-                value = get_case_field_value(case_data, field_key)
-            except Exception as field_err:
-                logger.warning(f"Alan değeri alınamadı: {field_key} -> {cell_address}: {field_err}")
-                value = ""
-            
-            # İmza alanı ise ve base64 görüntü varsa, görüntü olarak ekle
-            if '_imza' in field_key or '_signature' in field_key:
-                sig_key_map = {
-                    'sig.hekim_prm_imza': 'doctor_paramedic_signature',
-                    'sig.saglik_per_imza': 'health_personnel_signature',
-                    'sig.sofor_teknisyen_imza': 'driver_pilot_signature',
-                    'sig.teslim_alan_imza': 'receiver_signature',
-                    'sig.hasta_yakin_imza': 'patient_info_consent_signature',
-                    'sig.hasta_reddi_imza': 'patient_rejection_signature',
-                    'sig.hastane_reddi_imza': 'hospital_rejection_doctor_signature',
-                }
-                
-                inline_key = sig_key_map.get(field_key)
-                if inline_key:
-                    sig_data = case_data.get('inline_consents', {}).get(inline_key)
-                    if sig_data and isinstance(sig_data, str) and sig_data.startswith('data:image') and ',' in sig_data:
-                        try:
-                            header, encoded = sig_data.split(",", 1)
-                            if encoded:  # Base64 verisi var mı kontrol et
-                                sig_bytes = base64.b64decode(encoded)
-                                sig_buffer = BytesIO(sig_bytes)
-                                sig_img = XLImage(sig_buffer)
-                                # İmza boyutları - büyük (yazıcıda net görünsün)
-                                sig_img.width = 150   # ~5cm genişlik
-                                sig_img.height = 55   # ~1.7cm yükseklik
-                                ws.add_image(sig_img, cell_address)
-                                continue
-                        except Exception as e:
-                            logger.warning(f"İmza görüntüsü eklenemedi {cell_address}: {e}")
-                            value = '✓'
-                    elif sig_data:
-                        # İmza var ama görüntü olarak eklenemedi
-                        value = '✓'
-            
-            match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
-            if match:
-                try:
-                    cell = ws[cell_address]
-                    cell.value = value
-                    
-                    from openpyxl.styles import Alignment
-                    
-                    # Tüm hücrelere text wrap uygula (uzun içerik varsa satıra sığması için)
-                    cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='left')
-                    
-                    # Uzun içerik için satır yüksekliğini artır
-                    if value and len(str(value)) > 25:
-                        row_num = int(match.group(2))
-                        
-                        # Sütun genişliğini hesapla (yaklaşık karakter sayısı)
-                        col_letter = match.group(1)
-                        col_width = ws.column_dimensions[col_letter].width or 10
-                        chars_per_line = int(col_width * 1.2)  # Yaklaşık
-                        
-                        # Gerekli satır sayısını hesapla
-                        content_lines = max(1, len(str(value)) // max(chars_per_line, 10) + 1)
-                        
-                        # Mevcut yüksekliği al
-                        current_height = ws.row_dimensions[row_num].height or 15
-                        
-                        # Yeni yükseklik hesapla (satır başına ~14px)
-                        needed_height = content_lines * 14
-                        new_height = max(current_height, needed_height, 15)
-                        
-                        # Maksimum sınır koy (çok uzun içerikler için)
-                        ws.row_dimensions[row_num].height = min(new_height, 100)
-                        
-                except Exception as e:
-                    logger.warning(f"Hücre yazma hatası {cell_address}: {e}")
+        # Derlenmiş şablon: logo, hizalama ve A4 tek sayfa ayarları şablonda hazır
+        values, images = resolve_vaka_form_cells(flat_mappings, case_data, for_pdf=True)
+        xlsx_content = await vaka_form_templates.render("pdf", mapping_doc, values, images)
         
-        # SAYFA AYARLARI: A4 Dikey (Portrait), TEK SAYFAYA SIĞDIR
-        # Şablonun kendi boyutlandırmasını kullan - V4 şablonu A4'e uygun hazırlandı
-        try:
-            from openpyxl.worksheet.properties import PageSetupProperties
-            
-            # Sayfa ayarları - A4 Portrait
-            ws.page_setup.orientation = 'portrait'  # Dikey
-            ws.page_setup.paperSize = 9  # A4 (9 = A4)
-            ws.page_setup.fitToWidth = 1  # 1 sayfa genişliğine sığdır
-            ws.page_setup.fitToHeight = 1  # 1 sayfa yüksekliğine sığdır
-            ws.page_setup.fitToPage = True  # FitToPage modunu etkinleştir
-            
-            # Scale ayarını kullanma - fitToPage ile otomatik ölçeklenir
-            # ws.page_setup.scale = None  # Ölçek kullanılmıyor, FitToPage aktif
-            
-            # Sheet properties
-            if ws.sheet_properties.pageSetUpPr is None:
-                ws.sheet_properties.pageSetUpPr = PageSetupProperties()
-            ws.sheet_properties.pageSetUpPr.fitToPage = True
-            
-            # Print area: Tüm şablon alanı (şablondaki max satır/sütun)
-            from openpyxl.utils import get_column_letter
-            max_row = ws.max_row or 79
-            max_col = ws.max_column or 20
-            print_area = f"A1:{get_column_letter(max_col)}{max_row}"
-            ws.print_area = print_area
-            
-            # Kenar boşlukları - minimum (sayfayı tam kullan)
-            ws.page_margins.left = 0.1    # ~0.25cm
-            ws.page_margins.right = 0.1
-            ws.page_margins.top = 0.1
-            ws.page_margins.bottom = 0.1
-            ws.page_margins.header = 0
-            ws.page_margins.footer = 0
-            
-            # Şablonun satır yüksekliklerini KORU - değiştirme
-            # V4 şablonu zaten A4'e uygun hazırlandı
-            
-            logger.info(f"Sayfa ayarları: A4 Portrait, FitToPage=1x1, PrintArea={print_area}, MaxRow={max_row}")
-        except Exception as e:
-            logger.warning(f"Sayfa ayarları yapılamadı: {e}")
+        # Geçici Excel dosyası - her iş kendi dizininde
+        job_dir = create_job_dir(prefix=f"case_{case_id[:8]}_")
+        temp_xlsx = os.path.join(job_dir, f"case_{case_id}.xlsx")
+        with open(temp_xlsx, "wb") as f:
+            f.write(xlsx_content)
         
-        # Geçici Excel dosyası oluştur
-        temp_dir = os.path.join(backend_dir, "temp")
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        temp_xlsx = os.path.join(temp_dir, f"case_{case_id}_{uuid_module.uuid4().hex[:8]}.xlsx")
-        wb.save(temp_xlsx)
-        
-        # LibreOffice ile PDF'e dönüştür (A4 tek sayfa)
+        # LibreOffice havuzu ile PDF'e dönüştür (A4 tek sayfa)
         try:
             # Önce ODS'ye çevir, sonra PDF'e (sayfa ayarları daha iyi korunuyor)
             # ODS dönüşümü
-            result1 = subprocess.run([
-                'libreoffice', '--headless', '--convert-to', 'ods',
-                '--outdir', temp_dir, temp_xlsx
-            ], capture_output=True, timeout=60, text=True)
-            
-            temp_ods = temp_xlsx.replace('.xlsx', '.ods')
+            temp_ods = None
+            try:
+                temp_ods = await libreoffice_pool.convert(temp_xlsx, "ods", job_dir)
+            except OfficeNotInstalled:
+                raise
+            except ConversionError as e:
+                logger.warning(f"ODS dönüşümü başarısız, XLSX'ten devam ediliyor: {e}")
             
-            # ODS dosyasını aç ve sayfa ayarlarını düzelt
-            if os.path.exists(temp_ods):
+            # ODS sayfa stilini düzelt (A4 dikey, tek sayfaya sığdır)
+            if temp_ods and os.path.exists(temp_ods):
                 try:
-                    # ODS dosyasını zipfile olarak aç ve styles.xml'i düzenle
-                    import zipfile
-                    import xml.etree.ElementTree as ET
-                    
-                    # ODS'yi aç
-                    with zipfile.ZipFile(temp_ods, 'r') as zf:
-                        content = {name: zf.read(name) for name in zf.namelist()}
-                    
-                    # styles.xml'i düzenle - A4 Dikey (Portrait) ve tek sayfaya sığdır
-                    if 'styles.xml' in content:
-                        styles_xml = content['styles.xml'].decode('utf-8')
-                        
-                        # Sayfa ayarlarını değiştir
-                        # fo:page-width="21cm" fo:page-height="29.7cm" (A4 portrait)
-                        # style:scale-to-pages="1"
-                        import re
-                        
-                        # A4 portrait boyutları
-                        styles_xml = re.sub(r'fo:page-width="[^"]*"', 'fo:page-width="21cm"', styles_xml)
-                        styles_xml = re.sub(r'fo:page-height="[^"]*"', 'fo:page-height="29.7cm"', styles_xml)
-                        
-                        # Orientation'ı portrait yap
-                        styles_xml = re.sub(r'style:print-orientation="[^"]*"', 'style:print-orientation="portrait"', styles_xml)
-                        
-                        # Kenar boşluklarını minimize et (A4'ü doldurmak için)
-                        styles_xml = re.sub(r'fo:margin-top="[^"]*"', 'fo:margin-top="0.25cm"', styles_xml)
-                        styles_xml = re.sub(r'fo:margin-bottom="[^"]*"', 'fo:margin-bottom="0.25cm"', styles_xml)
-                        styles_xml = re.sub(r'fo:margin-left="[^"]*"', 'fo:margin-left="0.25cm"', styles_xml)
-                        styles_xml = re.sub(r'fo:margin-right="[^"]*"', 'fo:margin-right="0.25cm"', styles_xml)
-                        
-                        # Tek sayfaya sığdır (1x1 sayfa)
-                        styles_xml = re.sub(r'style:scale-to="[^"]*"', '', styles_xml)
-                        styles_xml = re.sub(r'style:scale-to-pages="[^"]*"', '', styles_xml)
-                        
-                        # FitToPage: 1 sayfa genişlik x 1 sayfa yükseklik
-                        if 'style:scale-to-X' not in styles_xml:
-                            styles_xml = styles_xml.replace(
-                                'style:print-orientation="portrait"',
-                                'style:print-orientation="portrait" style:scale-to-X="1" style:scale-to-Y="1"'
-                            )
-                        
-                        content['styles.xml'] = styles_xml.encode('utf-8')
-                    
-                    # Yeni ODS dosyası oluştur
-                    temp_ods_fixed = temp_ods.replace('.ods', '_fixed.ods')
-                    with zipfile.ZipFile(temp_ods_fixed, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        for name, data in content.items():
-                            zf.writestr(name, data)
-                    
-                    # Eski ODS'yi sil, yenisini kullan
-                    os.remove(temp_ods)
-                    os.rename(temp_ods_fixed, temp_ods)
-                    
+                    await asyncio.to_thread(fix_ods_page_styles, temp_ods)
                 except Exception as e:
                     logger.warning(f"ODS düzenleme hatası: {e}")
             
             # Kaynak dosya (ODS veya XLSX)
-            source_file = temp_ods if os.path.exists(temp_ods) else temp_xlsx
+            source_file = temp_ods if temp_ods and os.path.exists(temp_ods) else temp_xlsx
             
             # PDF'e dönüştür
-            result2 = subprocess.run([
-                'libreoffice', '--headless', '--convert-to', 'pdf',
-                '--outdir', temp_dir, source_file
-            ], capture_output=True, timeout=60, text=True)
+            try:
+                pdf_path = await libreoffice_pool.convert(source_file, "pdf", job_dir)
+            except ConversionTimeout:
+                raise
+            except OfficeNotInstalled:
+                raise
+            except ConversionError as e:
+                logger.error(f"PDF oluşturulamadı. LibreOffice çıktısı: {e}")
+                raise HTTPException(status_code=500, detail=f"PDF dönüştürme başarısız: {str(e)[:200]}")
             
-            pdf_path = source_file.replace('.ods', '.pdf').replace('.xlsx', '.pdf')
+            # PDF'i oku
+            with open(pdf_path, 'rb') as f:
+                pdf_content = f.read()
             
-            if os.path.exists(pdf_path):
-                # PDF'i oku
-                with open(pdf_path, 'rb') as f:
-                    pdf_content = f.read()
-                
-                # Temizlik
-                for f_path in [temp_xlsx, temp_ods, pdf_path]:
-                    try:
-                        if os.path.exists(f_path):
-                            os.remove(f_path)
-                    except:
-                        pass
-                
-                case_number = case_doc.get("case_number", case_id[:8])
-                date_str = get_turkey_time().strftime("%Y-%m-%d")
-                filename = f"VAKA_FORMU_{case_number}_{date_str}.pdf"
-                
-                from io import BytesIO
-                return StreamingResponse(
-                    BytesIO(pdf_content),
-                    media_type="application/pdf",
-                    headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-                )
-            else:
-                error_msg = result2.stderr if result2.stderr else result2.stdout
-                logger.error(f"PDF oluşturulamadı. LibreOffice çıktısı: {error_msg}")
-                for f_path in [temp_xlsx, temp_ods]:
-                    try:
-                        if os.path.exists(f_path):
-                            os.remove(f_path)
-                    except:
-                        pass
-                raise HTTPException(status_code=500, detail=f"PDF dönüştürme başarısız: {error_msg[:200]}")
+            case_number = case_doc.get("case_number", case_id[:8])
+            date_str = get_turkey_time().strftime("%Y-%m-%d")
+            filename = f"VAKA_FORMU_{case_number}_{date_str}.pdf"
+            
+            return StreamingResponse(
+                BytesIO(pdf_content),
+                media_type="application/pdf",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
                 
-        except subprocess.TimeoutExpired:
-            os.remove(temp_xlsx)
+        except ConversionTimeout:
             raise HTTPException(status_code=500, detail="PDF dönüştürme zaman aşımı")
-        except FileNotFoundError:
+        except OfficeNotInstalled:
             # LibreOffice yok - Excel döndür
             logger.warning("LibreOffice bulunamadı, Excel döndürülüyor")
             with open(temp_xlsx, 'rb') as f:
                 excel_content = f.read()
-            os.remove(temp_xlsx)
             
             case_number = case_doc.get("case_number", case_id[:8])
             date_str = get_turkey_time().strftime("%Y-%m-%d")
             filename = f"VAKA_FORMU_{case_number}_{date_str}.xlsx"
             
-            from io import BytesIO
             return StreamingResponse(
                 BytesIO(excel_content),
                 media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 headers={"Content-Disposition": f'attachment; filename="{filename}"'}
             )
+        finally:
+            # Temizlik - iş dizini tüm ara dosyalarla birlikte silinir
+            remove_job_dir(job_dir)
         
     except HTTPException:
         raise
@@ -2654,6 +2470,7 @@ async def delete_case(case_id: str, request: Request):
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Silme işlemi başarısız oldu")
+    await dashboard_stats.record_case_transition(case_doc, None)
     
     logger.info(f"Vaka silindi: {case_number} (ID: {case_id}) - Silen: {user.name} ({user.role})")
     
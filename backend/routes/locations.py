@@ -6,7 +6,7 @@ Lokasyon Yönetimi API
 - Araç güncel lokasyon takibi
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, WebSocket
 from typing import List, Optional
 from datetime import datetime, timedelta
 import logging
@@ -20,7 +20,11 @@ from models import (
     LocationChangeRequest, LocationChangeRequestCreate,
     VehicleCurrentLocation, HEALMEDY_LOCATIONS
 )
-from auth_utils import get_current_user, require_roles
+from auth_utils import get_current_user, get_connection_user, require_roles
+from services.case_hub import case_hub, encode_event
+from services.fleet_positions import fleet_positions, FLEET_TOPIC
+from services.gps_ingest import gps_ingest
+from utils.timezone import get_turkey_time, parse_turkey_datetime, to_naive_turkey_time
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -413,24 +417,35 @@ async def get_vehicles_by_location(location_id: str, request: Request):
 vehicle_gps_history_collection = db.vehicle_gps_history
 
 
+def device_time(timestamp, received_at: datetime) -> datetime:
+    """Cihazın ölçüm zamanı (naive Türkiye saati); yoksa, çözülemiyorsa ya da ileri tarihliyse alım zamanı"""
+    recorded_at = parse_turkey_datetime(timestamp)
+    if recorded_at is None or recorded_at > received_at:
+        return received_at
+    return recorded_at
+
+
 @router.post("/vehicle/{vehicle_id}/gps")
 async def update_vehicle_gps(vehicle_id: str, request: Request):
-    """Araç GPS konumunu güncelle (gerçek zamanlı tracking)"""
+    """
+    Araç GPS konumunu güncelle (gerçek zamanlı tracking)
+    Kayıt GPS alım tamponuna eklenir; geçmiş ve güncel konum birkaç saniye içinde toplu yazılır.
+    """
     user = await get_current_user(request)
     body = await request.json()
     
     turkey_now = datetime.utcnow() + timedelta(hours=3)
     
-    # Araç bilgisini al
-    vehicle = await vehicles_collection.find_one({"_id": vehicle_id})
-    if not vehicle:
+    # Araç plakası (önbellekten)
+    plate = (await gps_ingest.plates_for([vehicle_id]))[vehicle_id]
+    if plate is None:
         raise HTTPException(status_code=404, detail="Araç bulunamadı")
     
     # GPS verisi
     gps_data = {
         "_id": f"gps_{vehicle_id}_{int(turkey_now.timestamp())}",
         "vehicle_id": vehicle_id,
-        "vehicle_plate": vehicle.get("plate"),
+        "vehicle_plate": plate,
         "user_id": body.get("userId") or user.id,
         "latitude": body.get("latitude"),
         "longitude": body.get("longitude"),
@@ -439,31 +454,36 @@ async def update_vehicle_gps(vehicle_id: str, request: Request):
         "heading": body.get("heading"),
         "speed": body.get("speed"),
         "timestamp": body.get("timestamp") or turkey_now.isoformat(),
+        "recorded_at": device_time(body.get("timestamp"), turkey_now),
         "created_at": turkey_now
     }
     
-    # GPS geçmişine kaydet
-    await vehicle_gps_history_collection.insert_one(gps_data)
+    position = {
+        "last_gps_latitude": body.get("latitude"),
+        "last_gps_longitude": body.get("longitude"),
+        "last_gps_accuracy": body.get("accuracy"),
+        "last_gps_speed": body.get("speed"),
+        "last_gps_heading": body.get("heading"),
+        "last_gps_update": turkey_now
+    }
     
-    # Araç güncel konumunu güncelle
-    await vehicle_current_locations_collection.update_one(
-        {"vehicle_id": vehicle_id},
-        {"$set": {
-            "last_gps_latitude": body.get("latitude"),
-            "last_gps_longitude": body.get("longitude"),
-            "last_gps_accuracy": body.get("accuracy"),
-            "last_gps_speed": body.get("speed"),
-            "last_gps_heading": body.get("heading"),
-            "last_gps_update": turkey_now
-        }},
-        upsert=True
-    )
+    # GPS geçmişi + araç güncel konumu (araç başına son ping yazılır)
+    await gps_ingest.add([gps_data], {vehicle_id: position})
+    # Filo canlı konum tablosu (harita akışı)
+    fleet_positions.record(vehicle_id, plate, position)
     
-    logger.debug(f"GPS güncellendi: {vehicle.get('plate')} - {body.get('latitude')}, {body.get('longitude')}")
+    logger.debug(f"GPS güncellendi: {plate} - {body.get('latitude')}, {body.get('longitude')}")
     
     return {"success": True, "message": "GPS konumu güncellendi"}
 
 
+@router.get("/gps/ingest/stats")
+async def get_gps_ingest_stats(request: Request):
+    """GPS alım tamponu metrikleri (bu worker)"""
+    await require_roles(["merkez_ofis", "operasyon_muduru"])(request)
+    return gps_ingest.get_stats()
+
+
 @router.get("/vehicle/{vehicle_id}/gps/history")
 async def get_vehicle_gps_history(
     vehicle_id: str, 
@@ -496,23 +516,65 @@ async def get_vehicle_gps_history(
     return history
 
 
+@router.get("/vehicle/{vehicle_id}/gps/track")
+async def get_vehicle_gps_track(
+    vehicle_id: str,
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    tolerance_m: float = 15.0,
+    bucket_seconds: Optional[int] = None,
+    polyline: bool = False
+):
+    """
+    Araç rotası (harita oynatma için sadeleştirilmiş)
+    Pencere varsayılan olarak son 24 saat; tolerance_m Douglas-Peucker toleransı,
+    bucket_seconds verilirse zaman kovası kullanılır. Mesafe, duraklamalar ve
+    isteğe bağlı encoded polyline döner.
+    """
+    await require_roles(["merkez_ofis", "operasyon_muduru", "cagri_merkezi"])(request)
+    from services.gps_tracks import get_vehicle_track, GPS_TRACK_MAX_HOURS
+    
+    # Offset'li girdiler (…Z, …+03:00) naive Türkiye saatine çevrilir; kayıtlar naive Türkiye saatindedir
+    try:
+        end = to_naive_turkey_time(datetime.fromisoformat(end_date)) if end_date else get_turkey_time()
+        start = to_naive_turkey_time(datetime.fromisoformat(start_date)) if start_date else end - timedelta(hours=24)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz tarih formatı")
+    
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Başlangıç bitişten önce olmalı")
+    if end - start > timedelta(hours=GPS_TRACK_MAX_HOURS):
+        raise HTTPException(status_code=400, detail=f"En fazla {GPS_TRACK_MAX_HOURS} saatlik pencere sorgulanabilir")
+    if tolerance_m < 0 or (bucket_seconds is not None and bucket_seconds <= 0):
+        raise HTTPException(status_code=400, detail="Geçersiz çözünürlük")
+    
+    return await get_vehicle_track(
+        vehicle_id, start, end,
+        tolerance_m=tolerance_m,
+        bucket_seconds=bucket_seconds,
+        include_polyline=polyline
+    )
+
+
 @router.get("/vehicle/{vehicle_id}/gps/latest")
 async def get_vehicle_latest_gps(vehicle_id: str, request: Request):
     """Araç son GPS konumunu getir"""
     await get_current_user(request)
     
-    # Önce güncel lokasyon tablosundan kontrol et
-    current = await vehicle_current_locations_collection.find_one({"vehicle_id": vehicle_id})
+    # Önce bellekteki filo konum tablosu (henüz yazılmamış ping'ler dahil)
+    await fleet_positions.ensure_loaded()
+    current = fleet_positions.get(vehicle_id)
     
-    if current and current.get("last_gps_latitude"):
+    if current and current.get("latitude") is not None:
         return {
             "vehicle_id": vehicle_id,
-            "latitude": current.get("last_gps_latitude"),
-            "longitude": current.get("last_gps_longitude"),
-            "accuracy": current.get("last_gps_accuracy"),
-            "speed": current.get("last_gps_speed"),
-            "heading": current.get("last_gps_heading"),
-            "last_update": current.get("last_gps_update")
+            "latitude": current["latitude"],
+            "longitude": current["longitude"],
+            "accuracy": current["accuracy"],
+            "speed": current["speed"],
+            "heading": current["heading"],
+            "last_update": current["last_update"]
         }
     
     # GPS geçmişinden son kaydı al
@@ -546,22 +608,20 @@ async def save_batch_locations(request: Request):
         raise HTTPException(status_code=400, detail="Konum verisi bulunamadı")
     
     turkey_now = datetime.utcnow() + timedelta(hours=3)
-    saved_count = 0
+    
+    # Araç kontrolü (tüm araçlar tek sorguda / önbellekten)
+    plates = await gps_ingest.plates_for(loc.get("vehicleId") for loc in locations if loc.get("vehicleId"))
+    history = []
     
     for loc in locations:
         vehicle_id = loc.get("vehicleId")
-        if not vehicle_id:
+        if not vehicle_id or plates.get(vehicle_id) is None:
             continue
         
-        # Araç kontrolü
-        vehicle = await vehicles_collection.find_one({"_id": vehicle_id})
-        if not vehicle:
-            continue
-        
-        gps_data = {
+        history.append({
             "_id": f"gps_{vehicle_id}_{loc.get('timestamp', turkey_now.isoformat())}",
             "vehicle_id": vehicle_id,
-            "vehicle_plate": vehicle.get("plate"),
+            "vehicle_plate": plates[vehicle_id],
             "user_id": loc.get("userId") or user.id,
             "latitude": loc.get("latitude"),
             "longitude": loc.get("longitude"),
@@ -570,20 +630,24 @@ async def save_batch_locations(request: Request):
             "heading": loc.get("heading"),
             "speed": loc.get("speed"),
             "timestamp": loc.get("timestamp"),
+            "recorded_at": device_time(loc.get("timestamp"), turkey_now),
             "created_at": turkey_now,
             "synced_from_offline": True
-        }
-        
-        try:
-            await vehicle_gps_history_collection.insert_one(gps_data)
-            saved_count += 1
-        except Exception as e:
-            # Duplicate key hatası olabilir, devam et
-            logger.warning(f"GPS kayıt hatası: {e}")
+        })
     
-    logger.info(f"Toplu GPS kaydı: {saved_count}/{len(locations)} konum kaydedildi")
+    # Yazım tamponda (write-behind); daha önce gönderilmiş noktalar yazarken atlanır,
+    # bu yüzden burada sadece kabul edilen nokta sayısı bilinir (bkz. /gps/ingest/stats)
+    await gps_ingest.add(history)
+    accepted_count = len(history)
     
-    return {"success": True, "saved_count": saved_count, "total": len(locations)}
+    logger.info(f"Toplu GPS kaydı: {accepted_count}/{len(locations)} konum yazım kuyruğuna alındı")
+    
+    return {
+        "success": True,
+        "accepted_count": accepted_count,
+        "skipped_count": len(locations) - accepted_count,
+        "total": len(locations)
+    }
 
 
 # ==================== MERKEZİ LOKASYON API ====================
@@ -960,30 +1024,61 @@ async def sync_all_locations(request: Request):
     }
 
 
+FLEET_VIEW_ROLES = ["merkez_ofis", "operasyon_muduru", "cagri_merkezi"]
+
+
 @router.get("/vehicles/all-gps")
 async def get_all_vehicles_gps(request: Request):
-    """Tüm araçların güncel GPS konumlarını getir (harita için)"""
-    await require_roles(["merkez_ofis", "operasyon_muduru", "cagri_merkezi"])(request)
+    """Tüm araçların güncel GPS konumlarını getir (harita için, bellekteki filo tablosundan)"""
+    await require_roles(FLEET_VIEW_ROLES)(request)
     
-    # GPS verisi olan araçları getir
-    vehicles_with_gps = await vehicle_current_locations_collection.find({
-        "last_gps_latitude": {"$exists": True, "$ne": None}
-    }).to_list(500)
-    
-    result = []
-    for v in vehicles_with_gps:
-        result.append({
-            "vehicle_id": v.get("vehicle_id"),
-            "vehicle_plate": v.get("vehicle_plate"),
-            "latitude": v.get("last_gps_latitude"),
-            "longitude": v.get("last_gps_longitude"),
-            "accuracy": v.get("last_gps_accuracy"),
-            "speed": v.get("last_gps_speed"),
-            "heading": v.get("last_gps_heading"),
-            "last_update": v.get("last_gps_update"),
-            "current_location_name": v.get("current_location_name")
-        })
-    
-    return result
+    await fleet_positions.ensure_loaded()
+    return fleet_positions.snapshot()
+
+
+@router.get("/fleet/stats")
+async def get_fleet_positions_stats(request: Request):
+    """Filo konum tablosu ve canlı akış metrikleri (bu worker)"""
+    await require_roles(["merkez_ofis", "operasyon_muduru"])(request)
+    return fleet_positions.get_stats()
+
+
+def _can_view_fleet(user) -> bool:
+    return any(role in FLEET_VIEW_ROLES for role in [user.role] + (user.temp_roles or []))
+
+
+async def _fleet_snapshot_message(subscription=None) -> str:
+    """İlk mesaj; abone olduktan sonra çağrılır, arada gelen konumlar kuyrukta kalır"""
+    await fleet_positions.ensure_loaded()
+    return encode_event({"type": "snapshot", "vehicles": fleet_positions.snapshot()})
+
+
+@router.websocket("/fleet/live")
+async def fleet_live_ws(websocket: WebSocket):
+    """
+    Filo canlı konum akışı (WebSocket; ?ticket= (POST /auth/stream-ticket) veya session_token cookie)
+    İlk mesaj tüm filonun anlık görüntüsü ("snapshot"), sonra sadece değişen araçlar ("positions").
+    """
+    await websocket.accept()
+    user = await get_connection_user(websocket)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    if not _can_view_fleet(user):
+        await websocket.close(code=4403)
+        return
+    
+    await case_hub.serve_websocket(websocket, case_hub.subscribe_topic(FLEET_TOPIC, user.id), _fleet_snapshot_message)
+
+
+@router.get("/fleet/live/stream")
+async def fleet_live_sse(request: Request):
+    """Filo canlı konum akışı (Server-Sent Events; WebSocket ile aynı olaylar)"""
+    user = await get_connection_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not _can_view_fleet(user):
+        raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
+    return case_hub.event_stream(request, case_hub.subscribe_topic(FLEET_TOPIC, user.id), _fleet_snapshot_message)
 
 
@@ -4,7 +4,6 @@ Medication Usage API - Vakada kullanılan ilaçlar ve karekod işlemleri
 from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 from datetime import datetime
-import re
 
 from database import (
     cases_collection, 
@@ -22,6 +21,7 @@ from models import (
     StockItemCreate
 )
 from auth_utils import get_current_user, require_roles
+from utils import gs1
 
 router = APIRouter()
 
@@ -103,92 +103,18 @@ def parse_gs1_barcode(raw_data: str) -> ParsedBarcodeData:
     - (10) Parti/Lot Numarası
     - (21) Seri Numarası
     
-    Örnek: 010869954321012317251231 10ABC123 21SN123456
+    Örnek: 01086995432101231725123110ABC123<GS>21SN123456
     """
-    result = ParsedBarcodeData(raw_data=raw_data)
-    
-    # Clean the input - remove spaces and special chars
-    clean_data = raw_data.strip()
-    
-    # Try different parsing methods
-    
-    # Method 1: With parentheses format (01)xxx(17)xxx...
-    if '(' in clean_data:
-        # Extract using regex with parentheses
-        gtin_match = re.search(r'\(01\)(\d{14})', clean_data)
-        expiry_match = re.search(r'\(17\)(\d{6})', clean_data)
-        lot_match = re.search(r'\(10\)([^\(]+)', clean_data)
-        serial_match = re.search(r'\(21\)([^\(]+)', clean_data)
-        
-        if gtin_match:
-            result.gtin = gtin_match.group(1)
-        if expiry_match:
-            result.expiry_date = expiry_match.group(1)
-        if lot_match:
-            result.lot_number = lot_match.group(1).strip()
-        if serial_match:
-            result.serial_number = serial_match.group(1).strip()
-    
-    # Method 2: Without parentheses - position based
-    # Format: 01XXXXXXXXXXXXXX17YYMMDD10LOT21SERIAL
-    else:
-        # GS1 uses FNC1 (Group Separator) character, often represented as ]d2 or GS (ASCII 29)
-        # Remove any control characters
-        clean_data = re.sub(r'[\x00-\x1f]', '', clean_data)
-        
-        # Try to find AI codes by position
-        pos = 0
-        while pos < len(clean_data):
-            # Check for known AIs
-            if clean_data[pos:pos+2] == '01' and pos + 16 <= len(clean_data):
-                result.gtin = clean_data[pos+2:pos+16]
-                pos += 16
-            elif clean_data[pos:pos+2] == '17' and pos + 8 <= len(clean_data):
-                result.expiry_date = clean_data[pos+2:pos+8]
-                pos += 8
-            elif clean_data[pos:pos+2] == '10':
-                # Lot number - variable length, ends at next AI or end
-                lot_end = len(clean_data)
-                for ai in ['17', '21', '01']:
-                    ai_pos = clean_data.find(ai, pos+2)
-                    if ai_pos != -1 and ai_pos < lot_end:
-                        lot_end = ai_pos
-                result.lot_number = clean_data[pos+2:lot_end].strip()
-                pos = lot_end
-            elif clean_data[pos:pos+2] == '21':
-                # Serial number - variable length
-                serial_end = len(clean_data)
-                for ai in ['17', '10', '01']:
-                    ai_pos = clean_data.find(ai, pos+2)
-                    if ai_pos != -1 and ai_pos < serial_end:
-                        serial_end = ai_pos
-                result.serial_number = clean_data[pos+2:serial_end].strip()
-                pos = serial_end
-            else:
-                pos += 1
-    
-    # Parse expiry date if found
-    if result.expiry_date and len(result.expiry_date) == 6:
-        try:
-            year = int(result.expiry_date[0:2])
-            month = int(result.expiry_date[2:4])
-            day = int(result.expiry_date[4:6])
-            
-            # Handle century (00-69 = 2000s, 70-99 = 1900s)
-            if year < 70:
-                year += 2000
-            else:
-                year += 1900
-            
-            # Handle day = 00 (means last day of month)
-            if day == 0:
-                day = 28  # Safe default
-            
-            result.expiry_date_parsed = datetime(year, month, day)
-        except (ValueError, TypeError):
-            pass
-    
-    return result
+    fields = gs1.parse(raw_data)
+    
+    return ParsedBarcodeData(
+        raw_data=raw_data,
+        gtin=fields.get("gtin"),
+        lot_number=fields.get("lot_number"),
+        serial_number=fields.get("serial_number"),
+        expiry_date=fields.get("expiry_date"),
+        expiry_date_parsed=gs1.parse_gs1_date(fields.get("expiry_date"))
+    )
 
 
 @router.post("/parse-barcode")
@@ -21,6 +21,7 @@ from services.onesignal_service import (
     send_master_code_notification
 )
 from services.firebase_service import firebase_service
+from services.token_directory import token_directory
 
 router = APIRouter()
 
@@ -206,6 +207,7 @@ async def register_fcm_token(data: FCMTokenRegistration, request: Request):
     
     if cleanup_result.modified_count > 0:
         logger.info(f"[FCM] Token temizlendi: {cleanup_result.modified_count} kullanıcıdan kaldırıldı (yeni kullanıcı: {user.name})")
+        token_directory.remove_tokens([data.fcm_token])
     
     # Mevcut FCM token'ları al
     user_doc = await users_collection.find_one({"_id": user.id})
@@ -245,6 +247,8 @@ async def register_fcm_token(data: FCMTokenRegistration, request: Request):
         }
     )
     
+    token_directory.put_user({**user_doc, "fcm_tokens": fcm_tokens})
+    
     logger.info(f"[FCM] Token kaydedildi: {user.name} ({user.role}) - toplam {len(fcm_tokens)} cihaz")
     
     return {
@@ -264,6 +268,7 @@ async def unregister_fcm_token(request: Request, fcm_token: str = None):
             {"_id": user.id},
             {"$pull": {"fcm_tokens": {"token": fcm_token}}}
         )
+        token_directory.remove_tokens([fcm_token], user_id=user.id)
     else:
         # Tüm token'ları kaldır
         await users_collection.update_one(
@@ -272,6 +277,7 @@ async def unregister_fcm_token(request: Request, fcm_token: str = None):
                 "$set": {"fcm_tokens": [], "fcm_enabled": False}
             }
         )
+        await token_directory.refresh_user(user.id)
     
     return {"message": "FCM token kaldırıldı"}
 
@@ -369,6 +375,22 @@ async def get_fcm_debug(request: Request):
     }
 
 
+@router.get("/outbox/stats")
+async def get_outbox_stats(request: Request):
+    """
+    Push bildirim outbox'ı - Admin endpoint
+    Teslim metrikleri (bu worker) ve kuyruk durumu (bekleyen/gönderilen/başarısız)
+    """
+    from auth_utils import require_roles
+    await require_roles(["merkez_ofis", "operasyon_muduru"])(request)
+    
+    from services.notification_outbox import notification_outbox
+    return {
+        **await notification_outbox.get_stats(),
+        "token_directory": token_directory.get_stats()
+    }
+
+
 # ==================== Bildirim Tercihleri ====================
 
 @router.get("/preferences")
@@ -8,7 +8,7 @@ from pydantic import BaseModel
 from typing import Optional
 from database import users_collection
 from auth_utils import get_current_user
-from services.otp_service import otp_service, generate_user_otp_secret, get_user_otp, verify_user_otp
+from services.otp_service import otp_service, generate_user_otp_secret, get_user_otp, verify_user_otp, approver_code_index
 import logging
 
 logger = logging.getLogger(__name__)
@@ -52,6 +52,7 @@ async def get_my_otp_code(request: Request):
             {"_id": user.id},
             {"$set": {"otp_secret": otp_secret}}
         )
+        approver_code_index.invalidate()
         logger.info(f"Generated OTP secret for user {user.id}")
     
     # OTP bilgisini döndür
@@ -126,6 +127,8 @@ async def regenerate_otp_secret(request: Request):
         {"_id": user.id},
         {"$set": {"otp_secret": new_secret, "otp_verified": False}}
     )
+    # Eski secret'ın kodları onay indeksinden hemen düşsün
+    approver_code_index.invalidate()
     
     logger.info(f"Regenerated OTP secret for user {user.id}")
     
@@ -161,6 +164,7 @@ async def get_otp_setup(request: Request):
             {"_id": user.id},
             {"$set": {"otp_secret": otp_secret, "otp_verified": False}}
         )
+        approver_code_index.invalidate()
         otp_verified = False
         logger.info(f"Generated OTP secret for user {user.id} during setup")
     
@@ -254,6 +258,7 @@ async def get_user_otp_code(user_id: str, request: Request):
             {"_id": user_id},
             {"$set": {"otp_secret": otp_secret}}
         )
+        approver_code_index.invalidate()
     
     otp_info = get_user_otp(otp_secret)
     
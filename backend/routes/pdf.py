@@ -1,12 +1,15 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from datetime import datetime
+import asyncio
 import os
 import logging
 
 from services.excel_to_pdf_with_data import excel_form_to_pdf_with_data
 from services.template_pdf_generator import generate_pdf_from_template
 from services.libreoffice_pdf import generate_case_pdf_with_libreoffice, check_libreoffice_installed
+from services.libreoffice_pool import create_job_dir, remove_job_dir
 from services.vaka_form_mapping import get_cell_mapping_for_display, VAKA_FORM_CELL_MAPPING, CHECKBOX_MAPPINGS
 from auth_utils import get_current_user
 from database import cases_collection, pdf_templates_collection, db
@@ -44,42 +47,44 @@ async def generate_case_pdf(case_id: str, request: Request):
     
     # Generate filename
     filename = f"Ambulans_Vaka_Formu_{case.get('case_number', case_id)}.pdf"
+    job_dir = create_job_dir(prefix="case_pdf_")
     
     try:
         # Use LibreOffice if available (better quality)
         if LIBREOFFICE_AVAILABLE:
             logger.info(f"Using LibreOffice for case {case_id}")
-            result_path = generate_case_pdf_with_libreoffice(
+            result_path = await generate_case_pdf_with_libreoffice(
                 template_path=excel_template,
                 case_data=case,
                 form_data=form_data,
-                output_filename=f"case_{case_id}.pdf"
+                output_dir=job_dir
             )
         else:
             # Fallback to ReportLab method
             logger.info(f"LibreOffice not available, using fallback for case {case_id}")
-            temp_dir = os.path.join(backend_dir, "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            pdf_path = os.path.join(temp_dir, f"case_{case_id}.pdf")
+            pdf_path = os.path.join(job_dir, f"case_{case_id}.pdf")
             
-            result_path = excel_form_to_pdf_with_data(
+            result_path = await asyncio.to_thread(
+                excel_form_to_pdf_with_data,
                 excel_path=excel_template,
                 pdf_path=pdf_path,
                 case_data=case,
                 form_data=form_data
             )
         
-        # Return PDF as download
+        # Return PDF as download - iş dizini yanıt gönderildikten sonra silinir
         return FileResponse(
             result_path,
             media_type="application/pdf",
             filename=filename,
             headers={
                 "Content-Disposition": f'attachment; filename="{filename}"'
-            }
+            },
+            background=BackgroundTask(remove_job_dir, job_dir)
         )
         
     except Exception as e:
+        remove_job_dir(job_dir)
         logger.error(f"Error generating PDF for case {case_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
@@ -110,42 +115,44 @@ async def generate_case_pdf_with_form_data(
     
     # Generate filename
     filename = f"Ambulans_Vaka_Formu_{case.get('case_number', case_id)}.pdf"
+    job_dir = create_job_dir(prefix="case_pdf_")
     
     try:
         # Use LibreOffice if available (better quality)
         if LIBREOFFICE_AVAILABLE:
             logger.info(f"Using LibreOffice for case {case_id} with form data")
-            result_path = generate_case_pdf_with_libreoffice(
+            result_path = await generate_case_pdf_with_libreoffice(
                 template_path=excel_template,
                 case_data=case,
                 form_data=form_data,
-                output_filename=f"case_{case_id}.pdf"
+                output_dir=job_dir
             )
         else:
             # Fallback to ReportLab method
             logger.info(f"LibreOffice not available, using fallback for case {case_id}")
-            temp_dir = os.path.join(backend_dir, "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            pdf_path = os.path.join(temp_dir, f"case_{case_id}.pdf")
+            pdf_path = os.path.join(job_dir, f"case_{case_id}.pdf")
             
-            result_path = excel_form_to_pdf_with_data(
+            result_path = await asyncio.to_thread(
+                excel_form_to_pdf_with_data,
                 excel_path=excel_template,
                 pdf_path=pdf_path,
                 case_data=case,
                 form_data=form_data
             )
         
-        # Return PDF as download
+        # Return PDF as download - iş dizini yanıt gönderildikten sonra silinir
         return FileResponse(
             result_path,
             media_type="application/pdf",
             filename=filename,
             headers={
                 "Content-Disposition": f'attachment; filename="{filename}"'
-            }
+            },
+            background=BackgroundTask(remove_job_dir, job_dir)
         )
         
     except Exception as e:
+        remove_job_dir(job_dir)
         logger.error(f"Error generating PDF for case {case_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
@@ -292,6 +299,8 @@ async def bulk_update_vaka_form_mapping(request: Request):
     existing["total_cells"] = len(mappings)
     existing["updated_at"] = datetime.now()
     existing["updated_by"] = user.id
+    # Derlenmiş VAKA FORMU şablonları bu sürümle geçersiz olur
+    existing["version"] = existing.get("version", 0) + 1
     
     await db.vaka_form_mappings.update_one(
         {"_id": "default"},
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, HTTPException, Request, Query
 from typing import List, Optional
+from bisect import bisect_left
+import hashlib
 import json
 import os
+import re
 from pathlib import Path
 
+from utils.text_search import TextSearchIndex, normalize_tr, tokenize_tr
+
 router = APIRouter()
 
 # Load data files
@@ -38,10 +43,227 @@ def load_hospitals_turkey():
         print(f"Error loading Turkey hospitals: {e}")
         return {"provinces": [], "hospitals_by_province": {}, "total_hospitals": 0}
 
+def _icd_code_key(code: str) -> str:
+    """ICD kodunu karşılaştırma anahtarına çevir: 'a00.1' -> 'A001'"""
+    return code.replace(".", "").replace(" ", "").upper()
+
+
+# Kod gibi görünen sorgular: harf + rakam (A0, J45.9, I21)
+ICD_CODE_QUERY = re.compile(r"^[A-Za-z]\d[\d.]*$|^[A-Za-z]$")
+# Harfsiz kod parçaları (45.9, 21): kodun içinde alt dize olarak aranır
+ICD_CODE_FRAGMENT = re.compile(r"^[\d.]*\d[\d.]*$")
+
+
+class ICDCodeIndex:
+    """
+    ICD-10 arama index'i (startup'ta bir kez kurulur)
+    - Kod önekleri: sıralı kod anahtarları üzerinde bisect
+    - Harfsiz kod parçaları: rakamla başlayan tüm kod alt dizeleri -> kod sırasındaki konumlar
+    - Tanı adları: Türkçe normalize kelime/trigram index'i (TextSearchIndex)
+    Sıralama: tam kod eşleşmesi > kod öneki (kod sırasıyla) > ad eşleşmeleri
+    Kod parçasında harften hemen sonra başlayan eşleşmeler (45 -> J45.9) diğerlerinden önce gelir.
+    """
+    
+    def __init__(self, codes: list):
+        self.codes = codes
+        order = sorted(range(len(codes)), key=lambda i: _icd_code_key(codes[i].get("code", "")))
+        self._code_keys = [_icd_code_key(codes[i].get("code", "")) for i in order]
+        self._code_ids = order
+        self._code_fragments = {}
+        for pos, key in enumerate(self._code_keys):
+            fragments = {
+                key[start:end]
+                for start in range(1, len(key)) if key[start].isdigit()
+                for end in range(start + 1, len(key) + 1)
+            }
+            for fragment in fragments:
+                self._code_fragments.setdefault(fragment, []).append(pos)
+        self._names = TextSearchIndex((i, c.get("name", "")) for i, c in enumerate(codes))
+    
+    def _code_prefix(self, prefix: str, limit: int) -> list:
+        start = bisect_left(self._code_keys, prefix)
+        end = min(start + limit, len(self._code_keys))
+        matches = []
+        for pos in range(start, end):
+            if not self._code_keys[pos].startswith(prefix):
+                break
+            matches.append(self._code_ids[pos])
+        return matches
+    
+    def _code_fragment(self, fragment: str, limit: int) -> list:
+        positions = self._code_fragments.get(fragment, ())
+        leading = [p for p in positions if self._code_keys[p].startswith(fragment, 1)]
+        if len(leading) < limit:
+            leading_set = set(leading)
+            leading += [p for p in positions if p not in leading_set][:limit - len(leading)]
+        return [self._code_ids[p] for p in leading[:limit]]
+    
+    def search(self, q: str, limit: int = 20) -> list:
+        q = q.strip()
+        if not q or limit <= 0:
+            return []
+        
+        result_ids = []
+        if ICD_CODE_QUERY.match(q):
+            # Tam eşleşme bisect'in ilk sonucu olur (A00 < A000 < A001 ...)
+            result_ids = self._code_prefix(_icd_code_key(q), limit)
+        elif ICD_CODE_FRAGMENT.match(q):
+            result_ids = self._code_fragment(_icd_code_key(q), limit)
+        
+        if len(result_ids) < limit:
+            # Kodla bulunanlar ad aramasında filtrelenir; sonuç limit'e kadar dolar
+            seen = set(result_ids)
+            names = self._names
+            for doc_id in names.search(q, limit=limit - len(result_ids),
+                                       filter_fn=lambda d: names.keys[d] not in seen):
+                result_ids.append(names.keys[doc_id])
+        
+        return [self.codes[i] for i in result_ids]
+
+
+# Hastane öncelik seviyeleri (sıralamada küçük olan önce gelir)
+HOSPITAL_TIER_CUSTOM = 0
+HOSPITAL_TIER_ZONGULDAK = 1
+HOSPITAL_TIER_NATIONAL = 2
+HOSPITAL_TIERS = (HOSPITAL_TIER_CUSTOM, HOSPITAL_TIER_ZONGULDAK, HOSPITAL_TIER_NATIONAL)
+HOME_PROVINCE = "zonguldak"
+
+# Kaynaklar: "form" = hospitals.json (vaka formu listesi), "turkey" = hospitals_turkey.json
+HOSPITAL_SOURCES = ("form", "turkey")
+
+
+def hospital_id(province: str, name: str) -> str:
+    """İl + hastane adından kararlı ID üret (yazım/büyük harf farkları aynı ID'yi verir)"""
+    raw = f"{normalize_tr(province).strip()}|{' '.join(tokenize_tr(name))}"
+    return "h_" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class _HospitalEntry:
+    __slots__ = ("id", "source", "tier", "province", "category", "record")
+    
+    def __init__(self, id: str, source: str, tier: int, province: str, category: str, record: dict):
+        self.id = id
+        self.source = source
+        self.tier = tier
+        self.province = province
+        self.category = category
+        self.record = record
+
+
+class HospitalCatalog:
+    """
+    Tüm hastane listeleri için tek, normalize katalog (startup'ta bir kez kurulur)
+    - Kararlı ID'ler; aynı kaynakta tekrar eden hastaneler kurulumda elenir
+    - İl index'i: normalize il -> kaynak -> kategori -> kayıtlar
+    - Ad index'leri: (kaynak, öncelik) ve (kaynak, il) başına TextSearchIndex
+    Öncelik (custom > Zonguldak > ulusal) sıralama anında uygulanır: seviyeler sırayla
+    okunur ve limit dolunca durulur, böylece arama eşleşme sayısıyla orantılıdır.
+    """
+    
+    def __init__(self, hospitals: dict, hospitals_turkey: dict):
+        self.entries: List[_HospitalEntry] = []
+        self._seen = {source: set() for source in HOSPITAL_SOURCES}
+        self._by_province = {}
+        
+        for tier, key in ((HOSPITAL_TIER_CUSTOM, "custom"), (HOSPITAL_TIER_ZONGULDAK, "zonguldak_all"), (HOSPITAL_TIER_NATIONAL, "all")):
+            for h in hospitals.get(key, []):
+                entry_tier = tier
+                if key == "all" and normalize_tr(h.get("il", "")) == HOME_PROVINCE:
+                    entry_tier = HOSPITAL_TIER_ZONGULDAK
+                self._add("form", entry_tier, h.get("il", ""), key, h)
+        
+        for province, groups in hospitals_turkey.get("hospitals_by_province", {}).items():
+            tier = HOSPITAL_TIER_ZONGULDAK if normalize_tr(province) == HOME_PROVINCE else HOSPITAL_TIER_NATIONAL
+            for category in ("kamu_universite", "ozel"):
+                for h in groups.get(category, []):
+                    self._add("turkey", tier, province, category, h)
+        
+        tier_groups = {}
+        for pos, entry in enumerate(self.entries):
+            tier_groups.setdefault((entry.source, entry.tier), []).append(pos)
+        self._tier_index = {key: self._build_index(positions) for key, positions in tier_groups.items()}
+        
+        self._province_index = {}
+        for province_key, sources in self._by_province.items():
+            for source, groups in sources.items():
+                positions = [pos for category_positions in groups.values() for pos in category_positions]
+                self._province_index[(source, province_key)] = self._build_index(positions)
+        del self._seen
+    
+    def _build_index(self, positions: List[int]) -> TextSearchIndex:
+        return TextSearchIndex((pos, self.entries[pos].record.get("name", "")) for pos in positions)
+    
+    def _add(self, source: str, tier: int, province: str, category: str, raw: dict):
+        entry_id = hospital_id(province, raw.get("name", ""))
+        if entry_id in self._seen[source]:
+            return
+        self._seen[source].add(entry_id)
+        
+        record = {"id": entry_id, **raw}
+        entry = _HospitalEntry(entry_id, source, tier, province, category, record)
+        self._by_province.setdefault(normalize_tr(province).strip(), {}) \
+            .setdefault(source, {}) \
+            .setdefault(category, []) \
+            .append(len(self.entries))
+        self.entries.append(entry)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def province_entries(self, province: str, source: str, categories: tuple = None) -> List[_HospitalEntry]:
+        """Bir ilin kayıtları (kaynak sırasıyla, kategori filtresi opsiyonel)"""
+        groups = self._by_province.get(normalize_tr(province).strip(), {}).get(source, {})
+        positions = []
+        for category in categories or groups.keys():
+            positions.extend(groups.get(category, ()))
+        return [self.entries[pos] for pos in positions]
+    
+    def search(self, q: str, source: str, limit: int = 20, province: str = "") -> List[_HospitalEntry]:
+        """
+        Ada göre ara; önce öncelik seviyesine, sonra eşleşme kalitesine göre sırala
+        
+        Args:
+            q: Hastane adı sorgusu
+            source: "form" veya "turkey"
+            limit: En fazla sonuç
+            province: İl filtresi (opsiyonel)
+        """
+        entries = self.entries
+        
+        if province:
+            # İl index'i küçük: tüm eşleşmeleri al, öncelik seviyesine göre (kararlı) sırala
+            index = self._province_index.get((source, normalize_tr(province).strip()))
+            if index is None:
+                return []
+            matches = [entries[index.keys[doc_id]] for doc_id in index.search(q, limit=len(index))]
+            matches.sort(key=lambda e: e.tier)
+            return matches[:limit]
+        
+        results: List[_HospitalEntry] = []
+        for tier in HOSPITAL_TIERS:
+            index = self._tier_index.get((source, tier))
+            if index is None:
+                continue
+            for doc_id in index.search(q, limit=limit - len(results)):
+                results.append(entries[index.keys[doc_id]])
+            if len(results) >= limit:
+                break
+        
+        return results
+
+
 # Cache data in memory
 ICD_CODES = load_icd_codes()
+ICD_INDEX = ICDCodeIndex(ICD_CODES)
 HOSPITALS = load_hospitals()
 HOSPITALS_TURKEY = load_hospitals_turkey()
+HOSPITAL_CATALOG = HospitalCatalog(HOSPITALS, HOSPITALS_TURKEY)
+
+# Sık kullanılan sabit listeler (katalogdan, ID'li)
+CUSTOM_HOSPITALS = [e.record for e in HOSPITAL_CATALOG.entries if e.source == "form" and e.category == "custom"]
+ZONGULDAK_FORM_HOSPITALS = CUSTOM_HOSPITALS + [
+    e.record for e in HOSPITAL_CATALOG.entries if e.source == "form" and e.category == "zonguldak_all"
+]
 
 @router.get("/icd-codes")
 async def search_icd_codes(
@@ -52,19 +274,7 @@ async def search_icd_codes(
     if not q:
         return []
     
-    q_lower = q.lower()
-    results = []
-    
-    for code in ICD_CODES:
-        code_match = q_lower in code.get("code", "").lower()
-        name_match = q_lower in code.get("name", "").lower()
-        
-        if code_match or name_match:
-            results.append(code)
-            if len(results) >= limit:
-                break
-    
-    return results
+    return ICD_INDEX.search(q, limit)
 
 @router.get("/hospitals")
 async def get_hospitals(
@@ -76,54 +286,36 @@ async def get_hospitals(
     
     if category == "custom":
         # Özel hastaneler ve sağlık merkezleri
-        return HOSPITALS.get("custom", [])
+        return CUSTOM_HOSPITALS
     
     elif category == "zonguldak":
         # Zonguldak devlet hastaneleri + custom
-        custom = HOSPITALS.get("custom", [])
-        zonguldak = HOSPITALS.get("zonguldak_all", [])
-        return custom + zonguldak
+        return ZONGULDAK_FORM_HOSPITALS
     
     elif q:
-        # Autocomplete arama - tüm hastanelerde
-        q_lower = q.lower()
-        results = []
-        
-        # Önce custom (öncelikli)
-        for h in HOSPITALS.get("custom", []):
-            if q_lower in h.get("name", "").lower():
-                results.append(h)
-        
-        # Sonra Zonguldak
-        for h in HOSPITALS.get("zonguldak_all", []):
-            if q_lower in h.get("name", "").lower():
-                results.append(h)
-        
-        # Son olarak diğer iller
-        if len(results) < 20:
-            for h in HOSPITALS.get("all", []):
-                if q_lower in h.get("name", "").lower():
-                    if h not in results:  # Duplicate kontrolü
-                        results.append(h)
-                        if len(results) >= 20:
-                            break
-        
-        return results[:20]
+        # Autocomplete arama - tüm hastanelerde (custom > Zonguldak > diğer iller)
+        return [e.record for e in HOSPITAL_CATALOG.search(q, "form", limit=20, province=il)]
+    
+    elif il:
+        return [e.record for e in HOSPITAL_CATALOG.province_entries(il, "form")]
     
     else:
         # Varsayılan: Zonguldak hastaneleri
-        custom = HOSPITALS.get("custom", [])
-        zonguldak = HOSPITALS.get("zonguldak_all", [])
-        return custom + zonguldak
+        return ZONGULDAK_FORM_HOSPITALS
 
 @router.get("/hospitals/grouped")
 async def get_hospitals_grouped():
     """Get hospitals grouped by category for dropdown"""
     
     # Zonguldak hastanelerini Turkey veritabanından al
-    zonguldak_hospitals = HOSPITALS_TURKEY.get("hospitals_by_province", {}).get("Zonguldak", {})
-    zonguldak_kamu = [{"name": h["name"], "type": h["original_type"]} for h in zonguldak_hospitals.get("kamu_universite", [])]
-    zonguldak_ozel = [{"name": h["name"], "type": h["original_type"]} for h in zonguldak_hospitals.get("ozel", [])]
+    zonguldak_kamu = [
+        {"id": e.id, "name": e.record["name"], "type": e.record["original_type"]}
+        for e in HOSPITAL_CATALOG.province_entries(HOME_PROVINCE, "turkey", ("kamu_universite",))
+    ]
+    zonguldak_ozel = [
+        {"id": e.id, "name": e.record["name"], "type": e.record["original_type"]}
+        for e in HOSPITAL_CATALOG.province_entries(HOME_PROVINCE, "turkey", ("ozel",))
+    ]
     
     return {
         "healmedy": [
@@ -156,18 +348,13 @@ async def get_hospitals_by_province(province: str, hospital_type: str = "all"):
     Belirli bir ilin hastanelerini getir
     hospital_type: all, kamu_universite, ozel
     """
-    hospitals_by_province = HOSPITALS_TURKEY.get("hospitals_by_province", {})
-    province_hospitals = hospitals_by_province.get(province, {})
-    
-    if hospital_type == "kamu_universite":
-        return province_hospitals.get("kamu_universite", [])
-    elif hospital_type == "ozel":
-        return province_hospitals.get("ozel", [])
+    if hospital_type in ("kamu_universite", "ozel"):
+        categories = (hospital_type,)
     else:
         # Tümü
-        kamu = province_hospitals.get("kamu_universite", [])
-        ozel = province_hospitals.get("ozel", [])
-        return kamu + ozel
+        categories = ("kamu_universite", "ozel")
+    
+    return [e.record for e in HOSPITAL_CATALOG.province_entries(province, "turkey", categories)]
 
 
 @router.get("/hospitals/turkey/search")
@@ -182,40 +369,18 @@ async def search_turkey_hospitals(
     if len(q) < 2 and not province:
         return []
     
-    q_lower = q.lower() if q else ""
-    results = []
-    hospitals_by_province = HOSPITALS_TURKEY.get("hospitals_by_province", {})
-    
-    # Belirli il seçildiyse sadece o ilde ara
-    provinces_to_search = [province] if province else hospitals_by_province.keys()
+    if q:
+        entries = HOSPITAL_CATALOG.search(q, "turkey", limit=limit, province=province)
+    else:
+        entries = HOSPITAL_CATALOG.province_entries(province, "turkey")[:limit]
     
-    for prov in provinces_to_search:
-        if prov not in hospitals_by_province:
-            continue
-            
-        prov_hospitals = hospitals_by_province[prov]
-        
-        for h in prov_hospitals.get("kamu_universite", []):
-            if q_lower in h["name"].lower():
-                results.append({
-                    "name": h["name"],
-                    "type": h["original_type"],
-                    "province": prov,
-                    "category": "kamu_universite"
-                })
-                if len(results) >= limit:
-                    return results
-        
-        for h in prov_hospitals.get("ozel", []):
-            if q_lower in h["name"].lower():
-                results.append({
-                    "name": h["name"],
-                    "type": h["original_type"],
-                    "province": prov,
-                    "category": "ozel"
-                })
-                if len(results) >= limit:
-                    return results
-    
-    return results
-
+    return [
+        {
+            "id": e.id,
+            "name": e.record["name"],
+            "type": e.record["original_type"],
+            "province": e.province,
+            "category": e.category
+        }
+        for e in entries
+    ]
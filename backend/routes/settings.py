@@ -3,7 +3,7 @@ from pydantic import BaseModel
 from typing import Optional
 from database import users_collection
 from models import User, UserUpdate
-from auth_utils import get_current_user
+from auth_utils import get_current_user, get_full_user, invalidate_user_cache
 from datetime import datetime
 
 router = APIRouter()
@@ -23,7 +23,8 @@ class SettingsUpdate(BaseModel):
 async def get_profile(request: Request):
     """Get user profile"""
     user = await get_current_user(request)
-    return user
+    # Auth cache'indeki kullanıcıda profil fotoğrafı yok, profil için tam kaydı oku
+    return await get_full_user(user.id) or user
 
 @router.patch("/profile", response_model=User)
 async def update_profile(data: UserUpdate, request: Request):
@@ -42,6 +43,8 @@ async def update_profile(data: UserUpdate, request: Request):
     if not result:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_cache(user.id)
+    
     result["id"] = result.pop("_id")
     return User(**result)
 
@@ -65,6 +68,8 @@ async def update_signature(data: SignatureUpdate, request: Request):
     if not result:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_cache(user.id)
+    
     result["id"] = result.pop("_id")
     return {"message": "Signature updated successfully", "user": User(**result)}
 
@@ -6,10 +6,13 @@ from auth_utils import get_current_user, require_roles
 from datetime import datetime, timedelta
 from pydantic import BaseModel, validator
 from utils.timezone import get_turkey_time
+from services import dashboard_stats
+from services.token_directory import token_directory
 import base64
 import uuid
 import logging
 import pytz
+from pymongo import UpdateOne
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +59,75 @@ def serialize_assignment(assignment):
     
     return assignment
 
+
+# Vardiya değişim saati: bu saatten önce dünkü (24 saatlik) vardiyalar hala aktiftir
+SHIFT_CHANGE_HOUR = 8
+ACTIVE_ASSIGNMENT_STATUSES = ["pending", "started"]
+
+
+def parse_assignment_date(value) -> Optional[datetime]:
+    """shift_date/end_date değerini naive datetime'a çevir (eski string formatlar dahil)"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str) and value:
+        try:
+            if 'T' in value:
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+            return datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            return None
+    return None
+
+
+def active_assignments_query(turkey_now: datetime) -> dict:
+    """
+    Şu an aktif atamalar için index'li sorgu (status + shift_date / end_date)
+    08:00'dan sonra: sadece bugün başlayan vardiyalar
+    08:00'dan önce: bugünü kapsayan vardiyalar (end_date yoksa shift_date günü)
+    """
+    today = turkey_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+    starts_today = {"status": {"$in": ACTIVE_ASSIGNMENT_STATUSES}, "shift_date": {"$gte": today, "$lt": tomorrow}}
+    
+    if turkey_now.hour >= SHIFT_CHANGE_HOUR:
+        return starts_today
+    return {"$or": [
+        {**starts_today, "end_date": None},
+        {"status": {"$in": ACTIVE_ASSIGNMENT_STATUSES}, "end_date": {"$gte": today}, "shift_date": {"$lt": tomorrow}},
+    ]}
+
+
+async def migrate_assignment_dates() -> dict:
+    """
+    String olarak saklanmış shift_date/end_date değerlerini datetime'a çevir (idempotent)
+    Çözülemeyen shift_date olduğu gibi bırakılır; boş/çözülemeyen end_date None olur
+    (eski davranış: end_date yoksa shift_date günü kabul edilir).
+    """
+    cursor = shift_assignments_collection.find(
+        {"$or": [{"shift_date": {"$type": "string"}}, {"end_date": {"$type": "string"}}]},
+        {"shift_date": 1, "end_date": 1}
+    )
+    operations = []
+    invalid = []
+    async for doc in cursor:
+        update = {}
+        if isinstance(doc.get("shift_date"), str):
+            shift_date = parse_assignment_date(doc["shift_date"])
+            if shift_date:
+                update["shift_date"] = shift_date
+            else:
+                invalid.append(doc["_id"])
+        if isinstance(doc.get("end_date"), str):
+            update["end_date"] = parse_assignment_date(doc["end_date"])
+        if update:
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+    
+    if operations:
+        await shift_assignments_collection.bulk_write(operations, ordered=False)
+    if invalid:
+        logger.warning(f"Tarihi çözülemeyen vardiya atamaları: {invalid[:20]}")
+    return {"migrated": len(operations), "invalid": invalid}
+
 @router.get("/debug/data-check")
 async def debug_data_check(request: Request):
     """Debug endpoint to check users and shifts data"""
@@ -353,76 +425,33 @@ async def get_today_assignments(request: Request):
     """Get today's shift assignments - visible to all users"""
     await get_current_user(request)  # Just verify user is logged in
     
-    from database import users_collection
-    from datetime import timedelta
-    
     # Türkiye saati (UTC+3) kullan
     turkey_now = get_turkey_time()
-    today = turkey_now.date()
-    today_str = today.isoformat()
-    current_hour = turkey_now.hour
-    
-    # Saat 08:00'dan sonra mı? (Vardiya değişim saati)
-    is_after_shift_change = current_hour >= 8
-    yesterday = today - timedelta(days=1)
+    today_str = turkey_now.date().isoformat()
     
-    logger.info(f"Bugünkü atamalar sorgusu - Bugün (TR): {today}, Saat: {current_hour}:00, Vardiya değişti mi: {is_after_shift_change}")
-    
-    # Find all assignments that include today
-    # Either: shift_date is today OR (shift_date <= today AND end_date >= today)
-    all_assignments = await shift_assignments_collection.find({
-        "status": {"$in": ["pending", "started"]}
-    }).to_list(1000)
+    today_assignments = await shift_assignments_collection.find(
+        active_assignments_query(turkey_now)
+    ).to_list(None)
     
-    # Filter assignments that are active today
-    today_assignments = []
-    for assignment in all_assignments:
-        shift_date_str = assignment.get("shift_date", "")
-        end_date_str = assignment.get("end_date", "")
-        
-        # Parse shift date
-        if isinstance(shift_date_str, datetime):
-            shift_date = shift_date_str.date()
-        elif isinstance(shift_date_str, str):
-            try:
-                if 'T' in shift_date_str:
-                    shift_date = datetime.fromisoformat(shift_date_str.replace('Z', '+00:00')).date()
-                else:
-                    shift_date = datetime.strptime(shift_date_str, "%Y-%m-%d").date()
-            except:
-                continue
-        else:
-            continue
-        
-        # Parse end date
-        end_date = shift_date  # Default to same day
-        if end_date_str:
-            if isinstance(end_date_str, datetime):
-                end_date = end_date_str.date()
-            elif isinstance(end_date_str, str):
-                try:
-                    if 'T' in end_date_str:
-                        end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')).date()
-                    else:
-                        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-                except:
-                    pass
-        
-        # Saat 08:00'dan sonra: sadece bugünkü vardiyaları göster
-        # Saat 08:00'dan önce: hem dünkü (devam eden) hem bugünkü vardiyaları göster
-        if is_after_shift_change:
-            # Saat 08:00'dan sonra - sadece bugün başlayan vardiyalar
-            if shift_date == today:
-                today_assignments.append(assignment)
-        else:
-            # Saat 08:00'dan önce - bugün geçerli olan tüm vardiyalar
-            if shift_date <= today <= end_date:
-                today_assignments.append(assignment)
+    # Kullanıcı ve araç bilgilerini toplu çek
+    user_ids = list({a.get("user_id") for a in today_assignments if a.get("user_id")})
+    vehicle_ids = list({a.get("vehicle_id") for a in today_assignments
+                        if a.get("vehicle_id") and a.get("location_type") == "arac"})
+    users_map = {}
+    if user_ids:
+        async for user_doc in users_collection.find(
+            {"_id": {"$in": user_ids}}, {"name": 1, "role": 1, "profile_photo": 1}
+        ):
+            users_map[user_doc["_id"]] = user_doc
+    vehicles_map = {}
+    if vehicle_ids:
+        async for vehicle in vehicles_collection.find({"_id": {"$in": vehicle_ids}}, {"plate": 1, "type": 1}):
+            vehicles_map[vehicle["_id"]] = vehicle
     
     # Enrich with user information
     enriched_assignments = []
     for assignment in today_assignments:
-        user_doc = await users_collection.find_one({"_id": assignment.get("user_id")})
+        user_doc = users_map.get(assignment.get("user_id"))
         serialized = serialize_assignment(assignment)
         if user_doc:
             serialized["user_name"] = user_doc.get("name", "Bilinmiyor")
@@ -438,12 +467,10 @@ async def get_today_assignments(request: Request):
     
     # Get vehicle info for vehicle assignments
     for assignment in vehicle_assignments:
-        vehicle_id = assignment.get("vehicle_id")
-        if vehicle_id:
-            vehicle = await vehicles_collection.find_one({"_id": vehicle_id})
-            if vehicle:
-                assignment["vehicle_plate"] = vehicle.get("plate", "")
-                assignment["vehicle_type"] = vehicle.get("type", "")
+        vehicle = vehicles_map.get(assignment.get("vehicle_id"))
+        if vehicle:
+            assignment["vehicle_plate"] = vehicle.get("plate", "")
+            assignment["vehicle_type"] = vehicle.get("type", "")
     
     return {
         "date": today_str,
@@ -775,10 +802,7 @@ async def admin_start_shift(assignment_id: str, request: Request):
         if vehicle:
             vehicle_plate = vehicle.get("plate")
             # Update vehicle status to "gorevde"
-            await vehicles_collection.update_one(
-                {"_id": vehicle_id},
-                {"$set": {"status": "gorevde", "updated_at": get_turkey_time()}}
-            )
+            await dashboard_stats.set_vehicle_status(vehicle_id, {"status": "gorevde", "updated_at": get_turkey_time()})
     
     # Create shift
     new_shift = Shift(
@@ -871,10 +895,7 @@ async def admin_end_shift(assignment_id: str, request: Request):
         # Update vehicle status back to "musait"
         vehicle_id = assignment.get("vehicle_id")
         if vehicle_id:
-            await vehicles_collection.update_one(
-                {"_id": vehicle_id},
-                {"$set": {"status": "musait", "updated_at": get_turkey_time()}}
-            )
+            await dashboard_stats.set_vehicle_status(vehicle_id, {"status": "musait", "updated_at": get_turkey_time()})
     
     # Update assignment status
     await shift_assignments_collection.update_one(
@@ -926,12 +947,14 @@ async def import_december_2024_shifts(request: Request):
         if existing:
             return existing["_id"], False
         user_id = str(uuid.uuid4())
-        await users_collection.insert_one({
+        user_doc = {
             "_id": user_id, "email": email, "name": name, "role": role,
             "password_hash": hashlib.sha256("123456".encode()).hexdigest(),
             "is_active": True, "phone": "",
             "created_at": get_turkey_time(), "updated_at": get_turkey_time()
-        })
+        }
+        await users_collection.insert_one(user_doc)
+        token_directory.put_user(user_doc)
         return user_id, True
     
     async def get_vehicle_id(plate):
@@ -944,6 +967,7 @@ async def import_december_2024_shifts(request: Request):
             "km": 0, "qr_code": str(uuid.uuid4()),
             "created_at": get_turkey_time(), "updated_at": get_turkey_time()
         })
+        await dashboard_stats.record_vehicle_transition(None, "musait")
         return vehicle_id
     
     SCHEDULE = {
@@ -1090,36 +1114,12 @@ async def start_shift(data: ShiftStart, request: Request):
     # Filter to find an assignment that is valid for today
     valid_assignment = None
     for assignment in all_assignments:
-        shift_date_str = assignment.get("shift_date", "")
-        end_date_str = assignment.get("end_date", "")
-        
-        # Parse shift date
-        if isinstance(shift_date_str, datetime):
-            shift_date = shift_date_str.date()
-        elif isinstance(shift_date_str, str):
-            try:
-                if 'T' in shift_date_str:
-                    shift_date = datetime.fromisoformat(shift_date_str.replace('Z', '+00:00')).date()
-                else:
-                    shift_date = datetime.strptime(shift_date_str, "%Y-%m-%d").date()
-            except:
-                continue
-        else:
+        shift_date = parse_assignment_date(assignment.get("shift_date"))
+        if not shift_date:
             continue
-        
-        # Parse end date
-        end_date = shift_date  # Default to same day
-        if end_date_str:
-            if isinstance(end_date_str, datetime):
-                end_date = end_date_str.date()
-            elif isinstance(end_date_str, str):
-                try:
-                    if 'T' in end_date_str:
-                        end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')).date()
-                    else:
-                        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-                except:
-                    pass
+        shift_date = shift_date.date()
+        end_date = parse_assignment_date(assignment.get("end_date"))
+        end_date = end_date.date() if end_date else shift_date  # Default to same day
         
         # Check if today OR yesterday falls within the assignment period
         # (Gece yarısı toleransı - vardiya gece yarısını geçebilir)
@@ -6,9 +6,14 @@ Vaka bazlı ilaç kullanımı ve stoktan düşme
 """
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from typing import Optional, List
 from datetime import datetime, timedelta
+import asyncio
+import codecs
 import uuid
 
 import json
@@ -23,7 +28,8 @@ from database import (
     vehicles_collection
 )
 from auth_utils import get_current_user, require_roles
-from services.its_service import parse_datamatrix, get_its_service
+from services.its_service import parse_datamatrix, parse_datamatrix_many, get_its_service
+from utils.text_search import TextSearchIndex
 
 # İlaç barkod veritabanını yükle
 MEDICATIONS_BARCODE_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'medications_barcode.json')
@@ -42,6 +48,25 @@ def get_medications_barcode_db():
             _medications_cache = {}
     return _medications_cache
 
+
+_medications_search_index = None
+
+def get_medications_search_index() -> TextSearchIndex:
+    """
+    İlaç adı arama index'i
+    Startup'ta warm_medications_search_index() ile kurulur; burada sadece kurulmamışsa (ör. script) kurulur.
+    """
+    global _medications_search_index
+    if _medications_search_index is None:
+        _medications_search_index = TextSearchIndex(get_medications_barcode_db().items())
+        print(f"[INFO] Built medication search index: {len(_medications_search_index)} products")
+    return _medications_search_index
+
+
+async def warm_medications_search_index():
+    """~22 bin ürünlük index'i (~0.6 sn) event loop dışında kur; ilk autocomplete isteği API'yi bekletmesin"""
+    await asyncio.to_thread(get_medications_search_index)
+
 router = APIRouter()
 
 # MongoDB collections
@@ -116,6 +141,68 @@ class CaseMedicationByBarcodeRequest(BaseModel):
 # KAREKOD İLE STOK GİRİŞİ
 # ============================================================================
 
+def _expiry_datetime(expiry_str: Optional[str]) -> Optional[datetime]:
+    """parse_datamatrix çıktısındaki SKT (YYYY-MM-DD) -> datetime"""
+    if not expiry_str:
+        return None
+    try:
+        return datetime.strptime(expiry_str, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _build_stock_documents(
+    parsed: dict,
+    serial: str,
+    drug_name: str,
+    manufacturer_name: Optional[str],
+    location: str,
+    location_detail: Optional[str],
+    user,
+    barcode: str
+) -> tuple:
+    """Karekod stok kaydı + ana stok kaydı (Stok Yönetimi sayfası için) oluştur"""
+    expiry_date = _expiry_datetime(parsed.get("expiry_date"))
+    
+    stock_item = BarcodeStockItem(
+        gtin=parsed.get("gtin") or "",
+        serial_number=serial,
+        lot_number=parsed.get("lot_number"),
+        expiry_date=expiry_date,
+        expiry_date_str=parsed.get("expiry_date"),
+        name=drug_name,
+        manufacturer_name=manufacturer_name,
+        location=location,
+        location_detail=location_detail,
+        status="available",
+        added_by=user.id,
+        added_by_name=user.name,
+        raw_barcode=barcode
+    )
+    
+    now = datetime.utcnow()
+    main_stock_item = {
+        "_id": str(uuid.uuid4()),
+        "name": drug_name,
+        "code": parsed.get("gtin", "")[:8] if parsed.get("gtin") else serial[:8],
+        "gtin": parsed.get("gtin"),
+        "quantity": 1,  # Her karekod 1 adet
+        "min_quantity": 1,
+        "location": location,
+        "location_detail": location_detail,
+        "lot_number": parsed.get("lot_number"),
+        "serial_number": serial,
+        "expiry_date": expiry_date,
+        "qr_code": stock_item.id,  # Karekod stok ID'si ile bağla
+        "unit": "adet",
+        "created_at": now,
+        "updated_at": now,
+        "barcode_stock_id": stock_item.id  # Karekod stoğu ile ilişkilendir
+    }
+    
+    return stock_item, main_stock_item
+
+
 @router.post("/add")
 async def add_stock_by_barcode(request: Request):
     """
@@ -230,72 +317,18 @@ async def add_stock_by_barcode(request: Request):
             drug_name = f"Ürün #{serial[-8:]}"  # Son 8 karakter
         logging.warning(f"Drug name not found, using default: {drug_name}")
     
-    # Expiry date parse - artık YYYY-MM-DD formatında geliyor
-    expiry_date = None
-    if parsed.get("expiry_date"):
-        try:
-            exp_str = parsed["expiry_date"]
-            # Eğer YYYY-MM-DD formatındaysa
-            if '-' in exp_str:
-                parts = exp_str.split('-')
-                expiry_date = datetime(int(parts[0]), int(parts[1]), int(parts[2]))
-            # Eğer YYMMDD formatındaysa (eski format)
-            elif len(exp_str) == 6:
-                year = int(exp_str[0:2])
-                month = int(exp_str[2:4])
-                day = int(exp_str[4:6])
-                
-                if year < 70:
-                    year += 2000
-                else:
-                    year += 1900
-                
-                if day == 0:
-                    day = 28
-                
-                expiry_date = datetime(year, month, day)
-        except Exception as e:
-            logging.warning(f"Could not parse expiry date: {parsed.get('expiry_date')} - {e}")
-    
-    # Yeni karekod stok kaydı oluştur
-    stock_item = BarcodeStockItem(
-        gtin=parsed.get("gtin", ""),
-        serial_number=serial,
-        lot_number=parsed.get("lot_number"),
-        expiry_date=expiry_date,
-        expiry_date_str=parsed.get("expiry_date"),
-        name=drug_name,
-        manufacturer_name=manufacturer_name,
-        location=location,
-        location_detail=location_detail,
-        status="available",
-        added_by=user.id,
-        added_by_name=user.name,
-        raw_barcode=barcode
+    stock_item, main_stock_item = _build_stock_documents(
+        parsed, serial, drug_name, manufacturer_name, location, location_detail, user, barcode
     )
     
-    await barcode_stock_collection.insert_one(stock_item.model_dump(by_alias=True))
+    try:
+        await barcode_stock_collection.insert_one(stock_item.model_dump(by_alias=True))
+    except DuplicateKeyError:
+        # unique (seri, GTIN) index'i: açılmış/bölünmüş kayıt ya da eşzamanlı giriş (toplu girişteki INTAKE_EXISTS)
+        existing = await barcode_stock_collection.find_one({"serial_number": serial, "gtin": parsed.get("gtin")})
+        raise HTTPException(status_code=400, detail=_existing_stock_message(existing or {}))
     
     # ANA STOK COLLECTION'INA DA EKLE (Stok Yönetimi sayfasında görünmesi için)
-    main_stock_item = {
-        "_id": str(uuid.uuid4()),
-        "name": drug_name,
-        "code": parsed.get("gtin", "")[:8] if parsed.get("gtin") else serial[:8],
-        "gtin": parsed.get("gtin"),
-        "quantity": 1,  # Her karekod 1 adet
-        "min_quantity": 1,
-        "location": location,
-        "location_detail": location_detail,
-        "lot_number": parsed.get("lot_number"),
-        "serial_number": serial,
-        "expiry_date": expiry_date,
-        "qr_code": stock_item.id,  # Karekod stok ID'si ile bağla
-        "unit": "adet",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-        "barcode_stock_id": stock_item.id  # Karekod stoğu ile ilişkilendir
-    }
-    
     await stock_collection.insert_one(main_stock_item)
     logging.info(f"Stock item added to main collection: {main_stock_item['_id']}")
     
@@ -307,6 +340,297 @@ async def add_stock_by_barcode(request: Request):
     }
 
 
+# ============================================================================
+# TOPLU KAREKOD GİRİŞİ (Merkez Depo koli/palet kabulü)
+# ============================================================================
+
+BULK_INTAKE_CHUNK_SIZE = int(os.getenv("BULK_INTAKE_CHUNK_SIZE", 500))  # Tek seferde yazılan satır
+BULK_INTAKE_MAX_ROWS = int(os.getenv("BULK_INTAKE_MAX_ROWS", 20000))  # JSON gövdesi için üst sınır
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson")
+DUPLICATE_KEY_ERROR = 11000
+
+# Satır durumları
+INTAKE_ADDED = "added"
+INTAKE_DUPLICATE = "duplicate"  # Aynı yüklemede tekrar okutulmuş
+INTAKE_EXISTS = "exists"  # Daha önce stoğa girilmiş / kullanılmış
+INTAKE_ERROR = "error"
+
+
+def _intake_row(row_no: int, entry) -> dict:
+    """Giriş satırını {"row", "barcode", "name"} biçimine getir (string veya {"barcode", "name"})"""
+    if isinstance(entry, dict):
+        return {"row": row_no, "barcode": str(entry.get("barcode") or "").strip(), "name": entry.get("name")}
+    return {"row": row_no, "barcode": str(entry or "").strip(), "name": None}
+
+
+def _ndjson_row(row_no: int, line: str) -> dict:
+    """NDJSON satırı: JSON string, JSON nesne veya düz karekod metni"""
+    if line[:1] in ('{', '"'):
+        try:
+            return _intake_row(row_no, json.loads(line))
+        except ValueError:
+            return {"row": row_no, "barcode": "", "name": None, "error": "Geçersiz JSON satırı"}
+    return _intake_row(row_no, line)
+
+
+async def _resolve_drug_names(gtins: set) -> dict:
+    """GTIN -> {"name", "manufacturer_name"}: its_drugs'ta tek $in sorgusu, bulunamayanlar İTS cache'inden"""
+    drugs = {}
+    if not gtins:
+        return drugs
+    
+    cursor = db["its_drugs"].find(
+        {"gtin": {"$in": list(gtins)}},
+        {"gtin": 1, "name": 1, "manufacturer_name": 1}
+    )
+    async for drug in cursor:
+        if drug.get("name"):
+            drugs[drug["gtin"]] = {"name": drug["name"], "manufacturer_name": drug.get("manufacturer_name")}
+    
+    missing = gtins - drugs.keys()
+    if missing:
+        service = get_its_service()
+        for gtin in missing:
+            cached = service.get_drug_by_gtin(gtin)
+            if cached and cached.get("name"):
+                drugs[gtin] = {"name": cached["name"], "manufacturer_name": cached.get("manufacturer_name")}
+    
+    return drugs
+
+
+async def _bulk_insert(collection, docs: list) -> dict:
+    """Sırasız bulk_write; başarısız belgeler için index -> writeError döndürür"""
+    if not docs:
+        return {}
+    try:
+        await collection.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+    except BulkWriteError as e:
+        return {err["index"]: err for err in e.details.get("writeErrors", [])}
+    return {}
+
+
+def _existing_stock_message(existing: dict) -> str:
+    if existing.get("status") == "used":
+        return f"Bu ilaç daha önce kullanılmış. Vaka: {existing.get('used_in_case_id')}"
+    return f"Bu ilaç zaten stokta mevcut. Lokasyon: {existing.get('location')} - {existing.get('location_detail') or ''}"
+
+
+async def _intake_chunk(
+    rows: list,
+    location: str,
+    location_detail: Optional[str],
+    user,
+    seen_keys: set
+) -> list:
+    """
+    Bir grup karekodu stoğa al ve satır bazlı rapor döndür (giriş sırasıyla)
+    Grup başına: 1 parse_many, 1 seri sorgusu, 1 its_drugs sorgusu, barcode_stock ve stock için birer bulk_write
+    seen_keys: yükleme boyunca görülen (seri, GTIN) çiftleri (gruplar arası tekrar kontrolü)
+    """
+    reports = []
+    pending = []  # (report, parsed, manual_name)
+    
+    for row, parsed in zip(rows, parse_datamatrix_many([row["barcode"] for row in rows])):
+        barcode = row["barcode"]
+        report = {"row": row["row"], "barcode": barcode, "status": None, "gtin": parsed.get("gtin")}
+        reports.append(report)
+        
+        if row.get("error") or not barcode:
+            report["status"] = INTAKE_ERROR
+            report["error"] = row.get("error") or "Karekod verisi gerekli"
+            continue
+        
+        # Tekil girişle aynı kural: hiçbir şey parse edilemezse ham veri seri numarası olur
+        if not parsed.get("serial_number") and not parsed.get("gtin"):
+            parsed["serial_number"] = f"RAW-{barcode[:20]}"
+        serial = parsed.get("serial_number") or f"UNKNOWN-{uuid.uuid4().hex[:8]}"
+        report["serial_number"] = serial
+        
+        key = (serial, parsed.get("gtin"))
+        if key in seen_keys:
+            report["status"] = INTAKE_DUPLICATE
+            report["error"] = "Bu karekod aynı yüklemede daha önce okutuldu"
+            continue
+        seen_keys.add(key)
+        pending.append((report, parsed, row.get("name")))
+    
+    if not pending:
+        return reports
+    
+    # Kayıtlı seri numaraları - tek sorgu
+    existing = {}
+    cursor = barcode_stock_collection.find(
+        {"serial_number": {"$in": list({report["serial_number"] for report, _, _ in pending})}},
+        {"serial_number": 1, "gtin": 1, "status": 1, "location": 1, "location_detail": 1, "used_in_case_id": 1}
+    )
+    async for doc in cursor:
+        existing[(doc.get("serial_number"), doc.get("gtin"))] = doc
+    
+    new_rows = []
+    for report, parsed, manual_name in pending:
+        found = existing.get((report["serial_number"], parsed.get("gtin")))
+        if found:
+            report["status"] = INTAKE_EXISTS
+            report["existing_status"] = found.get("status")
+            report["error"] = _existing_stock_message(found)
+        else:
+            new_rows.append((report, parsed, manual_name))
+    
+    # İlaç adları - tek sorgu
+    drugs = await _resolve_drug_names({parsed["gtin"] for _, parsed, _ in new_rows if parsed.get("gtin")})
+    
+    barcode_docs = []
+    main_docs = []
+    for report, parsed, manual_name in new_rows:
+        gtin = parsed.get("gtin")
+        drug = drugs.get(gtin) if gtin else None
+        drug_name = (drug or {}).get("name") or manual_name
+        if not drug_name:
+            drug_name = f"İlaç #{gtin[-6:]}" if gtin else f"Ürün #{report['serial_number'][-8:]}"
+        
+        stock_item, main_stock_item = _build_stock_documents(
+            parsed, report["serial_number"], drug_name, (drug or {}).get("manufacturer_name"),
+            location, location_detail, user, report["barcode"]
+        )
+        report["name"] = drug_name
+        report["stock_id"] = stock_item.id
+        barcode_docs.append(stock_item.model_dump(by_alias=True))
+        main_docs.append(main_stock_item)
+    
+    # Karekod stoğu: unique (seri, GTIN) index'i eşzamanlı girişlerde de tekrarı engeller
+    barcode_errors = await _bulk_insert(barcode_stock_collection, barcode_docs)
+    
+    written_main_docs = []
+    written_reports = []
+    for index, ((report, _, _), main_doc) in enumerate(zip(new_rows, main_docs)):
+        error = barcode_errors.get(index)
+        if error is None:
+            written_main_docs.append(main_doc)
+            written_reports.append(report)
+            report["status"] = INTAKE_ADDED
+        elif error.get("code") == DUPLICATE_KEY_ERROR:
+            report["status"] = INTAKE_EXISTS
+            report["error"] = "Bu ilaç zaten stokta mevcut"
+            report.pop("stock_id", None)
+        else:
+            report["status"] = INTAKE_ERROR
+            report["error"] = error.get("errmsg", "Kayıt yazılamadı")
+            report.pop("stock_id", None)
+    
+    main_errors = await _bulk_insert(stock_collection, written_main_docs)
+    for index, error in main_errors.items():
+        written_reports[index]["warning"] = f"Ana stok kaydı yazılamadı: {error.get('errmsg', '')}"
+    
+    return reports
+
+
+def _intake_summary(counts: dict, total: int) -> dict:
+    return {
+        "total": total,
+        "added": counts.get(INTAKE_ADDED, 0),
+        "duplicate": counts.get(INTAKE_DUPLICATE, 0),
+        "exists": counts.get(INTAKE_EXISTS, 0),
+        "error": counts.get(INTAKE_ERROR, 0)
+    }
+
+
+async def _read_ndjson_rows(request: Request) -> list:
+    """
+    NDJSON gövdesini yanıt başlamadan önce oku ve satırlara ayır
+    Gövde StreamingResponse içinde okunamaz: yanıt başlayınca Starlette'in bağlantı kopma
+    dinleyicisi kalan http.request mesajlarını tüketir. Parçalar artımlı decoder ile çözülür
+    (parça sınırına düşen çok baytlı Türkçe karakterler bozulmaz).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    rows = []
+    buffer = ""
+    
+    def add(line: str):
+        line = line.strip()
+        if line:
+            rows.append(_ndjson_row(len(rows) + 1, line))
+    
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            add(line)
+    
+    add(buffer + decoder.decode(b"", final=True))
+    return rows
+
+
+async def _stream_intake(rows: list, location: str, location_detail: Optional[str], user):
+    """Okunmuş NDJSON satırlarını gruplar halinde işle, raporu grup grup NDJSON olarak döndür"""
+    seen_keys = set()
+    counts = {}
+    
+    for start in range(0, len(rows), BULK_INTAKE_CHUNK_SIZE):
+        reports = await _intake_chunk(rows[start:start + BULK_INTAKE_CHUNK_SIZE], location, location_detail, user, seen_keys)
+        for report in reports:
+            counts[report["status"]] = counts.get(report["status"], 0) + 1
+        yield "".join(json.dumps(report, ensure_ascii=False) + "\n" for report in reports)
+    
+    yield json.dumps({"summary": _intake_summary(counts, len(rows))}, ensure_ascii=False) + "\n"
+
+
+@router.post("/bulk-intake")
+async def bulk_intake_barcodes(
+    request: Request,
+    location: str = "merkez_depo",
+    location_detail: Optional[str] = None
+):
+    """
+    Toplu karekod girişi (koli/palet kabulü)
+    Her karekod /add ile aynı kurallarla tek adetlik stok kaydı olur; sonuç satır bazlı raporlanır.
+    
+    JSON: {"barcodes": ["0108699...", {"barcode": "...", "name": "..."}], "location": "...", "location_detail": "..."}
+    NDJSON (Content-Type: application/x-ndjson): her satır bir karekod (düz metin, JSON string veya nesne);
+        lokasyon query parametresiyle verilir; gövde okunduktan sonra rapor grup grup NDJSON olarak döner,
+        son satır özettir.
+    """
+    await require_roles(["operasyon_muduru", "merkez_ofis", "att", "paramedik", "hemsire", "bas_sofor"])(request)
+    user = await get_current_user(request)
+    
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_MEDIA_TYPES:
+        rows = await _read_ndjson_rows(request)
+        return StreamingResponse(
+            _stream_intake(rows, location, location_detail, user),
+            media_type=NDJSON_MEDIA_TYPES[0]
+        )
+    
+    body = await request.json()
+    entries = body.get("barcodes") or []
+    location = body.get("location", location)
+    location_detail = body.get("location_detail", location_detail)
+    
+    if not entries:
+        raise HTTPException(status_code=400, detail="Karekod listesi boş")
+    if len(entries) > BULK_INTAKE_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tek istekte en fazla {BULK_INTAKE_MAX_ROWS} karekod gönderilebilir (daha büyük yüklemeler için NDJSON kullanın)"
+        )
+    
+    rows = [_intake_row(i + 1, entry) for i, entry in enumerate(entries)]
+    seen_keys = set()
+    results = []
+    for start in range(0, len(rows), BULK_INTAKE_CHUNK_SIZE):
+        results.extend(await _intake_chunk(rows[start:start + BULK_INTAKE_CHUNK_SIZE], location, location_detail, user, seen_keys))
+    
+    counts = {}
+    for report in results:
+        counts[report["status"]] = counts.get(report["status"], 0) + 1
+    
+    summary = _intake_summary(counts, len(results))
+    return {
+        "message": f"{summary['added']}/{summary['total']} karekod stoğa eklendi",
+        "summary": summary,
+        "results": results
+    }
+
+
 @router.get("/details/{barcode}")
 async def get_barcode_details(barcode: str, request: Request):
     """
@@ -930,15 +1254,12 @@ async def search_medications(request: Request, q: str = ""):
     if len(q) < 2:
         return {"results": [], "count": 0}
     
-    medications_db = get_medications_barcode_db()
-    q_lower = q.lower()
-    
-    results = []
-    for barcode, name in medications_db.items():
-        if q_lower in name.lower():
-            results.append({"barcode": barcode, "name": name})
-            if len(results) >= 20:  # Limit sonuç sayısı
-                break
+    # Türkçe duyarlı index - sıralı sonuçlar (tam/baştan eşleşme önce)
+    index = get_medications_search_index()
+    results = [
+        {"barcode": index.keys[doc_id], "name": index.texts[doc_id]}
+        for doc_id in index.search(q, limit=20)  # Limit sonuç sayısı
+    ]
     
     return {"results": results, "count": len(results)}
 
@@ -2258,17 +2579,26 @@ async def bulk_add_stock(request: Request):
     
     results = []
     
+    # Karekodlar tek seferde parse edilir (aynı koliden tekrar eden karekodlar bir kez çözülür)
+    parsed_barcodes = {}
+    if category == "ilac":
+        barcodes = [item["barcode"] for item in items if item.get("barcode")]
+        parsed_barcodes = dict(zip(barcodes, parse_datamatrix_many(barcodes)))
+    
+    # Belgeler önce hazırlanır, sonra koleksiyon başına tek bulk_write ile yazılır
+    pending = {"barcode_stock": [], "stock": []}  # (sonuç index'i, belge)
+    
     for item in items:
         try:
             if category == "ilac" and item.get("barcode"):
                 # Karekodlu ilac ekle
-                parsed = parse_datamatrix(item["barcode"])
+                parsed = parsed_barcodes[item["barcode"]]
                 
                 stock_id = str(uuid.uuid4())
                 stock_item = {
                     "_id": stock_id,
-                    "gtin": parsed.get("gtin", ""),
-                    "serial_number": parsed.get("serial_number", f"BULK-{uuid.uuid4().hex[:8]}"),
+                    "gtin": parsed.get("gtin") or "",
+                    "serial_number": parsed.get("serial_number") or f"BULK-{uuid.uuid4().hex[:8]}",
                     "lot_number": parsed.get("lot_number"),
                     "expiry_date_str": parsed.get("expiry_date"),
                     "name": item.get("name", "Bilinmeyen Ilac"),
@@ -2286,7 +2616,7 @@ async def bulk_add_stock(request: Request):
                     "raw_barcode": item["barcode"]
                 }
                 
-                await barcode_stock_collection.insert_one(stock_item)
+                pending["barcode_stock"].append((len(results), stock_item))
                 results.append({"success": True, "name": item.get("name"), "id": stock_id})
                 
             else:
@@ -2307,12 +2637,23 @@ async def bulk_add_stock(request: Request):
                     "added_by_name": user.name,
                 }
                 
-                await stock_collection.insert_one(stock_item)
+                pending["stock"].append((len(results), stock_item))
                 results.append({"success": True, "name": item.get("name"), "id": stock_id})
                 
         except Exception as e:
             results.append({"success": False, "name": item.get("name"), "error": str(e)})
     
+    for collection, docs in ((barcode_stock_collection, pending["barcode_stock"]), (stock_collection, pending["stock"])):
+        errors = await _bulk_insert(collection, [doc for _, doc in docs])
+        for index, error in errors.items():
+            result = results[docs[index][0]]
+            result["success"] = False
+            result.pop("id", None)
+            if error.get("code") == DUPLICATE_KEY_ERROR:
+                result["error"] = "Bu karekod zaten stokta kayıtlı"
+            else:
+                result["error"] = error.get("errmsg", "Kayıt yazılamadı")
+    
     success_count = sum(1 for r in results if r.get("success"))
     
     return {
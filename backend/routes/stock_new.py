@@ -11,6 +11,7 @@ from database import db
 from auth_utils import get_current_user, require_roles
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
 from typing import Literal
 import uuid
 import json
@@ -25,6 +26,9 @@ location_stocks = db.location_stocks_v2  # Yeni koleksiyon
 stock_requests = db.stock_requests_v2
 stock_templates = db.stock_templates_v2
 
+# Koşullu kalem güncellemesi eşzamanlı değişiklik nedeniyle eşleşmezse yeniden deneme sayısı
+LOCATION_ITEM_UPDATE_RETRIES = 5
+
 
 # ============ YARDIMCI FONKSİYONLAR ============
 
@@ -141,6 +145,168 @@ async def cleanup_duplicate_waiting_points():
     return {"deleted": deleted_count, "kept": kept_count}
 
 
+# ============ ATOMİK KALEM GÜNCELLEMELERİ ============
+# items dizisi Python'da değiştirilip geri yazılmaz; her kalem arrayFilters ile sunucuda güncellenir.
+# Böylece aynı lokasyonda eşzamanlı kullanım/sayım birbirinin değişikliğini ezmez.
+
+def _item_filters(names: list) -> list:
+    """Her kalem için ayrı arrayFilters tanımlayıcısı: i0, i1, ..."""
+    return [{f"i{index}.name": name} for index, name in enumerate(names)]
+
+
+async def set_location_item_quantities(location_doc_id: str, quantities: dict) -> int:
+    """
+    Sayım: verilen kalemlerin miktarını tek atomik güncellemeyle ayarla
+    quantities: {ürün adı: yeni miktar}; lokasyonda olmayan kalemler yok sayılır
+    """
+    if not quantities:
+        return 0
+    names = list(quantities)
+    update = {f"items.$[i{index}].quantity": quantities[name] for index, name in enumerate(names)}
+    update["updated_at"] = get_turkey_time()
+    result = await location_stocks.update_one(
+        {"_id": location_doc_id},
+        {"$set": update},
+        array_filters=_item_filters(names)
+    )
+    return result.modified_count
+
+
+async def increment_location_items(location_doc_id: str, quantities: dict) -> int:
+    """Teslimat: mevcut kalemlerin miktarını tek atomik $inc ile artır"""
+    if not quantities:
+        return 0
+    names = list(quantities)
+    result = await location_stocks.update_one(
+        {"_id": location_doc_id},
+        {
+            "$inc": {f"items.$[i{index}].quantity": quantities[name] for index, name in enumerate(names)},
+            "$set": {"updated_at": get_turkey_time()}
+        },
+        array_filters=_item_filters(names)
+    )
+    return result.modified_count
+
+
+async def deduct_location_items(location_doc_id: str, usages: dict) -> dict:
+    """
+    Kullanım: her kalemi ayrı atomik $inc ile düş, miktar eksiye düşmez
+    
+    Stok yeterliyse {quantity >= kullanım} koşuluyla $inc yapılır. Yetersizse kalem 0'a çekilir
+    (eski davranış: max(0, miktar - kullanım)) ve eksik miktar raporlanır.
+    
+    Returns:
+        {"deducted": {ad: düşülen}, "shortages": {ad: karşılanamayan}, "not_found": [ad, ...]}
+    """
+    result = {"deducted": {}, "shortages": {}, "not_found": []}
+    
+    for name, quantity in usages.items():
+        if quantity <= 0:
+            continue
+        
+        for _ in range(LOCATION_ITEM_UPDATE_RETRIES):
+            # 1. Yeterli stok varsa koşullu düş
+            updated = await location_stocks.update_one(
+                {"_id": location_doc_id, "items": {"$elemMatch": {"name": name, "quantity": {"$gte": quantity}}}},
+                {"$inc": {"items.$[it].quantity": -quantity}, "$set": {"updated_at": get_turkey_time()}},
+                array_filters=[{"it.name": name, "it.quantity": {"$gte": quantity}}]
+            )
+            if updated.modified_count:
+                result["deducted"][name] = quantity
+                break
+            
+            # 2. Yetersiz: kalanı oku ve tam o değerden 0'a çek (arada değiştiyse tekrar dene)
+            loc = await location_stocks.find_one(
+                {"_id": location_doc_id, "items.name": name},
+                {"items.$": 1}
+            )
+            if not loc:
+                result["not_found"].append(name)
+                break
+            available = loc["items"][0].get("quantity", 0)
+            if available >= quantity:
+                continue
+            if available <= 0:
+                result["shortages"][name] = quantity
+                break
+            
+            updated = await location_stocks.update_one(
+                {"_id": location_doc_id, "items": {"$elemMatch": {"name": name, "quantity": available}}},
+                {"$set": {"items.$[it].quantity": 0, "updated_at": get_turkey_time()}},
+                array_filters=[{"it.name": name, "it.quantity": available}]
+            )
+            if updated.modified_count:
+                result["deducted"][name] = available
+                result["shortages"][name] = quantity - available
+                break
+        else:
+            logger.warning(f"Stok düşümü tamamlanamadı (yoğun eşzamanlı güncelleme): {location_doc_id} - {name}")
+            result["shortages"][name] = quantity
+    
+    return result
+
+
+async def deduct_location_item_exact(location_doc_id: str, name: str, quantity: int):
+    """
+    Vakada kullanım: kalemi tam miktar kadar atomik düş; stok yetersizse hiç düşme
+    Kalem yoksa 404, yetersizse 400 döner.
+    """
+    updated = await location_stocks.update_one(
+        {"_id": location_doc_id, "items": {"$elemMatch": {"name": name, "quantity": {"$gte": quantity}}}},
+        {"$inc": {"items.$[it].quantity": -quantity}, "$set": {"updated_at": get_turkey_time()}},
+        array_filters=[{"it.name": name, "it.quantity": {"$gte": quantity}}]
+    )
+    if updated.modified_count:
+        return
+    
+    loc = await location_stocks.find_one({"_id": location_doc_id, "items.name": name}, {"items.$": 1})
+    if not loc:
+        raise HTTPException(status_code=404, detail="Ürün bu lokasyonda bulunamadı")
+    raise HTTPException(status_code=400, detail=f"Yetersiz stok. Mevcut: {loc['items'][0].get('quantity', 0)}")
+
+
+async def add_item_to_location(
+    location_id: str,
+    location_type: str,
+    location_name: str,
+    item: dict,
+    quantity: int
+):
+    """
+    Lokasyona kalem ekle: varsa miktarı atomik artır, yoksa diziye ekle (lokasyon yoksa oluştur)
+    item: {"name", "min_quantity", "unit", "category"}
+    """
+    for _ in range(LOCATION_ITEM_UPDATE_RETRIES):
+        updated = await location_stocks.update_one(
+            {"location_id": location_id, "items.name": item["name"]},
+            {"$inc": {"items.$.quantity": quantity}, "$set": {"updated_at": get_turkey_time()}}
+        )
+        if updated.matched_count:
+            return
+        
+        try:
+            await location_stocks.update_one(
+                {"location_id": location_id, "items.name": {"$ne": item["name"]}},
+                {
+                    "$push": {"items": {**item, "quantity": quantity}},
+                    "$set": {"updated_at": get_turkey_time()},
+                    "$setOnInsert": {
+                        "_id": str(uuid.uuid4()),
+                        "location_type": location_type,
+                        "location_name": location_name,
+                        "created_at": get_turkey_time()
+                    }
+                },
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            # Kalem (veya lokasyon) eşzamanlı olarak eklendi - artırmayı tekrar dene
+            continue
+    
+    raise HTTPException(status_code=409, detail="Stok güncellenemedi, lütfen tekrar deneyin")
+
+
 # ============ STOK BAŞLATMA (SEED) ============
 
 async def seed_location_stock(location_id: str, location_type: str, location_name: str):
@@ -407,26 +573,18 @@ async def update_location_stock(location_id: str, request: Request):
         if location_id not in accessible_location_ids:
             raise HTTPException(status_code=403, detail="Bu lokasyona erişim yetkiniz yok")
     
-    loc = await location_stocks.find_one({"location_id": location_id})
+    loc = await location_stocks.find_one({"location_id": location_id}, {"items": 0})
     if not loc:
-        loc = await location_stocks.find_one({"_id": location_id})
+        loc = await location_stocks.find_one({"_id": location_id}, {"items": 0})
     
     if not loc:
         raise HTTPException(status_code=404, detail="Lokasyon bulunamadı")
     
-    # Güncellemeleri uygula
+    # Güncellemeleri uygula (kalem bazlı, diğer kalemlere dokunmadan)
     updates = data.get("items", [])  # [{name, quantity}, ...]
     update_map = {u["name"]: u["quantity"] for u in updates}
     
-    items = loc.get("items", [])
-    for item in items:
-        if item["name"] in update_map:
-            item["quantity"] = update_map[item["name"]]
-    
-    await location_stocks.update_one(
-        {"_id": loc["_id"]},
-        {"$set": {"items": items, "updated_at": get_turkey_time()}}
-    )
+    await set_location_item_quantities(loc["_id"], update_map)
     
     logger.info(f"Stok güncellendi: {user.name} - {loc.get('location_name')} - {len(updates)} ürün")
     
@@ -480,31 +638,31 @@ async def use_from_location(location_id: str, request: Request):
         if location_id not in accessible_location_ids:
             raise HTTPException(status_code=403, detail="Bu lokasyona erişim yetkiniz yok")
     
-    loc = await location_stocks.find_one({"location_id": location_id})
+    loc = await location_stocks.find_one({"location_id": location_id}, {"items": 0})
     if not loc:
-        loc = await location_stocks.find_one({"_id": location_id})
+        loc = await location_stocks.find_one({"_id": location_id}, {"items": 0})
     
     if not loc:
         raise HTTPException(status_code=404, detail="Lokasyon bulunamadı")
     
-    # Kullanımları uygula
+    # Kullanımları uygula (kalem bazlı atomik düşüm)
     usages = data.get("items", [])  # [{name, quantity}, ...]
-    usage_map = {u["name"]: u["quantity"] for u in usages}
-    
-    items = loc.get("items", [])
-    for item in items:
-        if item["name"] in usage_map:
-            new_qty = item["quantity"] - usage_map[item["name"]]
-            item["quantity"] = max(0, new_qty)
+    usage_map = {}
+    for u in usages:
+        usage_map[u["name"]] = usage_map.get(u["name"], 0) + u["quantity"]
     
-    await location_stocks.update_one(
-        {"_id": loc["_id"]},
-        {"$set": {"items": items, "updated_at": get_turkey_time()}}
-    )
+    result = await deduct_location_items(loc["_id"], usage_map)
     
     logger.info(f"Stok kullanımı: {user.name} - {loc.get('location_name')} - {len(usages)} ürün")
+    if result["shortages"]:
+        logger.warning(f"Yetersiz stok: {loc.get('location_name')} - {result['shortages']}")
     
-    return {"success": True, "message": "Stok kullanımı kaydedildi"}
+    return {
+        "success": True,
+        "message": "Stok kullanımı kaydedildi",
+        "shortages": result["shortages"],
+        "not_found": result["not_found"]
+    }
 
 
 @router.get("/my-location")
@@ -848,22 +1006,13 @@ async def deliver_request(request_id: str, request: Request):
     )
     
     # Lokasyon stoğunu güncelle
-    loc = await location_stocks.find_one({"location_id": req["location_id"]})
+    loc = await location_stocks.find_one({"location_id": req["location_id"]}, {"items": 0})
     if loc:
-        items = loc.get("items", [])
-        item_map = {i["name"]: i for i in items}
-        
+        deliveries = {}
         for req_item in req.get("items", []):
-            name = req_item["name"]
-            qty = req_item["quantity"]
-            
-            if name in item_map:
-                item_map[name]["quantity"] += qty
+            deliveries[req_item["name"]] = deliveries.get(req_item["name"], 0) + req_item["quantity"]
         
-        await location_stocks.update_one(
-            {"_id": loc["_id"]},
-            {"$set": {"items": items, "updated_at": get_turkey_time()}}
-        )
+        await increment_location_items(loc["_id"], deliveries)
     
     return {"success": True, "message": "Talep teslim edildi"}
 
@@ -1250,31 +1399,12 @@ async def use_stock_in_case(case_id: str, request: Request):
     if not case:
         raise HTTPException(status_code=404, detail="Vaka bulunamadı")
     
-    # Stok kontrolü ve düşme
-    stock_loc = await location_stocks.find_one({"location_id": source_id})
+    # Stok kontrolü ve düşme (kalem bazlı atomik)
+    stock_loc = await location_stocks.find_one({"location_id": source_id}, {"items": 0})
     if not stock_loc:
         raise HTTPException(status_code=404, detail="Stok lokasyonu bulunamadı")
     
-    items = stock_loc.get("items", [])
-    item_found = False
-    
-    for item in items:
-        if item["name"] == item_name:
-            if item["quantity"] < quantity:
-                raise HTTPException(status_code=400, detail=f"Yetersiz stok: {item['quantity']} adet mevcut")
-            
-            item["quantity"] -= quantity
-            item_found = True
-            break
-    
-    if not item_found:
-        raise HTTPException(status_code=404, detail="Ürün stokta bulunamadı")
-    
-    # Stoku güncelle
-    await location_stocks.update_one(
-        {"_id": stock_loc["_id"]},
-        {"$set": {"items": items, "updated_at": get_turkey_time()}}
-    )
+    await deduct_location_item_exact(stock_loc["_id"], item_name, quantity)
     
     # Kullanım kaydı oluştur (medication_usage koleksiyonuna)
     usage_doc = {
@@ -1329,18 +1459,9 @@ async def remove_case_stock_usage(case_id: str, usage_id: str, request: Request)
     # Stoğa geri ekle
     source_id = usage.get("source_location_id")
     if source_id:
-        stock_loc = await location_stocks.find_one({"location_id": source_id})
+        stock_loc = await location_stocks.find_one({"location_id": source_id}, {"items": 0})
         if stock_loc:
-            items = stock_loc.get("items", [])
-            for item in items:
-                if item["name"] == usage["name"]:
-                    item["quantity"] += usage.get("quantity", 1)
-                    break
-            
-            await location_stocks.update_one(
-                {"_id": stock_loc["_id"]},
-                {"$set": {"items": items, "updated_at": get_turkey_time()}}
-            )
+            await increment_location_items(stock_loc["_id"], {usage["name"]: usage.get("quantity", 1)})
     
     # Kullanım kaydını sil
     await db.medication_usage.delete_one({"_id": usage_id})
@@ -1479,30 +1600,12 @@ async def use_stock_for_case(case_id: str, request: Request):
     if not item_name or not source_id:
         raise HTTPException(status_code=400, detail="item_name ve source_id gerekli")
     
-    # Lokasyon stoğundan düş
-    loc = await location_stocks.find_one({"location_id": source_id})
+    # Lokasyon stoğundan düş (kalem bazlı atomik)
+    loc = await location_stocks.find_one({"location_id": source_id}, {"items": 0})
     if not loc:
         raise HTTPException(status_code=404, detail="Lokasyon bulunamadı")
     
-    items = loc.get("items", [])
-    item_found = False
-    
-    for item in items:
-        if item["name"] == item_name:
-            item_found = True
-            if item["quantity"] < quantity:
-                raise HTTPException(status_code=400, detail=f"Yetersiz stok. Mevcut: {item['quantity']}")
-            item["quantity"] -= quantity
-            break
-    
-    if not item_found:
-        raise HTTPException(status_code=404, detail="Ürün bu lokasyonda bulunamadı")
-    
-    # Lokasyon stoğunu güncelle
-    await location_stocks.update_one(
-        {"_id": loc["_id"]},
-        {"$set": {"items": items, "updated_at": get_turkey_time()}}
-    )
+    await deduct_location_item_exact(loc["_id"], item_name, quantity)
     
     # Vakaya ekle (medications alanına)
     case = await db.cases.find_one({"_id": case_id})
@@ -1522,7 +1625,7 @@ async def use_stock_for_case(case_id: str, request: Request):
         
         await db.cases.update_one(
             {"_id": case_id},
-            {"$set": {"medications": medications}}
+            {"$set": {"medications": medications, "updated_at": get_turkey_time()}}
         )
     
     logger.info(f"Vaka stok kullanımı: {user.name} - {case_id} - {item_name} x{quantity}")
@@ -1559,24 +1662,15 @@ async def remove_case_stock_usage(case_id: str, request: Request):
     # Stoğa iade et
     source_id = med_to_remove.get("source_id")
     if source_id:
-        loc = await location_stocks.find_one({"location_id": source_id})
+        loc = await location_stocks.find_one({"location_id": source_id}, {"items": 0})
         if loc:
-            items = loc.get("items", [])
-            for item in items:
-                if item["name"] == med_to_remove["name"]:
-                    item["quantity"] += med_to_remove.get("quantity", 1)
-                    break
-            
-            await location_stocks.update_one(
-                {"_id": loc["_id"]},
-                {"$set": {"items": items, "updated_at": get_turkey_time()}}
-            )
+            await increment_location_items(loc["_id"], {med_to_remove["name"]: med_to_remove.get("quantity", 1)})
     
     # Vakadan kaldır
     medications = [m for m in medications if m.get("id") != usage_id]
     await db.cases.update_one(
         {"_id": case_id},
-        {"$set": {"medications": medications}}
+        {"$set": {"medications": medications, "updated_at": get_turkey_time()}}
     )
     
     logger.info(f"Vaka stok iadesi: {user.name} - {case_id} - {med_to_remove['name']}")
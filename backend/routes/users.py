@@ -1,10 +1,13 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import List, Optional
 from pydantic import BaseModel, EmailStr
-from database import users_collection, shifts_collection, cases_collection, forms_collection
+from database import users_collection
 from models import User, UserUpdate, UserRole
-from auth_utils import get_current_user, require_roles
-from datetime import datetime
+from auth_utils import get_current_user, require_roles, invalidate_user_cache, clear_auth_cache
+from datetime import datetime, timedelta
+from services import staff_rollups
+from services.token_directory import token_directory
+from services.otp_service import approver_code_index
 import bcrypt
 import uuid
 
@@ -23,84 +26,27 @@ class CreateUserRequest(BaseModel):
 
 @router.get("/staff-performance")
 async def get_staff_performance(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
-    """Get staff performance metrics"""
+    """
+    Get staff performance metrics
+    Günlük özetlerden (staff_daily_stats) toplanır; start_date/end_date gün bazında dahildir.
+    """
     await require_roles(["merkez_ofis", "operasyon_muduru", "bas_sofor"])(request)
     
-    users = await users_collection.find({}, {"password_hash": 0}).to_list(1000)
+    start_day = datetime.fromisoformat(start_date).strftime("%Y-%m-%d") if start_date else None
+    end_day = datetime.fromisoformat(end_date).strftime("%Y-%m-%d") if end_date else None
     
-    # Date filters
-    date_filter = {}
-    if start_date:
-        date_filter["start_time"] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        if "start_time" in date_filter:
-            date_filter["start_time"]["$lte"] = datetime.fromisoformat(end_date)
-        else:
-            date_filter["start_time"] = {"$lte": datetime.fromisoformat(end_date)}
+    users = await users_collection.find(
+        {}, {"name": 1, "email": 1, "role": 1, "phone": 1, "is_active": 1}
+    ).to_list(None)
+    totals = await staff_rollups.sum_staff_rollups(start_day, end_day)
     
     performance = []
     
     for user in users:
-        # Get user's shifts
-        shift_query = {"user_id": user["_id"]}
-        if date_filter:
-            shift_query.update(date_filter)
-        
-        shifts = await shifts_collection.find(shift_query).to_list(1000)
-        
-        # Get user's assigned cases
-        case_query = {
-            "$or": [
-                {"assigned_team.driver_id": user["_id"]},
-                {"assigned_team.paramedic_id": user["_id"]},
-                {"assigned_team.att_id": user["_id"]},
-                {"assigned_team.nurse_id": user["_id"]}
-            ]
-        }
-        
-        cases = await cases_collection.find(case_query).to_list(1000)
-        
-        # Calculate shift metrics
-        total_shifts = len(shifts)
-        completed_shifts = [s for s in shifts if s.get("end_time")]
-        total_minutes = sum(shift.get("duration_minutes", 0) for shift in completed_shifts)
-        total_hours = round(total_minutes / 60, 2) if total_minutes > 0 else 0
-        
-        # Calculate case metrics
-        total_cases = len(cases)
-        completed_cases = len([c for c in cases if c.get("status") == "tamamlandi"])
-        
-        # Calculate KM metrics from forms
-        case_km = 0
-        shift_km = 0
-        
-        # Get ambulance case forms submitted by this user
-        ambulance_forms = await forms_collection.find({
-            "form_type": "ambulance_case",
-            "submitted_by": user["_id"]
-        }).to_list(1000)
-        
-        for form in ambulance_forms:
-            form_data = form.get("form_data", {})
-            if form_data.get("startKm") and form_data.get("endKm"):
-                try:
-                    start = int(form_data["startKm"])
-                    end = int(form_data["endKm"])
-                    case_km += (end - start)
-                except (ValueError, TypeError):
-                    pass
-        
-        # Calculate shift KM from handover forms
-        for shift in completed_shifts:
-            handover = shift.get("handover_form")
-            if handover and isinstance(handover, dict):
-                if handover.get("teslimAlinanKm") and handover.get("currentKm"):
-                    try:
-                        start = int(handover["teslimAlinanKm"])
-                        end = int(handover.get("currentKm", start))
-                        shift_km += (end - start)
-                    except (ValueError, TypeError):
-                        pass
+        metrics = totals.get(user["_id"], {})
+        total_minutes = metrics.get("shift_minutes", 0)
+        shift_km = metrics.get("shift_km", 0)
+        case_km = metrics.get("case_km", 0)
         
         non_case_km = shift_km - case_km if shift_km > case_km else 0
         efficiency_rate = round((case_km / shift_km * 100) if shift_km > 0 else 0, 2)
@@ -111,11 +57,11 @@ async def get_staff_performance(request: Request, start_date: Optional[str] = No
             "email": user.get("email"),
             "role": user.get("role"),
             "phone": user.get("phone"),
-            "total_shifts": total_shifts,
-            "completed_shifts": len(completed_shifts),
-            "total_hours": total_hours,
-            "total_cases": total_cases,
-            "completed_cases": completed_cases,
+            "total_shifts": metrics.get("total_shifts", 0),
+            "completed_shifts": metrics.get("completed_shifts", 0),
+            "total_hours": round(total_minutes / 60, 2) if total_minutes > 0 else 0,
+            "total_cases": metrics.get("total_cases", 0),
+            "completed_cases": metrics.get("completed_cases", 0),
             "total_shift_km": shift_km,
             "case_km": case_km,
             "non_case_km": non_case_km,
@@ -128,6 +74,20 @@ async def get_staff_performance(request: Request, start_date: Optional[str] = No
     
     return performance
 
+
+@router.post("/staff-performance/rebuild")
+async def rebuild_staff_performance(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Personel performans özetlerini yeniden hesapla (geçmiş veri düzeltmelerinden sonra)
+    Tarih verilmezse tüm geçmiş yeniden üretilir; end_date dahildir.
+    """
+    await require_roles(["merkez_ofis", "operasyon_muduru"])(request)
+    
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) + timedelta(days=1) if end_date else None
+    report = await staff_rollups.rebuild_staff_rollups(start, end)
+    return {"message": "Personel performans özetleri güncellendi", "report": report}
+
 @router.post("/create", response_model=User)
 async def create_user(data: CreateUserRequest, request: Request):
     """
@@ -165,6 +125,7 @@ async def create_user(data: CreateUserRequest, request: Request):
     user_dict["created_at"] = datetime.utcnow()
     
     await users_collection.insert_one(user_dict)
+    token_directory.put_user(user_dict)
     
     return new_user
 
@@ -251,6 +212,10 @@ async def update_user(user_id: str, data: UserUpdate, request: Request):
     if not result:
         raise HTTPException(status_code=404, detail="User not found")
     
+    invalidate_user_cache(user_id)
+    token_directory.put_user(result)
+    approver_code_index.invalidate()
+    
     result["id"] = result.pop("_id")
     return User(**result)
 
@@ -268,6 +233,7 @@ async def assign_temp_role(user_id: str, role: UserRole, duration_days: int, req
         {"_id": user_id},
         {"$addToSet": {"temp_roles": role}}
     )
+    invalidate_user_cache(user_id)
     
     return {"message": f"Temporary role '{role}' assigned for {duration_days} days"}
 
@@ -280,6 +246,7 @@ async def remove_temp_role(user_id: str, role: UserRole, request: Request):
         {"_id": user_id},
         {"$pull": {"temp_roles": role}}
     )
+    invalidate_user_cache(user_id)
     
     return {"message": f"Temporary role '{role}' removed"}
 
@@ -396,6 +363,10 @@ async def delete_user(user_id: str, request: Request):
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Silme işlemi başarısız oldu")
     
+    invalidate_user_cache(user_id)
+    token_directory.drop_user(user_id)
+    approver_code_index.invalidate()
+    
     return {
         "message": f"Kullanıcı '{user_doc.get('name')}' başarıyla silindi",
         "deleted_user_id": user_id,
@@ -450,6 +421,7 @@ async def bulk_create_users(users_data: List[BulkUserCreate], request: Request):
             }
             
             await users_collection.insert_one(user_doc)
+            token_directory.put_user(user_doc)
             results["created"] += 1
             results["created_users"].append({"email": u.email, "name": u.name})
             
@@ -489,6 +461,8 @@ async def bulk_delete_users(data: BulkDeleteRequest, request: Request):
                 continue
             
             await users_collection.delete_one({"_id": user_id})
+            invalidate_user_cache(user_id)
+            token_directory.drop_user(user_id)
             results["deleted"] += 1
             results["deleted_names"].append(user_doc.get("name"))
             
@@ -522,6 +496,8 @@ async def delete_all_except(request: Request, keep_ids: str = ""):
         return {"deleted": 0, "message": "Silinecek kullanıcı yok"}
     
     result = await users_collection.delete_many({"_id": {"$in": delete_ids}})
+    clear_auth_cache()
+    token_directory.invalidate()
     
     return {
         "deleted": result.deleted_count,
@@ -3,6 +3,10 @@ from typing import List, Optional
 from database import vehicles_collection, cases_collection, users_collection, shifts_collection, forms_collection, vehicle_current_locations_collection
 from models import Vehicle, VehicleCreate, VehicleUpdate
 from auth_utils import get_current_user, require_roles
+from services import dashboard_stats
+from services.fleet_positions import fleet_positions
+from services.gps_ingest import gps_ingest
+from pymongo import ReturnDocument
 from datetime import datetime
 
 router = APIRouter()
@@ -90,6 +94,7 @@ async def create_vehicle(request: Request):
         vehicle_dict = new_vehicle.model_dump(by_alias=True)
         
         await vehicles_collection.insert_one(vehicle_dict)
+        await dashboard_stats.record_vehicle_transition(None, vehicle_dict.get("status"))
         
         logger.info(f"Vehicle created successfully: {new_vehicle.id}")
         return new_vehicle
@@ -168,15 +173,22 @@ async def update_vehicle(vehicle_id: str, data: VehicleUpdate, request: Request)
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await vehicles_collection.find_one_and_update(
+    before = await vehicles_collection.find_one_and_update(
         {"_id": vehicle_id},
         {"$set": update_data},
-        return_document=True
+        return_document=ReturnDocument.BEFORE
     )
     
-    if not result:
+    if not before:
         raise HTTPException(status_code=404, detail="Vehicle not found")
     
+    if "status" in update_data:
+        await dashboard_stats.record_vehicle_transition(before.get("status"), update_data["status"])
+    if "plate" in update_data:
+        gps_ingest.forget_vehicle(vehicle_id)
+        fleet_positions.set_plate(vehicle_id, update_data["plate"])
+    
+    result = {**before, **update_data}
     result["id"] = result.pop("_id")
     return result
 
@@ -197,10 +209,13 @@ async def delete_vehicle(vehicle_id: str, request: Request):
             detail="Bu araçta aktif vardiya var. Önce vardiyayı bitirin."
         )
     
-    result = await vehicles_collection.delete_one({"_id": vehicle_id})
+    deleted = await vehicles_collection.find_one_and_delete({"_id": vehicle_id}, projection={"status": 1})
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Araç bulunamadı")
+    await dashboard_stats.record_vehicle_transition(deleted.get("status"), None)
+    gps_ingest.forget_vehicle(vehicle_id)
+    fleet_positions.forget_vehicle(vehicle_id)
     
     return {"message": "Araç başarıyla silindi"}
 
@@ -524,6 +539,7 @@ async def update_station_codes(request: Request):
                     "updated_at": datetime.utcnow()
                 }
                 await vehicles_collection.insert_one(new_vehicle)
+                await dashboard_stats.record_vehicle_transition(None, new_vehicle["status"])
                 results["created"].append(f"{plate} ({station_code})")
         except Exception as e:
             results["errors"].append(f"{plate}: {str(e)}")
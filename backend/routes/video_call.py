@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from auth_utils import get_current_user
 from database import cases_collection
+from utils.timezone import get_turkey_time
 import os
 import httpx
 from datetime import datetime, timedelta
@@ -54,7 +55,8 @@ async def create_video_room(case_id: str, request: Request):
                 "video_room_id": video_room_id,
                 "video_room_url": f"https://{jitsi_domain}/{video_room_id}",
                 "video_provider": "jitsi",
-                "video_call_active": True
+                "video_call_active": True,
+                "updated_at": get_turkey_time()
             }}
         )
         
@@ -123,7 +125,8 @@ async def create_video_room(case_id: str, request: Request):
                 "video_provider": "daily",
                 "video_call_active": True,
                 "video_call_started_at": datetime.utcnow().isoformat(),
-                "video_call_started_by": user.id
+                "video_call_started_by": user.id,
+                "updated_at": get_turkey_time()
             }}
         )
         
@@ -153,7 +156,8 @@ async def end_video_room(case_id: str, request: Request):
         {"$set": {
             "video_call_active": False,
             "video_call_ended_at": datetime.utcnow().isoformat(),
-            "video_call_ended_by": user.id
+            "video_call_ended_by": user.id,
+            "updated_at": get_turkey_time()
         }}
     )
     
@@ -9,6 +9,7 @@ Merkez Depo Yönetimi (Warehouse Management)
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
 from typing import List, Optional, Literal
 from database import db
 from auth_utils import get_current_user, require_roles
@@ -150,7 +151,7 @@ async def parse_its_qr(qr_code: str) -> dict:
         its_verified = False
         
         try:
-            drug_info = get_drug_info_from_barcode(qr_code)
+            drug_info = get_drug_info_from_barcode(qr_code, parsed=parsed)
             if drug_info:
                 drug_name = drug_info.get("name")
                 its_verified = True
@@ -595,70 +596,49 @@ async def split_warehouse_box(stock_id: str, request: Request):
     if not destination_id or not destination_type:
         raise HTTPException(status_code=400, detail="Hedef lokasyon gerekli")
     
-    # Depo stoğunu bul
-    item = await warehouse_stock.find_one({"_id": stock_id})
-    if not item:
-        raise HTTPException(status_code=404, detail="Depo stok kaydı bulunamadı")
+    # 1. Depo stoğundan koşullu ve atomik düş (kalan yeterliyse; durum aynı güncellemede hesaplanır)
+    item = await warehouse_stock.find_one_and_update(
+        {"_id": stock_id, "remaining_items": {"$gte": quantity_to_split}},
+        [
+            {"$set": {
+                "remaining_items": {"$subtract": ["$remaining_items", quantity_to_split]},
+                "is_opened": True,
+                "updated_at": get_turkey_time()
+            }},
+            {"$set": {
+                "status": {"$cond": [
+                    {"$eq": ["$remaining_items", 0]},
+                    "empty",
+                    {"$cond": [{"$ne": ["$total_items", "$remaining_items"]}, "split", "active"]}
+                ]}
+            }}
+        ],
+        return_document=ReturnDocument.AFTER
+    )
     
-    # Yeterli stok var mı kontrol et
-    if item["remaining_items"] < quantity_to_split:
+    if not item:
+        current = await warehouse_stock.find_one({"_id": stock_id}, {"remaining_items": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Depo stok kaydı bulunamadı")
         raise HTTPException(
             status_code=400, 
-            detail=f"Yetersiz stok. Kalan: {item['remaining_items']} adet"
+            detail=f"Yetersiz stok. Kalan: {current.get('remaining_items', 0)} adet"
         )
     
-    # 1. Depo stoğundan düş
-    new_remaining = item["remaining_items"] - quantity_to_split
-    new_status = "empty" if new_remaining == 0 else ("split" if item["total_items"] != new_remaining else "active")
+    # 2. Hedef lokasyona ekle (stock_new sistemine, kalem bazlı atomik)
+    from routes.stock_new import add_item_to_location
     
-    await warehouse_stock.update_one(
-        {"_id": stock_id},
-        {"$set": {
-            "remaining_items": new_remaining,
-            "is_opened": True,
-            "status": new_status,
-            "updated_at": get_turkey_time()
-        }}
-    )
-    
-    # 2. Hedef lokasyona ekle (stock_new sistemine)
-    from routes.stock_new import location_stocks
-    
-    target_stock = await location_stocks.find_one({"location_id": destination_id})
-    if not target_stock:
-        # Yoksa oluştur
-        target_stock = {
-            "_id": str(uuid.uuid4()),
-            "location_id": destination_id,
-            "location_type": destination_type,
-            "location_name": destination_name,
-            "items": [],
-            "created_at": get_turkey_time(),
-            "updated_at": get_turkey_time()
-        }
-        await location_stocks.insert_one(target_stock)
-    
-    # İlacı ekle veya güncelle
-    items = target_stock.get("items", [])
-    found = False
-    for existing_item in items:
-        if existing_item["name"] == item["item_name"]:
-            existing_item["quantity"] += quantity_to_split
-            found = True
-            break
-    
-    if not found:
-        items.append({
+    await add_item_to_location(
+        destination_id,
+        destination_type,
+        destination_name,
+        {
             "name": item["item_name"],
-            "quantity": quantity_to_split,
             "min_quantity": 1,
             "unit": "ADET",
             "category": item.get("category", "ilac")
-        })
-    
-    await location_stocks.update_one(
-        {"location_id": destination_id},
-        {"$set": {"items": items, "updated_at": get_turkey_time()}}
+        },
+        quantity_to_split
     )
     
     # 3. Internal QR generate et
@@ -722,7 +702,7 @@ async def split_warehouse_box(stock_id: str, request: Request):
         "success": True,
         "message": f"{quantity_to_split} adet {destination_name} lokasyonuna gönderildi",
         "internal_qr": internal_qr,
-        "remaining_in_warehouse": new_remaining
+        "remaining_in_warehouse": item["remaining_items"]
     }
 
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GS1 karekod ayrıştırıcı mikro-benchmark'ı
+
+Gerçek karekodlar scripts/run_bulk_stock*.py ve bulk_stock_entry.py içindeki listelerden toplanır.
+Doğruluk kontrolü tests/test_gs1_parser.py'dedir (aynı korpus, eski ayrıştırıcılarla karşılaştırma).
+
+Kullanım:
+    python scripts/benchmark_gs1_parser.py
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+# Backend root'a ekle
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils import gs1
+
+SCRIPTS_DIR = os.path.join(BACKEND_DIR, 'scripts')
+ROUNDS = 20
+
+# Toplu giriş listelerinde bulunmayan biçimler (GS ayracı, parantezli format, sembol öneki, adet)
+EXTRA_CASES = [
+    "]d2010869978875002721ABC123\x1d1726123110LOT1",
+    "010869978875002721ABC123\x1d17261231\x1d10LOT1\x1d3024",
+    "(01)08699788750027(21)ABC123(17)261200(10)LOT 1(30)5",
+    "01086997887500271726123110LOT1\x1d21SN0001",
+    "010869978875002717261231",
+    "8699956000404",
+    "",
+]
+
+
+def load_corpus() -> list:
+    """run_bulk_stock*.py içindeki karekod listelerini topla (sıralı, tekrarsız)"""
+    barcodes = []
+    files = sorted(glob.glob(os.path.join(SCRIPTS_DIR, 'run_bulk_stock*.py')))
+    files.append(os.path.join(SCRIPTS_DIR, 'bulk_stock_entry.py'))
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        for block in re.findall(r'"""(.*?)"""', source, re.S):
+            lines = [line.strip() for line in block.split('\n') if line.strip()]
+            if lines and all(line[:8].isdigit() for line in lines[:3]):
+                barcodes.extend(lines)
+    return list(dict.fromkeys(barcodes)) + EXTRA_CASES
+
+
+def bench(corpus: list):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for barcode in corpus:
+            gs1.parse(barcode)
+    single = (time.perf_counter() - start) / (ROUNDS * len(corpus))
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        gs1.parse_many(corpus)
+    batch = (time.perf_counter() - start) / (ROUNDS * len(corpus))
+
+    print("\nOrtalama süre:")
+    print(f"  parse        {single * 1e6:8.2f} µs/karekod")
+    print(f"  parse_many   {batch * 1e6:8.2f} µs/karekod")
+
+
+def main():
+    corpus = load_corpus()
+    print(f"{len(corpus)} karekod yüklendi")
+
+    bench(corpus)
+
+
+if __name__ == "__main__":
+    main()
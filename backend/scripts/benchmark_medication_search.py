@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+İlaç adı arama mikro-benchmark'ı
+Eski doğrusal tarama (name.lower() her kayıtta) ile TextSearchIndex'i karşılaştırır
+
+Kullanım:
+    python scripts/benchmark_medication_search.py
+"""
+
+import json
+import os
+import sys
+import time
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.text_search import TextSearchIndex
+
+MEDICATIONS_BARCODE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'medications_barcode.json')
+
+# Autocomplete sırasında tipik olarak gelen sorgular (harf harf)
+QUERIES = ["pa", "par", "paro", "parol", "parol 500", "ası", "aspirin", "ibuprofen", "dekstroz", "serum fizyolojik", "adrenalin", "xyzqw"]
+ROUNDS = 50
+
+
+def linear_scan(medications_db: dict, q: str, limit: int = 20) -> list:
+    q_lower = q.lower()
+    results = []
+    for barcode, name in medications_db.items():
+        if q_lower in name.lower():
+            results.append(barcode)
+            if len(results) >= limit:
+                break
+    return results
+
+
+def bench(label: str, fn) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for q in QUERIES:
+            fn(q)
+    elapsed = (time.perf_counter() - start) / (ROUNDS * len(QUERIES))
+    print(f"  {label:<14} {elapsed * 1000:8.3f} ms/sorgu")
+    return elapsed
+
+
+def main():
+    with open(MEDICATIONS_BARCODE_FILE, 'r', encoding='utf-8') as f:
+        medications_db = json.load(f)
+    print(f"{len(medications_db)} ilaç yüklendi")
+    
+    start = time.perf_counter()
+    index = TextSearchIndex(medications_db.items())
+    print(f"Index kurulumu: {(time.perf_counter() - start) * 1000:.0f} ms\n")
+    
+    print("Ortalama sorgu süresi:")
+    linear = bench("doğrusal", lambda q: linear_scan(medications_db, q))
+    indexed = bench("index", lambda q: index.search(q, limit=20))
+    print(f"\nHızlanma: {linear / indexed:.1f}x")
+    
+    print("\nÖrnek sonuçlar:")
+    for q in ["parol", "ASPİRİN", "serum fizyolojik"]:
+        names = [index.texts[d] for d in index.search(q, limit=3)]
+        print(f"  {q!r}: {names}")
+
+
+if __name__ == "__main__":
+    main()
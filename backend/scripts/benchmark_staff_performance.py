@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Personel performans raporu benchmark'ı
+300 personel x 1 yıllık tohum veriyle eski kullanıcı başına sorgu döngüsü ile
+günlük özet (staff_daily_stats) yaklaşımını karşılaştırır ve özet toplamlarını
+tohum veriden hesaplanan beklenen değerlerle doğrular.
+
+Veri MONGO_URL üzerinde ayrı bir veritabanına (<DB_NAME>_perf_bench) yazılır ve sonunda silinir.
+
+Kullanım:
+    python scripts/benchmark_staff_performance.py [--staff 300] [--days 365]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import client, db_name, ensure_indexes
+from services.staff_rollups import rebuild_staff_rollups, sum_staff_rollups
+
+ROLES = ["sofor", "paramedik", "att", "hemsire"]
+TEAM_FIELDS = {"sofor": "driver_id", "paramedik": "paramedic_id", "att": "att_id", "hemsire": "nurse_id"}
+CASES_PER_DAY = 60
+BATCH_SIZE = 5000
+
+
+def seed_documents(staff: int, days: int, start: datetime):
+    """Tohum belgeleri ve beklenen kullanıcı toplamlarını üret"""
+    rng = random.Random(42)
+    users = [{
+        "_id": str(uuid.uuid4()), "name": f"Personel {i}", "email": f"p{i}@bench.local",
+        "role": ROLES[i % len(ROLES)], "is_active": True
+    } for i in range(staff)]
+    by_role = defaultdict(list)
+    for user in users:
+        by_role[user["role"]].append(user["_id"])
+
+    expected = defaultdict(lambda: defaultdict(int))
+    shifts, cases, forms = [], [], []
+
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        for user in users:
+            if rng.random() >= 0.35:
+                continue
+            uid = user["_id"]
+            begin = day_start + timedelta(hours=8, minutes=rng.randint(0, 30))
+            completed = day < days - 1 or rng.random() < 0.5
+            km_start = rng.randint(10000, 200000)
+            km_end = km_start + rng.randint(20, 400)
+            shift = {"_id": str(uuid.uuid4()), "user_id": uid, "start_time": begin,
+                     "end_time": None, "duration_minutes": None}
+            expected[uid]["total_shifts"] += 1
+            if completed:
+                shift["end_time"] = begin + timedelta(hours=24)
+                shift["duration_minutes"] = 24 * 60
+                shift["handover_form"] = {"teslimAlinanKm": str(km_start), "currentKm": str(km_end)}
+                expected[uid]["completed_shifts"] += 1
+                expected[uid]["shift_minutes"] += 24 * 60
+                expected[uid]["shift_km"] += km_end - km_start
+            shifts.append(shift)
+
+        for _ in range(CASES_PER_DAY):
+            created = day_start + timedelta(minutes=rng.randint(0, 24 * 60 - 1))
+            team = {TEAM_FIELDS[role]: rng.choice(by_role[role]) for role in ("sofor", "paramedik", "att")}
+            status = "tamamlandi" if rng.random() < 0.9 else "iptal"
+            case_id = str(uuid.uuid4())
+            cases.append({"_id": case_id, "created_at": created, "status": status, "assigned_team": team})
+            for uid in set(team.values()):
+                expected[uid]["total_cases"] += 1
+                expected[uid]["completed_cases"] += status == "tamamlandi"
+
+            km_start = rng.randint(10000, 200000)
+            km_end = km_start + rng.randint(5, 60)
+            submitter = team["paramedic_id"]
+            forms.append({"_id": str(uuid.uuid4()), "form_type": "ambulance_case", "case_id": case_id,
+                          "submitted_by": submitter, "created_at": created,
+                          "form_data": {"startKm": str(km_start), "endKm": str(km_end)}})
+            expected[submitter]["case_km"] += km_end - km_start
+
+    return users, shifts, cases, forms, expected
+
+
+async def insert_batches(collection, docs):
+    for i in range(0, len(docs), BATCH_SIZE):
+        await collection.insert_many(docs[i:i + BATCH_SIZE], ordered=False)
+
+
+async def legacy_report(database, users):
+    """Eski yöntem: kullanıcı başına vardiya, vaka ve form sorgusu (to_list(1000) sınırlı)"""
+    queries = 0
+    for user in users:
+        await database.shifts.find({"user_id": user["_id"]}).to_list(1000)
+        await database.cases.find({"$or": [
+            {f"assigned_team.{field}": user["_id"]} for field in TEAM_FIELDS.values()
+        ]}).to_list(1000)
+        await database.forms.find({"form_type": "ambulance_case", "submitted_by": user["_id"]}).to_list(1000)
+        queries += 3
+    return queries
+
+
+async def timed(label, coro):
+    start = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed * 1000:10.1f} ms")
+    return result
+
+
+async def main(staff: int, days: int) -> int:
+    database = client[f"{db_name}_perf_bench"]
+    start = datetime(2024, 1, 1)
+    users, shifts, cases, forms, expected = seed_documents(staff, days, start)
+    print(f"Tohum: {len(users)} personel, {len(shifts)} vardiya, {len(cases)} vaka, {len(forms)} form")
+
+    try:
+        await insert_batches(database.users, users)
+        await insert_batches(database.shifts, shifts)
+        await insert_batches(database.cases, cases)
+        await insert_batches(database.forms, forms)
+        await ensure_indexes(database)
+
+        print("\nSüreler:")
+        queries = await timed("eski yöntem (kullanıcı başına sorgu)", legacy_report(database, users))
+        await timed("özetleri tam yeniden üret", rebuild_staff_rollups(database=database))
+        totals = await timed("rapor: tüm yıl (özet toplamı)", sum_staff_rollups(database=database))
+        await timed("rapor: son 30 gün (özet toplamı)", sum_staff_rollups(
+            (start + timedelta(days=days - 30)).strftime("%Y-%m-%d"),
+            (start + timedelta(days=days - 1)).strftime("%Y-%m-%d"),
+            database=database
+        ))
+        await timed("son 3 günü yenile (zamanlanmış iş)", rebuild_staff_rollups(
+            start + timedelta(days=days - 3), start + timedelta(days=days), database=database
+        ))
+        print(f"  eski yöntem sorgu sayısı: {queries}, özet raporu: 1 aggregate")
+
+        mismatches = 0
+        for user in users:
+            actual = totals.get(user["_id"], {})
+            for metric, value in expected[user["_id"]].items():
+                if actual.get(metric, 0) != value:
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print(f"  FARK {user['_id']} {metric}: {actual.get(metric, 0)} (beklenen {value})")
+        print(f"\nDoğrulama: {len(users)} personel, {mismatches} fark")
+        return 1 if mismatches else 0
+    finally:
+        await client.drop_database(database.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Personel performans raporu benchmark'ı")
+    parser.add_argument("--staff", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.staff, args.days)))
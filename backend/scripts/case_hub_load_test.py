@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vaka canlı yayını yük testi
+Aynı vakaya çok sayıda eşzamanlı abone bağlar, form yamaları yayınlar ve her abonenin
+tüm yamaları sırasıyla aldığını doğrular; teslim gecikmesinin p50/p99/max değerlerini yazar.
+
+İki mod:
+    - Süreç içi (varsayılan): services.case_hub merkezini doğrudan kullanır, sunucu gerekmez
+    - Uzak (--url): çalışan sunucuya WebSocket ile bağlanır ve PATCH /medical-form gönderir.
+      Yamalar formdaki "loadtest_probe" alanına yazılır; test vakası kullanın.
+
+Kullanım:
+    python scripts/case_hub_load_test.py [--subscribers 200] [--patches 50]
+    python scripts/case_hub_load_test.py --url http://localhost:8001 --token <JWT> --case-id <id>
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PATCH_INTERVAL_SECONDS = 0.02
+RECEIVE_TIMEOUT_SECONDS = 10
+
+
+def report(latencies: list, received: dict, patches: int) -> int:
+    """Gecikme özetini yaz; eksik/sırasız alan abone varsa 1 döndür"""
+    failed = [name for name, seqs in received.items() if seqs != list(range(patches))]
+    if latencies:
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f"  teslim: {len(latencies)} mesaj, p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    print(f"\nDoğrulama: {len(received)} abone, {len(failed)} eksik/sırasız")
+    for name in failed[:10]:
+        print(f"  HATA {name}: {len(received[name])}/{patches} yama")
+    return 1 if failed else 0
+
+
+async def run_in_process(subscribers: int, patches: int) -> int:
+    from services.case_hub import CaseHub
+
+    hub = CaseHub()
+    await hub.start()
+    case_id = "load-test-case"
+    latencies, received = [], {}
+    ready = asyncio.Event()
+    connected = 0
+
+    async def subscriber(index: int):
+        nonlocal connected
+        seqs = received[f"abone-{index}"] = []
+        async with hub.subscribe(case_id, f"user-{index}") as subscription:
+            connected += 1
+            if connected == subscribers:
+                ready.set()
+            while len(seqs) < patches:
+                message = await subscription.next(RECEIVE_TIMEOUT_SECONDS)
+                if message is None:
+                    return
+                event = json.loads(message)
+                if event["type"] != "form_patch":
+                    continue
+                latencies.append(time.perf_counter() - event["changes"]["loadtest_probe.sent"])
+                seqs.append(event["changes"]["loadtest_probe.seq"])
+
+    tasks = [asyncio.create_task(subscriber(i)) for i in range(subscribers)]
+    await ready.wait()
+    print(f"{hub.subscriber_count()} abone bağlandı, {patches} yama yayınlanıyor...")
+
+    start = time.perf_counter()
+    for seq in range(patches):
+        await hub.publish(case_id, {
+            "type": "form_patch", "form_version": seq + 1,
+            "changes": {"loadtest_probe.seq": seq, "loadtest_probe.sent": time.perf_counter()}
+        })
+        await asyncio.sleep(PATCH_INTERVAL_SECONDS)
+    await asyncio.gather(*tasks)
+    print(f"  süre: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    await hub.stop()
+    return report(latencies, received, patches)
+
+
+async def run_remote(url: str, token: str, case_id: str, subscribers: int, patches: int) -> int:
+    import httpx
+    import websockets
+
+    ws_url = url.replace("http", "ws", 1).rstrip("/") + f"/api/cases/{case_id}/live"
+    http = httpx.AsyncClient(base_url=url, headers={"Authorization": f"Bearer {token}"})
+    latencies, received = [], {}
+    ready = asyncio.Event()
+    connected = 0
+
+    async def subscriber(index: int):
+        nonlocal connected
+        seqs = received[f"abone-{index}"] = []
+        # Bilet tek kullanımlık: her bağlantı kendi biletini alır
+        response = await http.post("/api/auth/stream-ticket")
+        response.raise_for_status()
+        async with websockets.connect(f"{ws_url}?ticket={response.json()['ticket']}", max_queue=None) as socket:
+            snapshot = json.loads(await socket.recv())
+            if snapshot.get("type") != "snapshot":
+                print(f"  HATA abone-{index}: ilk mesaj snapshot değil: {snapshot}")
+                return
+            connected += 1
+            if connected == subscribers:
+                ready.set()
+            while len(seqs) < patches:
+                try:
+                    event = json.loads(await asyncio.wait_for(socket.recv(), RECEIVE_TIMEOUT_SECONDS))
+                except asyncio.TimeoutError:
+                    return
+                probe = event.get("changes", {}).get("loadtest_probe.sent") if event.get("type") == "form_patch" else None
+                if probe is None:
+                    continue
+                latencies.append(time.time() - probe)
+                seqs.append(event["changes"]["loadtest_probe.seq"])
+
+    async with http:
+        tasks = [asyncio.create_task(subscriber(i)) for i in range(subscribers)]
+        try:
+            await asyncio.wait_for(ready.wait(), 30)
+        except asyncio.TimeoutError:
+            print(f"Sadece {connected}/{subscribers} abone bağlanabildi")
+            for task in tasks:
+                task.cancel()
+            return 1
+        print(f"{subscribers} abone bağlandı, {patches} yama gönderiliyor...")
+
+        for seq in range(patches):
+            response = await http.patch(f"/api/cases/{case_id}/medical-form",
+                                        json={"loadtest_probe": {"seq": seq, "sent": time.time()}})
+            response.raise_for_status()
+            await asyncio.sleep(PATCH_INTERVAL_SECONDS)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return report(latencies, received, patches)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vaka canlı yayını yük testi")
+    parser.add_argument("--subscribers", type=int, default=200)
+    parser.add_argument("--patches", type=int, default=50)
+    parser.add_argument("--url", help="Sunucu adresi (verilmezse süreç içi test)")
+    parser.add_argument("--token")
+    parser.add_argument("--case-id")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.token or not args.case_id:
+            parser.error("--url ile --token ve --case-id gerekli")
+        sys.exit(asyncio.run(run_remote(args.url, args.token, args.case_id, args.subscribers, args.patches)))
+    sys.exit(asyncio.run(run_in_process(args.subscribers, args.patches)))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MongoDB index'lerini database.py'deki COLLECTION_INDEXES registry'sine göre oluşturur
+Idempotent - tekrar çalıştırmak güvenlidir
+
+Kullanım:
+    python scripts/ensure_indexes.py           # index'leri oluştur
+    python scripts/ensure_indexes.py --list    # mevcut index'leri listele
+"""
+
+import asyncio
+import sys
+import os
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db, ensure_indexes, COLLECTION_INDEXES
+
+
+async def list_indexes():
+    for collection_name in COLLECTION_INDEXES:
+        info = await db[collection_name].index_information()
+        print(f"\n{collection_name}:")
+        for name, spec in info.items():
+            flags = " (unique)" if spec.get("unique") else ""
+            print(f"  {name}: {spec['key']}{flags}")
+
+
+async def main():
+    if "--list" in sys.argv:
+        await list_indexes()
+        return
+    
+    print("Index'ler oluşturuluyor...")
+    report = await ensure_indexes()
+    
+    failed = 0
+    for collection_name, result in report.items():
+        print(f"  {collection_name}: {len(result['created'])} index")
+        for name, error in result["failed"].items():
+            failed += 1
+            print(f"    HATA {name}: {error}")
+    
+    print(f"\nIslem tamamlandi! {failed} hata")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
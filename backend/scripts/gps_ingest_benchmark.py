@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GPS alım tamponu verim testi
+Aynı ping yükü iki yoldan yazılır ve saniyedeki ping sayısı karşılaştırılır:
+    - eski yol: ping başına vehicles.find_one + insert_one + current location upsert
+    - tampon:   services.gps_ingest (plaka önbelleği, insert_many, araç başına son konum)
+
+Tampon çalışmasından sonra stop() ile boşaltma yapılır ve şunlar doğrulanır:
+    - Tüm ping'ler vehicle_gps_history'ye yazılmıştır (kapanışta kayıp yok)
+    - vehicle_current_locations her araç için son ping'i gösterir
+
+Veri MONGO_URL üzerinde ayrı bir veritabanına (<DB_NAME>_gps_bench) yazılır ve sonunda silinir.
+
+Kullanım:
+    python scripts/gps_ingest_benchmark.py [--vehicles 200] [--pings 20] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import client, db_name, ensure_indexes
+from services.gps_ingest import GPSIngestBuffer
+
+
+def make_pings(vehicles: int, pings: int):
+    """(vehicle_id, sıra, enlem, boylam) - araçlar sırayla ping atar"""
+    base = datetime(2026, 1, 1)
+    for seq in range(pings):
+        for v in range(vehicles):
+            yield f"bench-vehicle-{v}", seq, 41.0 + v * 0.001 + seq * 0.0001, 29.0 + seq * 0.0001, base + timedelta(seconds=seq * 5)
+
+
+def gps_doc(vehicle_id, seq, lat, lng, at, plate):
+    return {
+        "_id": f"gps_{vehicle_id}_{seq}",
+        "vehicle_id": vehicle_id,
+        "vehicle_plate": plate,
+        "latitude": lat,
+        "longitude": lng,
+        "timestamp": at.isoformat(),
+        "created_at": at,
+    }
+
+
+def position(lat, lng, at):
+    return {"last_gps_latitude": lat, "last_gps_longitude": lng, "last_gps_update": at}
+
+
+async def run_bounded(pings, handler, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(ping):
+        async with semaphore:
+            await handler(*ping)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(ping) for ping in pings))
+    return time.perf_counter() - started
+
+
+async def main(vehicles: int, pings: int, concurrency: int) -> int:
+    database = client[f"{db_name}_gps_bench"]
+    total = vehicles * pings
+    errors = []
+
+    try:
+        await ensure_indexes(database)
+        await database.vehicles.insert_many([
+            {"_id": f"bench-vehicle-{v}", "plate": f"34 BNC {v:03d}", "type": "ambulans"} for v in range(vehicles)
+        ])
+
+        # Eski yol
+        async def legacy(vehicle_id, seq, lat, lng, at):
+            vehicle = await database.vehicles.find_one({"_id": vehicle_id})
+            await database.vehicle_gps_history.insert_one(gps_doc(vehicle_id, seq, lat, lng, at, vehicle.get("plate")))
+            await database.vehicle_current_locations.update_one(
+                {"vehicle_id": vehicle_id}, {"$set": position(lat, lng, at)}, upsert=True
+            )
+
+        legacy_elapsed = await run_bounded(make_pings(vehicles, pings), legacy, concurrency)
+        print(f"Eski yol: {total} ping, {legacy_elapsed:.2f} sn, {total / legacy_elapsed:.0f} ping/sn")
+
+        await database.vehicle_gps_history.delete_many({})
+        await database.vehicle_current_locations.delete_many({})
+
+        # Tampon
+        buffer = GPSIngestBuffer(database=database)
+        await buffer.start()
+
+        async def buffered(vehicle_id, seq, lat, lng, at):
+            plate = (await buffer.plates_for([vehicle_id]))[vehicle_id]
+            await buffer.add([gps_doc(vehicle_id, seq, lat, lng, at, plate)], {vehicle_id: position(lat, lng, at)})
+
+        buffered_elapsed = await run_bounded(make_pings(vehicles, pings), buffered, concurrency)
+        drain_started = time.perf_counter()
+        await buffer.stop()
+        drain_elapsed = time.perf_counter() - drain_started
+        stats = buffer.get_stats()
+        print(f"Tampon: {total} ping, {buffered_elapsed:.2f} sn, {total / buffered_elapsed:.0f} ping/sn "
+              f"(+{drain_elapsed * 1000:.0f} ms kapanış boşaltması)")
+        print(f"  {stats['flushes']} toplu yazım, en uzun {stats['max_flush_ms']} ms, "
+              f"{stats['positions_written']} konum güncellemesi")
+        print(f"Hızlanma: {legacy_elapsed / buffered_elapsed:.1f}x")
+
+        stored = await database.vehicle_gps_history.count_documents({})
+        if stored != total:
+            errors.append(f"geçmiş kaydı {stored}/{total}")
+        last_seq = pings - 1
+        async for current in database.vehicle_current_locations.find({}):
+            v = int(current["vehicle_id"].rsplit("-", 1)[1])
+            expected_lat = 41.0 + v * 0.001 + last_seq * 0.0001
+            if abs(current["last_gps_latitude"] - expected_lat) > 1e-9:
+                errors.append(f"{current['vehicle_id']} son konumu eski ping'i gösteriyor")
+                break
+        if stats["buffered"] or stats["dropped"]:
+            errors.append(f"kapanışta tampon boşalmadı: {stats}")
+    finally:
+        await client.drop_database(database.name)
+
+    for error in errors:
+        print(f"  HATA {error}")
+    print(f"\nDoğrulama: {len(errors)} hata")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GPS alım tamponu verim testi")
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--pings", type=int, default=20, help="Araç başına ping")
+    parser.add_argument("--concurrency", type=int, default=50, help="Aynı anda işlenen ping isteği")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.vehicles, args.pings, args.concurrency)))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vardiya atamalarındaki string shift_date/end_date değerlerini datetime'a çevirir
+("2025-12-14", "2025-12-14T08:00:00", "2025-12-14T05:00:00Z" gibi eski formatlar)
+Idempotent - sunucu açılışında da çalışır; tekrar çalıştırmak güvenlidir
+
+Kullanım:
+    python scripts/migrate_shift_assignment_dates.py
+"""
+
+import asyncio
+import sys
+import os
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.shifts import migrate_assignment_dates
+
+
+async def main():
+    print("Vardiya atama tarihleri dönüştürülüyor...")
+    result = await migrate_assignment_dates()
+    print(f"  {result['migrated']} kayıt güncellendi")
+    for assignment_id in result["invalid"]:
+        print(f"  HATA çözülemeyen shift_date: {assignment_id}")
+
+    print(f"\nIslem tamamlandi! {len(result['invalid'])} hata")
+    if result["invalid"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bildirim outbox kontrolü (yerel sahte FCM göndericisi ile)
+Çok sayıda cihazı olan kullanıcılar ve rol bazlı bir bildirim kuyruğa yazılır, dağıtıcı
+çalıştırılır ve şunlar doğrulanır:
+    - FCM çağrıları en fazla 500 token'lık gruplarla yapılır
+    - "flaky" token'lar tekrar denemede teslim edilir, "invalid" token'lar tekrar denenmez
+    - Tüm kayıtlar "sent" durumuna geçer; gönderim sırasında event loop bloklanmaz
+
+Veri MONGO_URL üzerinde ayrı bir veritabanına (<DB_NAME>_outbox_check) yazılır ve sonunda silinir.
+
+Kullanım:
+    python scripts/notification_outbox_check.py [--users 1200] [--latency 0.2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import client, db_name, ensure_indexes
+from services import notification_outbox as outbox_module
+from services.firebase_service import FakeFCMSender, FCM_MULTICAST_LIMIT, set_fcm_sender
+from services.notification_outbox import NotificationOutbox, STATUS_SENT
+
+ROLES = ["sofor", "att", "paramedik", "doktor"]
+BAD_TOKENS = 10  # Her türden (invalid / flaky) token sayısı
+
+
+def seed_users(count: int):
+    users, expected = [], set()
+    for i in range(count):
+        if i < BAD_TOKENS:
+            token = f"invalid-{i}"
+        elif i < 2 * BAD_TOKENS:
+            token = f"flaky-{i}"
+        else:
+            token = f"token-{i}"
+        if not token.startswith("invalid"):
+            expected.add(token)
+        users.append({
+            "_id": str(uuid.uuid4()),
+            "name": f"Personel {i}",
+            "role": ROLES[i % len(ROLES)],
+            "is_active": True,
+            "fcm_tokens": [{"token": token, "platform": "android"}],
+        })
+    return users, expected
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list):
+    """Event loop bloklanırsa uyanma gecikmesi artar"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - start - 0.01)
+
+
+async def main(user_count: int, latency: float) -> int:
+    database = client[f"{db_name}_outbox_check"]
+    fake = FakeFCMSender(latency=latency)
+    previous_sender = set_fcm_sender(fake)
+    outbox_module.OUTBOX_BACKOFF_SECONDS = 0  # Tekrar denemeleri beklemeden çalıştır
+    outbox = NotificationOutbox(database=database)
+
+    try:
+        users, expected = seed_users(user_count)
+        await database.users.insert_many(users)
+        await ensure_indexes(database)
+
+        all_ids = [u["_id"] for u in users]
+        started = time.perf_counter()
+        await outbox.enqueue("Test", "Tüm kullanıcılar", user_ids=all_ids, data={"case_number": 42})
+        await outbox.enqueue("Test", "Saha rolleri", roles=["sofor", "att"])
+        print(f"Kuyruğa yazma: {(time.perf_counter() - started) * 1000:.1f} ms (2 kayıt, {user_count} kullanıcı)")
+
+        stop, lag = asyncio.Event(), []
+        ticker = asyncio.create_task(measure_loop_lag(stop, lag))
+        started = time.perf_counter()
+        rounds = 0
+        while await outbox.dispatch_due():
+            rounds += 1
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+
+        stats = await outbox.get_stats()
+        metrics = stats["metrics"]
+        print(f"Dağıtım: {elapsed * 1000:.1f} ms, {rounds} tur, {fake.calls} FCM çağrısı, en büyük grup {fake.max_batch}")
+        print(f"Event loop en fazla gecikme: {max(lag) * 1000:.1f} ms (sahte FCM gecikmesi {latency * 1000:.0f} ms)")
+        print(f"Metrikler: {metrics}")
+        print(f"Kuyruk: {stats['queue']}")
+
+        errors = []
+        if fake.max_batch > FCM_MULTICAST_LIMIT:
+            errors.append(f"grup boyutu {fake.max_batch} > {FCM_MULTICAST_LIMIT}")
+        delivered = {token for token, data in fake.sent if data.get("body") == "Tüm kullanıcılar"}
+        if delivered != expected:
+            errors.append(f"teslim edilen {len(delivered)} token, beklenen {len(expected)}")
+        if any(token.startswith("invalid") for token, _ in fake.sent):
+            errors.append("geçersiz token'a gönderim yapıldı")
+        if stats["queue"] != {STATUS_SENT: 2}:
+            errors.append(f"kuyruk durumu beklenmedik: {stats['queue']}")
+        # Geçersiz token'lar her iki kayıtta da (rol kaydında sadece o rollerdekiler) sayılır
+        expected_invalid = BAD_TOKENS + sum(
+            1 for u in users[:BAD_TOKENS] if u["role"] in ("sofor", "att")
+        )
+        if metrics["retries"] < 1 or metrics["invalid_tokens"] != expected_invalid:
+            errors.append(f"tekrar/geçersiz token metriği beklenmedik: {metrics}")
+        if latency and max(lag) > latency:
+            errors.append("FCM çağrısı event loop'u blokladı")
+
+        for error in errors:
+            print(f"  HATA {error}")
+        print(f"\nDoğrulama: {len(errors)} hata")
+        return 1 if errors else 0
+    finally:
+        set_fcm_sender(previous_sender)
+        await client.drop_database(database.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bildirim outbox kontrolü")
+    parser.add_argument("--users", type=int, default=1200)
+    parser.add_argument("--latency", type=float, default=0.2, help="Sahte FCM çağrısı başına gecikme (saniye)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.users, args.latency)))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SMTP bağlantı havuzu kontrolü (yerel aiosmtpd sunucusu ile)
+Yerel bir SMTP sunucusu açılır, EmailService.send_bulk_emails ile toplu gönderim yapılır ve
+şunlar doğrulanır:
+    - Tüm mesajlar teslim edilir, açılan bağlantı sayısı havuz boyutunu aşmaz
+    - Sunucu bağlantıları koparınca havuz yeniden bağlanır ve mesaj kaybolmaz
+    - Boşta kalan bağlantılar NOOP ile sınanır
+
+Gereksinim: pip install aiosmtpd
+
+Kullanım:
+    python scripts/smtp_pool_check.py [--messages 200] [--pool-size 3]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, AuthResult
+
+from services import smtp_pool as pool_module
+from services.email_service import EmailService
+from services.smtp_pool import SMTPPool
+
+
+class CountingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+class TrackingController(Controller):
+    """Açılan bağlantıları sayar, istenince hepsini sunucu tarafından koparır"""
+
+    def __init__(self, handler, **kwargs):
+        super().__init__(
+            handler,
+            authenticator=lambda *args: AuthResult(success=True),
+            auth_require_tls=False,
+            **kwargs
+        )
+        self.sessions = []
+
+    def factory(self):
+        controller = self
+
+        class TrackingSMTP(SMTP):
+            def connection_made(self, transport):
+                controller.sessions.append(transport)
+                super().connection_made(transport)
+
+        return TrackingSMTP(self.handler, **self.SMTP_kwargs)
+
+    def drop_connections(self):
+        for transport in self.sessions:
+            self.loop.call_soon_threadsafe(transport.close)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def main(message_count: int, pool_size: int) -> int:
+    handler = CountingHandler()
+    port = free_port()
+    controller = TrackingController(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    service = EmailService()
+    service.config = {
+        **service.config,
+        "host": "127.0.0.1",
+        "port": port,
+        "use_ssl": False,
+        "username": "check",
+        "password": "check",
+    }
+    service.pool = SMTPPool(service.config, size=pool_size)
+    errors = []
+
+    try:
+        recipients = [{"email": f"user{i}@example.com", "name": f"Personel {i}"} for i in range(message_count)]
+        started = time.perf_counter()
+        results = await service.send_bulk_emails(recipients, "Kontrol", "<p>Merhaba {{name}}</p>", personalize=True)
+        elapsed = time.perf_counter() - started
+        print(f"Toplu gönderim: {message_count} mesaj, {elapsed * 1000:.0f} ms, "
+              f"{service.pool.stats['connections_opened']} bağlantı")
+        if not all(results.values()) or len(handler.messages) != message_count:
+            errors.append(f"toplu gönderim: {len(handler.messages)}/{message_count} teslim")
+        if service.pool.stats["connections_opened"] > pool_size:
+            errors.append(f"{service.pool.stats['connections_opened']} bağlantı > havuz boyutu {pool_size}")
+
+        # Sunucu bağlantıları koparır; sonraki gönderimler yeni bağlantıyla devam etmeli
+        controller.drop_connections()
+        await asyncio.sleep(0.2)
+        before = len(handler.messages)
+        results = await service.send_bulk_emails(recipients[:10], "Kontrol", "<p>Yeniden bağlantı</p>")
+        print(f"Kopma sonrası: {len(handler.messages) - before}/10 teslim, havuz: {service.pool.get_stats()}")
+        if not all(results.values()) or len(handler.messages) - before != 10:
+            errors.append("bağlantı koptuktan sonra mesaj kaybı")
+
+        # Boşta kalan bağlantı NOOP ile sınanmalı
+        pool_module.SMTP_HEALTHCHECK_SECONDS = 0
+        healthchecks = service.pool.stats["healthchecks"]
+        await asyncio.sleep(0.05)
+        if not await service.send_email_async("noop@example.com", "Kontrol", "<p>NOOP</p>"):
+            errors.append("sağlık kontrolü sonrası gönderim başarısız")
+        if service.pool.stats["healthchecks"] <= healthchecks:
+            errors.append("boştaki bağlantı NOOP ile sınanmadı")
+    finally:
+        await service.close()
+        controller.stop()
+
+    for error in errors:
+        print(f"  HATA {error}")
+    print(f"\nDoğrulama: {len(errors)} hata")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMTP bağlantı havuzu kontrolü")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.messages, args.pool_size)))
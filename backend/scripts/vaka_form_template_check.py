@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VAKA FORMU derlenmiş şablon regresyon ve hız testi
+Aynı değerler iki yoldan doldurulur ve çıktılar karşılaştırılır:
+    - openpyxl:  services.vaka_form_template.render_with_openpyxl (şablonu aç, yaz, kaydet)
+    - derlenmiş: CompiledTemplate.render (hazır zip + sheet XML yaması)
+
+Her senaryo excel ve pdf çıktı türleri için çalışır. Zip'teki her parça bayt bayt aynı olmalıdır
+(docProps/core.xml kayıt zamanı içerdiğinden hariç). Senaryolar: kısa değerler, satır yüksekliğini
+büyüten uzun metinler, karışık tipler (sayı, boş, formül benzeri, geçersiz karakter), PNG imzalar
+ve openpyxl'e düşmesi beklenen tarih değeri.
+
+Mapping şablondaki boş hücrelerden üretilir; veritabanı gerekmez.
+
+Bu script yeni kodun iki yolunu birbiriyle karşılaştırır. Eski export uçlarının (b4db7d8) çıktısına
+karşı altın veri testi tests/test_vaka_form_template.py'dedir.
+
+Kullanım:
+    python scripts/vaka_form_template_check.py [--iterations 50]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+from zipfile import ZipFile
+
+# Backend root'a ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import load_workbook
+from PIL import Image
+
+from services.vaka_form_template import (
+    TEMPLATE_PATH, VARIANTS, CompiledTemplate, render_with_openpyxl, _NeedsOpenpyxl
+)
+
+SKIPPED_PARTS = {"docProps/core.xml"}
+
+
+def build_mapping():
+    """Şablondaki boş hücreler -> sahte alan anahtarları (+ logo ve imza hücreleri)"""
+    ws = load_workbook(TEMPLATE_PATH).active
+    empty = [
+        cell.coordinate
+        for row in ws.iter_rows(min_row=7, max_row=ws.max_row)
+        for cell in row
+        if cell.value is None and cell.coordinate not in ws.merged_cells
+    ]
+    mapping = {address: f"field.{address.lower()}" for address in empty[:240]}
+    for address in empty[240:243]:
+        mapping[address] = "sig.hekim_prm_imza"
+    mapping["B2"] = "__LOGO__"
+    return mapping
+
+
+def signature_png(seed: int) -> bytes:
+    image = Image.new("RGB", (300, 110), (255, 255, 255))
+    for x in range(20, 280):
+        image.putpixel((x, 55 + ((x * seed) % 30) - 15), (0, 0, 128))
+    output = BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def scenarios(mapping):
+    cells = [address for address, key in mapping.items() if key.startswith("field.")]
+    signatures = [address for address, key in mapping.items() if key.startswith("sig.")]
+    short = {address: f"Değer {i}" for i, address in enumerate(cells)}
+    long_text = {
+        address: (f"  Uzun açıklama {i} & <özel> \"karakterler\" 'tırnak' " * (1 + i % 4)) + ("\nikinci satır" if i % 5 == 0 else "")
+        for i, address in enumerate(cells)
+    }
+    mixed_values = [12, 3.75, None, "", True, "=SUM(A1:A2)", "kontrol\x01karakteri", "çğıöşü ÇĞİÖŞÜ", 0, "   "]
+    mixed = {address: mixed_values[i % len(mixed_values)] for i, address in enumerate(cells)}
+    signed_values = {**short, **{address: "✓" for address in signatures[1:]}}
+    images = {signatures[0]: signature_png(3)}
+    dated = {**short, cells[0]: datetime(2026, 3, 1, 14, 30)}
+    # Son alan: openpyxl'e düşmesi beklenen çıktı türleri
+    return [
+        ("kısa değerler", short, {}, set()),
+        ("uzun metin", long_text, {}, set()),
+        # PDF'te reddedilen değerler hizalanmaz; stil tablosu değiştiği için openpyxl kullanılır
+        ("karışık tipler", mixed, {}, {"pdf"}),
+        ("imzalı", signed_values, images, set()),
+        ("tarih değeri", dated, {}, set(VARIANTS)),
+    ]
+
+
+def part_differences(expected: bytes, actual: bytes):
+    with ZipFile(BytesIO(expected)) as a, ZipFile(BytesIO(actual)) as b:
+        names_a, names_b = set(a.namelist()), set(b.namelist())
+        diffs = [f"eksik/fazla parça: {sorted(names_a ^ names_b)}"] if names_a != names_b else []
+        for name in sorted(names_a & names_b - SKIPPED_PARTS):
+            if a.read(name) != b.read(name):
+                diffs.append(f"{name} farklı")
+    return diffs
+
+
+def timed(fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main(iterations: int) -> int:
+    mapping = build_mapping()
+    cases = scenarios(mapping)
+    errors = []
+    print(f"Mapping: {len(mapping)} hücre")
+
+    for variant in VARIANTS:
+        started = time.perf_counter()
+        compiled = CompiledTemplate(variant, mapping, {})
+        print(f"\n[{variant}] derleme {(time.perf_counter() - started) * 1000:.0f} ms, {len(compiled.slots)} hücre")
+
+        for name, values, images, fallback_variants in cases:
+            expected = render_with_openpyxl(variant, mapping, {}, values, images)
+            try:
+                actual = compiled.render(values, images)
+                fell_back = False
+            except _NeedsOpenpyxl:
+                actual = render_with_openpyxl(variant, mapping, {}, values, images)
+                fell_back = True
+            diffs = part_differences(expected, actual)
+            if fell_back != (variant in fallback_variants):
+                diffs.append("openpyxl'e düşme beklenmiyordu" if fell_back else "openpyxl'e düşmesi bekleniyordu")
+            load_workbook(BytesIO(actual))  # açılabiliyor mu
+            status = "AYNI" if not diffs else "FARKLI"
+            print(f"  {name:<16} {status}{' (openpyxl)' if fell_back else ''}")
+            errors.extend(f"[{variant}] {name}: {diff}" for diff in diffs)
+
+        values = cases[1][1]
+        legacy_mean, legacy_p95 = timed(lambda: render_with_openpyxl(variant, mapping, {}, values, {}), iterations)
+        fast_mean, fast_p95 = timed(lambda: compiled.render(values, {}), iterations)
+        print(f"  openpyxl:  ort {legacy_mean:.1f} ms, p95 {legacy_p95:.1f} ms")
+        print(f"  derlenmiş: ort {fast_mean:.1f} ms, p95 {fast_p95:.1f} ms ({legacy_mean / fast_mean:.0f}x)")
+
+    for error in errors:
+        print(f"  HATA {error}")
+    print(f"\nDoğrulama: {len(errors)} hata")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VAKA FORMU derlenmiş şablon regresyon ve hız testi")
+    parser.add_argument("--iterations", type=int, default=50, help="Hız testi tekrar sayısı")
+    args = parser.parse_args()
+    sys.exit(main(args.iterations))
@@ -273,6 +273,22 @@ scheduler = AsyncIOScheduler()
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Server başlatılıyor...")
+    
+    # MongoDB index'lerini oluştur (idempotent)
+    try:
+        from database import ensure_indexes
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index bootstrap hatası: {e}")
+    
+    # Eski string vardiya atama tarihlerini datetime'a çevir (idempotent)
+    try:
+        from routes.shifts import migrate_assignment_dates
+        migration = await migrate_assignment_dates()
+        if migration["migrated"]:
+            logger.info(f"Vardiya atama tarihleri dönüştürüldü: {migration['migrated']} kayıt")
+    except Exception as e:
+        logger.error(f"Vardiya atama tarihi dönüşümü hatası: {e}")
     logger.info(f"Excel templates router yüklendi: {hasattr(excel_templates, 'router')}")
     if hasattr(excel_templates, 'router'):
         logger.info(f"Excel templates router routes: {[r.path for r in excel_templates.router.routes]}")
@@ -331,6 +347,43 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"Stok sistemi başlatma hatası: {e}")
     
+    # İlaç adı arama index'i (thread'de kurulur; ilk autocomplete isteği kurulumu beklemez)
+    try:
+        from routes.stock_barcode import warm_medications_search_index
+        await warm_medications_search_index()
+    except Exception as e:
+        logger.warning(f"İlaç arama index'i kurulamadı: {e}")
+    
+    # LibreOffice dönüşüm havuzunu başlat (profiller ısıtılır, ilk PDF soğuk başlangıç beklemez)
+    try:
+        from services.libreoffice_pool import libreoffice_pool
+        if libreoffice_pool.available:
+            await libreoffice_pool.start()
+        else:
+            logger.warning("LibreOffice bulunamadı, PDF dönüşüm havuzu başlatılmadı")
+    except Exception as e:
+        logger.warning(f"LibreOffice havuzu başlatılamadı: {e}")
+    
+    # Vaka canlı yayın aracısı (CASE_HUB_REDIS_URL varsa worker'lar arası dağıtım)
+    from services.case_hub import case_hub
+    await case_hub.start()
+    
+    # Push bildirim outbox dağıtıcısı (istekler sadece kuyruğa yazar)
+    from services.notification_outbox import notification_outbox
+    await notification_outbox.start()
+    
+    # Yönetici OTP kod indeksi (her 30 sn'lik dilim önceden hesaplanır)
+    from services.otp_service import approver_code_index
+    await approver_code_index.start()
+    
+    # GPS alım tamponu (ping'ler toplu yazılır)
+    from services.gps_ingest import gps_ingest
+    await gps_ingest.start()
+    
+    # Filo canlı konum yayını (haritaya sadece değişen araçlar gönderilir)
+    from services.fleet_positions import fleet_positions
+    await fleet_positions.start()
+    
     # Otomatik vardiya başlatma scheduler'ını başlat
     try:
         from routes.shifts import auto_start_health_center_shifts
@@ -343,6 +396,39 @@ async def startup_event():
             name="Sağlık Merkezi Otomatik Vardiya Başlatma",
             replace_existing=True
         )
+        
+        # Dashboard sayaçlarının periyodik mutabakatı (artımlı güncellemelerdeki kaymaları düzeltir)
+        from services.dashboard_stats import run_reconcile_job, RECONCILE_INTERVAL_MINUTES
+        scheduler.add_job(
+            run_reconcile_job,
+            trigger=IntervalTrigger(minutes=RECONCILE_INTERVAL_MINUTES),
+            id="reconcile_dashboard_stats",
+            name="Dashboard Sayaç Mutabakatı",
+            replace_existing=True
+        )
+        
+        # Personel performans günlük özetleri (ilk çalışmada tüm geçmiş doldurulur)
+        from datetime import datetime
+        from services.staff_rollups import refresh_staff_rollups, ROLLUP_INTERVAL_MINUTES
+        scheduler.add_job(
+            refresh_staff_rollups,
+            trigger=IntervalTrigger(minutes=ROLLUP_INTERVAL_MINUTES),
+            id="refresh_staff_rollups",
+            name="Personel Performans Özetleri",
+            next_run_time=datetime.now(),
+            replace_existing=True
+        )
+        
+        # Bildirim alıcı dizininin tam yenilemesi (diğer worker'lardaki değişiklikler için)
+        from services.token_directory import run_refresh_job, TOKEN_DIRECTORY_REFRESH_MINUTES
+        scheduler.add_job(
+            run_refresh_job,
+            trigger=IntervalTrigger(minutes=TOKEN_DIRECTORY_REFRESH_MINUTES),
+            id="refresh_token_directory",
+            name="Bildirim Alıcı Dizini Yenileme",
+            next_run_time=datetime.now(),
+            replace_existing=True
+        )
         scheduler.start()
         logger.info("Otomatik vardiya başlatma scheduler'ı başlatıldı (her 1 dakikada bir)")
     except Exception as e:
@@ -354,6 +440,34 @@ async def shutdown_db_client():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler durduruldu")
+    
+    # LibreOffice havuzunu durdur
+    from services.libreoffice_pool import libreoffice_pool
+    await libreoffice_pool.stop()
+    
+    from services.fleet_positions import fleet_positions
+    await fleet_positions.stop()
+    
+    from services.case_hub import case_hub
+    await case_hub.stop()
+    
+    # Arka planda gönderilen onay kodu bildirimlerini bekle (push'lar outbox'a yazılır, SMTP havuzu açık)
+    from services.approval_service import approval_service
+    await approval_service.stop()
+    
+    from services.notification_outbox import notification_outbox
+    await notification_outbox.stop()
+    
+    from services.otp_service import approver_code_index
+    await approver_code_index.stop()
+    
+    # Bekleyen GPS kayıtlarını yaz (Mongo bağlantısı kapanmadan önce)
+    from services.gps_ingest import gps_ingest
+    await gps_ingest.stop()
+    
+    # Havuzdaki SMTP bağlantılarını kapat
+    from services.email_service import email_service
+    await email_service.close()
     client.close()
 
 # Run the server
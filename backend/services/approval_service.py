@@ -2,12 +2,14 @@
 Approval Service - Onay Kodu Yönetimi
 SMS, Email, Push bildirimleri ile birleşik onay sistemi
 """
+import asyncio
 import os
 import random
 import string
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set
 from database import approvals_collection, users_collection
 from .email_service import (
     email_service, 
@@ -21,10 +23,27 @@ from .sms_service import (
     get_shift_handover_sms,
     get_manager_approval_sms
 )
-from .onesignal_service import onesignal_service
+from .notification_outbox import enqueue_push
 
 logger = logging.getLogger(__name__)
 
+# Aynı anda açık kanal gönderimi (tüm onaylar için) ve kanal başına zaman aşımı (saniye)
+APPROVAL_NOTIFY_CONCURRENCY = int(os.getenv("APPROVAL_NOTIFY_CONCURRENCY", 10))
+APPROVAL_CHANNEL_TIMEOUTS = {
+    "email": int(os.getenv("APPROVAL_EMAIL_TIMEOUT", 15)),
+    "sms": int(os.getenv("APPROVAL_SMS_TIMEOUT", 10)),
+    "push": int(os.getenv("APPROVAL_PUSH_TIMEOUT", 5)),
+}
+APPROVAL_SHUTDOWN_TIMEOUT = float(os.getenv("APPROVAL_SHUTDOWN_TIMEOUT", 10))  # Kapanışta bekleyen gönderimler için süre
+
+APPROVAL_CONTEXTS = {
+    "shift_handover": "Vardiya Devir Teslim",
+    "shift_start_approval": "Vardiya Başlatma",
+    "manager_approval": "Yönetici Onayı",
+    "case_reopen": "Vaka Yeniden Açma",
+    "medication_approval": "İlaç Kullanım Onayı"
+}
+
 
 class ApprovalService:
     """Birleşik onay kodu servisi"""
@@ -32,6 +51,8 @@ class ApprovalService:
     def __init__(self):
         self.code_length = 6
         self.code_expiry_minutes = 5
+        self._semaphore = asyncio.Semaphore(APPROVAL_NOTIFY_CONCURRENCY)
+        self._tasks: Set[asyncio.Task] = set()
     
     def _generate_code(self) -> str:
         """6 haneli onay kodu oluştur"""
@@ -75,14 +96,17 @@ class ApprovalService:
             "expires_at": expires_at,
             "verified_at": None,
             "verified_by": None,
-            "notified_users": notify_user_ids or []
+            "notified_users": notify_user_ids or [],
+            "delivery": {}
         }
         
         await approvals_collection.insert_one(approval)
         
-        # Bildirimleri gönder
+        # Bildirimleri arka planda gönder - kod beklemeden döner, durum "delivery" alanına yazılır
         if notify_user_ids:
-            await self._send_notifications(approval, notify_user_ids)
+            task = asyncio.create_task(self._deliver_in_background(approval, notify_user_ids))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
         
         return {
             "approval_id": approval["_id"],
@@ -91,111 +115,165 @@ class ApprovalService:
             "type": approval_type
         }
     
+    def _context(self, approval_type: str) -> str:
+        """Onay tipinin kullanıcıya gösterilen adı"""
+        return APPROVAL_CONTEXTS.get(approval_type, "İşlem Onayı")
+    
+    def _email_html(self, approval: Dict, user_name: str) -> str:
+        approval_type = approval["type"]
+        code = approval["code"]
+        metadata = approval.get("metadata", {})
+        context = self._context(approval_type)
+        
+        if approval_type == "shift_handover":
+            return get_shift_handover_email_template(
+                receiver_name=user_name,
+                giver_name=metadata.get("giver_name", "Personel"),
+                vehicle_plate=metadata.get("vehicle_plate", ""),
+                code=code,
+                shift_date=metadata.get("date", datetime.utcnow().strftime("%d.%m.%Y")),
+                shift_time=metadata.get("time", datetime.utcnow().strftime("%H:%M"))
+            )
+        if approval_type in ["manager_approval", "shift_start_approval"]:
+            return get_manager_approval_email_template(
+                manager_name=user_name,
+                requester_name=metadata.get("requester_name", "Personel"),
+                action=metadata.get("action", context),
+                vehicle_plate=metadata.get("vehicle_plate", ""),
+                code=code,
+                details=metadata.get("details", "")
+            )
+        return get_approval_code_email_template(
+            user_name=user_name,
+            code=code,
+            context=context,
+            expires_in="5 dakika"
+        )
+    
+    def _sms_text(self, approval: Dict) -> str:
+        approval_type = approval["type"]
+        code = approval["code"]
+        metadata = approval.get("metadata", {})
+        context = self._context(approval_type)
+        
+        if approval_type == "shift_handover":
+            return get_shift_handover_sms(
+                giver_name=metadata.get("giver_name", "Personel"),
+                vehicle_plate=metadata.get("vehicle_plate", ""),
+                code=code
+            )
+        if approval_type in ["manager_approval", "shift_start_approval"]:
+            return get_manager_approval_sms(
+                requester_name=metadata.get("requester_name", "Personel"),
+                action=metadata.get("action", context),
+                code=code
+            )
+        return get_approval_code_sms(code, context)
+    
+    async def _send_email(self, approval: Dict, user: Dict) -> Dict[str, Any]:
+        context = self._context(approval["type"])
+        sent = await email_service.send_email_async(
+            to_email=user["email"],
+            subject=f"HealMedy - {context} Onay Kodu",
+            body_html=self._email_html(approval, user.get("name", "Kullanıcı"))
+        )
+        return {"status": "sent" if sent else "failed"}
+    
+    async def _send_sms(self, phone: str, sms_text: str) -> Dict[str, Any]:
+        result = await sms_service.send_sms(phone, sms_text)
+        if result.get("success"):
+            return {"status": "sent"}
+        return {"status": "failed", "error": result.get("error")}
+    
+    async def _send_push(self, approval: Dict, user_id: str) -> Dict[str, Any]:
+        outbox_id = await enqueue_push(
+            f"🔐 {self._context(approval['type'])}",
+            f"Onay kodunuz: {approval['code']}",
+            user_ids=[user_id],
+            data={
+                "type": "approval_code",
+                "approval_type": approval["type"],
+                "approval_id": approval["_id"]
+            },
+            notification_type="approval_code"
+        )
+        return {"status": "queued", "outbox_id": outbox_id}
+    
+    async def _run_channel(self, channel: str, user_id: str, send) -> Dict[str, Any]:
+        """Tek kanal gönderimi: eşzamanlılık sınırı + kanal zaman aşımı, hata yükseltmez"""
+        started = time.perf_counter()
+        async with self._semaphore:
+            try:
+                result = await asyncio.wait_for(send, APPROVAL_CHANNEL_TIMEOUTS[channel])
+            except asyncio.TimeoutError:
+                result = {"status": "timeout"}
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+        result["ms"] = round((time.perf_counter() - started) * 1000)
+        if result["status"] in ("sent", "queued"):
+            logger.info(f"Approval {channel} {result['status']} for user {user_id} ({result['ms']} ms)")
+        else:
+            logger.error(f"Failed to send approval {channel} to user {user_id}: {result}")
+        return result
+    
     async def _send_notifications(
         self,
         approval: Dict,
         user_ids: List[str]
     ):
-        """Onay bildirimleri gönder (SMS, Email, Push)"""
-        for user_id in user_ids:
-            user = await users_collection.find_one({"_id": user_id})
-            if not user:
-                continue
-            
-            user_name = user.get("name", "Kullanıcı")
-            user_email = user.get("email")
-            user_phone = user.get("phone")
-            
-            approval_type = approval["type"]
-            code = approval["code"]
-            metadata = approval.get("metadata", {})
-            
-            # Context mesajı oluştur
-            context_map = {
-                "shift_handover": "Vardiya Devir Teslim",
-                "shift_start_approval": "Vardiya Başlatma",
-                "manager_approval": "Yönetici Onayı",
-                "case_reopen": "Vaka Yeniden Açma",
-                "medication_approval": "İlaç Kullanım Onayı"
-            }
-            context = context_map.get(approval_type, "İşlem Onayı")
-            
-            # 1. EMAIL GÖNDERİMİ
-            if user_email:
-                try:
-                    if approval_type == "shift_handover":
-                        email_html = get_shift_handover_email_template(
-                            receiver_name=user_name,
-                            giver_name=metadata.get("giver_name", "Personel"),
-                            vehicle_plate=metadata.get("vehicle_plate", ""),
-                            code=code,
-                            shift_date=metadata.get("date", datetime.utcnow().strftime("%d.%m.%Y")),
-                            shift_time=metadata.get("time", datetime.utcnow().strftime("%H:%M"))
-                        )
-                    elif approval_type in ["manager_approval", "shift_start_approval"]:
-                        email_html = get_manager_approval_email_template(
-                            manager_name=user_name,
-                            requester_name=metadata.get("requester_name", "Personel"),
-                            action=metadata.get("action", context),
-                            vehicle_plate=metadata.get("vehicle_plate", ""),
-                            code=code,
-                            details=metadata.get("details", "")
-                        )
-                    else:
-                        email_html = get_approval_code_email_template(
-                            user_name=user_name,
-                            code=code,
-                            context=context,
-                            expires_in="5 dakika"
-                        )
-                    
-                    await email_service.send_email_async(
-                        to_email=user_email,
-                        subject=f"HealMedy - {context} Onay Kodu",
-                        body_html=email_html
-                    )
-                    logger.info(f"Approval email sent to {user_email}")
-                except Exception as e:
-                    logger.error(f"Failed to send approval email: {e}")
-            
-            # 2. SMS GÖNDERİMİ
-            if user_phone:
-                try:
-                    if approval_type == "shift_handover":
-                        sms_text = get_shift_handover_sms(
-                            giver_name=metadata.get("giver_name", "Personel"),
-                            vehicle_plate=metadata.get("vehicle_plate", ""),
-                            code=code
-                        )
-                    elif approval_type in ["manager_approval", "shift_start_approval"]:
-                        sms_text = get_manager_approval_sms(
-                            requester_name=metadata.get("requester_name", "Personel"),
-                            action=metadata.get("action", context),
-                            code=code
-                        )
-                    else:
-                        sms_text = get_approval_code_sms(code, context)
-                    
-                    await sms_service.send_sms(user_phone, sms_text)
-                    logger.info(f"Approval SMS sent to {user_phone}")
-                except Exception as e:
-                    logger.error(f"Failed to send approval SMS: {e}")
-            
-            # 3. PUSH BİLDİRİMİ GÖNDERİMİ
-            try:
-                await onesignal_service.send_to_user(
-                    user_id=user_id,
-                    title=f"🔐 {context}",
-                    message=f"Onay kodunuz: {code}",
-                    data={
-                        "type": "approval_code",
-                        "approval_type": approval_type,
-                        "approval_id": approval["_id"]
-                    }
-                )
-                logger.info(f"Approval push sent to user {user_id}")
-            except Exception as e:
-                logger.error(f"Failed to send approval push: {e}")
+        """
+        Onay bildirimleri gönder (SMS, Email, Push)
+        Alıcılar tek sorguda okunur; tüm alıcı/kanal gönderimleri eşzamanlı çalışır ve
+        sonuçlar onay kaydının "delivery" alanına yazılır.
+        """
+        users = await users_collection.find(
+            {"_id": {"$in": user_ids}},
+            {"name": 1, "email": 1, "phone": 1}
+        ).to_list(len(user_ids))
+        
+        sms_text = self._sms_text(approval)
+        jobs = []
+        for user in users:
+            user_id = user["_id"]
+            if user.get("email"):
+                jobs.append(("email", user_id, self._send_email(approval, user)))
+            if user.get("phone"):
+                jobs.append(("sms", user_id, self._send_sms(user["phone"], sms_text)))
+            jobs.append(("push", user_id, self._send_push(approval, user_id)))
+        
+        results = await asyncio.gather(*(
+            self._run_channel(channel, user_id, send) for channel, user_id, send in jobs
+        ))
+        
+        delivery = {}
+        for (channel, user_id, _), result in zip(jobs, results):
+            delivery.setdefault(user_id, {})[channel] = result
+        for user_id in set(user_ids) - set(delivery):
+            delivery[user_id] = {"error": "user_not_found"}
+        
+        await approvals_collection.update_one(
+            {"_id": approval["_id"]},
+            {"$set": {"delivery": delivery, "delivery_completed_at": datetime.utcnow()}}
+        )
+        return delivery
+    
+    async def stop(self):
+        """Kapanışta arka plandaki bildirim gönderimlerini bekle (en fazla APPROVAL_SHUTDOWN_TIMEOUT)"""
+        if not self._tasks:
+            return
+        pending = set(self._tasks)
+        _, unfinished = await asyncio.wait(pending, timeout=APPROVAL_SHUTDOWN_TIMEOUT)
+        if unfinished:
+            logger.error(f"Kapanışta {len(unfinished)} onay bildirimi tamamlanamadı, iptal ediliyor")
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+    
+    async def _deliver_in_background(self, approval: Dict, user_ids: List[str]):
+        try:
+            await self._send_notifications(approval, user_ids)
+        except Exception as e:
+            logger.error(f"Approval notification fan-out failed ({approval['_id']}): {e}", exc_info=True)
     
     async def verify_code(
         self,
@@ -342,7 +420,7 @@ async def create_manager_shift_approval(
     # Baş şoför ve operasyon müdürlerini bul
     managers = await users_collection.find({
         "role": {"$in": ["bas_sofor", "operasyon_muduru"]}
-    }).to_list(100)
+    }, {"_id": 1}).to_list(100)
     
     manager_ids = [m["_id"] for m in managers]
     
@@ -0,0 +1,304 @@
+"""
+Vaka Canlı Yayın Merkezi (medical form ortak düzenleme)
+Vaka başına abonelere form yamalarını (alan bazlı fark) ve katılımcı varlığını iletir;
+istemcilerin GET /cases/{id}/medical-form'u sürekli yoklamasına gerek kalmaz.
+
+Abonelikler konu (topic) bazlıdır: vakalar "case:{id}" konusunu kullanır (subscribe/publish),
+diğer akışlar kendi konularıyla subscribe_topic/publish_topic'i kullanır (ör. filo konumları).
+
+Yayın süreç içidir. Birden fazla worker çalışıyorsa CASE_HUB_REDIS_URL ile yerel bir
+Redis pub/sub aracısı takılır; her worker kendi abonelerine teslim eder. Redis bağlantısı koparsa
+okuyucu artan beklemeyle (en fazla CASE_HUB_RECONNECT_MAX_SECONDS) yeniden abone olur ve bu
+worker'ın abonelerine "resync" gönderilir (kopukluk sırasında diğer worker'ların olayları kaçmıştır).
+Aracı arayüzü (CaseHubBroker) başka bir aracı eklemek için yeterlidir.
+
+serve_websocket / event_stream: WebSocket ve SSE uçlarının ortak akışı (ilk mesaj, olaylar,
+CASE_HUB_KEEPALIVE_SECONDS'ta bir ping). İlk mesaj (snapshot) abone olduktan sonra okunur;
+arada yayınlanan olay kaçmaz, snapshot'ta zaten olanlar Subscription.skip ile atlanabilir.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set, Union
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+CASE_HUB_QUEUE_SIZE = int(os.getenv("CASE_HUB_QUEUE_SIZE", 256))  # Abone başına bekleyen olay sınırı
+CASE_HUB_KEEPALIVE_SECONDS = int(os.getenv("CASE_HUB_KEEPALIVE_SECONDS", 25))
+CASE_HUB_REDIS_URL = os.getenv("CASE_HUB_REDIS_URL")
+CASE_HUB_RECONNECT_MAX_SECONDS = float(os.getenv("CASE_HUB_RECONNECT_MAX_SECONDS", 30))  # Yeniden bağlanma bekleme üst sınırı
+CASE_HUB_CHANNEL = "case_hub"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_event(event: dict) -> str:
+    return json.dumps(event, default=_json_default, ensure_ascii=False)
+
+
+def case_topic(case_id: str) -> str:
+    return f"case:{case_id}"
+
+
+class Subscription:
+    """Tek bir istemci bağlantısı; kuyruk dolarsa olaylar atılır ve 'resync' istenir"""
+
+    def __init__(self, topic: str, user_id: Optional[str] = None, resync_event: Optional[dict] = None):
+        self.topic = topic
+        self.user_id = user_id
+        self.resync_message = encode_event(resync_event or {"type": "resync"})
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CASE_HUB_QUEUE_SIZE)
+        self.lagged = False
+        self.skip: Optional[Callable[[str], bool]] = None  # True dönen mesajlar istemciye gönderilmez
+
+    def offer(self, message: str):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Yavaş istemci: bekleyenleri at, tek bir resync mesajı bırak
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.resync_message)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Sıradaki mesaj (JSON); timeout dolarsa None"""
+        while True:
+            try:
+                message = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if self.lagged and self.queue.empty():
+                self.lagged = False
+            if message != self.resync_message and self.skip is not None and self.skip(message):
+                continue
+            return message
+
+
+# İlk mesaj: hazır JSON ya da abone olduktan sonra snapshot'ı üreten fonksiyon
+FirstMessage = Union[str, Callable[[Subscription], Awaitable[str]]]
+
+
+async def _first_message(first_message: FirstMessage, subscription: Subscription) -> str:
+    if isinstance(first_message, str):
+        return first_message
+    return await first_message(subscription)
+
+
+class CaseHubBroker:
+    """Worker'lar arası dağıtım arayüzü (varsayılan: yok, sadece süreç içi)"""
+
+    async def start(self, on_message: Callable[[str], Awaitable[None]],
+                    on_reconnect: Optional[Callable[[], None]] = None):
+        """on_reconnect: bağlantı koptuktan sonra yeniden abone olununca çağrılır"""
+        pass
+
+    async def publish(self, message: str):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisCaseHubBroker(CaseHubBroker):
+    """Yerel Redis pub/sub üzerinden tüm worker'lara dağıtım"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_message, on_reconnect=None):
+        self._redis = aioredis.from_url(self.url)
+        # İlk abonelik burada: başarısızsa CaseHub süreç içi yayına düşer
+        pubsub = await self._subscribe()
+        self._task = asyncio.create_task(self._reader(pubsub, on_message, on_reconnect))
+
+    async def _subscribe(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(CASE_HUB_CHANNEL)
+        return pubsub
+
+    async def _reader(self, pubsub, on_message, on_reconnect):
+        delay = 1.0
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    logger.info("Vaka yayın aracısına yeniden abone olundu")
+                    delay = 1.0
+                    if on_reconnect:
+                        on_reconnect()
+                async for item in pubsub.listen():
+                    if item.get("type") == "message":
+                        data = item["data"]
+                        await on_message(data.decode() if isinstance(data, bytes) else data)
+                logger.warning("Vaka yayın aracısı aboneliği sona erdi, yeniden abone olunacak")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Vaka yayın aracısı okuma hatası, {delay:.0f} sn sonra yeniden denenecek: {e}")
+            if pubsub is not None:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+                pubsub = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CASE_HUB_RECONNECT_MAX_SECONDS)
+
+    async def publish(self, message: str):
+        await self._redis.publish(CASE_HUB_CHANNEL, message)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._redis:
+            await self._redis.close()
+
+
+class CaseHub:
+    """Konu başına abonelik tablosu + isteğe bağlı worker'lar arası aracı"""
+
+    def __init__(self, broker: Optional[CaseHubBroker] = None):
+        self.broker = broker or CaseHubBroker()
+        self.origin = uuid.uuid4().hex  # Aracıdan dönen kendi mesajlarımızı ayırt etmek için
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        """Bu worker'daki abone sayısı (topic verilmezse tüm konular)"""
+        if topic is not None:
+            return len(self._subscriptions.get(topic, ()))
+        return sum(len(subs) for subs in self._subscriptions.values())
+
+    async def start(self):
+        try:
+            await self.broker.start(self._on_broker_message, self._resync_all)
+        except Exception as e:
+            logger.warning(f"Vaka yayın aracısı başlatılamadı, yayın süreç içi kalacak: {e}")
+            self.broker = CaseHubBroker()
+
+    async def stop(self):
+        await self.broker.stop()
+
+    @asynccontextmanager
+    async def subscribe_topic(self, topic: str, user_id: Optional[str] = None, resync_event: Optional[dict] = None):
+        subscription = Subscription(topic, user_id, resync_event)
+        self._subscriptions[topic].add(subscription)
+        try:
+            yield subscription
+        finally:
+            subs = self._subscriptions.get(topic)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscriptions[topic]
+
+    def subscribe(self, case_id: str, user_id: Optional[str] = None):
+        """Vaka aboneliği (async context manager)"""
+        return self.subscribe_topic(case_topic(case_id), user_id, {"type": "resync", "case_id": case_id})
+
+    async def serve_websocket(self, websocket: WebSocket, subscribe, first_message: FirstMessage):
+        """
+        Kabul edilmiş WebSocket'i aboneliğe bağla ve bağlantı kopana kadar olayları gönder
+        subscribe: subscribe() / subscribe_topic() dönüşü. first_message fonksiyonsa abone
+        olduktan sonra çağrılır (snapshot). İstemci mesajları yok sayılır; okuma döngüsü sadece kopmayı
+        algılamak içindir.
+        """
+        async with subscribe as subscription:
+            await websocket.send_text(await _first_message(first_message, subscription))
+
+            async def pump():
+                while True:
+                    message = await subscription.next(CASE_HUB_KEEPALIVE_SECONDS)
+                    await websocket.send_text(message or encode_event({"type": "ping"}))
+
+            pump_task = asyncio.create_task(pump())
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+            finally:
+                pump_task.cancel()
+
+    def event_stream(self, request: Request, subscribe, first_message: FirstMessage) -> StreamingResponse:
+        """Aynı akışın Server-Sent Events yanıtı (WebSocket kullanamayan istemciler için)"""
+        async def events():
+            async with subscribe as subscription:
+                yield f"data: {await _first_message(first_message, subscription)}\n\n"
+                while not await request.is_disconnected():
+                    message = await subscription.next(CASE_HUB_KEEPALIVE_SECONDS)
+                    yield f"data: {message}\n\n" if message else ": ping\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    def _resync_all(self):
+        """Aracı kopukluğunda kaçmış olabilecek olaylar için tüm abonelere resync"""
+        for subs in tuple(self._subscriptions.values()):
+            for subscription in tuple(subs):
+                subscription.offer(subscription.resync_message)
+
+    def _deliver(self, topic: str, message: str):
+        for subscription in tuple(self._subscriptions.get(topic, ())):
+            subscription.offer(message)
+
+    async def publish_topic(self, topic: str, event: dict):
+        """Olayı bu worker'ın abonelerine ilet ve aracıya gönder (hata yayını bozmaz)"""
+        message = encode_event(event)
+        self._deliver(topic, message)
+        try:
+            await self.broker.publish(json.dumps({"origin": self.origin, "topic": topic, "message": message}))
+        except Exception as e:
+            logger.warning(f"Yayın aracıya gönderilemedi ({topic}): {e}")
+
+    async def publish(self, case_id: str, event: dict):
+        """Vaka olayı (olaya case_id eklenir)"""
+        await self.publish_topic(case_topic(case_id), {"case_id": case_id, **event})
+
+    async def _on_broker_message(self, raw: str):
+        try:
+            envelope = json.loads(raw)
+        except ValueError:
+            return
+        topic = envelope.get("topic")
+        if not topic and envelope.get("case_id"):
+            topic = case_topic(envelope["case_id"])  # Güncellenmemiş worker'dan gelen zarf
+        if envelope.get("origin") != self.origin and topic and envelope.get("message"):
+            self._deliver(topic, envelope["message"])
+
+
+def _create_broker() -> CaseHubBroker:
+    if CASE_HUB_REDIS_URL:
+        if REDIS_AVAILABLE:
+            return RedisCaseHubBroker(CASE_HUB_REDIS_URL)
+        logger.warning("CASE_HUB_REDIS_URL tanımlı ama redis paketi yüklü değil; yayın süreç içi kalacak")
+    return CaseHubBroker()
+
+
+# Singleton
+case_hub = CaseHub(_create_broker())
@@ -0,0 +1,154 @@
+"""
+Dashboard İstatistikleri (materyalize sayaçlar)
+/cases/stats/dashboard her çağrıda koleksiyonları saymak yerine tek bir belgeyi okur.
+
+Belge vaka ve araç durum yazma yollarında $inc ile artımlı güncellenir; kaçırılan
+yazmalar (script'ler, elle müdahale, eşzamanlı yeniden hesaplama) periyodik mutabakat
+işiyle düzeltilir. Yanıttaki updated_at / reconciled_at alanları verinin tazeliğini gösterir.
+"""
+
+import logging
+from typing import Optional
+
+from database import cases_collection, vehicles_collection, dashboard_stats_collection
+from utils.timezone import get_turkey_time
+
+logger = logging.getLogger(__name__)
+
+STATS_DOC_ID = "dashboard"
+RECONCILE_INTERVAL_MINUTES = 2
+
+# Bu durumlardaki vakalar aktif sayılmaz
+INACTIVE_CASE_STATUSES = ("tamamlandi", "iptal")
+HIGH_PRIORITY = "yuksek"
+AVAILABLE_VEHICLE_STATUS = "musait"
+UNKNOWN_KEY = "belirtilmemis"
+
+
+def _counter_key(value) -> str:
+    """Durum/öncelik değerini alan adı olarak kullanılabilir hale getir"""
+    if value is None or value == "":
+        return UNKNOWN_KEY
+    return str(value).replace(".", "_").lstrip("$") or UNKNOWN_KEY
+
+
+def _is_active(case: Optional[dict]) -> bool:
+    return bool(case) and case.get("status") not in INACTIVE_CASE_STATUSES
+
+
+async def _apply_increments(increments: dict):
+    increments = {field: delta for field, delta in increments.items() if delta}
+    if not increments:
+        return
+    try:
+        # upsert yok: belge yoksa ilk okuma/mutabakat tamamını hesaplar
+        await dashboard_stats_collection.update_one(
+            {"_id": STATS_DOC_ID},
+            {"$inc": increments, "$set": {"updated_at": get_turkey_time()}}
+        )
+    except Exception as e:
+        # Sayaç hatası asıl yazmayı bozmamalı; mutabakat işi düzeltir
+        logger.warning(f"Dashboard sayaçları güncellenemedi: {e}")
+
+
+async def record_case_transition(before: Optional[dict], after: Optional[dict]):
+    """
+    Vaka durum/öncelik değişikliğini sayaçlara yansıt
+    before=None -> yeni vaka, after=None -> silinen vaka. Sadece status/priority alanları okunur.
+    """
+    increments = {}
+    for case, sign in ((before, -1), (after, 1)):
+        if _is_active(case):
+            status_field = f"active_by_status.{_counter_key(case.get('status'))}"
+            priority_field = f"active_by_priority.{_counter_key(case.get('priority'))}"
+            increments[status_field] = increments.get(status_field, 0) + sign
+            increments[priority_field] = increments.get(priority_field, 0) + sign
+    await _apply_increments(increments)
+
+
+async def record_vehicle_transition(before_status: Optional[str], after_status: Optional[str]):
+    """
+    Araç durum değişikliğini sayaçlara yansıt
+    before_status=None -> yeni araç, after_status=None -> silinen araç
+    """
+    if before_status == after_status:
+        return
+    increments = {}
+    if before_status is not None:
+        increments[f"vehicles_by_status.{_counter_key(before_status)}"] = -1
+    if after_status is not None:
+        increments[f"vehicles_by_status.{_counter_key(after_status)}"] = 1
+    await _apply_increments(increments)
+
+
+async def set_vehicle_status(vehicle_id: str, fields: dict):
+    """Araç durumunu ($set fields, status içermeli) güncelle ve sayaçlara yansıt"""
+    before = await vehicles_collection.find_one_and_update(
+        {"_id": vehicle_id},
+        {"$set": fields},
+        projection={"status": 1}
+    )
+    if before:
+        await record_vehicle_transition(before.get("status"), fields["status"])
+    return before
+
+
+async def reconcile_dashboard_stats() -> dict:
+    """Sayaçları koleksiyonlardan baştan hesapla ve belgeyi değiştir (periyodik iş)"""
+    active_by_status = {}
+    active_by_priority = {}
+    pipeline = [
+        {"$match": {"status": {"$nin": list(INACTIVE_CASE_STATUSES)}}},
+        {"$group": {"_id": {"status": "$status", "priority": "$priority"}, "count": {"$sum": 1}}}
+    ]
+    async for row in cases_collection.aggregate(pipeline):
+        status = _counter_key(row["_id"].get("status"))
+        priority = _counter_key(row["_id"].get("priority"))
+        active_by_status[status] = active_by_status.get(status, 0) + row["count"]
+        active_by_priority[priority] = active_by_priority.get(priority, 0) + row["count"]
+
+    vehicles_by_status = {}
+    async for row in vehicles_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        status = _counter_key(row["_id"])
+        vehicles_by_status[status] = vehicles_by_status.get(status, 0) + row["count"]
+
+    now = get_turkey_time()
+    stats = {
+        "active_by_status": active_by_status,
+        "active_by_priority": active_by_priority,
+        "vehicles_by_status": vehicles_by_status,
+        "updated_at": now,
+        "reconciled_at": now,
+    }
+    await dashboard_stats_collection.replace_one({"_id": STATS_DOC_ID}, stats, upsert=True)
+    return stats
+
+
+async def run_reconcile_job():
+    """Scheduler için sarmalayıcı - hata iş zamanlayıcısını durdurmamalı"""
+    try:
+        await reconcile_dashboard_stats()
+    except Exception as e:
+        logger.error(f"Dashboard mutabakatı başarısız: {e}")
+
+
+async def get_dashboard_stats() -> dict:
+    """Dashboard yanıtı - tek birincil anahtar okuması (belge yoksa hesaplanır)"""
+    stats = await dashboard_stats_collection.find_one({"_id": STATS_DOC_ID})
+    if not stats:
+        stats = await reconcile_dashboard_stats()
+
+    active_by_status = {k: v for k, v in stats.get("active_by_status", {}).items() if v > 0}
+    active_by_priority = {k: v for k, v in stats.get("active_by_priority", {}).items() if v > 0}
+    vehicles_by_status = {k: v for k, v in stats.get("vehicles_by_status", {}).items() if v > 0}
+
+    return {
+        "active_cases": sum(active_by_status.values()),
+        "available_vehicles": vehicles_by_status.get(AVAILABLE_VEHICLE_STATUS, 0),
+        "high_priority_cases": active_by_priority.get(HIGH_PRIORITY, 0),
+        "active_by_status": active_by_status,
+        "active_by_priority": active_by_priority,
+        "vehicles_by_status": vehicles_by_status,
+        "updated_at": stats.get("updated_at"),
+        "reconciled_at": stats.get("reconciled_at"),
+    }
@@ -12,6 +12,8 @@ from typing import List, Optional, Dict, Any
 import asyncio
 from functools import partial
 
+from .smtp_pool import SMTPPool, AIOSMTPLIB_AVAILABLE
+
 logger = logging.getLogger(__name__)
 
 # SMTP Configuration
@@ -22,13 +24,15 @@ SMTP_CONFIG = {
     "password": os.getenv("SMTP_PASSWORD", "Mhacare1."),
     "from_email": os.getenv("SMTP_FROM_EMAIL", "auth@healmedy.tech"),
     "from_name": os.getenv("SMTP_FROM_NAME", "HealMedy HBYS"),
-    "use_ssl": True
+    "use_ssl": os.getenv("SMTP_USE_SSL", "true").lower() == "true"
 }
 
 
 class EmailService:
     def __init__(self):
         self.config = SMTP_CONFIG
+        # aiosmtplib varsa bağlantılar havuzdan yeniden kullanılır
+        self.pool = SMTPPool(self.config) if AIOSMTPLIB_AVAILABLE else None
     
     def _get_connection(self):
         """Create SMTP connection"""
@@ -96,12 +100,22 @@ class EmailService:
         body_html: str,
         body_text: Optional[str] = None
     ) -> bool:
-        """Send email asynchronously"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            partial(self.send_email, to_email, subject, body_html, body_text)
-        )
+        """Send email asynchronously (pooled aiosmtplib connection, smtplib in executor as fallback)"""
+        if self.pool is None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None,
+                partial(self.send_email, to_email, subject, body_html, body_text)
+            )
+        
+        try:
+            msg = self._create_message(to_email, subject, body_html, body_text)
+            await self.pool.send(msg, self.config["from_email"], [to_email])
+            logger.info(f"Email sent successfully to {to_email}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send email to {to_email}: {e}")
+            return False
     
     async def send_bulk_emails(
         self,
@@ -110,8 +124,8 @@ class EmailService:
         body_template: str,
         personalize: bool = False
     ) -> Dict[str, bool]:
-        """Send emails to multiple recipients"""
-        results = {}
+        """Send emails to multiple recipients (concurrently, bounded by the SMTP pool size)"""
+        messages = {}
         for recipient in recipients:
             email = recipient.get("email")
             if not email:
@@ -123,10 +137,17 @@ class EmailService:
                 for key, value in recipient.items():
                     body = body.replace(f"{{{{{key}}}}}", str(value))
             
-            result = await self.send_email_async(email, subject, body)
-            results[email] = result
+            messages[email] = body
         
-        return results
+        sent = await asyncio.gather(*(
+            self.send_email_async(email, subject, body) for email, body in messages.items()
+        ))
+        return dict(zip(messages, sent))
+    
+    async def close(self):
+        """Close pooled SMTP connections (shutdown)"""
+        if self.pool is not None:
+            await self.pool.close()
 
 
 # Singleton instance
@@ -5,12 +5,21 @@ Android push bildirimleri için FCM kullanır
 
 import os
 import json
+import time
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+FCM_MULTICAST_LIMIT = 500  # send_each_for_multicast tek çağrıda en fazla 500 token kabul eder
+FCM_SEND_WORKERS = int(os.getenv("FCM_SEND_WORKERS", 4))  # Bloklayıcı SDK çağrıları için thread sayısı
+FCM_FAKE_SENDER = os.getenv("FCM_FAKE_SENDER", "").lower() in ("1", "true", "yes")
+
+_fcm_executor = ThreadPoolExecutor(max_workers=FCM_SEND_WORKERS, thread_name_prefix="fcm")
+
 # Firebase Admin SDK
 try:
     import firebase_admin
@@ -78,6 +87,105 @@ def initialize_firebase():
         return False
 
 
+def _notification_data(
+    title: str,
+    body: str,
+    data: Optional[Dict[str, str]],
+    notification_type: str,
+    priority: str
+) -> Dict[str, str]:
+    """DATA-ONLY mesajın data payload'ı - tüm bildirim bilgisi burada"""
+    notification_data = {
+        "title": title,
+        "body": body,
+        "type": notification_type,
+        "priority": "critical" if notification_type in ["emergency", "new_case"] else priority,
+        "timestamp": datetime.utcnow().isoformat(),
+        "click_action": "FLUTTER_NOTIFICATION_CLICK"  # Compatibility
+    }
+    if data:
+        notification_data.update(data)
+    return notification_data
+
+
+def is_invalid_token_error(error_msg: str) -> bool:
+    """Token kalıcı olarak geçersiz mi ("Requested entity was not found", NOT_FOUND, unregistered)"""
+    return "not found" in error_msg.lower() or "NOT_FOUND" in error_msg or "unregistered" in error_msg.lower()
+
+
+class FirebaseSender:
+    """
+    firebase-admin ile gerçek gönderim
+    SDK çağrıları bloklayıcıdır; send_multicast thread havuzunda çalıştırılır.
+    """
+    
+    def available(self) -> bool:
+        return FIREBASE_AVAILABLE and initialize_firebase()
+    
+    def send_multicast(self, tokens: List[str], data: Dict[str, str]) -> List[Optional[str]]:
+        """Token başına sonuç: None = başarılı, aksi halde hata mesajı"""
+        # DATA-ONLY mesaj için Android config - notification payload YOK!
+        # Bu sayede uygulama arka planda olsa bile onMessageReceived çağrılır
+        message = messaging.MulticastMessage(
+            android=messaging.AndroidConfig(
+                priority="high",  # Her zaman high priority (data mesajlar için önemli)
+                ttl=0,  # Anında teslim, cache'leme yok
+            ),
+            data=data,
+            tokens=tokens
+        )
+        response = messaging.send_each_for_multicast(message)
+        return [
+            None if item.success else str(item.exception or "FCM send failed")
+            for item in response.responses
+        ]
+
+
+class FakeFCMSender:
+    """
+    Yerel test göndericisi (FCM_FAKE_SENDER=1): ağa çıkmaz, gönderilenleri kaydeder
+    "invalid" ile başlayan token'lar kalıcı hata (NOT_FOUND), "flaky" ile başlayanlar
+    ilk denemede geçici hata (UNAVAILABLE) döndürür. latency ile ağ gecikmesi taklit edilir.
+    """
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent: List[tuple] = []  # (token, data)
+        self.calls = 0
+        self.max_batch = 0
+        self._flaky_seen = set()
+    
+    def available(self) -> bool:
+        return True
+    
+    def send_multicast(self, tokens: List[str], data: Dict[str, str]) -> List[Optional[str]]:
+        if self.latency:
+            time.sleep(self.latency)  # Bloklayıcı SDK çağrısı gibi davranır
+        self.calls += 1
+        self.max_batch = max(self.max_batch, len(tokens))
+        results = []
+        for token in tokens:
+            if token.startswith("invalid"):
+                results.append("Requested entity was not found.")
+            elif token.startswith("flaky") and token not in self._flaky_seen:
+                self._flaky_seen.add(token)
+                results.append("UNAVAILABLE: The service is currently unavailable.")
+            else:
+                self.sent.append((token, data))
+                results.append(None)
+        return results
+
+
+_fcm_sender = FakeFCMSender() if FCM_FAKE_SENDER else FirebaseSender()
+
+
+def set_fcm_sender(sender):
+    """Göndericiyi değiştir (testler / yerel geliştirme); öncekini döndürür"""
+    global _fcm_sender
+    previous, _fcm_sender = _fcm_sender, sender
+    return previous
+
+
 async def send_fcm_notification(
     token: str,
     title: str,
@@ -97,49 +205,8 @@ async def send_fcm_notification(
         notification_type: emergency, case, general
         priority: high veya normal
     """
-    if not FIREBASE_AVAILABLE:
-        logger.warning("Firebase not available, skipping FCM notification")
-        return False
-    
-    if not initialize_firebase():
-        return False
-    
-    try:
-        # DATA-ONLY Android config - notification payload YOK!
-        android_config = messaging.AndroidConfig(
-            priority="high",  # Her zaman high priority
-            ttl=0,  # Anında teslim
-        )
-        
-        # Data payload - tüm bildirim bilgisi burada
-        notification_data = {
-            "title": title,
-            "body": body,
-            "type": notification_type,
-            "priority": "critical" if notification_type in ["emergency", "new_case"] else priority,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        if data:
-            notification_data.update(data)
-        
-        # DATA-ONLY mesaj - notification payload yok
-        message = messaging.Message(
-            android=android_config,
-            data=notification_data,
-            token=token
-        )
-        
-        # Gönder
-        response = messaging.send(message)
-        logger.info(f"FCM DATA-ONLY notification sent: {response}")
-        return True
-        
-    except messaging.UnregisteredError:
-        logger.warning(f"FCM token expired or invalid: {token[:20]}...")
-        return False
-    except Exception as e:
-        logger.error(f"FCM send error: {e}")
-        return False
+    result = await send_fcm_to_multiple([token], title, body, data, notification_type, priority)
+    return result["success_count"] > 0
 
 
 async def send_fcm_to_multiple(
@@ -159,89 +226,70 @@ async def send_fcm_to_multiple(
     - data-only mesajda her zaman onMessageReceived çağrılır
     - Böylece custom alarm ses ve titreşim kodu çalışabilir
     
+    Token'lar FCM_MULTICAST_LIMIT'lik gruplara bölünür, bloklayıcı SDK çağrıları
+    thread havuzunda paralel çalışır (event loop bloklanmaz).
+    
     Returns:
-        {"success_count": int, "failure_count": int, "failed_tokens": list}
+        {"success_count": int, "failure_count": int, "failed_tokens": list,
+         "retry_tokens": list (geçici hata, tekrar denenebilir), "invalid_tokens_cleaned": int}
     """
-    if not FIREBASE_AVAILABLE:
-        return {"success_count": 0, "failure_count": len(tokens), "failed_tokens": tokens}
+    if not tokens:
+        return {"success_count": 0, "failure_count": 0, "failed_tokens": [], "retry_tokens": []}
     
-    if not initialize_firebase():
-        return {"success_count": 0, "failure_count": len(tokens), "failed_tokens": tokens}
+    sender = _fcm_sender
+    if not sender.available():
+        logger.warning("Firebase not available, skipping FCM notification")
+        return {"success_count": 0, "failure_count": len(tokens), "failed_tokens": tokens,
+                "retry_tokens": [], "error": "FCM not configured"}
     
-    if not tokens:
-        return {"success_count": 0, "failure_count": 0, "failed_tokens": []}
+    notification_data = _notification_data(title, body, data, notification_type, priority)
+    batches = [tokens[i:i + FCM_MULTICAST_LIMIT] for i in range(0, len(tokens), FCM_MULTICAST_LIMIT)]
+    logger.info(f"📢 Sending FCM DATA-ONLY message: type={notification_type}, tokens={len(tokens)}, batches={len(batches)}")
     
-    try:
-        # DATA-ONLY mesaj için Android config - notification payload YOK!
-        # Bu sayede uygulama arka planda olsa bile onMessageReceived çağrılır
-        android_config = messaging.AndroidConfig(
-            priority="high",  # Her zaman high priority (data mesajlar için önemli)
-            ttl=0,  # Anında teslim, cache'leme yok
-            # notification YOKK! Data-only mesaj olacak
-        )
-        
-        # Data payload - tüm bildirim bilgisi burada
-        notification_data = {
-            "title": title,
-            "body": body,
-            "type": notification_type,
-            "priority": "critical" if notification_type in ["emergency", "new_case"] else priority,
-            "timestamp": datetime.utcnow().isoformat(),
-            "click_action": "FLUTTER_NOTIFICATION_CLICK"  # Compatibility
-        }
-        if data:
-            notification_data.update(data)
-        
-        logger.info(f"📢 Sending FCM DATA-ONLY message: type={notification_type}, tokens={len(tokens)}")
-        
-        # MulticastMessage - NOTIFICATION PAYLOAD YOK, sadece DATA!
-        message = messaging.MulticastMessage(
-            # notification=None -> Bu mesaj DATA-ONLY olacak
-            android=android_config,
-            data=notification_data,
-            tokens=tokens
-        )
-        
-        # Gönder
-        response = messaging.send_each_for_multicast(message)
-        
-        # Başarısız token'ları bul ve temizle
-        failed_tokens = []
-        invalid_tokens = []  # Geçersiz token'lar (veritabanından silinecek)
-        
-        for idx, send_response in enumerate(response.responses):
-            if not send_response.success:
-                failed_tokens.append(tokens[idx])
-                if send_response.exception:
-                    error_msg = str(send_response.exception)
-                    logger.warning(f"FCM send failed for token {tokens[idx][:20]}...: {error_msg}")
-                    
-                    # "Requested entity was not found" veya "NOT_FOUND" hatası = geçersiz token
-                    if "not found" in error_msg.lower() or "NOT_FOUND" in error_msg or "unregistered" in error_msg.lower():
-                        invalid_tokens.append(tokens[idx])
-                        logger.info(f"🗑️ Marking token for removal: {tokens[idx][:20]}...")
-        
-        # Geçersiz token'ları veritabanından temizle
-        if invalid_tokens:
-            try:
-                await _cleanup_invalid_tokens(invalid_tokens)
-            except Exception as e:
-                logger.error(f"Error cleaning up invalid tokens: {e}")
-        
-        logger.info(f"✅ FCM multicast: {response.success_count} success, {response.failure_count} failed (DATA-ONLY)")
-        if invalid_tokens:
-            logger.info(f"🗑️ Cleaned up {len(invalid_tokens)} invalid FCM tokens")
-        
-        return {
-            "success_count": response.success_count,
-            "failure_count": response.failure_count,
-            "failed_tokens": failed_tokens,
-            "invalid_tokens_cleaned": len(invalid_tokens)
-        }
-        
-    except Exception as e:
-        logger.error(f"FCM multicast error: {e}")
-        return {"success_count": 0, "failure_count": len(tokens), "failed_tokens": tokens}
+    loop = asyncio.get_running_loop()
+    responses = await asyncio.gather(*(
+        loop.run_in_executor(_fcm_executor, sender.send_multicast, batch, notification_data)
+        for batch in batches
+    ), return_exceptions=True)
+    
+    success_count = 0
+    failed_tokens = []
+    retry_tokens = []  # Geçici hatalar (ağ, kota, UNAVAILABLE)
+    invalid_tokens = []  # Geçersiz token'lar (veritabanından silinecek)
+    
+    for batch, response in zip(batches, responses):
+        if isinstance(response, Exception):
+            # Grubun tamamı gönderilemedi - hepsi tekrar denenebilir
+            logger.error(f"FCM multicast error: {response}")
+            failed_tokens.extend(batch)
+            retry_tokens.extend(batch)
+            continue
+        for token, error_msg in zip(batch, response):
+            if error_msg is None:
+                success_count += 1
+                continue
+            failed_tokens.append(token)
+            logger.warning(f"FCM send failed for token {token[:20]}...: {error_msg}")
+            if is_invalid_token_error(error_msg):
+                invalid_tokens.append(token)
+            else:
+                retry_tokens.append(token)
+    
+    # Geçersiz token'ları veritabanından temizle
+    if invalid_tokens:
+        await _cleanup_invalid_tokens(invalid_tokens)
+        logger.info(f"🗑️ Cleaned up {len(invalid_tokens)} invalid FCM tokens")
+    
+    logger.info(f"✅ FCM multicast: {success_count} success, {len(failed_tokens)} failed (DATA-ONLY)")
+    
+    return {
+        "success_count": success_count,
+        "failure_count": len(failed_tokens),
+        "failed_tokens": failed_tokens,
+        "retry_tokens": retry_tokens,
+        "invalid_tokens_cleaned": len(invalid_tokens),
+        "batches": len(batches)
+    }
 
 
 async def send_case_notification_fcm(
@@ -329,18 +377,24 @@ class FirebaseService:
 
 
 async def _cleanup_invalid_tokens(invalid_tokens: List[str]):
-    """Geçersiz FCM token'larını veritabanından temizle"""
+    """Geçersiz FCM token'larını veritabanından temizle (cihaz listesi + eski tekil alan)"""
     try:
         from database import users_collection
         
-        for token in invalid_tokens:
-            # Token'ı boş string yaparak temizle
-            result = await users_collection.update_many(
-                {"fcm_token": token},
-                {"$set": {"fcm_token": None}}
-            )
-            if result.modified_count > 0:
-                logger.info(f"🗑️ Removed invalid FCM token from {result.modified_count} user(s)")
+        result = await users_collection.update_many(
+            {"fcm_tokens.token": {"$in": invalid_tokens}},
+            {"$pull": {"fcm_tokens": {"token": {"$in": invalid_tokens}}}}
+        )
+        legacy = await users_collection.update_many(
+            {"fcm_token": {"$in": invalid_tokens}},
+            {"$set": {"fcm_token": None}}
+        )
+        modified = result.modified_count + legacy.modified_count
+        
+        from services.token_directory import token_directory
+        token_directory.remove_tokens(invalid_tokens)
+        if modified > 0:
+            logger.info(f"🗑️ Removed invalid FCM tokens from {modified} user(s)")
     except Exception as e:
         logger.error(f"Error in _cleanup_invalid_tokens: {e}")
 
@@ -0,0 +1,188 @@
+"""
+Filo Canlı Konum Tablosu
+Tüm araçların son bilinen konumu bellekte tutulur; harita araç başına /gps/latest yoklamak
+yerine tek bir anlık görüntü (/locations/vehicles/all-gps) alır ve canlı akışa (WebSocket/SSE)
+bağlanarak sadece değişen araçları alır.
+
+Tablo ilk kullanımda vehicle_current_locations'tan tek sorguyla yüklenir ve GPS alım yolunda
+(update_vehicle_gps) güncellenir. Değişen araçlar FLEET_PUSH_INTERVAL_SECONDS'da bir tek
+"positions" olayı olarak case_hub'ın FLEET_TOPIC konusunda yayınlanır (CASE_HUB_REDIS_URL varsa tüm worker'lara).
+Diğer worker'lara düşen ping'ler tabloya FLEET_RESYNC_SECONDS'da bir yapılan birleştirmeyle
+(daha yeni olan kazanır) yansır.
+
+Akış olayları:
+    {"type": "positions", "vehicles": [...]}  - değişen araçlar (anlık görüntü ile aynı alanlar)
+    {"type": "resync"}                        - istemci geride kaldı, anlık görüntüyü yeniden alsın
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from database import db
+from services.case_hub import case_hub
+
+logger = logging.getLogger(__name__)
+
+FLEET_TOPIC = "fleet"
+FLEET_PUSH_INTERVAL_SECONDS = float(os.getenv("FLEET_PUSH_INTERVAL_SECONDS", 1))
+FLEET_RESYNC_SECONDS = int(os.getenv("FLEET_RESYNC_SECONDS", 30))
+
+CURRENT_PROJECTION = {
+    "vehicle_id": 1, "vehicle_plate": 1, "current_location_name": 1,
+    "last_gps_latitude": 1, "last_gps_longitude": 1, "last_gps_accuracy": 1,
+    "last_gps_speed": 1, "last_gps_heading": 1, "last_gps_update": 1,
+}
+# Bu alanlardan biri değişmezse araç akışa tekrar gönderilmez
+MOTION_FIELDS = ("latitude", "longitude", "speed", "heading")
+
+
+def _entry_from_current(doc: dict, plate: Optional[str]) -> dict:
+    """vehicle_current_locations dokümanı -> /vehicles/all-gps öğesi"""
+    return {
+        "vehicle_id": doc["vehicle_id"],
+        "vehicle_plate": plate or doc.get("vehicle_plate"),
+        "latitude": doc.get("last_gps_latitude"),
+        "longitude": doc.get("last_gps_longitude"),
+        "accuracy": doc.get("last_gps_accuracy"),
+        "speed": doc.get("last_gps_speed"),
+        "heading": doc.get("last_gps_heading"),
+        "last_update": doc.get("last_gps_update"),
+        "current_location_name": doc.get("current_location_name"),
+    }
+
+
+class FleetPositions:
+    """vehicle_id -> son konum + değişenlerin periyodik yayını"""
+
+    def __init__(self, database=None, hub=None):
+        self.database = database
+        self.hub = hub or case_hub
+        self._positions: Dict[str, dict] = {}
+        self._dirty: set = set()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"updates": 0, "pushes": 0, "vehicles_pushed": 0, "resyncs": 0}
+
+    @property
+    def _db(self):
+        return self.database if self.database is not None else db
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ---------- tablo ----------
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._merge_from_db()
+
+    async def _merge_from_db(self):
+        """vehicle_current_locations'ı tabloya birleştir (yerel kayıt daha yeniyse korunur)"""
+        docs = await self._db.vehicle_current_locations.find(
+            {"last_gps_latitude": {"$ne": None}}, CURRENT_PROJECTION
+        ).to_list(None)
+        plates = {}
+        vehicle_ids = [doc["vehicle_id"] for doc in docs if doc.get("vehicle_id")]
+        async for vehicle in self._db.vehicles.find({"_id": {"$in": vehicle_ids}}, {"plate": 1}):
+            plates[vehicle["_id"]] = vehicle.get("plate")
+
+        for doc in docs:
+            vehicle_id = doc.get("vehicle_id")
+            if vehicle_id not in plates:
+                continue  # Silinmiş araç
+            entry = _entry_from_current(doc, plates.get(vehicle_id))
+            current = self._positions.get(vehicle_id)
+            if current and current["last_update"] and entry["last_update"] and current["last_update"] >= entry["last_update"]:
+                current["current_location_name"] = entry["current_location_name"]
+                continue
+            if current is None or any(current.get(f) != entry[f] for f in MOTION_FIELDS):
+                self._dirty.add(vehicle_id)
+            self._positions[vehicle_id] = entry
+        self._loaded = True
+        self.stats["resyncs"] += 1
+
+    def record(self, vehicle_id: str, plate: Optional[str], fields: dict):
+        """GPS alım yolundan gelen son konum (vehicle_current_locations $set alanları)"""
+        current = self._positions.get(vehicle_id, {})
+        entry = _entry_from_current({**fields, "vehicle_id": vehicle_id}, plate)
+        entry["current_location_name"] = current.get("current_location_name")
+        if any(current.get(f) != entry[f] for f in MOTION_FIELDS):
+            self._dirty.add(vehicle_id)
+        self._positions[vehicle_id] = entry
+        self.stats["updates"] += 1
+
+    def get(self, vehicle_id: str) -> Optional[dict]:
+        return self._positions.get(vehicle_id)
+
+    def snapshot(self) -> List[dict]:
+        return [dict(entry) for entry in self._positions.values() if entry.get("latitude") is not None]
+
+    def set_plate(self, vehicle_id: str, plate: str):
+        entry = self._positions.get(vehicle_id)
+        if entry:
+            entry["vehicle_plate"] = plate
+            self._dirty.add(vehicle_id)
+
+    def forget_vehicle(self, vehicle_id: str):
+        """Araç silindi"""
+        self._positions.pop(vehicle_id, None)
+        self._dirty.discard(vehicle_id)
+
+    # ---------- yayın ----------
+
+    async def push_changes(self) -> int:
+        """Değişen araçları tek olay olarak yayınla; yayınlanan araç sayısını döndür"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        vehicles = [dict(self._positions[v]) for v in dirty if v in self._positions]
+        if vehicles:
+            await self.hub.publish_topic(FLEET_TOPIC, {"type": "positions", "vehicles": vehicles})
+            self.stats["pushes"] += 1
+            self.stats["vehicles_pushed"] += len(vehicles)
+        return len(vehicles)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_resync = loop.time() + FLEET_RESYNC_SECONDS
+        while True:
+            try:
+                await asyncio.sleep(FLEET_PUSH_INTERVAL_SECONDS)
+                if loop.time() >= next_resync:
+                    next_resync = loop.time() + FLEET_RESYNC_SECONDS
+                    if self._loaded:
+                        await self._merge_from_db()
+                await self.push_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Filo konum yayını hatası: {e}")
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "vehicles": len(self._positions),
+            "pending": len(self._dirty),
+            "subscribers": self.hub.subscriber_count(FLEET_TOPIC),
+            **self.stats,
+        }
+
+
+# Singleton
+fleet_positions = FleetPositions()
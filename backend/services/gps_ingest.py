@@ -0,0 +1,254 @@
+"""
+GPS Alım Tamponu (write-behind)
+Araç GPS ping'leri istek içinde tek tek yazılmaz: geçmiş kayıtları bellekte biriktirilir ve
+boyut (GPS_FLUSH_SIZE) ya da süre (GPS_FLUSH_INTERVAL_SECONDS) dolunca tek insert_many(ordered=False)
+ile yazılır. Araç başına sadece en son konum tutulur ve vehicle_current_locations'a tek bulk_write
+ile aktarılır. Plaka bilgisi araç başına önbellekten okunur.
+
+Yazma hatasında kayıtlar tampona geri konur (GPS_BUFFER_MAX sınırına kadar). Tampon bu sınırı
+aşarsa ping isteği boşaltma bitene kadar bekler. stop() kapanışta tamponu sonuna kadar boşaltır.
+
+Tekrar gönderilen offline noktalar (aynı _id: gps_{araç}_{cihaz zamanı}) normal koleksiyonda
+_id tekilliğiyle atlanır. vehicle_gps_history time-series olarak açıldıysa (GPS_HISTORY_TIMESERIES)
+_id tekil değildir; yazmadan önce aynı tampondaki ve son GPS_DEDUP_WINDOW_SECONDS içinde yazılmış
+_id'ler ayıklanır. Pencereden eski tekrarlar ve iki worker'ın aynı anda yazdığı tekrarlar yakalanmaz.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+GPS_FLUSH_SIZE = int(os.getenv("GPS_FLUSH_SIZE", 500))  # Bu kadar kayıt birikince hemen yaz
+GPS_FLUSH_INTERVAL_SECONDS = float(os.getenv("GPS_FLUSH_INTERVAL_SECONDS", 2))  # En geç bu kadar sonra yaz
+GPS_BUFFER_MAX = int(os.getenv("GPS_BUFFER_MAX", 50000))  # Üstünde istekler boşaltmayı bekler
+GPS_PLATE_CACHE_TTL = int(os.getenv("GPS_PLATE_CACHE_TTL", 300))  # Araç plakası önbellek süresi (saniye)
+GPS_DEDUP_WINDOW_SECONDS = int(os.getenv("GPS_DEDUP_WINDOW_SECONDS", 3600))  # Time-series tekrar kontrolü geriye bakışı
+
+HISTORY_COLLECTION = "vehicle_gps_history"
+CURRENT_COLLECTION = "vehicle_current_locations"
+
+_MISSING = object()
+
+
+class GPSIngestBuffer:
+    """GPS geçmişi + son konum write-behind tamponu"""
+
+    def __init__(self, database=None):
+        self.database = database
+        self._history: List[dict] = []
+        self._latest: Dict[str, dict] = {}
+        self._plates = TTLCache(maxsize=10000, ttl=GPS_PLATE_CACHE_TTL)  # vehicle_id -> plaka (yoksa None)
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._timeseries: Optional[bool] = None
+        self.stats = {
+            "received": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "positions_written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "dropped": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": 0,
+        }
+
+    @property
+    def _db(self):
+        return self.database if self.database is not None else db
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._history)
+
+    # ---------- plaka önbelleği ----------
+
+    async def plates_for(self, vehicle_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """vehicle_id -> plaka; olmayan araçlar None (tek sorguda, önbellekten)"""
+        result, missing = {}, []
+        for vehicle_id in dict.fromkeys(vehicle_ids):
+            plate = self._plates.get(vehicle_id, _MISSING)
+            if plate is _MISSING:
+                missing.append(vehicle_id)
+            else:
+                result[vehicle_id] = plate
+        if missing:
+            found = {}
+            async for vehicle in self._db.vehicles.find({"_id": {"$in": missing}}, {"plate": 1}):
+                found[vehicle["_id"]] = vehicle.get("plate", "")
+            for vehicle_id in missing:
+                self._plates[vehicle_id] = result[vehicle_id] = found.get(vehicle_id)
+        return result
+
+    def forget_vehicle(self, vehicle_id: str):
+        """Araç silindi / plakası değişti"""
+        self._plates.pop(vehicle_id, None)
+
+    # ---------- alım ----------
+
+    async def add(self, history: List[dict], latest: Optional[Dict[str, dict]] = None):
+        """
+        Geçmiş kayıtlarını ve araç başına son konumları tampona ekle
+        latest: {vehicle_id: vehicle_current_locations $set alanları}
+        """
+        self._history.extend(history)
+        if latest:
+            self._latest.update(latest)
+        self.stats["received"] += len(history)
+
+        if len(self._history) >= GPS_BUFFER_MAX:
+            # Geri basınç: yazma yetişemiyor, istek boşaltmayı beklesin
+            await self.flush()
+        elif len(self._history) >= GPS_FLUSH_SIZE:
+            self._wake.set()
+
+    # ---------- boşaltma ----------
+
+    async def flush(self) -> int:
+        """Tamponu yaz; yazılan geçmiş kaydı sayısını döndür"""
+        async with self._flush_lock:
+            history, self._history = self._history, []
+            latest, self._latest = self._latest, {}
+            if not history and not latest:
+                return 0
+
+            started = time.perf_counter()
+            inserted = 0
+            try:
+                if history:
+                    inserted = await self._insert_history(history)
+                    history = []  # Yazıldı; konum güncellemesi başarısız olursa tekrar yazılmasın
+                if latest:
+                    await self._db[CURRENT_COLLECTION].bulk_write([
+                        UpdateOne({"vehicle_id": vehicle_id}, {"$set": fields}, upsert=True)
+                        for vehicle_id, fields in latest.items()
+                    ], ordered=False)
+                    self.stats["positions_written"] += len(latest)
+            except asyncio.CancelledError:
+                # Yazım yarıda kesildi; kayıtlar kaybolmasın (tekrarlar _id ile ayıklanır)
+                self._requeue(history, latest)
+                raise
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                self._requeue(history, latest)
+                logger.error(f"GPS tamponu yazılamadı ({len(history)} kayıt, {len(latest)} konum geri kondu): {e}")
+                return 0
+
+            elapsed_ms = round((time.perf_counter() - started) * 1000)
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = elapsed_ms
+            self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed_ms)
+            return inserted
+
+    async def _history_is_timeseries(self) -> bool:
+        """Geçmiş koleksiyonu time-series mi (ilk yazımda bir kez okunur)"""
+        if self._timeseries is None:
+            options = await self._db[HISTORY_COLLECTION].options()
+            self._timeseries = "timeseries" in options
+        return self._timeseries
+
+    async def _drop_recently_written(self, docs: List[dict]) -> List[dict]:
+        """Son GPS_DEDUP_WINDOW_SECONDS içinde yazılmış _id'leri çıkar (time-series'te _id tekil değil)"""
+        since = min(doc["created_at"] for doc in docs) - timedelta(seconds=GPS_DEDUP_WINDOW_SECONDS)
+        written = set(await self._db[HISTORY_COLLECTION].distinct("_id", {
+            "vehicle_id": {"$in": list({doc["vehicle_id"] for doc in docs})},
+            "created_at": {"$gte": since},
+            "_id": {"$in": [doc["_id"] for doc in docs]},
+        }))
+        return [doc for doc in docs if doc["_id"] not in written]
+
+    async def _insert_history(self, history: List[dict]) -> int:
+        # Aynı tampondaki tekrarlar (aynı _id) tek kayda indirilir
+        unique = list({doc["_id"]: doc for doc in history}.values())
+        if await self._history_is_timeseries():
+            unique = await self._drop_recently_written(unique)
+        self.stats["duplicates"] += len(history) - len(unique)
+        if not unique:
+            return 0
+        try:
+            result = await self._db[HISTORY_COLLECTION].insert_many(unique, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            # ordered=False: tekrar eden _id'ler atlanır, diğerleri yazılır
+            details = e.details or {}
+            write_errors = details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in write_errors):
+                raise
+            inserted = details.get("nInserted", 0)
+            self.stats["duplicates"] += len(write_errors)
+        self.stats["inserted"] += inserted
+        return inserted
+
+    def _requeue(self, history: List[dict], latest: Dict[str, dict]):
+        # Yeni gelen son konumlar eskilerden önceliklidir
+        self._latest = {**latest, **self._latest}
+        self._history = history + self._history
+        overflow = len(self._history) - GPS_BUFFER_MAX
+        if overflow > 0:
+            self._history = self._history[overflow:]
+            self.stats["dropped"] += overflow
+            logger.error(f"GPS tamponu taştı, en eski {overflow} kayıt atıldı")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), GPS_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"GPS tampon boşaltma hatası: {e}")
+
+    async def start(self):
+        if not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("GPS alım tamponu başlatıldı")
+
+    async def stop(self):
+        """Arka plan görevini durdur ve tamponu sonuna kadar boşalt"""
+        if self._task:
+            # İptal yerine son turun bitmesini bekle (yarım kalan yazım olmasın)
+            self._stopping = True
+            self._wake.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for _ in range(3):
+            await self.flush()
+            if not self._history and not self._latest:
+                break
+        if self._history:
+            logger.error(f"GPS tamponu kapanışta boşaltılamadı: {len(self._history)} kayıt kaybedildi")
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "timeseries": self._timeseries,
+            "buffered": len(self._history),
+            "pending_positions": len(self._latest),
+            "plate_cache": len(self._plates),
+            **self.stats,
+        }
+
+
+# Singleton
+gps_ingest = GPSIngestBuffer()
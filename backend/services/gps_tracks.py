@@ -0,0 +1,294 @@
+"""
+GPS Rota Özetleme
+Bir zaman penceresindeki ham GPS noktalarını haritada oynatılabilir sade bir rotaya indirger:
+    - Douglas-Peucker (tolerance_m) ya da zaman kovası (bucket_seconds) ile nokta azaltma
+    - Toplam mesafe (duraklamalardaki GPS titreşimi hariç) ve duraklama segmentleri
+    - İsteğe bağlı Google encoded polyline (delta kodlu, kompakt)
+
+Noktalar cihazın ölçüm zamanına (recorded_at) göre sıralanır ve zamanlanır; offline biriktirilip
+sonradan gönderilen noktalar alım zamanında (created_at) üst üste binmez. recorded_at alanı
+olmayan eski kayıtlarda timestamp alanı, o da çözülemezse created_at kullanılır.
+
+Hesaplar NumPy ile vektörel yapılır ve event loop'u bloklamamak için executor'da çalışır.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from functools import partial
+from typing import List, Optional
+
+import numpy as np
+
+from database import db
+from utils.timezone import parse_turkey_datetime
+
+logger = logging.getLogger(__name__)
+
+GPS_TRACK_MAX_HOURS = int(os.getenv("GPS_TRACK_MAX_HOURS", 48))  # Tek sorguda izin verilen pencere
+GPS_TRACK_MAX_RAW_POINTS = int(os.getenv("GPS_TRACK_MAX_RAW_POINTS", 200000))
+GPS_TRACK_MAX_ACCURACY_M = float(os.getenv("GPS_TRACK_MAX_ACCURACY_M", 100))  # Daha kötü doğruluklu noktalar atılır
+STOP_RADIUS_M = 50  # Bu yarıçap içinde kalan ardışık noktalar duraklama sayılır
+STOP_MIN_SECONDS = 120  # En kısa duraklama süresi
+
+EARTH_RADIUS_M = 6371008.8
+TRACK_PROJECTION = {
+    "_id": 0, "latitude": 1, "longitude": 1, "speed": 1, "accuracy": 1,
+    "recorded_at": 1, "timestamp": 1, "created_at": 1,
+}
+
+
+# ---------- geometri ----------
+
+def segment_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Ardışık noktalar arası haversine mesafeleri (metre, n-1 eleman)"""
+    lat_r, lon_r = np.radians(lat), np.radians(lon)
+    dlat, dlon = np.diff(lat_r), np.diff(lon_r)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_r[:-1]) * np.cos(lat_r[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def project_xy(lat: np.ndarray, lon: np.ndarray):
+    """Eşdikdörtgen izdüşüm (metre) - şehir ölçeğinde mesafe karşılaştırması için yeterli"""
+    lat0 = np.radians(lat.mean()) if len(lat) else 0.0
+    x = np.radians(lon) * EARTH_RADIUS_M * np.cos(lat0)
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Korunan noktaların mask'ı (yığın tabanlı, her segmentte mesafeler vektörel)"""
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            middle = start + 1 + index
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return keep
+
+
+def time_buckets(t: np.ndarray, bucket_seconds: float) -> np.ndarray:
+    """Her zaman kovasının son noktasını koruyan mask (ilk nokta da korunur)"""
+    keep = np.zeros(len(t), dtype=bool)
+    if len(t) == 0:
+        return keep
+    buckets = np.floor((t - t[0]) / bucket_seconds).astype(np.int64)
+    last_in_bucket = np.append(buckets[1:] != buckets[:-1], True)
+    keep[last_in_bucket] = True
+    keep[0] = True
+    return keep
+
+
+def detect_stops(t: np.ndarray, x: np.ndarray, y: np.ndarray,
+                 radius_m: float = STOP_RADIUS_M, min_seconds: float = STOP_MIN_SECONDS) -> List[tuple]:
+    """
+    Duraklama segmentleri: (başlangıç_index, bitiş_index)
+    Çapa noktasından radius_m içinde kalınan ve en az min_seconds süren ardışık noktalar.
+    """
+    stops = []
+    n = len(t)
+    i = 0
+    while i < n - 1:
+        # Çapadan radius dışına çıkılan ilk nokta (parça parça vektörel arama)
+        j, chunk = i + 1, 256
+        while j < n:
+            window = slice(j, min(n, j + chunk))
+            outside = np.hypot(x[window] - x[i], y[window] - y[i]) > radius_m
+            if outside.any():
+                j += int(np.argmax(outside))
+                break
+            j = window.stop
+        last = j - 1
+        if last > i and t[last] - t[i] >= min_seconds:
+            stops.append((i, last))
+            i = last + 1
+        else:
+            i += 1
+
+    # Çapa hareketin son noktasına denk gelince bölünen duraklamaları birleştir
+    merged = []
+    for start, end in stops:
+        if merged and start == merged[-1][1] + 1:
+            prev_start, prev_end = merged[-1]
+            gap = np.hypot(x[prev_start:prev_end + 1].mean() - x[start:end + 1].mean(),
+                           y[prev_start:prev_end + 1].mean() - y[start:end + 1].mean())
+            if gap <= radius_m:
+                merged[-1] = (prev_start, end)
+                continue
+        merged.append((start, end))
+    return merged
+
+
+def encode_polyline(lat: np.ndarray, lon: np.ndarray, precision: int = 5) -> str:
+    """Google encoded polyline (delta + zigzag + 5 bit gruplar)"""
+    if len(lat) == 0:
+        return ""
+    factor = 10 ** precision
+    coords = np.column_stack([np.round(lat * factor), np.round(lon * factor)]).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+# ---------- rota özeti ----------
+
+def _as_float(value) -> Optional[float]:
+    """Sayıya çevrilebilen değer (string dahil) ya da None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if np.isfinite(number) else None
+
+
+def point_time(point: dict) -> Optional[datetime]:
+    """Noktanın ölçüm zamanı: recorded_at, eski kayıtlarda timestamp ya da created_at"""
+    return point.get("recorded_at") or parse_turkey_datetime(point.get("timestamp")) or point.get("created_at")
+
+
+def _clean_points(points: List[dict]) -> List[dict]:
+    """
+    Koordinatı ve zamanı okunabilen, doğruluğu yeterli noktalar (ölçüm zamanına göre sıralı)
+    String saklanmış sayılar çevrilir; doğruluğu okunamayan nokta atılır.
+    """
+    cleaned = []
+    for p in points:
+        lat, lon, recorded_at = _as_float(p.get("latitude")), _as_float(p.get("longitude")), point_time(p)
+        if lat is None or lon is None or not isinstance(recorded_at, datetime):
+            continue
+        accuracy = p.get("accuracy")
+        if accuracy is not None:
+            accuracy = _as_float(accuracy)
+            if accuracy is None or accuracy > GPS_TRACK_MAX_ACCURACY_M:
+                continue
+        cleaned.append({"latitude": lat, "longitude": lon, "speed": _as_float(p.get("speed")), "time": recorded_at})
+    cleaned.sort(key=lambda p: p["time"])
+    return cleaned
+
+
+def summarize_track(points: List[dict], tolerance_m: Optional[float] = 15.0,
+                    bucket_seconds: Optional[float] = None, include_polyline: bool = False) -> dict:
+    """
+    Ham noktalardan sade rota + mesafe + duraklamalar
+    bucket_seconds verilirse zaman kovası, yoksa Douglas-Peucker (tolerance_m) kullanılır.
+    """
+    points = _clean_points(points)
+    n = len(points)
+    result = {
+        "raw_points": n,
+        "points": [],
+        "distance_km": 0.0,
+        "duration_seconds": 0,
+        "moving_seconds": 0,
+        "stops": [],
+    }
+    if n == 0:
+        return result
+
+    lat = np.fromiter((p["latitude"] for p in points), dtype=np.float64, count=n)
+    lon = np.fromiter((p["longitude"] for p in points), dtype=np.float64, count=n)
+    t = np.fromiter((p["time"].timestamp() for p in points), dtype=np.float64, count=n)
+    x, y = project_xy(lat, lon)
+
+    # Duraklamalar; duraklama içindeki segmentler mesafeye katılmaz (GPS titreşimi)
+    stops = detect_stops(t, x, y)
+    in_stop = np.zeros(max(n - 1, 0), dtype=bool)
+    for start, end in stops:
+        in_stop[start:end] = True
+    distances = segment_distances(lat, lon) if n > 1 else np.zeros(0)
+    stopped_seconds = sum(t[end] - t[start] for start, end in stops)
+
+    if bucket_seconds:
+        keep = time_buckets(t, bucket_seconds)
+        result["simplification"] = {"method": "time_bucket", "bucket_seconds": bucket_seconds}
+    else:
+        keep = douglas_peucker(x, y, tolerance_m or 0)
+        result["simplification"] = {"method": "douglas_peucker", "tolerance_m": tolerance_m}
+    # Duraklama sınırları rotada kalsın
+    for start, end in stops:
+        keep[start] = keep[end] = True
+
+    indices = np.flatnonzero(keep)
+    result["simplification"]["ratio"] = round(len(indices) / n, 4)
+    result["points"] = [
+        {
+            "latitude": points[i]["latitude"],
+            "longitude": points[i]["longitude"],
+            "speed": points[i]["speed"],
+            "timestamp": points[i]["time"].isoformat(),
+        }
+        for i in indices.tolist()
+    ]
+    result["distance_km"] = round(float(distances[~in_stop].sum()) / 1000, 3)
+    result["duration_seconds"] = int(t[-1] - t[0])
+    result["moving_seconds"] = int(t[-1] - t[0] - stopped_seconds)
+    result["stops"] = [
+        {
+            "start": points[start]["time"].isoformat(),
+            "end": points[end]["time"].isoformat(),
+            "duration_seconds": int(t[end] - t[start]),
+            "latitude": round(float(lat[start:end + 1].mean()), 6),
+            "longitude": round(float(lon[start:end + 1].mean()), 6),
+        }
+        for start, end in stops
+    ]
+    if include_polyline:
+        result["polyline"] = encode_polyline(lat[indices], lon[indices])
+    return result
+
+
+async def get_vehicle_track(vehicle_id: str, start: datetime, end: datetime,
+                            tolerance_m: Optional[float] = 15.0, bucket_seconds: Optional[float] = None,
+                            include_polyline: bool = False, database=None) -> dict:
+    """
+    Ölçüm zamanı pencere içindeki noktaları (eskiden yeniye) oku ve özetle
+    start/end naive Türkiye saati olmalıdır (kayıtlarla aynı).
+    """
+    database = database if database is not None else db
+    window = {"$gte": start, "$lte": end}
+    points = await database.vehicle_gps_history.find(
+        {"vehicle_id": vehicle_id, "$or": [
+            {"recorded_at": window},
+            {"recorded_at": {"$exists": False}, "created_at": window},  # recorded_at öncesi kayıtlar
+        ]},
+        TRACK_PROJECTION
+    ).sort("recorded_at", 1).to_list(GPS_TRACK_MAX_RAW_POINTS)
+
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(
+        None,
+        partial(summarize_track, points, tolerance_m, bucket_seconds, include_polyline)
+    )
+    return {
+        "vehicle_id": vehicle_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "truncated": len(points) >= GPS_TRACK_MAX_RAW_POINTS,
+        **summary,
+    }
@@ -15,6 +15,8 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 import asyncio
 
+from utils import gs1
+
 logger = logging.getLogger(__name__)
 
 # İTS API URLs
@@ -320,6 +322,7 @@ def parse_datamatrix(barcode: str) -> Dict:
     - 21: Seri Numarası (değişken uzunluk)
     - 10: Parti/Lot Numarası (değişken uzunluk)
     - 17: Son Kullanma Tarihi (YYMMDD - 6 hane)
+    - 30: Kutudaki adet (değişken uzunluk)
     
     Args:
         barcode: DataMatrix içeriği
@@ -333,186 +336,54 @@ def parse_datamatrix(barcode: str) -> Dict:
             "raw": "orijinal karekod"
         }
     """
-    import re
+    return _datamatrix_result(barcode, gs1.parse(barcode) if barcode else {})
+
+
+def parse_datamatrix_many(barcodes: List[str]) -> List[Dict]:
+    """
+    Karekod listesini toplu parse et (toplu stok girişi için)
+    Sonuçlar giriş sırasıyla, parse_datamatrix ile aynı formatta döner.
+    """
+    barcodes = list(barcodes)
+    return [
+        _datamatrix_result(barcode, fields)
+        for barcode, fields in zip(barcodes, gs1.parse_many(b or "" for b in barcodes))
+    ]
+
+
+def _datamatrix_result(barcode: str, fields: Dict) -> Dict:
+    quantity = fields.get("quantity")
+    if quantity is not None:
+        quantity = int(quantity)
+        # Makul değer kontrolü (1-1000 arası)
+        if not 1 <= quantity <= 1000:
+            quantity = None
     
     result = {
-        "gtin": None,
-        "serial_number": None,
-        "lot_number": None,
-        "expiry_date": None,
-        "quantity": None,  # AI (30) - Kutudaki adet
+        "gtin": fields.get("gtin"),
+        "serial_number": fields.get("serial_number"),
+        "lot_number": fields.get("lot_number"),
+        "expiry_date": _parse_expiry_date(fields.get("expiry_date")),
+        "quantity": quantity,  # AI (30) - Kutudaki adet
         "raw": barcode
     }
-    
-    if not barcode:
-        return result
-    
-    # Kontrol karakterlerini temizle (FNC1, GS, RS, EOT vs.)
-    clean_barcode = barcode.replace('\x1d', '|').replace('\x1e', '|').replace('\x04', '|')
-    clean_barcode = re.sub(r'[\x00-\x1f]', '|', clean_barcode)
-    
-    logger.debug(f"Parsing barcode: {repr(barcode)}")
-    logger.debug(f"Cleaned barcode: {clean_barcode}")
-    
-    # Yöntem 1: Parantezli format: (01)GTIN(21)SERI...
-    if '(' in clean_barcode:
-        # GTIN (01)
-        gtin_match = re.search(r'\(01\)(\d{14})', clean_barcode)
-        if gtin_match:
-            result["gtin"] = gtin_match.group(1)
-        
-        # Seri Numarası (21)
-        serial_match = re.search(r'\(21\)([^\(\)]+)', clean_barcode)
-        if serial_match:
-            result["serial_number"] = serial_match.group(1).strip()
-        
-        # Parti/Lot Numarası (10)
-        lot_match = re.search(r'\(10\)([^\(\)]+)', clean_barcode)
-        if lot_match:
-            result["lot_number"] = lot_match.group(1).strip()
-        
-        # Son Kullanma Tarihi (17)
-        exp_match = re.search(r'\(17\)(\d{6})', clean_barcode)
-        if exp_match:
-            exp_str = exp_match.group(1)
-            result["expiry_date"] = _parse_expiry_date(exp_str)
-        
-        # Kutudaki Adet (30) - parantezli format
-        qty_match = re.search(r'\(30\)(\d+)', clean_barcode)
-        if qty_match:
-            qty = int(qty_match.group(1))
-            # Makul değer kontrolü (1-1000 arası)
-            if 1 <= qty <= 1000:
-                result["quantity"] = qty
-    
-    # Yöntem 2: GS ayraçlı veya ayraçsız format
-    # 01GTIN17SKT10LOT21SERIAL veya 01GTIN|17SKT|10LOT|21SERIAL
-    if not result["gtin"]:
-        # AI kodlarını bul (01, 10, 17, 21)
-        # Önce ayraçlarla dene
-        parts = clean_barcode.split('|')
-        
-        # Tüm parçaları birleştir ve AI'ları bul
-        full_data = ''.join(parts)
-        
-        # GTIN (01) - 14 haneli
-        gtin_match = re.search(r'01(\d{14})', full_data)
-        if gtin_match:
-            result["gtin"] = gtin_match.group(1)
-        
-        # SKT (17) - 6 haneli tarih
-        exp_match = re.search(r'17(\d{6})', full_data)
-        if exp_match:
-            result["expiry_date"] = _parse_expiry_date(exp_match.group(1))
-        
-        # Kutudaki Adet (30) - değişken uzunluklu
-        # AI (30) dan sonra gelen sayıları al, ama başka AI ile karışmaması için dikkatli ol
-        qty_match = re.search(r'(?:^|[^\d])30(\d{1,8})(?:[^\d]|$)', full_data)
-        if qty_match:
-            result["quantity"] = int(qty_match.group(1))
-        
-        # Lot (10) ve Seri (21) değişken uzunluklu - daha karmaşık parse
-        # Bu AI'lar değişken uzunlukta olduğu için sırayla bakmamız gerekiyor
-        
-        # Önce sabit uzunluklu AI'ları çıkar
-        remaining = full_data
-        if result["gtin"]:
-            remaining = remaining.replace(f'01{result["gtin"]}', '|')
-        if exp_match:
-            remaining = remaining.replace(f'17{exp_match.group(1)}', '|')
-        
-        # Kalan parçalarda 10 ve 21'i ara
-        for segment in remaining.split('|'):
-            segment = segment.strip()
-            if not segment:
-                continue
-            
-            if segment.startswith('21') and not result["serial_number"]:
-                # Seri numarasını al (sonraki AI'ya kadar veya sona kadar)
-                serial_val = segment[2:]
-                # Başka bir AI ile başlayan kısmı kes
-                for ai in ['01', '10', '17']:
-                    ai_pos = serial_val.find(ai)
-                    if ai_pos > 0:
-                        serial_val = serial_val[:ai_pos]
-                result["serial_number"] = serial_val.strip()
-                
-            elif segment.startswith('10') and not result["lot_number"]:
-                lot_val = segment[2:]
-                for ai in ['01', '17', '21']:
-                    ai_pos = lot_val.find(ai)
-                    if ai_pos > 0:
-                        lot_val = lot_val[:ai_pos]
-                result["lot_number"] = lot_val.strip()
-    
-    # Yöntem 3: Ham veriyi pozisyon bazlı parse et
-    # Bazı karekodlar şöyle: 01XXXXXXXXXXXXXX17YYMMDD10LOT21SERIAL
-    if not result["gtin"] and not result["serial_number"]:
-        # 01 ile başlıyorsa
-        if clean_barcode.startswith('01') and len(clean_barcode) >= 16:
-            result["gtin"] = clean_barcode[2:16]
-            rest = clean_barcode[16:]
-            
-            # 17YYMMDD
-            if '17' in rest:
-                idx = rest.find('17')
-                if idx >= 0 and len(rest) >= idx + 8:
-                    result["expiry_date"] = _parse_expiry_date(rest[idx+2:idx+8])
-            
-            # 10LOT
-            if '10' in rest:
-                idx = rest.find('10')
-                if idx >= 0:
-                    # Sonraki AI'ya kadar al
-                    lot_end = len(rest)
-                    for ai in ['17', '21']:
-                        ai_idx = rest.find(ai, idx + 2)
-                        if ai_idx > idx and ai_idx < lot_end:
-                            lot_end = ai_idx
-                    result["lot_number"] = rest[idx+2:lot_end]
-            
-            # 21SERIAL
-            if '21' in rest:
-                idx = rest.find('21')
-                if idx >= 0:
-                    serial_end = len(rest)
-                    for ai in ['17', '10']:
-                        ai_idx = rest.find(ai, idx + 2)
-                        if ai_idx > idx and ai_idx < serial_end:
-                            serial_end = ai_idx
-                    result["serial_number"] = rest[idx+2:serial_end]
-    
-    # Son temizlik
-    if result["serial_number"]:
-        result["serial_number"] = result["serial_number"].strip()
-    if result["lot_number"]:
-        result["lot_number"] = result["lot_number"].strip()
-    
     logger.debug(f"Parse result: {result}")
-    
     return result
 
 
 def _parse_expiry_date(exp_str: str) -> str:
     """YYMMDD formatını YYYY-MM-DD'ye çevir"""
-    try:
-        year = 2000 + int(exp_str[0:2])
-        month = int(exp_str[2:4])
-        day = int(exp_str[4:6])
-        # Gün 00 ise ayın son günü
-        if day == 0:
-            day = 28  # Güvenli varsayılan
-        return f"{year}-{month:02d}-{day:02d}"
-    except:
-        return None
+    expiry = gs1.parse_gs1_date(exp_str)
+    return expiry.strftime("%Y-%m-%d") if expiry else None
 
 
-def get_drug_info_from_barcode(barcode: str) -> Dict:
+def get_drug_info_from_barcode(barcode: str, parsed: Dict = None) -> Dict:
     """
     Karekoddan ilaç bilgisi getir
     
     Args:
         barcode: DataMatrix karekod içeriği
+        parsed: Daha önce parse_datamatrix ile elde edilmiş sonuç (tekrar parse etmemek için)
         
     Returns:
         {
@@ -521,7 +392,8 @@ def get_drug_info_from_barcode(barcode: str) -> Dict:
             "drug_name": "..."  # İlaç adı (varsa)
         }
     """
-    parsed = parse_datamatrix(barcode)
+    if parsed is None:
+        parsed = parse_datamatrix(barcode)
     
     result = {
         "parsed": parsed,
@@ -5,10 +5,9 @@ LibreOffice-based Excel to PDF Generator
 Uses LibreOffice headless to convert Excel files to PDF with perfect formatting
 """
 
+import asyncio
 import subprocess
 import os
-import shutil
-import tempfile
 import logging
 from datetime import datetime
 from openpyxl import load_workbook
@@ -19,6 +18,13 @@ from services.vaka_form_mapping import (
     MEDICATION_MAPPINGS,
     MATERIAL_MAPPINGS
 )
+from services.libreoffice_pool import (
+    libreoffice_pool,
+    create_job_dir,
+    ConversionError,
+    ConversionTimeout,
+    OfficeNotInstalled
+)
 
 logger = logging.getLogger(__name__)
 
@@ -796,9 +802,10 @@ def populate_excel_with_case_data(excel_path: str, output_path: str, case_data:
     return output_path
 
 
-def convert_excel_to_pdf_libreoffice(excel_path: str, output_dir: str) -> str:
+async def convert_excel_to_pdf_libreoffice(excel_path: str, output_dir: str) -> str:
     """
     LibreOffice Headless kullanarak Excel'i PDF'e çevirir
+    Dönüşüm LibreOffice havuzunda çalışır, event loop bloklanmaz
     
     Args:
         excel_path: Excel dosyasının yolu
@@ -808,52 +815,27 @@ def convert_excel_to_pdf_libreoffice(excel_path: str, output_dir: str) -> str:
         str: Oluşturulan PDF dosyasının yolu
     """
     try:
-        # LibreOffice komutu
-        cmd = [
-            'soffice',
-            '--headless',
-            '--convert-to', 'pdf',
-            '--outdir', output_dir,
-            excel_path
-        ]
-        
-        logger.info(f"LibreOffice çalıştırılıyor: {' '.join(cmd)}")
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60  # 60 saniye timeout
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"LibreOffice hatası: {result.stderr}")
-            raise Exception(f"LibreOffice dönüşüm hatası: {result.stderr}")
-        
-        # PDF dosya adını hesapla
-        excel_filename = os.path.basename(excel_path)
-        pdf_filename = os.path.splitext(excel_filename)[0] + '.pdf'
-        pdf_path = os.path.join(output_dir, pdf_filename)
-        
-        if not os.path.exists(pdf_path):
-            raise Exception(f"PDF oluşturulamadı: {pdf_path}")
-        
+        logger.info(f"LibreOffice dönüşümü kuyruğa alındı: {excel_path}")
+        pdf_path = await libreoffice_pool.convert(excel_path, "pdf", output_dir)
         logger.info(f"PDF oluşturuldu: {pdf_path}")
         return pdf_path
         
-    except subprocess.TimeoutExpired:
+    except ConversionTimeout:
         logger.error("LibreOffice zaman aşımı")
         raise Exception("PDF dönüşümü zaman aşımına uğradı")
-    except FileNotFoundError:
+    except OfficeNotInstalled:
         logger.error("LibreOffice bulunamadı")
         raise Exception("LibreOffice kurulu değil. Dockerfile'da 'libreoffice-calc' yüklendiğinden emin olun.")
+    except ConversionError as e:
+        logger.error(f"LibreOffice hatası: {e}")
+        raise Exception(str(e))
 
 
-def generate_case_pdf_with_libreoffice(
+async def generate_case_pdf_with_libreoffice(
     template_path: str,
     case_data: dict,
     form_data: dict = None,
-    output_filename: str = None
+    output_dir: str = None
 ) -> str:
     """
     Vaka verilerini kullanarak Excel template'ten PDF oluşturur
@@ -862,38 +844,23 @@ def generate_case_pdf_with_libreoffice(
         template_path: Excel template dosyasının yolu
         case_data: Vaka verileri
         form_data: Form verileri (opsiyonel)
-        output_filename: Çıktı dosya adı (opsiyonel)
+        output_dir: İşe özel çıktı dizini (opsiyonel, yoksa yeni bir iş dizini açılır)
     
     Returns:
-        str: Oluşturulan PDF dosyasının yolu
+        str: Oluşturulan PDF dosyasının yolu (output_dir içinde)
     """
-    # Temp dizin oluştur
-    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    temp_dir = os.path.join(backend_dir, "temp")
-    os.makedirs(temp_dir, exist_ok=True)
+    # Her iş kendi dizininde çalışır; aynı vaka için eşzamanlı istekler çakışmaz
+    output_dir = output_dir or create_job_dir(prefix="case_pdf_")
     
     case_id = case_data.get('_id', case_data.get('id', 'unknown'))
-    case_number = case_data.get('case_number', case_id)
-    
-    # Geçici Excel dosyası oluştur
-    temp_excel = os.path.join(temp_dir, f"temp_case_{case_id}.xlsx")
+    temp_excel = os.path.join(output_dir, f"case_{case_id}.xlsx")
     
     try:
-        # Excel'i verilerle doldur
-        populate_excel_with_case_data(template_path, temp_excel, case_data, form_data)
+        # Excel'i verilerle doldur (openpyxl CPU yoğun, thread'de çalıştır)
+        await asyncio.to_thread(populate_excel_with_case_data, template_path, temp_excel, case_data, form_data)
         
         # LibreOffice ile PDF'e çevir
-        pdf_path = convert_excel_to_pdf_libreoffice(temp_excel, temp_dir)
-        
-        # İstenen dosya adına yeniden adlandır
-        if output_filename:
-            final_pdf_path = os.path.join(temp_dir, output_filename)
-            if os.path.exists(final_pdf_path):
-                os.remove(final_pdf_path)
-            shutil.move(pdf_path, final_pdf_path)
-            pdf_path = final_pdf_path
-        
-        return pdf_path
+        return await convert_excel_to_pdf_libreoffice(temp_excel, output_dir)
         
     finally:
         # Geçici Excel dosyasını temizle
@@ -906,9 +873,11 @@ def generate_case_pdf_with_libreoffice(
 
 def check_libreoffice_installed() -> bool:
     """LibreOffice'in kurulu olup olmadığını kontrol eder"""
+    if not libreoffice_pool.available:
+        return False
     try:
         result = subprocess.run(
-            ['soffice', '--version'],
+            [libreoffice_pool.binary, '--version'],
             capture_output=True,
             text=True,
             timeout=10
@@ -0,0 +1,434 @@
+"""
+LibreOffice Dönüşüm Havuzu
+Headless LibreOffice dönüşümlerini event loop'u bloklamadan, sınırlı eşzamanlılıkla çalıştırır.
+
+Her worker kendi kullanıcı profiliyle kalıcı bir soffice dinleyicisi (--accept) açar ve ona
+UNO köprüsü (services/office_bridge.py) üzerinden bağlanır. Dönüşümler bu sıcak süreçte yapılır;
+iş başına soffice başlatma (soğuk başlangıç) maliyeti ödenmez. Dinleyici çökerse, zaman aşımında
+veya LIBREOFFICE_MAX_JOBS_PER_WORKER işten sonra süreçler öldürülür ve yenisi açılır.
+
+UNO modülünü içeren python bulunamazsa (python3-uno kurulu değilse) worker'lar iş başına
+`soffice --convert-to` çalıştırır; bu modda sadece önceden ısıtılmış profil korunur.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import logging
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Havuz ayarları
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", 2))  # Aynı anda çalışacak dönüşüm sayısı
+LIBREOFFICE_JOB_TIMEOUT = int(os.getenv("LIBREOFFICE_JOB_TIMEOUT", 60))  # İş başına zaman aşımı (saniye)
+LIBREOFFICE_WARMUP_TIMEOUT = int(os.getenv("LIBREOFFICE_WARMUP_TIMEOUT", 120))  # Dinleyici/profil açılış zaman aşımı
+LIBREOFFICE_MAX_JOBS_PER_WORKER = int(os.getenv("LIBREOFFICE_MAX_JOBS_PER_WORKER", 200))  # Bu kadar işten sonra süreç yenilenir
+LIBREOFFICE_QUEUE_LIMIT = int(os.getenv("LIBREOFFICE_QUEUE_LIMIT", 0))  # 0 = sınırsız kuyruk
+LIBREOFFICE_PYTHON = os.getenv("LIBREOFFICE_PYTHON")  # UNO içeren python (boşsa otomatik aranır)
+
+# İş dizinleri backend/temp altında oluşturulur
+BACKEND_DIR = Path(__file__).parent.parent.resolve()
+TEMP_ROOT = BACKEND_DIR / "temp"
+BRIDGE_SCRIPT = Path(__file__).parent / "office_bridge.py"
+
+OFFICE_FLAGS = ("--headless", "--invisible", "--nologo", "--nodefault", "--norestore", "--nolockcheck")
+
+
+class ConversionError(Exception):
+    """LibreOffice dönüşümü başarısız oldu"""
+
+
+class ConversionTimeout(ConversionError):
+    """LibreOffice dönüşümü zaman aşımına uğradı"""
+
+
+class OfficeNotInstalled(ConversionError):
+    """Sistemde soffice/libreoffice bulunamadı"""
+
+
+def find_office_binary() -> Optional[str]:
+    """soffice veya libreoffice çalıştırılabilir dosyasını bul"""
+    configured = os.getenv("LIBREOFFICE_BINARY")
+    if configured:
+        return shutil.which(configured) or (configured if os.path.exists(configured) else None)
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def find_uno_python(binary: str) -> Optional[str]:
+    """UNO köprüsünü çalıştırabilecek python: LIBREOFFICE_PYTHON, LibreOffice'in kendi python'u, sistem python3"""
+    candidates = [LIBREOFFICE_PYTHON] if LIBREOFFICE_PYTHON else [
+        os.path.join(os.path.dirname(os.path.realpath(binary)), "python"),
+        "/usr/bin/python3",
+    ]
+    for candidate in candidates:
+        if not candidate or not os.path.exists(candidate):
+            continue
+        try:
+            result = subprocess.run([candidate, "-c", "import uno"], capture_output=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if result.returncode == 0:
+            return candidate
+    return None
+
+
+def create_job_dir(prefix: str = "job_") -> str:
+    """Her dönüşüm için ayrı geçici dizin oluştur (sabit dosya adı çakışmalarını önler)"""
+    TEMP_ROOT.mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=str(TEMP_ROOT))
+
+
+def remove_job_dir(path: Optional[str]):
+    """İş dizinini tüm içeriğiyle sil"""
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class _ConversionJob:
+    __slots__ = ("source_path", "target_format", "output_dir", "timeout", "future")
+
+    def __init__(self, source_path: str, target_format: str, output_dir: str, timeout: int, future: asyncio.Future):
+        self.source_path = source_path
+        self.target_format = target_format
+        self.output_dir = output_dir
+        self.timeout = timeout
+        self.future = future
+
+
+class _OfficeWorker:
+    """Tek bir LibreOffice profiline (ve varsa kalıcı dinleyiciye) bağlı worker"""
+
+    def __init__(self, index: int, binary: str, uno_python: Optional[str] = None):
+        self.index = index
+        self.binary = binary
+        self.uno_python = uno_python
+        self.profile_dir: Optional[str] = None
+        self.office: Optional[asyncio.subprocess.Process] = None
+        self.bridge: Optional[asyncio.subprocess.Process] = None
+        self.jobs_done = 0
+        self.recycles = 0
+        self._ready_lock = asyncio.Lock()
+
+    @property
+    def profile_url(self) -> str:
+        return Path(self.profile_dir).as_uri()
+
+    @property
+    def persistent(self) -> bool:
+        return self.uno_python is not None
+
+    @property
+    def ready(self) -> bool:
+        if not self.persistent:
+            return self.profile_dir is not None
+        return (
+            self.office is not None and self.office.returncode is None
+            and self.bridge is not None and self.bridge.returncode is None
+        )
+
+    async def _spawn(self, args: list, **kwargs) -> asyncio.subprocess.Process:
+        """soffice'i bu worker'ın profiliyle, kendi process grubunda başlat"""
+        return await asyncio.create_subprocess_exec(
+            self.binary,
+            f"-env:UserInstallation={self.profile_url}",
+            *OFFICE_FLAGS,
+            *args,
+            start_new_session=True,
+            **kwargs
+        )
+
+    async def _run(self, args: list, timeout: int) -> tuple:
+        """Tek seferlik soffice çalıştır; zaman aşımında veya iptalde tüm grubu öldür"""
+        proc = await self._spawn(args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self._terminate(proc)
+            raise ConversionTimeout(f"LibreOffice {timeout} saniyede yanıt vermedi")
+        except asyncio.CancelledError:
+            await self._terminate(proc)
+            raise
+        return proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+    @staticmethod
+    async def _terminate(proc: Optional[asyncio.subprocess.Process]):
+        """Process grubunu öldür ve çıkışını bekle (zombi süreç bırakmaz)"""
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        await proc.wait()
+
+    async def ensure_ready(self):
+        """Profil yoksa oluştur; kalıcı modda dinleyiciyi ve UNO köprüsünü aç"""
+        if self.ready:
+            return
+        async with self._ready_lock:
+            if not self.ready:
+                await self._open()
+
+    async def _open(self):
+        if self.persistent:
+            await self._stop_processes()
+        if not self.profile_dir:
+            self.profile_dir = tempfile.mkdtemp(prefix=f"lo_profile_{self.index}_")
+        try:
+            if self.persistent:
+                await self._start_listener()
+            else:
+                returncode, _, stderr = await self._run(["--terminate_after_init"], LIBREOFFICE_WARMUP_TIMEOUT)
+                if returncode != 0:
+                    logger.warning(f"LibreOffice worker {self.index} ısıtma uyarısı: {stderr.strip()[:200]}")
+        except asyncio.CancelledError:
+            await self._stop_processes()
+            raise
+        logger.info(f"LibreOffice worker {self.index} hazır (profil: {self.profile_dir})")
+
+    async def _start_listener(self):
+        pipe_name = f"lo_pool_{os.getpid()}_{self.index}_{self.recycles}"
+        self.office = await self._spawn(
+            [f"--accept=pipe,name={pipe_name};urp;StarOffice.ComponentContext"],
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        self.bridge = await asyncio.create_subprocess_exec(
+            self.uno_python, str(BRIDGE_SCRIPT), pipe_name, str(LIBREOFFICE_WARMUP_TIMEOUT),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        try:
+            response = await self._read_response(LIBREOFFICE_WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            response = None
+        if not response or not response.get("ready"):
+            await self._stop_processes()
+            raise ConversionError(f"LibreOffice worker {self.index} dinleyicisine bağlanılamadı")
+
+    async def _read_response(self, timeout: int) -> Optional[dict]:
+        line = await asyncio.wait_for(self.bridge.stdout.readline(), timeout=timeout)
+        return json.loads(line) if line else None
+
+    async def _stop_processes(self):
+        await self._terminate(self.bridge)
+        await self._terminate(self.office)
+        self.bridge = None
+        self.office = None
+
+    async def recycle(self, reason: str):
+        """Süreçleri öldür ve profili at; bir sonraki işte temiz profil ile yeniden başlar"""
+        logger.warning(f"LibreOffice worker {self.index} yenileniyor: {reason}")
+        await self._stop_processes()
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+        self.profile_dir = None
+        self.jobs_done = 0
+        self.recycles += 1
+
+    async def _convert_persistent(self, job: _ConversionJob, output_path: str):
+        request = {"source": job.source_path, "output": output_path, "format": job.target_format}
+        try:
+            self.bridge.stdin.write(json.dumps(request).encode() + b"\n")
+            await self.bridge.stdin.drain()
+            response = await self._read_response(job.timeout)
+        except asyncio.TimeoutError:
+            await self.recycle("zaman aşımı")
+            raise ConversionTimeout(f"LibreOffice {job.timeout} saniyede yanıt vermedi")
+        except asyncio.CancelledError:
+            # Köprü yarım kalan işin yanıtını yazabilir; süreçler temiz açılsın
+            await self.recycle("iş iptal edildi")
+            raise
+        except (ConnectionError, ValueError) as e:
+            response = {"ok": False, "error": str(e)}
+
+        if not response:
+            await self.recycle("LibreOffice süreci kapandı")
+            raise ConversionError("LibreOffice dönüşüm hatası: süreç beklenmedik şekilde kapandı")
+        if not response.get("ok") or not os.path.exists(output_path):
+            if not self.ready:
+                await self.recycle("LibreOffice süreci kapandı")
+            raise ConversionError(f"LibreOffice dönüşüm hatası: {(response.get('error') or 'çıktı dosyası oluşmadı')[:300]}")
+
+    async def _convert_cli(self, job: _ConversionJob, output_path: str):
+        try:
+            returncode, stdout, stderr = await self._run(
+                ["--convert-to", job.target_format, "--outdir", job.output_dir, job.source_path],
+                job.timeout
+            )
+        except ConversionTimeout:
+            await self.recycle("zaman aşımı")
+            raise
+
+        if returncode != 0 or not os.path.exists(output_path):
+            await self.recycle(f"çıkış kodu {returncode}")
+            error_msg = stderr.strip() or stdout.strip() or "çıktı dosyası oluşmadı"
+            raise ConversionError(f"LibreOffice dönüşüm hatası: {error_msg[:300]}")
+
+    async def convert(self, job: _ConversionJob) -> str:
+        await self.ensure_ready()
+
+        base_name = os.path.splitext(os.path.basename(job.source_path))[0]
+        output_path = os.path.join(job.output_dir, f"{base_name}.{job.target_format.split(':')[0]}")
+
+        if self.persistent:
+            await self._convert_persistent(job, output_path)
+        else:
+            await self._convert_cli(job, output_path)
+
+        self.jobs_done += 1
+        if self.jobs_done >= LIBREOFFICE_MAX_JOBS_PER_WORKER:
+            await self.recycle(f"{self.jobs_done} iş tamamlandı")
+
+        return output_path
+
+    async def close(self):
+        await self._stop_processes()
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+
+class LibreOfficePool:
+    """Asenkron iş kuyruğu + sabit sayıda LibreOffice worker'ı"""
+
+    def __init__(self, size: int = None, job_timeout: int = None):
+        self.size = max(1, size or LIBREOFFICE_POOL_SIZE)
+        self.job_timeout = job_timeout or LIBREOFFICE_JOB_TIMEOUT
+        self.binary = find_office_binary()
+        self.uno_python: Optional[str] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self._tasks: list = []
+        self._start_lock = asyncio.Lock()
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def available(self) -> bool:
+        return self.binary is not None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, warm: bool = True):
+        """Worker'ları başlat; warm=True ise dinleyicileri/profilleri hemen aç"""
+        async with self._start_lock:
+            if self.running or not self.available:
+                return
+
+            self.uno_python = await asyncio.to_thread(find_uno_python, self.binary)
+            if not self.uno_python:
+                logger.warning("UNO python bulunamadı (python3-uno), dönüşümler iş başına soffice ile yapılacak")
+            self._queue = asyncio.Queue(maxsize=LIBREOFFICE_QUEUE_LIMIT)
+            self._workers = [_OfficeWorker(i, self.binary, self.uno_python) for i in range(self.size)]
+            self._tasks = [asyncio.create_task(self._worker_loop(w)) for w in self._workers]
+            mode = "kalıcı dinleyici" if self.uno_python else "iş başına süreç"
+            logger.info(f"LibreOffice havuzu başlatıldı: {self.size} worker ({mode}), timeout={self.job_timeout}s")
+
+        if warm:
+            results = await asyncio.gather(*(w.ensure_ready() for w in self._workers), return_exceptions=True)
+            for worker, result in zip(self._workers, results):
+                if isinstance(result, Exception):
+                    await worker.recycle(f"ısıtma hatası: {result}")
+
+    async def stop(self):
+        """Worker'ları durdur, soffice süreçlerini kapat ve profilleri temizle"""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for worker in self._workers:
+            await worker.close()
+        self._tasks = []
+        self._workers = []
+        self._queue = None
+        logger.info("LibreOffice havuzu durduruldu")
+
+    async def _worker_loop(self, worker: _OfficeWorker):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.future.done():
+                    continue
+                result = await worker.convert(job)
+                if not job.future.done():
+                    job.future.set_result(result)
+                self._completed += 1
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(ConversionError("LibreOffice havuzu durduruldu"))
+                raise
+            except Exception as e:
+                self._failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def convert(
+        self,
+        source_path: str,
+        target_format: str = "pdf",
+        output_dir: str = None,
+        timeout: int = None
+    ) -> str:
+        """
+        Dosyayı hedef formata çevir ve çıktı dosyasının yolunu döndür
+
+        Args:
+            source_path: Kaynak dosya (xlsx, ods, ...)
+            target_format: LibreOffice --convert-to formatı (pdf, ods, ...)
+            output_dir: Çıktı dizini (varsayılan: kaynak dosyanın dizini)
+            timeout: İş başına zaman aşımı (varsayılan: LIBREOFFICE_JOB_TIMEOUT)
+        """
+        if not self.available:
+            raise OfficeNotInstalled("LibreOffice kurulu değil. Dockerfile'da 'libreoffice-calc' yüklendiğinden emin olun.")
+
+        if not self.running:
+            await self.start(warm=False)
+
+        future = asyncio.get_running_loop().create_future()
+        job = _ConversionJob(
+            source_path=os.path.abspath(source_path),
+            target_format=target_format,
+            output_dir=os.path.abspath(output_dir or os.path.dirname(source_path)),
+            timeout=timeout or self.job_timeout,
+            future=future
+        )
+        await self._queue.put(job)
+        return await future
+
+    def get_stats(self) -> dict:
+        """Havuz durumu (izleme için)"""
+        return {
+            "available": self.available,
+            "running": self.running,
+            "size": self.size,
+            "persistent": self.uno_python is not None,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "completed": self._completed,
+            "failed": self._failed,
+            "workers": [
+                {
+                    "index": w.index,
+                    "ready": w.ready,
+                    "pid": w.office.pid if w.ready and w.office else None,
+                    "jobs_done": w.jobs_done,
+                    "recycles": w.recycles
+                }
+                for w in self._workers
+            ]
+        }
+
+
+# Global instance
+libreoffice_pool = LibreOfficePool()
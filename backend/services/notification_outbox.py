@@ -0,0 +1,255 @@
+"""
+Bildirim Giden Kutusu (outbox)
+Push bildirimleri istek içinde gönderilmez: çağıran taraf notification_outbox
+koleksiyonuna bir kayıt yazar (enqueue_push) ve hemen döner. Arka plandaki dağıtıcı
+kayıtları sahiplenir, alıcı token'larını bellek içi dizinden (token_directory) çözer,
+FCM'e 500'lük gruplarla gönderir ve geçici hatalarda artan beklemeyle tekrar dener.
+
+Kayıt durumları: pending -> sending -> sent | failed
+Dağıtıcı çöken bir worker'ın "sending" kaydını kira süresi dolunca yeniden alır.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from database import db
+from services.token_directory import TokenDirectory, token_directory
+from utils.timezone import get_turkey_time
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "notification_outbox"
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", 5))  # Diğer worker'ların kayıtları ve tekrarlar için
+OUTBOX_CLAIM_BATCH = int(os.getenv("OUTBOX_CLAIM_BATCH", 20))  # Bir turda paralel işlenen kayıt
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", 10))  # 10, 20, 40, ... saniye
+OUTBOX_BACKOFF_MAX_SECONDS = 600
+OUTBOX_LEASE_SECONDS = 120  # "sending" kaydı bu süreden sonra sahipsiz sayılır
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+
+def _backoff(attempts: int) -> int:
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def _fcm_data(data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """FCM data değerleri string olmalı"""
+    return {k: "" if v is None else str(v) for k, v in (data or {}).items()}
+
+
+class NotificationOutbox:
+    """Outbox dağıtıcısı (tek arka plan görevi) + teslim metrikleri"""
+
+    def __init__(self, database=None):
+        self.database = database
+        self.directory = token_directory if database is None else TokenDirectory(database)
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self.metrics = {
+            "enqueued": 0,
+            "jobs_sent": 0,
+            "jobs_failed": 0,
+            "retries": 0,
+            "tokens_delivered": 0,
+            "tokens_failed": 0,
+            "invalid_tokens": 0,
+            "batches": 0,
+            "last_delivery_latency_ms": None,
+            "max_delivery_latency_ms": 0,
+        }
+
+    @property
+    def collection(self):
+        return (self.database if self.database is not None else db)[OUTBOX_COLLECTION]
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Bildirim outbox dağıtıcısı başlatıldı")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def enqueue(
+        self,
+        title: str,
+        body: str,
+        *,
+        user_ids: Optional[List[str]] = None,
+        roles: Optional[List[str]] = None,
+        tokens: Optional[List[str]] = None,
+        data: Optional[Dict[str, Any]] = None,
+        notification_type: str = "general",
+        priority: str = "high"
+    ) -> str:
+        """Push bildirimini kuyruğa yaz (gönderim arka planda); kayıt id'sini döndür"""
+        now = get_turkey_time()
+        job = {
+            "_id": f"outbox-{uuid.uuid4()}",
+            "title": title,
+            "body": body,
+            "data": _fcm_data(data),
+            "notification_type": notification_type,
+            "priority": priority,
+            "user_ids": list(user_ids or []),
+            "roles": list(roles or []),
+            "tokens": list(tokens or []),
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        await self.collection.insert_one(job)
+        self.metrics["enqueued"] += 1
+        self.wake()
+        return job["_id"]
+
+    async def _claim(self) -> Optional[dict]:
+        now = get_turkey_time()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": STATUS_PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": STATUS_SENDING, "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": STATUS_SENDING, "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def dispatch_due(self) -> int:
+        """Zamanı gelen kayıtları sahiplen ve gönder; işlenen kayıt sayısını döndür"""
+        jobs = []
+        while len(jobs) < OUTBOX_CLAIM_BATCH:
+            job = await self._claim()
+            if not job:
+                break
+            jobs.append(job)
+        if jobs:
+            await asyncio.gather(*(self._deliver(job) for job in jobs))
+        return len(jobs)
+
+    async def _deliver(self, job: dict):
+        from services.firebase_service import send_fcm_to_multiple
+
+        try:
+            tokens = job.get("pending_tokens")
+            if tokens is None:
+                tokens = await self.directory.tokens_for(job.get("user_ids"), job.get("roles"))
+                tokens = list(dict.fromkeys(job.get("tokens", []) + tokens))
+
+            result = await send_fcm_to_multiple(
+                tokens=tokens,
+                title=job["title"],
+                body=job["body"],
+                data=job.get("data"),
+                notification_type=job.get("notification_type", "general"),
+                priority=job.get("priority", "high")
+            )
+        except Exception as e:
+            logger.error(f"Outbox gönderim hatası ({job['_id']}): {e}", exc_info=True)
+            result = {"success_count": 0, "failed_tokens": [], "retry_tokens": None, "error": str(e)}
+
+        attempts = job.get("attempts", 0) + 1
+        retry_tokens = result.get("retry_tokens")
+        now = get_turkey_time()
+        self.metrics["tokens_delivered"] += result.get("success_count", 0)
+        self.metrics["invalid_tokens"] += result.get("invalid_tokens_cleaned", 0)
+        self.metrics["batches"] += result.get("batches", 0)
+
+        update = {
+            "attempts": attempts,
+            "last_error": result.get("error"),
+            "token_count": job.get("token_count") or len(tokens or []),
+        }
+        # retry_tokens None: token'lar bile çözülemedi - aynı kayıt baştan denenir
+        should_retry = (retry_tokens is None or retry_tokens) and attempts < OUTBOX_MAX_ATTEMPTS
+        if should_retry:
+            update.update({
+                "status": STATUS_PENDING,
+                "next_attempt_at": now + timedelta(seconds=_backoff(attempts)),
+            })
+            if retry_tokens is not None:
+                update["pending_tokens"] = retry_tokens
+            self.metrics["retries"] += 1
+        else:
+            failed = bool(retry_tokens) or retry_tokens is None or bool(result.get("error"))
+            update.update({"status": STATUS_FAILED if failed else STATUS_SENT, "finished_at": now})
+            self.metrics["jobs_failed" if failed else "jobs_sent"] += 1
+            self.metrics["tokens_failed"] += result.get("failure_count", 0)
+            latency_ms = round((now - job["created_at"]).total_seconds() * 1000)
+            self.metrics["last_delivery_latency_ms"] = latency_ms
+            self.metrics["max_delivery_latency_ms"] = max(self.metrics["max_delivery_latency_ms"], latency_ms)
+            if not tokens:
+                logger.warning(f"[Outbox] Alıcıların FCM token'ı yok: {job['_id']}")
+
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": update, "$inc": {"delivered_count": result.get("success_count", 0)}, "$unset": {"lease_until": ""}}
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                started = time.perf_counter()
+                processed = await self.dispatch_due()
+                if processed:
+                    logger.info(f"[Outbox] {processed} kayıt işlendi ({(time.perf_counter() - started) * 1000:.0f} ms)")
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox dağıtıcı hatası: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def get_stats(self) -> dict:
+        """Teslim metrikleri (bu worker) + kuyruk durumu (tüm worker'lar)"""
+        by_status = {}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            by_status[row["_id"]] = row["count"]
+        oldest = await self.collection.find_one(
+            {"status": {"$in": [STATUS_PENDING, STATUS_SENDING]}},
+            {"created_at": 1},
+            sort=[("created_at", 1)]
+        )
+        return {
+            "running": self.running,
+            "metrics": dict(self.metrics),
+            "queue": by_status,
+            "oldest_pending_seconds": (
+                round((get_turkey_time() - oldest["created_at"]).total_seconds()) if oldest else 0
+            ),
+        }
+
+
+# Singleton
+notification_outbox = NotificationOutbox()
+
+
+async def enqueue_push(title: str, body: str, **kwargs) -> str:
+    """notification_outbox.enqueue kısayolu"""
+    return await notification_outbox.enqueue(title, body, **kwargs)
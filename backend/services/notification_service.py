@@ -10,15 +10,15 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# FCM servisini import et
+# FCM servisini import et (gönderim notification_outbox üzerinden arka planda yapılır)
 try:
     from services.firebase_service import (
-        send_fcm_to_multiple,
-        send_fcm_notification,
         initialize_firebase,
-        FIREBASE_AVAILABLE
+        FIREBASE_AVAILABLE,
+        FCM_FAKE_SENDER
     )
-    FCM_ENABLED = FIREBASE_AVAILABLE and initialize_firebase()
+    from services.notification_outbox import enqueue_push
+    FCM_ENABLED = FCM_FAKE_SENDER or (FIREBASE_AVAILABLE and initialize_firebase())
 except ImportError:
     FCM_ENABLED = False
     logger.warning("Firebase service not available")
@@ -156,17 +156,23 @@ class NotificationService:
             logger.warning(f"Missing template variable: {e}")
             return template
     
-    async def _get_user_fcm_tokens(self, user_ids: List[str]) -> List[str]:
-        """Kullanıcıların FCM token'larını getir"""
-        from database import users_collection
-        
-        tokens = []
-        for user_id in user_ids:
-            user = await users_collection.find_one({"_id": user_id})
-            if user and user.get("fcm_token"):
-                tokens.append(user["fcm_token"])
-        
-        return tokens
+    def _push_payload(self, notification_type: NotificationType, data: Dict[str, Any], url: str = None) -> dict:
+        """Şablondan outbox kaydı alanlarını (başlık, içerik, data) üret"""
+        template = NOTIFICATION_TEMPLATES.get(notification_type, {})
+        fcm_data = {
+            "type": template.get("type", "general"),
+            "notification_type": notification_type.value,
+            **{k: str(v) for k, v in data.items()}  # FCM data string olmalı
+        }
+        if url:
+            fcm_data["navigate_to"] = url
+        return {
+            "title": self._format_template(template.get("title", ""), data),
+            "body": self._format_template(template.get("body", ""), data),
+            "data": fcm_data,
+            "notification_type": template.get("type", "general"),
+            "priority": template.get("priority", "normal")
+        }
     
     async def send_to_users(
         self,
@@ -177,6 +183,7 @@ class NotificationService:
     ) -> Dict[str, Any]:
         """
         Belirli kullanıcılara FCM bildirimi gönder
+        Bildirim outbox'a yazılır; token çözümü ve gönderim arka planda yapılır.
         
         Args:
             notification_type: Bildirim tipi
@@ -185,7 +192,7 @@ class NotificationService:
             url: Tıklandığında açılacak URL
         
         Returns:
-            Gönderim sonuçları
+            {"success": bool, "queued": bool, "outbox_id": str}
         """
         logger.info(f"[FCM] send_to_users called: type={notification_type}, users={user_ids}")
         
@@ -202,44 +209,10 @@ class NotificationService:
             logger.warning(f"[FCM] Template not found: {notification_type}")
             return {"success": False, "error": f"Template not found for {notification_type}"}
         
-        title = self._format_template(template.get("title", ""), data)
-        body = self._format_template(template.get("body", ""), data)
-        
-        # FCM token'ları al
-        tokens = await self._get_user_fcm_tokens(user_ids)
-        
-        if not tokens:
-            logger.warning(f"[FCM] No FCM tokens found for users: {user_ids}")
-            # Token yoksa sadece in-app bildirim kaydet
-            return {"success": False, "error": "No FCM tokens found", "in_app_saved": True}
+        outbox_id = await enqueue_push(user_ids=user_ids, **self._push_payload(notification_type, data, url))
+        logger.info(f"[FCM] Queued for {len(user_ids)} users: {outbox_id}")
         
-        # Data payload
-        fcm_data = {
-            "type": template.get("type", "general"),
-            "notification_type": notification_type.value,
-            **{k: str(v) for k, v in data.items()}  # FCM data string olmalı
-        }
-        
-        if url:
-            fcm_data["navigate_to"] = url
-        
-        # FCM gönder
-        result = await send_fcm_to_multiple(
-            tokens=tokens,
-            title=title,
-            body=body,
-            data=fcm_data,
-            notification_type=template.get("type", "general"),
-            priority=template.get("priority", "normal")
-        )
-        
-        logger.info(f"[FCM] Sent to {result.get('success_count', 0)} devices")
-        
-        return {
-            "success": result.get("success_count", 0) > 0,
-            "sent_count": result.get("success_count", 0),
-            "failed_count": result.get("failure_count", 0)
-        }
+        return {"success": True, "queued": True, "outbox_id": outbox_id}
     
     async def save_in_app_notification(
         self,
@@ -273,6 +246,42 @@ class NotificationService:
             logger.error(f"In-app notification error: {e}")
             return {"success": False, "error": str(e)}
     
+    async def save_in_app_notifications(
+        self,
+        user_ids: List[str],
+        notification_type: NotificationType,
+        data: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Birden fazla kullanıcıya in-app bildirim kaydet (tek insert_many)"""
+        from database import notifications_collection
+        import uuid
+        
+        if not user_ids:
+            return []
+        
+        template = NOTIFICATION_TEMPLATES.get(notification_type, {})
+        title = self._format_template(template.get("title", "Bildirim"), data)
+        body = self._format_template(template.get("body", ""), data)
+        created_at = datetime.utcnow().isoformat()
+        
+        notifications = [{
+            "_id": f"notif-{uuid.uuid4()}",
+            "user_id": user_id,
+            "type": notification_type.value,
+            "title": title,
+            "body": body,
+            "data": data,
+            "read": False,
+            "created_at": created_at
+        } for user_id in user_ids]
+        
+        try:
+            await notifications_collection.insert_many(notifications, ordered=False)
+            return [{"success": True, "notification_id": n["_id"]} for n in notifications]
+        except Exception as e:
+            logger.error(f"In-app notification error: {e}")
+            return [{"success": False, "error": str(e)}]
+    
     async def send_notification(
         self,
         notification_type: NotificationType,
@@ -309,31 +318,11 @@ class NotificationService:
             if fcm_token:
                 tokens.append(fcm_token)
         
-        # FCM Push bildirimi gönder
+        # FCM Push bildirimi kuyruğa yaz
         if tokens and self.enabled:
-            template = NOTIFICATION_TEMPLATES.get(notification_type, {})
-            title = self._format_template(template.get("title", ""), data)
-            body = self._format_template(template.get("body", ""), data)
-            
-            fcm_data = {
-                "type": template.get("type", "general"),
-                "notification_type": notification_type.value,
-                **{k: str(v) for k, v in data.items()}
-            }
-            
-            if url:
-                fcm_data["navigate_to"] = url
-            
-            push_result = await send_fcm_to_multiple(
-                tokens=tokens,
-                title=title,
-                body=body,
-                data=fcm_data,
-                notification_type=template.get("type", "general"),
-                priority=template.get("priority", "normal")
-            )
-            results["push"] = push_result
-            logger.info(f"[FCM] Push sent: {push_result.get('success_count', 0)} success")
+            outbox_id = await enqueue_push(tokens=tokens, **self._push_payload(notification_type, data, url))
+            results["push"] = {"success": True, "queued": True, "outbox_id": outbox_id}
+            logger.info(f"[FCM] Push queued for {len(tokens)} tokens: {outbox_id}")
         else:
             # Token yoksa user_ids üzerinden dene
             if user_ids:
@@ -342,11 +331,9 @@ class NotificationService:
         
         # In-app bildirimleri kaydet
         if save_in_app:
-            for user_id in user_ids:
-                in_app_result = await self.save_in_app_notification(user_id, notification_type, data)
-                results["in_app"].append(in_app_result)
+            results["in_app"] = await self.save_in_app_notifications(user_ids, notification_type, data)
         
-        push_success = results.get("push", {}).get("success_count", 0) > 0 if results.get("push") else False
+        push_success = bool(results["push"] and results["push"].get("queued"))
         in_app_success = len([r for r in results["in_app"] if r.get("success")]) > 0
         
         return {
@@ -477,12 +464,10 @@ async def send_stock_alert(item_data: Dict, manager_ids: List[str]):
 
 async def broadcast_to_roles(notification_type: NotificationType, roles: List[str], data: Dict[str, Any], url: str = None):
     """Belirli rollere broadcast bildirim gönder"""
-    from database import users_collection
+    from services.token_directory import token_directory
     
-    # Bu rollerdeki tüm aktif kullanıcıları bul
-    user_ids = []
-    async for user in users_collection.find({"role": {"$in": roles}, "is_active": True}):
-        user_ids.append(user["_id"])
+    # Bu rollerdeki tüm aktif kullanıcılar (bellek içi dizinden, Mongo okuması yok)
+    user_ids = await token_directory.users_in_roles(roles)
     
     if not user_ids:
         logger.warning(f"No active users found for roles: {roles}")
@@ -496,42 +481,26 @@ async def send_notification_to_roles(roles: List[str], title: str, message: str,
     Belirli rollere özel bildirim gönder (şablon kullanmadan)
     Ticket, talep gibi dinamik bildirimler için kullanılır
     """
-    from database import users_collection
-    
-    # Bu rollerdeki kullanıcıları bul
-    tokens = []
-    user_ids = []
-    async for user in users_collection.find({"role": {"$in": roles}, "is_active": True}):
-        user_ids.append(user["_id"])
-        if user.get("fcm_token"):
-            tokens.append(user["fcm_token"])
+    if not FCM_ENABLED:
+        return {"success": False, "error": "FCM not configured"}
     
-    if not tokens:
-        logger.warning(f"No FCM tokens found for roles: {roles}")
-        return {"success": False, "error": "No FCM tokens found"}
-    
-    # FCM gönder
-    fcm_data = data or {}
+    # Rollerdeki aktif kullanıcılar ve token'ları gönderim sırasında çözülür
+    fcm_data = dict(data or {})
     if url:
         fcm_data["navigate_to"] = url
     
-    fcm_data = {k: str(v) for k, v in fcm_data.items()}
-    
-    result = await send_fcm_to_multiple(
-        tokens=tokens,
-        title=title,
-        body=message,
+    outbox_id = await enqueue_push(
+        title,
+        message,
+        roles=roles,
         data=fcm_data,
         notification_type="general",
         priority="high"
     )
     
-    logger.info(f"[FCM] Role notification sent to {result.get('success_count', 0)} devices")
+    logger.info(f"[FCM] Role notification queued for {roles}: {outbox_id}")
     
-    return {
-        "success": result.get("success_count", 0) > 0,
-        "sent_count": result.get("success_count", 0)
-    }
+    return {"success": True, "queued": True, "outbox_id": outbox_id}
 
 
 # Legacy send_master_code alias
@@ -0,0 +1,104 @@
+"""
+LibreOffice UNO Köprüsü
+libreoffice_pool worker'larının kalıcı soffice dinleyicisine bağlanan yardımcı süreç.
+
+Uygulamanın python ortamında genellikle uno modülü bulunmaz; bu betik LibreOffice'in UNO
+modülünü içeren python ile çalıştırılır (ör. Debian'da /usr/bin/python3 + python3-uno).
+Backend modüllerini import etmez.
+
+Protokol (satır başına bir JSON):
+    stdout <- {"ready": true}                                           bağlantı kuruldu
+    stdin  -> {"source": "/yol/a.xlsx", "output": "/yol/a.pdf", "format": "pdf"}
+    stdout <- {"ok": true} | {"ok": false, "error": "..."}
+
+Kullanım:
+    python3 office_bridge.py <pipe_adı> [bağlantı_zaman_aşımı_saniye]
+"""
+
+import json
+import sys
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+
+# Hedef format -> (hesap tablosu filtresi, metin belgesi filtresi)
+EXPORT_FILTERS = {
+    "pdf": ("calc_pdf_Export", "writer_pdf_Export"),
+    "ods": ("calc8", None),
+    "xlsx": ("Calc MS Excel 2007 XML", None),
+    "odt": (None, "writer8"),
+    "docx": (None, "MS Word 2007 XML"),
+}
+
+
+def _props(**values):
+    return tuple(PropertyValue(Name=name, Value=value) for name, value in values.items())
+
+
+def connect(pipe_name: str, timeout: float):
+    """soffice dinleyicisi açılana kadar bağlanmayı dene; Desktop servisini döndür"""
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            ctx = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+            return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        except NoConnectException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def export_filter(doc, target_format: str) -> str:
+    """--convert-to biçimi (pdf, ods, pdf:calc_pdf_Export) -> dışa aktarma filtresi"""
+    if ":" in target_format:
+        return target_format.split(":")[1]
+    calc_filter, writer_filter = EXPORT_FILTERS.get(target_format, (None, None))
+    is_sheet = doc.supportsService("com.sun.star.sheet.SpreadsheetDocument")
+    filter_name = calc_filter if is_sheet else writer_filter
+    if not filter_name:
+        raise ValueError(f"Desteklenmeyen hedef format: {target_format}")
+    return filter_name
+
+
+def convert(desktop, job: dict):
+    doc = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(job["source"]), "_blank", 0, _props(Hidden=True, ReadOnly=True)
+    )
+    if doc is None:
+        raise RuntimeError("Belge açılamadı")
+    try:
+        doc.storeToURL(
+            uno.systemPathToFileUrl(job["output"]),
+            _props(FilterName=export_filter(doc, job["format"]), Overwrite=True)
+        )
+    finally:
+        doc.close(True)
+
+
+def reply(message: dict):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    pipe_name = sys.argv[1]
+    timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 120
+    desktop = connect(pipe_name, timeout)
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            convert(desktop, json.loads(line))
+            reply({"ok": True})
+        except Exception as e:
+            reply({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    main()
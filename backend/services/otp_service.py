@@ -3,13 +3,15 @@ Internal OTP Service - Google Authenticator tarzı TOTP sistemi
 Her 30 saniyede bir değişen onay kodu üretir
 """
 
+import asyncio
 import hmac
 import hashlib
+import os
 import struct
 import time
 import base64
 import secrets
-from typing import Optional
+from typing import Dict, List, Optional, Set
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,12 @@ logger = logging.getLogger(__name__)
 OTP_INTERVAL = 30  # 30 saniyede bir değişir
 OTP_DIGITS = 6     # 6 haneli kod
 OTP_SECRET_LENGTH = 32  # Secret key uzunluğu
+OTP_WINDOW = 1     # Önceki/sonraki zaman dilimi toleransı
+
+# Onaylayıcı kod indeksi: bu rollerdeki aktif kullanıcıların kodları başlangıçta hesaplanır.
+# verify_any_manager_otp başka bir rol isterse indeks o rolü ekleyip yeniden yüklenir.
+OTP_APPROVER_ROLES = ["doktor", "operasyon_muduru", "merkez_ofis", "bas_sofor"]
+OTP_APPROVER_REFRESH_SECONDS = int(os.getenv("OTP_APPROVER_REFRESH_SECONDS", 60))  # Onaylayıcı listesinin yenilenme aralığı
 
 class OTPService:
     """TOTP (Time-based One-Time Password) servisi"""
@@ -171,10 +179,160 @@ def verify_user_otp(secret: str, code: str) -> bool:
     return otp_service.verify_totp(secret, code)
 
 
+class ApproverCodeIndex:
+    """
+    Zaman dilimi -> kod -> onaylayıcı indeksi
+    Yetkili kullanıcıların secret'ları OTP_APPROVER_REFRESH_SECONDS'da bir okunur, her 30 saniyelik
+    dilim için tüm kodlar bir kez hesaplanır; doğrulama sözlük aramasına iner.
+
+    Arka plan görevi bir sonraki dilimi önceden hesaplar. Secret değişince (regenerate-secret,
+    ilk oluşturma) invalidate() çağrılır; başka worker'daki değişiklik yenileme aralığında ya da
+    eşleşmeyen bir kodda (en fazla dilim başına bir kez) yeniden okunarak yakalanır.
+
+    İndekslenen roller OTP_APPROVER_ROLES ile başlar ve çağıranların istediği rollerle genişler;
+    listede olmayan bir rol istenirse sessizce eşleşmemek yerine o rol eklenip yeniden okunur.
+    """
+    
+    def __init__(self, database=None):
+        self.database = database
+        self._approvers: Dict[str, dict] = {}
+        self._roles: Set[str] = set(OTP_APPROVER_ROLES)
+        self._steps: Dict[int, Dict[str, List[str]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"lookups": 0, "hits": 0, "reloads": 0, "steps_computed": 0}
+    
+    @property
+    def users(self):
+        if self.database is not None:
+            return self.database.users
+        from database import users_collection
+        return users_collection
+    
+    async def _load(self):
+        approvers = {}
+        async for user in self.users.find(
+            {"role": {"$in": sorted(self._roles)}, "is_active": True, "otp_secret": {"$nin": [None, ""]}},
+            {"name": 1, "role": 1, "otp_secret": 1}
+        ):
+            approvers[user["_id"]] = {
+                "secret": user["otp_secret"],
+                "name": user.get("name", "Bilinmiyor"),
+                "role": user.get("role"),
+            }
+        self._approvers = approvers
+        self._steps = {}
+        self._loaded_at = time.monotonic()
+        self.stats["reloads"] += 1
+    
+    async def reload(self):
+        async with self._lock:
+            await self._load()
+    
+    def invalidate(self):
+        """Sonraki doğrulamada onaylayıcıları yeniden oku (secret değişti)"""
+        self._loaded_at = None
+    
+    def _age(self) -> float:
+        return float("inf") if self._loaded_at is None else time.monotonic() - self._loaded_at
+    
+    async def _ensure_fresh(self):
+        if self._age() > OTP_APPROVER_REFRESH_SECONDS:
+            async with self._lock:
+                if self._age() > OTP_APPROVER_REFRESH_SECONDS:
+                    await self._load()
+    
+    def _codes_for_step(self, step: int) -> Dict[str, List[str]]:
+        codes = self._steps.get(step)
+        if codes is None:
+            codes = {}
+            for approver_id, approver in self._approvers.items():
+                code = OTPService.generate_totp(approver["secret"], step)
+                codes.setdefault(code, []).append(approver_id)
+            self._steps[step] = codes
+            self.stats["steps_computed"] += 1
+            # Pencere dışında kalan eski dilimleri bırak
+            for old_step in [s for s in self._steps if s < step - OTP_WINDOW - 1]:
+                del self._steps[old_step]
+        return codes
+    
+    def _match(self, code: str, allowed_roles: list) -> Optional[dict]:
+        current_step = OTPService.get_current_time_step()
+        for step in range(current_step - OTP_WINDOW, current_step + OTP_WINDOW + 1):
+            for approver_id in self._codes_for_step(step).get(code, ()):
+                approver = self._approvers.get(approver_id)
+                if approver and approver["role"] in allowed_roles:
+                    return {"approver_id": approver_id, **approver}
+        return None
+    
+    async def _ensure_roles(self, roles: list):
+        """İndekste olmayan rolleri ekle ve onaylayıcıları yeniden oku"""
+        missing = set(roles) - self._roles
+        if not missing:
+            return
+        async with self._lock:
+            missing = set(roles) - self._roles
+            if missing:
+                logger.info(f"OTP onaylayıcı indeksine roller eklendi: {sorted(missing)}")
+                self._roles |= missing
+                await self._load()
+    
+    async def find_approver(self, code: str, allowed_roles: list) -> Optional[dict]:
+        """Kodu üreten yetkili kullanıcıyı bul (yoksa None)"""
+        self.stats["lookups"] += 1
+        await self._ensure_roles(allowed_roles)
+        await self._ensure_fresh()
+        approver = self._match(code, allowed_roles)
+        if approver is None and self._age() > OTP_INTERVAL:
+            # Başka worker'da yeni oluşturulan secret olabilir - dilim başına en fazla bir yeniden okuma
+            await self.reload()
+            approver = self._match(code, allowed_roles)
+        if approver:
+            self.stats["hits"] += 1
+        return approver
+    
+    async def _run(self):
+        """Her dilim başında onaylayıcıları tazele ve sonraki dilimi önceden hesapla"""
+        while True:
+            try:
+                await self._ensure_fresh()
+                self._codes_for_step(OTPService.get_current_time_step() + OTP_WINDOW)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"OTP onaylayıcı indeksi yenilenemedi: {e}")
+            await asyncio.sleep(OTPService.get_time_remaining() + 0.05)
+    
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def get_stats(self) -> dict:
+        return {
+            "approvers": len(self._approvers),
+            "roles": sorted(self._roles),
+            "cached_steps": sorted(self._steps),
+            "age_seconds": None if self._loaded_at is None else round(self._age()),
+            **self.stats,
+        }
+
+
+# Singleton
+approver_code_index = ApproverCodeIndex()
+
+
 async def verify_any_manager_otp(code: str, allowed_roles: list) -> dict:
     """
     Herhangi bir yetkili kullanıcının OTP'sini doğrula
     Hemşirenin hasta kartına erişimi için doktor/müdür OTP'si gerektiğinde kullanılır
+    Kodlar zaman dilimi indeksinden (approver_code_index) aranır.
     
     Returns:
         {
@@ -184,29 +342,16 @@ async def verify_any_manager_otp(code: str, allowed_roles: list) -> dict:
             "approver_role": str or None
         }
     """
-    from database import users_collection
-    
     if not code or len(code) != OTP_DIGITS:
         return {"valid": False, "error": "Geçersiz kod formatı"}
     
-    # Yetkili rollerdeki tüm kullanıcıları al
-    users = await users_collection.find({
-        "role": {"$in": allowed_roles},
-        "is_active": True
-    }).to_list(100)
-    
-    for user in users:
-        otp_secret = user.get("otp_secret")
-        if not otp_secret:
-            continue
-        
-        if otp_service.verify_totp(otp_secret, code):
-            return {
-                "valid": True,
-                "approver_id": user["_id"],
-                "approver_name": user.get("name", "Bilinmiyor"),
-                "approver_role": user.get("role")
-            }
+    approver = await approver_code_index.find_approver(code, allowed_roles)
+    if approver:
+        return {
+            "valid": True,
+            "approver_id": approver["approver_id"],
+            "approver_name": approver["name"],
+            "approver_role": approver["role"]
+        }
     
     return {"valid": False, "error": "Onay kodu herhangi bir yetkili ile eşleşmedi"}
-
@@ -0,0 +1,177 @@
+"""
+SMTP Bağlantı Havuzu
+E-postaları aiosmtplib ile event loop'u bloklamadan gönderir ve SMTP bağlantılarını yeniden kullanır.
+
+Her mesajda yeni bağlantı + TLS el sıkışması + login yapmak yerine havuzdaki açık bağlantılar
+sırayla kullanılır. En fazla SMTP_POOL_SIZE bağlantı aynı anda mesaj gönderir; toplu
+gönderimlerde fazlası sıra bekler. Bir süre boşta kalan bağlantı kullanılmadan önce NOOP ile
+sınanır, sunucu bağlantıyı kopardıysa yeni bağlantı açılıp mesaj bir kez daha denenir.
+
+aiosmtplib yüklü değilse AIOSMTPLIB_AVAILABLE False olur ve EmailService eski (smtplib) yola döner.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from email.message import Message
+from typing import Dict, List, Optional
+
+try:
+    import aiosmtplib
+    AIOSMTPLIB_AVAILABLE = True
+except ImportError:
+    aiosmtplib = None
+    AIOSMTPLIB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Havuz ayarları
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))  # Aynı anda açık/gönderen bağlantı sayısı
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", 20))  # Bağlantı ve komut zaman aşımı (saniye)
+SMTP_HEALTHCHECK_SECONDS = int(os.getenv("SMTP_HEALTHCHECK_SECONDS", 30))  # Bu kadar boşta kalan bağlantı NOOP ile sınanır
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", 240))  # Bu kadar boşta kalan bağlantı sınanmadan kapatılır
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))  # Sunucu limitleri için
+
+
+class _PooledConnection:
+    __slots__ = ("client", "last_used", "sent")
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SMTPPool:
+    """aiosmtplib bağlantı havuzu"""
+
+    def __init__(self, config: Dict, size: int = None):
+        self.config = config
+        self.size = size or SMTP_POOL_SIZE
+        self._idle: List[_PooledConnection] = []
+        self._semaphore = asyncio.Semaphore(self.size)
+        self.stats = {
+            "sent": 0,
+            "failed": 0,
+            "connections_opened": 0,
+            "reconnects": 0,
+            "healthchecks": 0,
+        }
+
+    @property
+    def available(self) -> bool:
+        return AIOSMTPLIB_AVAILABLE
+
+    async def _connect(self) -> _PooledConnection:
+        use_ssl = self.config.get("use_ssl", True)
+        client = aiosmtplib.SMTP(
+            hostname=self.config["host"],
+            port=self.config["port"],
+            use_tls=use_ssl,
+            start_tls=None if not use_ssl else False,  # None: sunucu destekliyorsa STARTTLS
+            timeout=SMTP_TIMEOUT,
+        )
+        try:
+            await client.connect()
+            if self.config.get("username") and self.config.get("password"):
+                await client.login(self.config["username"], self.config["password"])
+        except BaseException:
+            # Hata ya da iptal (wait_for zaman aşımı): yarım açılmış bağlantı kalmasın
+            client.close()
+            raise
+        self.stats["connections_opened"] += 1
+        return _PooledConnection(client)
+
+    @staticmethod
+    async def _close(conn: _PooledConnection):
+        try:
+            if conn.client.is_connected:
+                await conn.client.quit()
+        except Exception:
+            conn.client.close()
+        except BaseException:
+            conn.client.close()
+            raise
+
+    async def _acquire(self) -> _PooledConnection:
+        """Boştaki en son kullanılan bağlantıyı al (gerekirse sına), yoksa yeni bağlantı aç"""
+        while self._idle:
+            conn = self._idle.pop()
+            idle_for = time.monotonic() - conn.last_used
+            if not conn.client.is_connected or idle_for > SMTP_IDLE_TIMEOUT:
+                await self._close(conn)
+                continue
+            if idle_for > SMTP_HEALTHCHECK_SECONDS:
+                self.stats["healthchecks"] += 1
+                try:
+                    await conn.client.noop()
+                except Exception:
+                    await self._close(conn)
+                    continue
+                except BaseException:
+                    conn.client.close()
+                    raise
+            return conn
+        return await self._connect()
+
+    async def _release(self, conn: _PooledConnection):
+        conn.last_used = time.monotonic()
+        if conn.client.is_connected and conn.sent < SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self._idle.append(conn)
+        else:
+            await self._close(conn)
+
+    async def send(self, message: Message, sender: str, recipients: List[str]):
+        """
+        Mesajı havuzdaki bir bağlantıyla gönder
+        Bağlantı kopmuşsa yeni bağlantıyla bir kez daha dener; diğer SMTP hataları yükseltilir.
+        """
+        async with self._semaphore:
+            for attempt in (1, 2):
+                conn: Optional[_PooledConnection] = None
+                try:
+                    conn = await self._acquire()
+                    response = await conn.client.send_message(message, sender=sender, recipients=recipients)
+                    conn.sent += 1
+                    self.stats["sent"] += 1
+                    await self._release(conn)
+                    return response
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError) as e:
+                    if conn:
+                        conn.client.close()
+                    if attempt == 2:
+                        self.stats["failed"] += 1
+                        raise
+                    self.stats["reconnects"] += 1
+                    logger.warning(f"SMTP bağlantısı koptu, yeniden bağlanılıyor: {e}")
+                except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                    # Sunucu mesajı/alıcıyı reddetti; bağlantı sağlamsa havuza geri dönsün
+                    self.stats["failed"] += 1
+                    if conn:
+                        await self._release(conn)
+                    raise
+                except Exception:
+                    self.stats["failed"] += 1
+                    if conn:
+                        conn.client.close()
+                    raise
+                except BaseException:
+                    # İptal (ör. ApprovalService kanal zaman aşımı): bağlantı işlem ortasında kalmış
+                    # olabilir; havuza dönmez, kapatılır
+                    if conn:
+                        conn.client.close()
+                    raise
+
+    async def close(self):
+        """Boştaki tüm bağlantıları kapat (kapanışta)"""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._close(conn) for conn in idle), return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "available": self.available,
+            "size": self.size,
+            "idle_connections": len(self._idle),
+            **self.stats,
+        }
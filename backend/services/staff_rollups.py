@@ -0,0 +1,245 @@
+"""
+Personel Performans Günlük Özetleri
+/users/staff-performance her kullanıcı için ayrı vardiya/vaka/form sorgusu atmak yerine
+staff_daily_stats koleksiyonundaki (kullanıcı, gün, kaynak) satırlarını toplar.
+
+Satırlar kaynak koleksiyonlardan sunucu tarafında ($merge) üretilir:
+    shifts -> vardiya sayısı, süre, devir teslim km'si (start_time günü)
+    cases  -> ekipte bulunulan vaka sayıları (created_at günü)
+    forms  -> ambulans vaka formu km'si (created_at günü)
+Zamanlanmış iş son günleri yeniden hesaplar; koleksiyon boşsa tüm geçmişi doldurur.
+Günü pencereden eski olup pencere içinde değişen kayıtların (geç tamamlanan vaka, geç kapanan
+vardiya) günleri de ayrıca yeniden hesaplanır; formlar oluşturulduktan sonra değişmez.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from database import db
+from utils.timezone import get_turkey_time
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "staff_daily_stats"
+ROLLUP_REFRESH_DAYS = 3  # Geç kapanan vardiya / sonradan düzenlenen form için geriye dönük pencere
+ROLLUP_INTERVAL_MINUTES = 10
+
+# Geriye dönük değişiklik: (koleksiyon, satırın gün alanı, değişiklik zamanı alanı)
+LATE_CHANGE_FIELDS = (
+    ("cases", "created_at", "updated_at"),  # Sonradan tamamlanan / düzenlenen vaka
+    ("shifts", "start_time", "end_time"),  # Pencereden önce başlayıp içinde kapanan vardiya
+)
+
+# Vaka ekibinde performansa sayılan alanlar
+TEAM_MEMBER_FIELDS = ("driver_id", "paramedic_id", "att_id", "nurse_id")
+
+METRIC_FIELDS = (
+    "total_shifts", "completed_shifts", "shift_minutes", "shift_km",
+    "total_cases", "completed_cases", "case_km",
+)
+
+
+def _to_int(expr):
+    return {"$convert": {"input": expr, "to": "int", "onError": None, "onNull": None}}
+
+
+def _day_of(field: str):
+    """Tarih alanını YYYY-MM-DD gününe çevir (string saklanmış eski kayıtlar dahil)"""
+    return {"$dateToString": {
+        "format": "%Y-%m-%d",
+        "date": {"$convert": {"input": field, "to": "date", "onError": None, "onNull": None}},
+        "onNull": None
+    }}
+
+
+def _km_diff(start_expr, end_expr):
+    """İki km değeri de sayıya çevrilebiliyorsa fark, değilse 0"""
+    return {"$let": {
+        "vars": {"start": _to_int(start_expr), "end": _to_int(end_expr)},
+        "in": {"$cond": [
+            {"$and": [{"$ne": ["$$start", None]}, {"$ne": ["$$end", None]}]},
+            {"$subtract": ["$$end", "$$start"]},
+            0
+        ]}
+    }}
+
+
+def _range_match(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {field: bounds} if bounds else {}
+
+
+def _rollup_tail(source: str, run_id: str) -> list:
+    """Gruplanmış (user_id, day) satırlarını kaynak etiketiyle özet koleksiyonuna yaz"""
+    return [
+        {"$match": {"_id.day": {"$type": "string"}, "_id.user_id": {"$type": "string"}}},
+        {"$set": {
+            "_id": {"$concat": [source, ":", "$_id.user_id", ":", "$_id.day"]},
+            "user_id": "$_id.user_id",
+            "day": "$_id.day",
+            "source": source,
+            "run_id": run_id,
+        }},
+        {"$merge": {"into": ROLLUP_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def _shift_pipeline(match: dict, run_id: str) -> list:
+    completed = {"$cond": [{"$ifNull": ["$end_time", False]}, 1, 0]}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": _day_of("$start_time")},
+            "total_shifts": {"$sum": 1},
+            "completed_shifts": {"$sum": completed},
+            "shift_minutes": {"$sum": {"$multiply": [completed, {"$ifNull": ["$duration_minutes", 0]}]}},
+            "shift_km": {"$sum": {"$multiply": [completed, _km_diff(
+                "$handover_form.teslimAlinanKm", "$handover_form.currentKm"
+            )]}},
+        }},
+        *_rollup_tail("shifts", run_id),
+    ]
+
+
+def _case_pipeline(match: dict, run_id: str) -> list:
+    members = [f"$assigned_team.{field}" for field in TEAM_MEMBER_FIELDS]
+    return [
+        {"$match": {**match, "assigned_team": {"$type": "object"}}},
+        {"$project": {
+            "day": _day_of("$created_at"),
+            "completed": {"$cond": [{"$eq": ["$status", "tamamlandi"]}, 1, 0]},
+            # Aynı kişi iki rolde görünse de vaka bir kez sayılır
+            "members": {"$setUnion": [{"$filter": {
+                "input": members, "as": "m", "cond": {"$eq": [{"$type": "$$m"}, "string"]}
+            }}]},
+        }},
+        {"$unwind": "$members"},
+        {"$group": {
+            "_id": {"user_id": "$members", "day": "$day"},
+            "total_cases": {"$sum": 1},
+            "completed_cases": {"$sum": "$completed"},
+        }},
+        *_rollup_tail("cases", run_id),
+    ]
+
+
+def _form_pipeline(match: dict, run_id: str) -> list:
+    return [
+        {"$match": {**match, "form_type": "ambulance_case"}},
+        {"$group": {
+            "_id": {"user_id": "$submitted_by", "day": _day_of("$created_at")},
+            "case_km": {"$sum": _km_diff("$form_data.startKm", "$form_data.endKm")},
+        }},
+        *_rollup_tail("forms", run_id),
+    ]
+
+
+async def rebuild_staff_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                database=None) -> dict:
+    """
+    [start, end) aralığındaki günlerin özet satırlarını yeniden üret (None = tüm geçmiş)
+    start/end gün başlangıcına yuvarlanır. Artık kaynağı olmayan eski satırlar silinir.
+    """
+    database = database if database is not None else db
+    if start:
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if end:
+        end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    run_id = uuid.uuid4().hex
+    sources = (
+        ("shifts", database.shifts, _shift_pipeline(_range_match("start_time", start, end), run_id)),
+        ("cases", database.cases, _case_pipeline(_range_match("created_at", start, end), run_id)),
+        ("forms", database.forms, _form_pipeline(_range_match("created_at", start, end), run_id)),
+    )
+
+    day_range = {}
+    if start:
+        day_range["$gte"] = start.strftime("%Y-%m-%d")
+    if end:
+        day_range["$lt"] = end.strftime("%Y-%m-%d")
+
+    report = {}
+    for source, collection, pipeline in sources:
+        # $merge çıktı döndürmez; imleci tüketmek pipeline'ı çalıştırır
+        await collection.aggregate(pipeline).to_list(None)
+        stale_filter = {"source": source, "run_id": {"$ne": run_id}}
+        if day_range:
+            stale_filter["day"] = day_range
+        removed = await database[ROLLUP_COLLECTION].delete_many(stale_filter)
+        report[source] = {"removed": removed.deleted_count}
+
+    logger.info(f"Personel özetleri güncellendi ({start or 'başlangıç'} - {end or 'bugün'}): {report}")
+    return report
+
+
+async def late_change_days(since: datetime, database=None) -> set:
+    """
+    since'tan önceki bir güne ait olup since'tan sonra değişen kayıtların günleri (YYYY-MM-DD)
+    Değişiklik zamanı datetime veya ISO string olarak saklanmış olabilir.
+    """
+    database = database if database is not None else db
+    since_day = since.strftime("%Y-%m-%d")
+    days = set()
+    for name, day_field, change_field in LATE_CHANGE_FIELDS:
+        pipeline = [
+            {"$match": {"$or": [
+                {change_field: {"$gte": since}},
+                {change_field: {"$gte": since.isoformat()}},
+            ]}},
+            {"$group": {"_id": _day_of(f"${day_field}")}},
+        ]
+        async for row in database[name].aggregate(pipeline):
+            if isinstance(row["_id"], str) and row["_id"] < since_day:
+                days.add(row["_id"])
+    return days
+
+
+async def refresh_staff_rollups():
+    """
+    Zamanlanmış iş: son günleri ve bu günlerde değişen eski kayıtların günlerini yenile
+    Özet koleksiyonu boşsa tüm geçmişi doldurur.
+    """
+    try:
+        if not await db[ROLLUP_COLLECTION].find_one({}, {"_id": 1}):
+            await rebuild_staff_rollups()
+            return
+        today = get_turkey_time()
+        start = (today - timedelta(days=ROLLUP_REFRESH_DAYS - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        await rebuild_staff_rollups(start, today + timedelta(days=1))
+        for day in sorted(await late_change_days(start)):
+            day_start = datetime.strptime(day, "%Y-%m-%d")
+            await rebuild_staff_rollups(day_start, day_start + timedelta(days=1))
+    except Exception as e:
+        logger.error(f"Personel özetleri güncellenemedi: {e}")
+
+
+async def sum_staff_rollups(start_day: Optional[str] = None, end_day: Optional[str] = None, database=None) -> dict:
+    """
+    [start_day, end_day] (YYYY-MM-DD, dahil) aralığındaki özetleri kullanıcı bazında topla
+    Returns: {user_id: {metrik: toplam}}
+    """
+    database = database if database is not None else db
+    match = {}
+    if start_day or end_day:
+        match["day"] = {}
+        if start_day:
+            match["day"]["$gte"] = start_day
+        if end_day:
+            match["day"]["$lte"] = end_day
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$user_id", **{
+            field: {"$sum": {"$ifNull": [f"${field}", 0]}} for field in METRIC_FIELDS
+        }}},
+    ]
+    totals = {}
+    async for row in database[ROLLUP_COLLECTION].aggregate(pipeline):
+        totals[row.pop("_id")] = row
+    return totals
@@ -0,0 +1,200 @@
+"""
+Bildirim Alıcı Dizini (rol -> kullanıcı -> FCM token)
+Bildirim yolları alıcıları ve cihaz token'larını her seferinde users koleksiyonundan
+okumak yerine bu bellek içi dizinden çözer.
+
+Dizin ilk kullanımda tek sorguyla yüklenir, sonra yazma yollarında artımlı güncellenir:
+    - /notifications/fcm/register, /fcm/unregister
+    - kullanıcı oluşturma / güncelleme / silme (rol, aktiflik)
+    - geçersiz token temizliği (_cleanup_invalid_tokens)
+Artımlı güncellemeler sadece o worker'a yansır; diğer worker'lar periyodik tam yenilemeyle
+(TOKEN_DIRECTORY_REFRESH_MINUTES) yakalar.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from database import db
+from utils.timezone import get_turkey_time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_DIRECTORY_REFRESH_MINUTES = int(os.getenv("TOKEN_DIRECTORY_REFRESH_MINUTES", 5))
+
+DIRECTORY_PROJECTION = {"role": 1, "is_active": 1, "fcm_tokens": 1, "fcm_token": 1}
+
+
+def extract_tokens(user_doc: dict) -> List[str]:
+    """Kullanıcı belgesindeki cihaz token'ları (fcm_tokens listesi + eski tekil fcm_token alanı)"""
+    tokens = []
+    for token_obj in user_doc.get("fcm_tokens") or []:
+        if isinstance(token_obj, dict) and token_obj.get("token"):
+            tokens.append(token_obj["token"])
+        elif isinstance(token_obj, str) and token_obj:
+            tokens.append(token_obj)
+    if user_doc.get("fcm_token"):
+        tokens.append(user_doc["fcm_token"])
+    return list(dict.fromkeys(tokens))
+
+
+class TokenDirectory:
+    """user_id -> (rol, aktiflik, token'lar) + rol ve token ters indeksleri"""
+
+    def __init__(self, database=None):
+        self.database = database
+        self._users: Dict[str, dict] = {}
+        self._by_role: Dict[str, Set[str]] = defaultdict(set)
+        self._token_owners: Dict[str, Set[str]] = defaultdict(set)
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.loaded_at = None
+
+    @property
+    def users(self):
+        return (self.database if self.database is not None else db).users
+
+    # ---------- yükleme ----------
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._load()
+
+    async def reload(self):
+        """Tüm dizini yeniden oku (periyodik iş / toplu kullanıcı işlemleri sonrası)"""
+        async with self._lock:
+            await self._load()
+
+    async def _load(self):
+        users, by_role, token_owners = {}, defaultdict(set), defaultdict(set)
+        async for doc in self.users.find({}, DIRECTORY_PROJECTION):
+            entry = self._entry(doc)
+            users[doc["_id"]] = entry
+            by_role[entry["role"]].add(doc["_id"])
+            for token in entry["tokens"]:
+                token_owners[token].add(doc["_id"])
+        self._users, self._by_role, self._token_owners = users, by_role, token_owners
+        self._loaded = True
+        self.loaded_at = get_turkey_time()
+        logger.info(f"Bildirim alıcı dizini yüklendi: {len(users)} kullanıcı, {len(token_owners)} token")
+
+    def invalidate(self):
+        """Sonraki kullanımda tamamen yeniden yükle"""
+        self._loaded = False
+
+    @staticmethod
+    def _entry(doc: dict) -> dict:
+        return {
+            "role": doc.get("role"),
+            "is_active": doc.get("is_active", True),
+            "tokens": tuple(extract_tokens(doc)),
+        }
+
+    # ---------- artımlı güncelleme ----------
+
+    def put_user(self, user_doc: dict):
+        """Kullanıcıyı belgedeki rol/aktiflik/token'larla ekle veya güncelle (_id veya id alanı)"""
+        if not self._loaded:
+            return
+        user_id = user_doc.get("_id") or user_doc.get("id")
+        if not user_id:
+            return
+        self.drop_user(user_id)
+        entry = self._entry(user_doc)
+        self._users[user_id] = entry
+        self._by_role[entry["role"]].add(user_id)
+        for token in entry["tokens"]:
+            self._token_owners[token].add(user_id)
+
+    def drop_user(self, user_id: str):
+        entry = self._users.pop(user_id, None)
+        if not entry:
+            return
+        self._by_role[entry["role"]].discard(user_id)
+        for token in entry["tokens"]:
+            self._discard_owner(token, user_id)
+
+    def remove_tokens(self, tokens: Iterable[str], user_id: Optional[str] = None):
+        """Token'ları (sadece user_id'den veya tüm sahiplerinden) kaldır"""
+        for token in tokens:
+            owners = [user_id] if user_id else list(self._token_owners.get(token, ()))
+            for owner in owners:
+                entry = self._users.get(owner)
+                if entry and token in entry["tokens"]:
+                    entry["tokens"] = tuple(t for t in entry["tokens"] if t != token)
+                self._discard_owner(token, owner)
+
+    def _discard_owner(self, token: str, user_id: str):
+        owners = self._token_owners.get(token)
+        if owners is not None:
+            owners.discard(user_id)
+            if not owners:
+                del self._token_owners[token]
+
+    async def refresh_user(self, user_id: str):
+        """Tek kullanıcıyı veritabanından yeniden oku (yazma yolunda belge elde yoksa)"""
+        if not self._loaded:
+            return
+        doc = await self.users.find_one({"_id": user_id}, DIRECTORY_PROJECTION)
+        if doc:
+            self.put_user(doc)
+        else:
+            self.drop_user(user_id)
+
+    # ---------- sorgular (Mongo okuması yok) ----------
+
+    async def users_in_roles(self, roles: Iterable[str], active_only: bool = True) -> List[str]:
+        await self.ensure_loaded()
+        user_ids = []
+        for role in roles:
+            for user_id in self._by_role.get(role, ()):
+                if not active_only or self._users[user_id]["is_active"]:
+                    user_ids.append(user_id)
+        return user_ids
+
+    async def tokens_for(self, user_ids: Optional[Iterable[str]] = None,
+                         roles: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Alıcıların cihaz token'ları
+        user_ids verilmezse roles'teki tüm aktif kullanıcılar; ikisi birlikte verilirse kesişim.
+        """
+        await self.ensure_loaded()
+        roles = set(roles or ())
+        if user_ids:
+            candidates = list(dict.fromkeys(user_ids))
+        elif roles:
+            candidates = await self.users_in_roles(roles)
+        else:
+            return []
+
+        tokens = []
+        for user_id in candidates:
+            entry = self._users.get(user_id)
+            if entry and (not roles or entry["role"] in roles):
+                tokens.extend(entry["tokens"])
+        return list(dict.fromkeys(tokens))
+
+    def get_stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "loaded_at": self.loaded_at,
+            "users": len(self._users),
+            "tokens": len(self._token_owners),
+            "roles": {role: len(ids) for role, ids in self._by_role.items() if ids},
+        }
+
+
+async def run_refresh_job():
+    """Scheduler için sarmalayıcı - diğer worker'lardaki değişiklikleri yakala"""
+    try:
+        await token_directory.reload()
+    except Exception as e:
+        logger.error(f"Bildirim alıcı dizini yenilenemedi: {e}")
+
+
+# Singleton
+token_directory = TokenDirectory()
@@ -0,0 +1,548 @@
+"""
+VAKA FORMU Şablon Önbelleği
+export-excel-mapped / export-pdf-mapped her istekte VAKA_FORMU_TEMPLATE.xlsx'i openpyxl ile açıp
+(~250 ms) logo ekleyip yeniden kaydediyordu. Şablon artık çıktı türü (excel/pdf) ve mapping sürümü
+başına bir kez derlenir:
+
+    - Eski akışın değerden bağımsız adımları openpyxl ile uygulanır (A1:C6 temizliği, logo,
+      __LOGO__ hücreleri, PDF için hizalama ve sayfa ayarları) ve çıktı bir kez kaydedilir
+    - Sheet XML'inde her eşlenmiş hücrenin ve satır etiketinin konumu çıkarılır
+    - Değişmeyen zip parçaları bir kez sıkıştırılıp saklanır
+
+Render sırasında saklanan zip kopyalanır ve sadece sheet XML'i (hücre değerleri, PDF'te satır
+yükseklikleri) ile imza varsa drawing/medya parçaları eklenir. Hücre, satır ve drawing XML'i
+openpyxl'in kendi yazıcılarıyla üretildiğinden parçalar render_with_openpyxl çıktısıyla bayt bayt
+aynıdır (docProps/core.xml'deki kayıt zamanı hariç; scripts/vaka_form_template_check.py).
+Eski uçların çıktısıyla karşılaştırma ve bilinçli farklar: tests/test_vaka_form_template.py.
+Derlenmiş şablonun karşılamadığı değerlerde (tarih tipi, PNG olmayan imza) render_with_openpyxl
+kullanılır.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from copy import copy
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import Cell
+from openpyxl.cell._writer import write_cell
+from openpyxl.compat import safe_string
+from openpyxl.drawing.image import Image as XLImage
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.properties import PageSetupProperties
+from openpyxl.xml.functions import tostring, xmlfile
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+TEMPLATE_PATH = os.path.join(TEMPLATES_DIR, "VAKA_FORMU_TEMPLATE.xlsx")
+LOGO_PATH = os.path.join(TEMPLATES_DIR, "healmedy_logo.png")
+
+VARIANTS = ("excel", "pdf")
+LOGO_SIZE = (200, 75)
+SIGNATURE_SIZE = (150, 55)
+DEFAULT_COLUMN_WIDTH = 13  # openpyxl'in boyut kaydı olmayan sütunlar için varsaydığı genişlik
+PDF_ALIGNMENT = Alignment(wrap_text=True, vertical='center', horizontal='left')
+
+CELL_ADDRESS_RE = re.compile(r'^([A-Z]+)(\d+)$')
+CELL_XML_RE = re.compile(r'<c r="([A-Z]+[0-9]+)"[^>]*?(?:/>|>.*?</c>)', re.S)
+ROW_XML_RE = re.compile(r'<row r="([0-9]+)"[^>]*>')
+ROW_HEIGHT_SENTINEL = 12345.5  # Derlemede satır etiketi kalıbını çıkarmak için geçici yükseklik
+
+ODS_PAGE_STYLE_SUBS = [
+    # A4 dikey, minimum kenar boşluğu
+    (re.compile(r'fo:page-width="[^"]*"'), 'fo:page-width="21cm"'),
+    (re.compile(r'fo:page-height="[^"]*"'), 'fo:page-height="29.7cm"'),
+    (re.compile(r'style:print-orientation="[^"]*"'), 'style:print-orientation="portrait"'),
+    (re.compile(r'fo:margin-top="[^"]*"'), 'fo:margin-top="0.25cm"'),
+    (re.compile(r'fo:margin-bottom="[^"]*"'), 'fo:margin-bottom="0.25cm"'),
+    (re.compile(r'fo:margin-left="[^"]*"'), 'fo:margin-left="0.25cm"'),
+    (re.compile(r'fo:margin-right="[^"]*"'), 'fo:margin-right="0.25cm"'),
+    # Ölçek ayarları kaldırılır, yerine 1x1 sayfaya sığdırma yazılır
+    (re.compile(r'style:scale-to="[^"]*"'), ''),
+    (re.compile(r'style:scale-to-pages="[^"]*"'), ''),
+]
+
+
+class _NeedsOpenpyxl(Exception):
+    """Derlenmiş şablon bu render'ı üretemez (openpyxl akışına düşülür)"""
+
+
+# ---------- openpyxl akışı (referans + yedek) ----------
+
+def mapping_version(mapping_doc: dict) -> tuple:
+    return (mapping_doc.get("version", 0), str(mapping_doc.get("updated_at")))
+
+
+def load_signature_image(data_url: str) -> Optional[bytes]:
+    """data:image/...;base64 imzayı çöz; görüntü olarak açılamıyorsa None"""
+    try:
+        _, encoded = data_url.split(",", 1)
+        data = base64.b64decode(encoded)
+        XLImage(BytesIO(data))
+        return data
+    except Exception as e:
+        logger.warning(f"İmza görüntüsü çözülemedi: {e}")
+        return None
+
+
+def _logo_image(logo_info: dict) -> Optional[XLImage]:
+    """Önce dosyadan, yoksa mapping'deki base64'ten logo"""
+    if os.path.exists(LOGO_PATH):
+        try:
+            return XLImage(LOGO_PATH)
+        except Exception as e:
+            logger.warning(f"Logo dosyadan eklenemedi: {e}")
+    logo_url = (logo_info or {}).get("url")
+    if logo_url and logo_url.startswith("data:image"):
+        try:
+            return XLImage(BytesIO(base64.b64decode(logo_url.split(",", 1)[1])))
+        except Exception as e:
+            logger.warning(f"Logo base64'ten eklenemedi: {e}")
+    return None
+
+
+def _prepare_workbook(variant: str, flat_mappings: dict, logo_info: dict):
+    """Şablon + logo + temizlenen logo hücreleri (değerden bağımsız kısım)"""
+    if os.path.exists(TEMPLATE_PATH):
+        wb = load_workbook(TEMPLATE_PATH)
+        ws = wb.active
+    else:
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Vaka Formu"
+        logger.warning(f"Şablon bulunamadı, boş oluşturuluyor: {TEMPLATE_PATH}")
+
+    # Logo alanı (A1:C6) temizlenir; D sütunundan başlayan metinlere dokunulmaz
+    for row in range(1, 7):
+        for col in range(1, 4):
+            try:
+                ws.cell(row=row, column=col).value = None
+            except AttributeError:
+                pass  # Birleştirilmiş hücre
+
+    logo_cell = (logo_info.get("cell", "A1") if logo_info else "A1") if variant == "excel" else "A1"
+    logo = _logo_image(logo_info)
+    if logo is not None:
+        logo.width, logo.height = LOGO_SIZE
+        ws.add_image(logo, logo_cell)
+
+    for address, field_key in flat_mappings.items():
+        if field_key == "__LOGO__" and CELL_ADDRESS_RE.match(address.upper()):
+            try:
+                ws[address] = None
+            except Exception:
+                pass
+    return wb, ws, logo
+
+
+def _column_width(ws, column_letter: str) -> float:
+    # column_dimensions[harf] okuması kaydı olmayan sütuna (ör. F:H grubundaki G) çakışan bir
+    # <col> kaydı ekliyordu; .get ile okunur, genişlik aynı kalır
+    dimension = ws.column_dimensions.get(column_letter)
+    width = dimension.width if dimension is not None else DEFAULT_COLUMN_WIDTH
+    return width or 10
+
+
+def _wrapped_row_height(text_length: int, column_width: float, current_height: Optional[float]) -> float:
+    """Uzun içerik için satır yüksekliği (satır başına ~14px, en fazla 100)"""
+    chars_per_line = int(column_width * 1.2)
+    content_lines = max(1, text_length // max(chars_per_line, 10) + 1)
+    return min(max(current_height or 15, content_lines * 14, 15), 100)
+
+
+def _write_value(ws, variant: str, address: str, value):
+    cell = ws[address]
+    cell.value = value
+    if variant != "pdf":
+        return
+    # Metin kaydırma + uzun içerikte satır yüksekliği
+    cell.alignment = PDF_ALIGNMENT
+    if value and len(str(value)) > 25:
+        match = CELL_ADDRESS_RE.match(address.upper())
+        row_num = int(match.group(2))
+        current = ws.row_dimensions[row_num].height
+        ws.row_dimensions[row_num].height = _wrapped_row_height(
+            len(str(value)), _column_width(ws, match.group(1)), current
+        )
+
+
+def _apply_page_setup(ws):
+    """A4 dikey, tek sayfaya sığdır, minimum kenar boşluğu"""
+    try:
+        ws.page_setup.orientation = 'portrait'
+        ws.page_setup.paperSize = 9  # A4
+        ws.page_setup.fitToWidth = 1
+        ws.page_setup.fitToHeight = 1
+        ws.page_setup.fitToPage = True
+        if ws.sheet_properties.pageSetUpPr is None:
+            ws.sheet_properties.pageSetUpPr = PageSetupProperties()
+        ws.sheet_properties.pageSetUpPr.fitToPage = True
+
+        max_row = ws.max_row or 79
+        max_col = ws.max_column or 20
+        ws.print_area = f"A1:{get_column_letter(max_col)}{max_row}"
+
+        ws.page_margins.left = 0.1
+        ws.page_margins.right = 0.1
+        ws.page_margins.top = 0.1
+        ws.page_margins.bottom = 0.1
+        ws.page_margins.header = 0
+        ws.page_margins.footer = 0
+    except Exception as e:
+        logger.warning(f"Sayfa ayarları yapılamadı: {e}")
+
+
+def render_with_openpyxl(variant: str, flat_mappings: dict, logo_info: dict,
+                         values: dict, images: Dict[str, bytes]) -> bytes:
+    """
+    Şablonu openpyxl ile aç, doldur, kaydet
+    values: {hücre: değer}, images: {hücre: imza PNG/JPEG baytları}
+    """
+    wb, ws, _ = _prepare_workbook(variant, flat_mappings, logo_info)
+    for address, field_key in flat_mappings.items():
+        if address in images:
+            image = XLImage(BytesIO(images[address]))
+            image.width, image.height = SIGNATURE_SIZE
+            ws.add_image(image, address)
+        elif address in values:
+            try:
+                _write_value(ws, variant, address, values[address])
+            except Exception as e:
+                logger.warning(f"Hücre yazma hatası {address}: {e}")
+    if variant == "pdf":
+        _apply_page_setup(ws)
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+# ---------- derlenmiş şablon ----------
+
+def _cell_xml(ws, cell) -> str:
+    """Hücrenin openpyxl sheet yazıcısındaki XML'i (yazılmayacak hücre için boş)"""
+    if cell._value is None and not cell.has_style and not cell._comment:
+        return ""
+    output = BytesIO()
+    with xmlfile(output) as xf:
+        write_cell(xf, ws, cell, cell.has_style)
+    return output.getvalue().decode("utf-8")
+
+
+class _Slot:
+    __slots__ = ("address", "row", "column", "style", "original_value", "original_style",
+                 "original_xml", "column_width")
+
+    def __init__(self, ws, address, cell, column_width):
+        self.address = address
+        self.row = cell.row
+        self.column = cell.column
+        self.style = None
+        self.original_value = cell._value
+        self.original_style = copy(cell._style)
+        self.original_xml = _cell_xml(ws, cell)
+        self.column_width = column_width
+
+
+class CompiledTemplate:
+    """Tek çıktı türü + mapping sürümü için hazır zip ve sheet XML konumları"""
+
+    def __init__(self, variant: str, flat_mappings: dict, logo_info: dict):
+        self.variant = variant
+        self.flat_mappings = dict(flat_mappings)
+        wb, ws, self.logo = _prepare_workbook(variant, flat_mappings, logo_info)
+        self.ws = ws
+
+        # Eşlenmiş hücreler: şablondaki hali (değer yazılamazsa / imza görüntüsünde korunur)
+        self.slots: Dict[str, _Slot] = {}
+        coordinates = set()
+        for address, field_key in flat_mappings.items():
+            match = CELL_ADDRESS_RE.match(address.upper())
+            if field_key == "__LOGO__" or not match:
+                continue
+            cell = ws[address]
+            if cell.coordinate in coordinates:
+                raise ValueError(f"Aynı hücre birden fazla eşlenmiş: {address}")
+            coordinates.add(cell.coordinate)
+            self.slots[address] = _Slot(ws, address, cell, _column_width(ws, match.group(1)))
+        template_styles = set(wb._cell_styles)
+
+        # Yer tutucu değer: her eşlenmiş hücre sheet XML'inde yer alsın
+        for address, slot in self.slots.items():
+            cell = ws[address]
+            cell.value = "#"
+            if variant == "pdf":
+                cell.alignment = PDF_ALIGNMENT
+            slot.style = copy(cell._style)
+        if variant == "pdf":
+            _apply_page_setup(ws)
+        # openpyxl yeni stilleri (PDF hizalaması) kayıtta satır sırasıyla ekler; bir hücre yazılmazsa
+        # (imza görüntüsü, geçersiz değer) bu sıra değişebilir
+        self.template_styles = template_styles
+        self.added_styles = self._added_styles(self.slots.values())
+
+        self.row_heights = {}
+        for slot in self.slots.values():
+            dimension = ws.row_dimensions.get(slot.row)
+            self.row_heights[slot.row] = dimension.height if dimension is not None else None
+
+        base = BytesIO()
+        wb.save(base)
+        self.sheet_part = f"xl/worksheets/sheet{wb.worksheets.index(ws) + 1}.xml"
+        self.row_tags = self._row_tag_templates(wb, ws) if variant == "pdf" else {}
+
+        with ZipFile(base) as zf:
+            parts = [(info, zf.read(info)) for info in zf.infolist()]
+        self.drawing_part = "xl/drawings/drawing1.xml" if self.logo is not None else None
+        dynamic = {self.sheet_part}
+        if self.drawing_part:
+            dynamic |= {self.drawing_part, "xl/drawings/_rels/drawing1.xml.rels"}
+        self.dynamic_parts = {info.filename: data for info, data in parts if info.filename in dynamic}
+        if self.sheet_part not in self.dynamic_parts:
+            raise ValueError(f"Sheet parçası bulunamadı: {self.sheet_part}")
+
+        # Sabit parçalar bir kez sıkıştırılır; render bu zip'in kopyasına ekleme yapar
+        prefix = BytesIO()
+        with ZipFile(prefix, "w", ZIP_DEFLATED) as zf:
+            for info, data in parts:
+                if info.filename not in dynamic:
+                    zf.writestr(info, data)
+        self.prefix = prefix.getvalue()
+
+        self.sheet_xml = self.dynamic_parts[self.sheet_part].decode("utf-8")
+        cell_spans = {m.group(1): m.span() for m in CELL_XML_RE.finditer(self.sheet_xml)}
+        self.row_spans = {int(m.group(1)): m.span() for m in ROW_XML_RE.finditer(self.sheet_xml)}
+        self.cell_spans = {}
+        for address, slot in self.slots.items():
+            coordinate = f"{get_column_letter(slot.column)}{slot.row}"
+            if coordinate not in cell_spans:
+                raise ValueError(f"Hücre sheet XML'inde bulunamadı: {coordinate}")
+            self.cell_spans[address] = cell_spans[coordinate]
+
+    def _row_tag_templates(self, wb, ws) -> Dict[int, str]:
+        """Yüksekliği değişebilecek satırların etiketleri (yükseklik yer tutuculu)"""
+        rows = set(self.row_heights)
+        for row in rows:
+            ws.row_dimensions[row].height = ROW_HEIGHT_SENTINEL
+        probe = BytesIO()
+        wb.save(probe)
+        for row, height in self.row_heights.items():
+            ws.row_dimensions[row].height = height
+
+        with ZipFile(probe) as zf:
+            sheet_xml = zf.read(self.sheet_part).decode("utf-8")
+        sentinel = f'ht="{safe_string(ROW_HEIGHT_SENTINEL)}"'
+        templates = {}
+        for m in ROW_XML_RE.finditer(sheet_xml):
+            row = int(m.group(1))
+            if row in rows and sentinel in m.group(0):
+                templates[row] = m.group(0)
+        return templates
+
+    def _added_styles(self, slots) -> list:
+        added = []
+        for slot in sorted(slots, key=lambda s: (s.row, s.column)):
+            if slot.style not in self.template_styles and slot.style not in added:
+                added.append(slot.style)
+        return added
+
+    def _value_xml(self, slot: _Slot, value) -> Optional[str]:
+        """Değer yazılmış hücrenin XML'i; openpyxl değeri reddederse None"""
+        cell = Cell(self.ws, row=slot.row, column=slot.column, style_array=copy(slot.style))
+        try:
+            cell.value = value
+        except Exception as e:
+            logger.warning(f"Hücre yazma hatası {slot.address}: {e}")
+            return None
+        if cell._style != slot.style:
+            raise _NeedsOpenpyxl(f"{slot.address} değeri hücre stilini değiştiriyor")
+        return _cell_xml(self.ws, cell)
+
+    def _rejected_xml(self, slot: _Slot, value) -> str:
+        """Reddedilen değer: şablon değeri kalır ama openpyxl hücre tipini yine de günceller"""
+        cell = Cell(self.ws, row=slot.row, column=slot.column, value=slot.original_value,
+                    style_array=copy(slot.original_style))
+        try:
+            cell.value = value
+        except Exception:
+            pass
+        return _cell_xml(self.ws, cell)
+
+    def render(self, values: dict, images: Dict[str, bytes]) -> bytes:
+        replacements = []
+        heights = {}
+        written = []
+        for address, slot in self.slots.items():
+            if address in images or address not in values:
+                xml = slot.original_xml
+            else:
+                value = values[address]
+                xml = self._value_xml(slot, value)
+                if xml is None:
+                    xml = self._rejected_xml(slot, value)
+                else:
+                    written.append(slot)
+                    if self.variant == "pdf" and value and len(str(value)) > 25:
+                        heights[slot.row] = _wrapped_row_height(
+                            len(str(value)), slot.column_width, heights.get(slot.row, self.row_heights[slot.row])
+                        )
+            replacements.append((*self.cell_spans[address], xml))
+        if len(written) != len(self.slots) and self._added_styles(written) != self.added_styles:
+            raise _NeedsOpenpyxl("Yazılmayan hücreler stil tablosunu değiştiriyor")
+        for row, height in heights.items():
+            if row not in self.row_tags:
+                raise _NeedsOpenpyxl(f"{row}. satır etiketi derlenmemiş")
+            tag = self.row_tags[row].replace(
+                f'ht="{safe_string(ROW_HEIGHT_SENTINEL)}"', f'ht="{safe_string(float(height))}"'
+            )
+            replacements.append((*self.row_spans[row], tag))
+
+        replacements.sort()
+        chunks, position = [], 0
+        for start, end, text in replacements:
+            chunks.append(self.sheet_xml[position:start])
+            chunks.append(text)
+            position = end
+        chunks.append(self.sheet_xml[position:])
+
+        parts = {self.sheet_part: "".join(chunks).encode("utf-8")}
+        if self.drawing_part:
+            parts.update({name: data for name, data in self.dynamic_parts.items() if name != self.sheet_part})
+        if images:
+            parts.update(self._drawing_parts(images))
+
+        output = BytesIO(self.prefix)
+        with ZipFile(output, "a", ZIP_DEFLATED) as zf:
+            for name, data in parts.items():
+                zf.writestr(name, data)
+        return output.getvalue()
+
+    def _drawing_parts(self, images: Dict[str, bytes]) -> Dict[str, bytes]:
+        """Logo + imzalar için drawing, ilişki ve medya parçaları (openpyxl sırasıyla)"""
+        if self.logo is None:
+            raise _NeedsOpenpyxl("Şablonda drawing yok")
+        signatures = []
+        for address in self.flat_mappings:
+            if address in images:
+                image = XLImage(BytesIO(images[address]))
+                if image.format != "png":
+                    raise _NeedsOpenpyxl(f"{address} imzası PNG değil")
+                image.width, image.height = SIGNATURE_SIZE
+                image.anchor = address
+                signatures.append((image, images[address]))
+
+        drawing = SpreadsheetDrawing()
+        drawing.images = [self.logo] + [image for image, _ in signatures]
+        for index, image in enumerate(drawing.images, 1):
+            image._id = index
+        drawing._id = 1
+        parts = {
+            self.drawing_part: tostring(drawing._write()),
+            "xl/drawings/_rels/drawing1.xml.rels": tostring(drawing._write_rels()),
+        }
+        for image, data in signatures:
+            parts[image.path[1:]] = data
+        return parts
+
+
+class VakaFormTemplates:
+    """Çıktı türü başına derlenmiş şablon (mapping sürümü değişince yeniden derlenir)"""
+
+    def __init__(self):
+        self._compiled: Dict[str, Tuple[tuple, Optional[CompiledTemplate]]] = {}
+        self._locks = defaultdict(asyncio.Lock)
+        self.stats = {"compiles": 0, "compile_errors": 0, "renders": 0, "fallbacks": 0, "last_render_ms": None}
+
+    async def get(self, variant: str, mapping_doc: dict) -> Optional[CompiledTemplate]:
+        key = mapping_version(mapping_doc)
+        cached = self._compiled.get(variant)
+        if cached and cached[0] == key:
+            return cached[1]
+        async with self._locks[variant]:
+            cached = self._compiled.get(variant)
+            if cached and cached[0] == key:
+                return cached[1]
+            started = time.perf_counter()
+            try:
+                compiled = await asyncio.to_thread(
+                    CompiledTemplate, variant, mapping_doc.get("flat_mappings", {}), mapping_doc.get("logo", {})
+                )
+                self.stats["compiles"] += 1
+                logger.info(f"VAKA FORMU şablonu derlendi ({variant}, {len(compiled.slots)} hücre, "
+                            f"{(time.perf_counter() - started) * 1000:.0f} ms)")
+            except Exception as e:
+                compiled = None
+                self.stats["compile_errors"] += 1
+                logger.error(f"VAKA FORMU şablonu derlenemedi ({variant}), openpyxl kullanılacak: {e}")
+            self._compiled[variant] = (key, compiled)
+            return compiled
+
+    def invalidate(self):
+        self._compiled.clear()
+
+    async def render(self, variant: str, mapping_doc: dict, values: dict,
+                     images: Optional[Dict[str, bytes]] = None) -> bytes:
+        """Doldurulmuş xlsx baytları"""
+        compiled = await self.get(variant, mapping_doc)
+        started = time.perf_counter()
+        content = await asyncio.to_thread(self._render_sync, compiled, variant, mapping_doc, values, images or {})
+        self.stats["renders"] += 1
+        self.stats["last_render_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return content
+
+    def _render_sync(self, compiled, variant, mapping_doc, values, images) -> bytes:
+        if compiled is not None:
+            try:
+                return compiled.render(values, images)
+            except _NeedsOpenpyxl as e:
+                logger.info(f"VAKA FORMU openpyxl ile oluşturuluyor: {e}")
+        self.stats["fallbacks"] += 1
+        return render_with_openpyxl(
+            variant, mapping_doc.get("flat_mappings", {}), mapping_doc.get("logo", {}), values, images
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "compiled": {variant: entry[1] is not None for variant, entry in self._compiled.items()},
+            **self.stats,
+        }
+
+
+def fix_ods_page_styles(ods_path: str):
+    """LibreOffice'in ürettiği ODS'de sayfa stilini A4 dikey, 1x1 sayfaya sığdır"""
+    with ZipFile(ods_path) as zf:
+        entries = [(info, zf.read(info)) for info in zf.infolist()]
+
+    fixed = []
+    for info, data in entries:
+        if info.filename == "styles.xml":
+            styles_xml = data.decode("utf-8")
+            for pattern, replacement in ODS_PAGE_STYLE_SUBS:
+                styles_xml = pattern.sub(replacement, styles_xml)
+            if 'style:scale-to-X' not in styles_xml:
+                styles_xml = styles_xml.replace(
+                    'style:print-orientation="portrait"',
+                    'style:print-orientation="portrait" style:scale-to-X="1" style:scale-to-Y="1"'
+                )
+            data = styles_xml.encode("utf-8")
+        fixed.append((info, data))
+
+    # Parçalar kendi sıkıştırma türleriyle yazılır (mimetype sıkıştırılmamış kalır)
+    temp_path = ods_path[:-len(".ods")] + "_fixed.ods"
+    with ZipFile(temp_path, "w", ZIP_DEFLATED) as zf:
+        for info, data in fixed:
+            zf.writestr(info, data)
+    os.replace(temp_path, ods_path)
+
+
+# Singleton
+vaka_form_templates = VakaFormTemplates()
@@ -0,0 +1,223 @@
+"""
+GS1 DataMatrix / Karekod Ayrıştırıcı
+İTS karekodları (01 GTIN, 21 Seri, 17 SKT, 10 Parti, 30 Adet) için tablo tabanlı, tek geçişli AI okuyucu
+
+Desteklenen girişler:
+    - GS (FNC1, \\x1d) ayraçlı ham veri: 0108699...21ABC\\x1d17261231\\x1d10LOT
+    - Ayraçsız ham veri (el terminalleri GS'yi düşürebilir): 0108699...21ABC1726123110LOT
+    - Parantezli okunabilir format: (01)08699...(21)ABC(17)261231(10)LOT
+    - Sembol tanımlayıcı önekleri: ]d2, ]C1, ]Q3
+"""
+import calendar
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GS = "\x1d"
+
+# AI -> (sabit uzunluk (None = değişken), maksimum uzunluk, sadece rakam, alan adı)
+# Sadece İTS karekodlarında ve koli etiketlerinde kullanılan AI'lar tanınır; tablo büyüdükçe
+# ayraçsız verilerde seri/parti içinde yanlış AI eşleşmesi ihtimali artar.
+AI_TABLE: Dict[str, Tuple[Optional[int], int, bool, str]] = {
+    "01": (14, 14, True, "gtin"),
+    "10": (None, 20, False, "lot_number"),
+    "17": (6, 6, True, "expiry_date"),
+    "21": (None, 20, False, "serial_number"),
+    "30": (None, 8, True, "quantity"),
+}
+
+# Tarih içeren AI'lar (YYMMDD) - değer geçerli bir tarih olmalı
+DATE_AIS = frozenset({"17"})
+
+_AI_LENGTHS = sorted({len(ai) for ai in AI_TABLE})
+_FIXED_AIS = tuple(ai for ai, spec in AI_TABLE.items() if spec[0])
+_SYMBOLOGY_PREFIXES = ("]d2", "]C1", "]Q3")
+_DIGITS = frozenset("0123456789")
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f]")
+
+ParsedGS1 = Dict[str, str]
+
+
+def _valid_date(value: str) -> bool:
+    month = int(value[2:4])
+    day = int(value[4:6])
+    return 1 <= month <= 12 and day <= 31
+
+
+def _valid_value(ai: str, value: str) -> bool:
+    length, max_length, numeric, _ = AI_TABLE[ai]
+    if not value or len(value) > max_length or (length and len(value) != length):
+        return False
+    if numeric and not _DIGITS.issuperset(value):
+        return False
+    if ai in DATE_AIS and not _valid_date(value):
+        return False
+    return True
+
+
+def _match_ai(text: str, pos: int) -> Optional[str]:
+    for size in _AI_LENGTHS:
+        ai = text[pos:pos + size]
+        if ai in AI_TABLE:
+            return ai
+    return None
+
+
+def _prepare(data: str) -> str:
+    """Sembol önekini at, kontrol karakterlerini GS'ye çevir"""
+    text = data.strip()
+    for prefix in _SYMBOLOGY_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    text = _CONTROL_CHARS.sub(GS, text)
+    return text.strip(GS)
+
+
+def _scan(text: str, pos: int, end: int, elements: Dict[str, str]) -> bool:
+    """
+    text[pos:end] aralığını AI'lara ayır (durum makinesi)
+    Tüm aralık tüketildiyse True; tanınmayan bir kısım kalırsa o ana kadarkiler elements'te kalır.
+    """
+    while pos < end:
+        if text[pos] == GS or text[pos] == " ":
+            pos += 1
+            continue
+
+        ai = _match_ai(text, pos)
+        if ai is None or ai in elements:
+            return False
+
+        length, max_length, _, _ = AI_TABLE[ai]
+        start = pos + len(ai)
+
+        if length:
+            value_end = start + length
+        else:
+            separator = text.find(GS, start, end)
+            value_end = separator if separator != -1 else end
+            if separator == -1 or value_end - start > max_length:
+                # Ayraç yok: değerin nerede bittiği belirsiz
+                value_end = _resolve_variable_end(text, ai, start, value_end, elements)
+
+        value = text[start:value_end]
+        if not _valid_value(ai, value.rstrip()):
+            return False
+        elements[ai] = value.rstrip()
+        pos = value_end
+
+    return True
+
+
+def _resolve_variable_end(text: str, ai: str, start: int, end: int, elements: Dict[str, str]) -> int:
+    """
+    Ayraçsız değişken uzunluklu değerin bitişini bul
+
+    Aday bitiş noktaları, kalan kısmın tamamen geçerli AI'lara ayrışabildiği yerlerdir
+    (tekrar eden AI ve geçersiz tarih kabul edilmez). Tercih sırası:
+        1. Arkasından sabit uzunluklu bir AI gelen en erken aday (İTS: 21 SERİ 17 SKT 10 PARTİ)
+        2. Kalan kısım maksimum uzunluğa sığıyorsa tamamı (son alan ayraç gerektirmez)
+        3. Arkasından değişken uzunluklu bir AI gelen en geç aday
+    """
+    max_end = min(end, start + AI_TABLE[ai][1])
+    seen = dict(elements)
+    seen[ai] = ""
+
+    best = None
+    for next_ai in _FIXED_AIS:
+        if next_ai in seen:
+            continue
+        search_end = max_end + len(next_ai)
+        candidate = text.find(next_ai, start + 1, search_end)
+        while candidate != -1 and (best is None or candidate < best):
+            if _scan(text, candidate, end, dict(seen)):
+                best = candidate
+                break
+            candidate = text.find(next_ai, candidate + 1, search_end)
+    if best is not None:
+        return best
+
+    if end - start <= AI_TABLE[ai][1]:
+        return end
+
+    for candidate in range(max_end, start, -1):
+        next_ai = _match_ai(text, candidate)
+        if next_ai is not None and next_ai not in seen and _scan(text, candidate, end, dict(seen)):
+            return candidate
+    return end
+
+
+def _scan_bracketed(text: str) -> Dict[str, str]:
+    """(AI)değer biçimi: AI sınırları açık olduğu için tek geçişte okunur"""
+    elements: Dict[str, str] = {}
+    pos = text.find("(")
+    while pos != -1:
+        close = text.find(")", pos + 1)
+        if close == -1:
+            break
+        ai = text[pos + 1:close]
+        next_open = text.find("(", close + 1)
+        value_end = next_open if next_open != -1 else len(text)
+        value = text[close + 1:value_end].replace(GS, "").strip()
+        if ai in AI_TABLE and ai not in elements:
+            length = AI_TABLE[ai][0]
+            if length:
+                value = value[:length]
+            if _valid_value(ai, value):
+                elements[ai] = value
+        pos = next_open
+    return elements
+
+
+def parse_elements(data: str) -> Dict[str, str]:
+    """Karekodu AI -> ham değer sözlüğüne ayır: {'01': '0869...', '21': 'ABC', ...}"""
+    if not data:
+        return {}
+    text = _prepare(data)
+    if "(" in text:
+        return _scan_bracketed(text)
+
+    elements: Dict[str, str] = {}
+    _scan(text, 0, len(text), elements)
+    return elements
+
+
+def parse(data: str) -> ParsedGS1:
+    """Karekodu alan adlarına göre ayır: {'gtin': ..., 'serial_number': ..., 'expiry_date': 'YYMMDD', ...}"""
+    return {AI_TABLE[ai][3]: value for ai, value in parse_elements(data).items()}
+
+
+def parse_many(barcodes: Iterable[str]) -> List[ParsedGS1]:
+    """
+    Karekod listesini sırayla ayır (toplu stok girişi / koli okutma için)
+    Aynı karekod listede birden fazla geçiyorsa bir kez çözülür; her sonuç ayrı bir sözlüktür.
+    """
+    cache: Dict[str, ParsedGS1] = {}
+    results: List[ParsedGS1] = []
+    for barcode in barcodes:
+        parsed = cache.get(barcode)
+        if parsed is None:
+            parsed = cache[barcode] = parse(barcode)
+        results.append(dict(parsed))
+    return results
+
+
+def parse_gs1_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    YYMMDD -> datetime
+    Yıl: 00-69 -> 20xx, 70-99 -> 19xx; gün 00 -> ayın son günü (GS1 kuralı)
+    """
+    if not value or len(value) != 6 or not value.isdigit():
+        return None
+    year = int(value[0:2])
+    month = int(value[2:4])
+    day = int(value[4:6])
+    year += 2000 if year < 70 else 1900
+    if not 1 <= month <= 12:
+        return None
+    if day == 0:
+        day = calendar.monthrange(year, month)[1]
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
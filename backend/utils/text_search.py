@@ -0,0 +1,208 @@
+"""
+Türkçe Metin Arama Utility Fonksiyonları
+Referans verileri (ilaç, ICD, hastane) için bellek içi arama index'i
+"""
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Türkçe büyük/küçük harf dönüşümü: str.lower() 'İ' -> 'i̇' (i + birleşik nokta) üretir ve 'I' -> 'i' yapar
+_TR_LOWER = str.maketrans({"İ": "i", "I": "ı"})
+
+# Aramada klavye farklarını tolere etmek için Türkçe karakterleri ASCII karşılıklarına indir
+_TR_FOLD = str.maketrans({
+    "ı": "i", "ş": "s", "ğ": "g", "ü": "u", "ö": "o", "ç": "c",
+    "â": "a", "î": "i", "û": "u", "\u0307": None
+})
+
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+
+# Önek aralığının üst sınırı için (bisect)
+_MAX_CHAR = "\uffff"
+
+
+def normalize_tr(text: str) -> str:
+    """
+    Türkçe kurallarına göre küçük harfe çevir ve aksanları kaldır
+    'İLAÇ' -> 'ilac', 'Işık' -> 'isik', 'ıSLAK' -> 'islak'
+    """
+    if not text:
+        return ""
+    return text.translate(_TR_LOWER).lower().translate(_TR_FOLD)
+
+
+def tokenize_tr(text: str) -> List[str]:
+    """Normalize edilmiş metni kelimelere ayır"""
+    return [t for t in _TOKEN_SPLIT.split(normalize_tr(text)) if t]
+
+
+def trigrams(text: str) -> set:
+    """Normalize edilmiş metnin 3'lü harf grupları"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def bigrams(text: str) -> set:
+    """Normalize edilmiş metnin 2'li harf grupları (2 harflik alt dize aramaları için)"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _dedupe_sorted(stream: Iterable[int]) -> Iterator[int]:
+    """Sıralı akıştaki ardışık tekrarları at (heapq.merge çıktısı için)"""
+    last = -1
+    for doc_id in stream:
+        if doc_id != last:
+            last = doc_id
+            yield doc_id
+
+
+class TextSearchIndex:
+    """
+    Kelime öneki + trigram index'i
+
+    Sonuç seviyeleri (iyiden kötüye):
+        0 - tam eşleşme, 1 - metin sorguyla başlıyor,
+        2 - her sorgu kelimesi bir kelimenin başı, 3 - her sorgu kelimesi alt dize olarak geçiyor
+    Alt dize adayları en uzun sorgu kelimesinin trigram'larından (2 harflik kelimede bigram'dan) gelir.
+    Aynı seviyede kısa ve alfabetik önce gelen kayıt önce döner.
+
+    doc_id'ler bu ikincil sıraya göre verilir; böylece tüm posting listeleri zaten sıralıdır ve
+    her seviye, limit dolunca duran artan bir akış olarak okunur. Yaygın sorgular ("mg", "tab")
+    tüm eşleşmeleri sıralamak zorunda kalmaz.
+
+    Kayıtlar (key, text) çiftleridir; key dışarıya döndürülen kimliktir (barkod, ICD kodu, ...).
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        prepared = [(normalize_tr(text), key, text) for key, text in entries]
+        prepared.sort(key=lambda item: (len(item[0]), item[0]))
+
+        self.keys: List[str] = [item[1] for item in prepared]
+        self.texts: List[str] = [item[2] for item in prepared]
+        self.normalized: List[str] = [item[0] for item in prepared]
+        # Kelime başı kontrolü için " kelime1 kelime2" biçimi (noktalama tek boşluğa indirgenmiş)
+        self._spaced: List[str] = []
+
+        token_postings: Dict[str, array] = {}
+        trigram_postings: Dict[str, array] = {}
+        bigram_postings: Dict[str, array] = {}
+
+        for doc_id, norm in enumerate(self.normalized):
+            tokens = [t for t in _TOKEN_SPLIT.split(norm) if t]
+            self._spaced.append(" " + " ".join(tokens))
+
+            for token in set(tokens):
+                token_postings.setdefault(token, array("I")).append(doc_id)
+            for gram in trigrams(norm):
+                trigram_postings.setdefault(gram, array("I")).append(doc_id)
+            for gram in bigrams(norm):
+                bigram_postings.setdefault(gram, array("I")).append(doc_id)
+
+        self._token_postings = token_postings
+        self._trigram_postings = trigram_postings
+        self._bigram_postings = bigram_postings
+
+        # Kelime öneki aramaları için sıralı sözlük
+        self._vocabulary: List[str] = sorted(token_postings)
+
+        # "Metin sorguyla başlıyor" aramaları için sıralı metinler
+        by_text = sorted(range(len(self.normalized)), key=self.normalized.__getitem__)
+        self._sorted_texts: List[str] = [self.normalized[d] for d in by_text]
+        self._sorted_text_ids = array("I", by_text)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _text_prefix_docs(self, query: str) -> List[int]:
+        """Normalize metni query ile başlayan kayıtlar (artan doc_id)"""
+        texts = self._sorted_texts
+        start = bisect_left(texts, query)
+        end = bisect_left(texts, query + _MAX_CHAR, lo=start)
+        return sorted(self._sorted_text_ids[start:end])
+
+    def _word_prefix_stream(self, prefix: str) -> Iterator[int]:
+        """prefix ile başlayan bir kelime içeren kayıtlar (artan doc_id)"""
+        vocab = self._vocabulary
+        start = bisect_left(vocab, prefix)
+        end = bisect_left(vocab, prefix + _MAX_CHAR, lo=start)
+        postings = [self._token_postings[vocab[i]] for i in range(start, end)]
+        if len(postings) == 1:
+            return iter(postings[0])
+        return _dedupe_sorted(heapq.merge(*postings))
+
+    def _substring_stream(self, fragment: str) -> Iterable[int]:
+        """fragment'i içerebilecek kayıtlar (en nadir trigram/bigram posting'i, artan doc_id)"""
+        if len(fragment) < 2:
+            return range(len(self.normalized))
+        if len(fragment) == 2:
+            return self._bigram_postings.get(fragment, ())
+        best = None
+        for gram in trigrams(fragment):
+            posting = self._trigram_postings.get(gram)
+            if posting is None:
+                return ()
+            if best is None or len(posting) < len(best):
+                best = posting
+        return best
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        filter_fn: Optional[Callable[[int], bool]] = None
+    ) -> List[int]:
+        """
+        Sorguya uyan kayıtların doc_id listesini sıralı döndür
+
+        Args:
+            query: Kullanıcı sorgusu (Türkçe karakterler/büyük harf fark etmez)
+            limit: Döndürülecek en fazla kayıt
+            filter_fn: doc_id -> bool ek filtre (ör. il filtresi)
+        """
+        query_tokens = [t for t in _TOKEN_SPLIT.split(normalize_tr(query)) if t]
+        if not query_tokens or limit <= 0:
+            return []
+
+        normalized_query = " ".join(query_tokens)
+        # En seçici (en uzun) kelimenin akışı okunur, diğer kelimeler kayıt üzerinde doğrulanır
+        primary = max(query_tokens, key=len)
+        word_prefixes = [" " + t for t in query_tokens]
+
+        results: List[int] = []
+        seen = set()
+
+        def accept(doc_id: int) -> bool:
+            """Sonuca ekle; limit dolduysa True döner"""
+            if filter_fn is not None and not filter_fn(doc_id):
+                return False
+            seen.add(doc_id)
+            results.append(doc_id)
+            return len(results) >= limit
+
+        # Seviye 0-1: metin sorguyla başlıyor (tam eşleşme önce)
+        normalized = self.normalized
+        prefix_docs = self._text_prefix_docs(normalized_query)
+        exact = [d for d in prefix_docs if normalized[d] == normalized_query]
+        for doc_id in exact + [d for d in prefix_docs if normalized[d] != normalized_query]:
+            if accept(doc_id):
+                return results
+
+        # Seviye 2: her sorgu kelimesi bir kelimenin başı
+        spaced = self._spaced
+        for doc_id in self._word_prefix_stream(primary):
+            if doc_id in seen:
+                continue
+            doc_spaced = spaced[doc_id]
+            if all(p in doc_spaced for p in word_prefixes) and accept(doc_id):
+                return results
+
+        # Seviye 3: her sorgu kelimesi alt dize olarak geçiyor
+        for doc_id in self._substring_stream(primary):
+            if doc_id in seen:
+                continue
+            norm = normalized[doc_id]
+            if all(t in norm for t in query_tokens) and accept(doc_id):
+                return results
+
+        return results
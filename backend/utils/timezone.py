@@ -2,8 +2,8 @@
 Türkiye Saati (UTC+3) Utility Fonksiyonları
 Sistemin tamamı Türkiye saati ile çalışır
 """
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
 
 # Türkiye timezone offset (UTC+3)
 TURKEY_OFFSET = timedelta(hours=3)
@@ -35,6 +35,37 @@ def from_turkey_time(turkey_dt: datetime) -> datetime:
     return turkey_dt - TURKEY_OFFSET
 
 
+def to_naive_turkey_time(value: datetime) -> datetime:
+    """
+    Saat dilimli datetime'ı sistemin kullandığı naive Türkiye saatine çevir
+    Naive değerler zaten Türkiye saati kabul edilir.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None) + TURKEY_OFFSET
+
+
+def parse_turkey_datetime(value: Union[str, int, float, datetime, None]) -> Optional[datetime]:
+    """
+    İstemciden gelen zamanı naive Türkiye saatine çevir; çözülemezse None
+    Kabul edilenler: ISO string (Z/offset'li veya naive), epoch saniye/milisaniye, datetime
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, datetime):
+        return to_naive_turkey_time(value)
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        try:
+            return datetime.utcfromtimestamp(seconds) + TURKEY_OFFSET
+        except (OverflowError, OSError, ValueError):
+            return None
+    try:
+        return to_naive_turkey_time(datetime.fromisoformat(str(value).strip()))
+    except ValueError:
+        return None
+
+
 def get_turkey_date() -> str:
     """
     Bugünün tarihini Türkiye saatine göre YYYY-MM-DD formatında döndür
@@ -0,0 +1,44 @@
+"""
+Ortak test ayarları
+Testler backend/ modüllerini doğrudan import eder (backend kök dizini sys.path'e eklenir).
+
+database.py import edildiğinde Motor istemcisi oluşturulur; testler üretim veritabanına
+bağlanmasın diye MONGO_URL/DB_NAME import'tan önce test değerlerine çekilir.
+Veritabanı gerektiren testler `mongo_client` + `mongo_db_name` (oturum başına geçici veritabanı)
+fixture'larını kullanır: TEST_MONGO_URL'deki (varsayılan mongodb://localhost:27017) mongod'a
+erişilemezse atlanır.
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+os.environ["MONGO_URL"] = TEST_MONGO_URL
+os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME", "healmedy_test")
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(TEST_MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError as e:
+        client.close()
+        pytest.skip(f"mongod erişilemiyor ({TEST_MONGO_URL}): {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def mongo_db_name(mongo_client):
+    """Oturum başına geçici veritabanı adı (sonunda silinir)"""
+    name = f"healmedy_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    mongo_client.drop_database(name)
@@ -0,0 +1,315 @@
+"""
+Değiştirilen GS1 ayrıştırıcılarının baseline (b4db7d8) kopyaları - sadece testler için
+utils/gs1.py öncesinde karekod üç yerde ayrıştırılıyordu:
+    - services/its_service.parse_datamatrix (stok, karekod uçları)
+    - routes/warehouse.parse_its_qr (parse_datamatrix'i çağırıyordu; ayrıştırması aynıdır)
+    - routes/medications.parse_gs1_barcode (ayrı, konum tabanlı okuyucu)
+
+Fonksiyon gövdeleri değiştirilmeden alınmıştır; test_gs1_parser.py yeni ayrıştırıcıyı bunlarla karşılaştırır.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import Dict
+
+from models import ParsedBarcodeData
+
+logger = logging.getLogger(__name__)
+
+
+def parse_datamatrix(barcode: str) -> Dict:
+    """
+    GS1 DataMatrix karekodunu parse et
+    
+    Format: (01)GTIN(21)SERI(10)PARTI(17)SKT
+    
+    AI Kodları:
+    - 01: GTIN (14 hane)
+    - 21: Seri Numarası (değişken uzunluk)
+    - 10: Parti/Lot Numarası (değişken uzunluk)
+    - 17: Son Kullanma Tarihi (YYMMDD - 6 hane)
+    
+    Args:
+        barcode: DataMatrix içeriği
+        
+    Returns:
+        {
+            "gtin": "08680123456789",
+            "serial_number": "ABC123",
+            "lot_number": "LOT001",
+            "expiry_date": "2026-12-31",
+            "raw": "orijinal karekod"
+        }
+    """
+    import re
+    
+    result = {
+        "gtin": None,
+        "serial_number": None,
+        "lot_number": None,
+        "expiry_date": None,
+        "quantity": None,  # AI (30) - Kutudaki adet
+        "raw": barcode
+    }
+    
+    if not barcode:
+        return result
+    
+    # Kontrol karakterlerini temizle (FNC1, GS, RS, EOT vs.)
+    clean_barcode = barcode.replace('\x1d', '|').replace('\x1e', '|').replace('\x04', '|')
+    clean_barcode = re.sub(r'[\x00-\x1f]', '|', clean_barcode)
+    
+    logger.debug(f"Parsing barcode: {repr(barcode)}")
+    logger.debug(f"Cleaned barcode: {clean_barcode}")
+    
+    # Yöntem 1: Parantezli format: (01)GTIN(21)SERI...
+    if '(' in clean_barcode:
+        # GTIN (01)
+        gtin_match = re.search(r'\(01\)(\d{14})', clean_barcode)
+        if gtin_match:
+            result["gtin"] = gtin_match.group(1)
+        
+        # Seri Numarası (21)
+        serial_match = re.search(r'\(21\)([^\(\)]+)', clean_barcode)
+        if serial_match:
+            result["serial_number"] = serial_match.group(1).strip()
+        
+        # Parti/Lot Numarası (10)
+        lot_match = re.search(r'\(10\)([^\(\)]+)', clean_barcode)
+        if lot_match:
+            result["lot_number"] = lot_match.group(1).strip()
+        
+        # Son Kullanma Tarihi (17)
+        exp_match = re.search(r'\(17\)(\d{6})', clean_barcode)
+        if exp_match:
+            exp_str = exp_match.group(1)
+            result["expiry_date"] = _parse_expiry_date(exp_str)
+        
+        # Kutudaki Adet (30) - parantezli format
+        qty_match = re.search(r'\(30\)(\d+)', clean_barcode)
+        if qty_match:
+            qty = int(qty_match.group(1))
+            # Makul değer kontrolü (1-1000 arası)
+            if 1 <= qty <= 1000:
+                result["quantity"] = qty
+    
+    # Yöntem 2: GS ayraçlı veya ayraçsız format
+    # 01GTIN17SKT10LOT21SERIAL veya 01GTIN|17SKT|10LOT|21SERIAL
+    if not result["gtin"]:
+        # AI kodlarını bul (01, 10, 17, 21)
+        # Önce ayraçlarla dene
+        parts = clean_barcode.split('|')
+        
+        # Tüm parçaları birleştir ve AI'ları bul
+        full_data = ''.join(parts)
+        
+        # GTIN (01) - 14 haneli
+        gtin_match = re.search(r'01(\d{14})', full_data)
+        if gtin_match:
+            result["gtin"] = gtin_match.group(1)
+        
+        # SKT (17) - 6 haneli tarih
+        exp_match = re.search(r'17(\d{6})', full_data)
+        if exp_match:
+            result["expiry_date"] = _parse_expiry_date(exp_match.group(1))
+        
+        # Kutudaki Adet (30) - değişken uzunluklu
+        # AI (30) dan sonra gelen sayıları al, ama başka AI ile karışmaması için dikkatli ol
+        qty_match = re.search(r'(?:^|[^\d])30(\d{1,8})(?:[^\d]|$)', full_data)
+        if qty_match:
+            result["quantity"] = int(qty_match.group(1))
+        
+        # Lot (10) ve Seri (21) değişken uzunluklu - daha karmaşık parse
+        # Bu AI'lar değişken uzunlukta olduğu için sırayla bakmamız gerekiyor
+        
+        # Önce sabit uzunluklu AI'ları çıkar
+        remaining = full_data
+        if result["gtin"]:
+            remaining = remaining.replace(f'01{result["gtin"]}', '|')
+        if exp_match:
+            remaining = remaining.replace(f'17{exp_match.group(1)}', '|')
+        
+        # Kalan parçalarda 10 ve 21'i ara
+        for segment in remaining.split('|'):
+            segment = segment.strip()
+            if not segment:
+                continue
+            
+            if segment.startswith('21') and not result["serial_number"]:
+                # Seri numarasını al (sonraki AI'ya kadar veya sona kadar)
+                serial_val = segment[2:]
+                # Başka bir AI ile başlayan kısmı kes
+                for ai in ['01', '10', '17']:
+                    ai_pos = serial_val.find(ai)
+                    if ai_pos > 0:
+                        serial_val = serial_val[:ai_pos]
+                result["serial_number"] = serial_val.strip()
+                
+            elif segment.startswith('10') and not result["lot_number"]:
+                lot_val = segment[2:]
+                for ai in ['01', '17', '21']:
+                    ai_pos = lot_val.find(ai)
+                    if ai_pos > 0:
+                        lot_val = lot_val[:ai_pos]
+                result["lot_number"] = lot_val.strip()
+    
+    # Yöntem 3: Ham veriyi pozisyon bazlı parse et
+    # Bazı karekodlar şöyle: 01XXXXXXXXXXXXXX17YYMMDD10LOT21SERIAL
+    if not result["gtin"] and not result["serial_number"]:
+        # 01 ile başlıyorsa
+        if clean_barcode.startswith('01') and len(clean_barcode) >= 16:
+            result["gtin"] = clean_barcode[2:16]
+            rest = clean_barcode[16:]
+            
+            # 17YYMMDD
+            if '17' in rest:
+                idx = rest.find('17')
+                if idx >= 0 and len(rest) >= idx + 8:
+                    result["expiry_date"] = _parse_expiry_date(rest[idx+2:idx+8])
+            
+            # 10LOT
+            if '10' in rest:
+                idx = rest.find('10')
+                if idx >= 0:
+                    # Sonraki AI'ya kadar al
+                    lot_end = len(rest)
+                    for ai in ['17', '21']:
+                        ai_idx = rest.find(ai, idx + 2)
+                        if ai_idx > idx and ai_idx < lot_end:
+                            lot_end = ai_idx
+                    result["lot_number"] = rest[idx+2:lot_end]
+            
+            # 21SERIAL
+            if '21' in rest:
+                idx = rest.find('21')
+                if idx >= 0:
+                    serial_end = len(rest)
+                    for ai in ['17', '10']:
+                        ai_idx = rest.find(ai, idx + 2)
+                        if ai_idx > idx and ai_idx < serial_end:
+                            serial_end = ai_idx
+                    result["serial_number"] = rest[idx+2:serial_end]
+    
+    # Son temizlik
+    if result["serial_number"]:
+        result["serial_number"] = result["serial_number"].strip()
+    if result["lot_number"]:
+        result["lot_number"] = result["lot_number"].strip()
+    
+    logger.debug(f"Parse result: {result}")
+    
+    return result
+
+
+def _parse_expiry_date(exp_str: str) -> str:
+    """YYMMDD formatını YYYY-MM-DD'ye çevir"""
+    try:
+        year = 2000 + int(exp_str[0:2])
+        month = int(exp_str[2:4])
+        day = int(exp_str[4:6])
+        # Gün 00 ise ayın son günü
+        if day == 0:
+            day = 28  # Güvenli varsayılan
+        return f"{year}-{month:02d}-{day:02d}"
+    except:
+        return None
+
+
+def parse_gs1_barcode(raw_data: str) -> ParsedBarcodeData:
+    """
+    Parse GS1 DataMatrix barcode (Türkiye ITS standardı)
+    
+    Format: (01)GTIN(17)YYMMDD(10)LOT(21)SERIAL
+    
+    Application Identifiers (AI):
+    - (01) GTIN - 14 haneli ürün kodu
+    - (17) Son Kullanma Tarihi - YYMMDD
+    - (10) Parti/Lot Numarası
+    - (21) Seri Numarası
+    
+    Örnek: 010869954321012317251231 10ABC123 21SN123456
+    """
+    result = ParsedBarcodeData(raw_data=raw_data)
+    
+    # Clean the input - remove spaces and special chars
+    clean_data = raw_data.strip()
+    
+    # Try different parsing methods
+    
+    # Method 1: With parentheses format (01)xxx(17)xxx...
+    if '(' in clean_data:
+        # Extract using regex with parentheses
+        gtin_match = re.search(r'\(01\)(\d{14})', clean_data)
+        expiry_match = re.search(r'\(17\)(\d{6})', clean_data)
+        lot_match = re.search(r'\(10\)([^\(]+)', clean_data)
+        serial_match = re.search(r'\(21\)([^\(]+)', clean_data)
+        
+        if gtin_match:
+            result.gtin = gtin_match.group(1)
+        if expiry_match:
+            result.expiry_date = expiry_match.group(1)
+        if lot_match:
+            result.lot_number = lot_match.group(1).strip()
+        if serial_match:
+            result.serial_number = serial_match.group(1).strip()
+    
+    # Method 2: Without parentheses - position based
+    # Format: 01XXXXXXXXXXXXXX17YYMMDD10LOT21SERIAL
+    else:
+        # GS1 uses FNC1 (Group Separator) character, often represented as ]d2 or GS (ASCII 29)
+        # Remove any control characters
+        clean_data = re.sub(r'[\x00-\x1f]', '', clean_data)
+        
+        # Try to find AI codes by position
+        pos = 0
+        while pos < len(clean_data):
+            # Check for known AIs
+            if clean_data[pos:pos+2] == '01' and pos + 16 <= len(clean_data):
+                result.gtin = clean_data[pos+2:pos+16]
+                pos += 16
+            elif clean_data[pos:pos+2] == '17' and pos + 8 <= len(clean_data):
+                result.expiry_date = clean_data[pos+2:pos+8]
+                pos += 8
+            elif clean_data[pos:pos+2] == '10':
+                # Lot number - variable length, ends at next AI or end
+                lot_end = len(clean_data)
+                for ai in ['17', '21', '01']:
+                    ai_pos = clean_data.find(ai, pos+2)
+                    if ai_pos != -1 and ai_pos < lot_end:
+                        lot_end = ai_pos
+                result.lot_number = clean_data[pos+2:lot_end].strip()
+                pos = lot_end
+            elif clean_data[pos:pos+2] == '21':
+                # Serial number - variable length
+                serial_end = len(clean_data)
+                for ai in ['17', '10', '01']:
+                    ai_pos = clean_data.find(ai, pos+2)
+                    if ai_pos != -1 and ai_pos < serial_end:
+                        serial_end = ai_pos
+                result.serial_number = clean_data[pos+2:serial_end].strip()
+                pos = serial_end
+            else:
+                pos += 1
+    
+    # Parse expiry date if found
+    if result.expiry_date and len(result.expiry_date) == 6:
+        try:
+            year = int(result.expiry_date[0:2])
+            month = int(result.expiry_date[2:4])
+            day = int(result.expiry_date[4:6])
+            
+            # Handle century (00-69 = 2000s, 70-99 = 1900s)
+            if year < 70:
+                year += 2000
+            else:
+                year += 1900
+            
+            # Handle day = 00 (means last day of month)
+            if day == 0:
+                day = 28  # Safe default
+            
+            result.expiry_date_parsed = datetime(year, month, day)
+        except (ValueError, TypeError):
+            pass
+    
+    return result
@@ -0,0 +1,210 @@
+"""
+GS1 karekod ayrıştırıcısı - değiştirilen üç ayrıştırıcıya karşı altın veri testi
+Beklenen değerler baseline ayrıştırıcılarından (tests/gs1_legacy.py) o anda üretilir; yeni
+ayrıştırıcının kendi çıktısından alınmış bir anlık görüntü kullanılmaz.
+
+Karşılaştırılan çağrı yerleri:
+    - services.its_service.parse_datamatrix  <-> eski parse_datamatrix (warehouse.parse_its_qr de bunu kullanır)
+    - routes.medications.parse_gs1_barcode   <-> eski parse_gs1_barcode
+
+Korpus: scripts/run_bulk_stock*.py ve bulk_stock_entry.py'deki gerçek karekodlar + biçim örnekleri
+(scripts/benchmark_gs1_parser.load_corpus). Sonuç eski ayrıştırıcıyla aynı değilse fark aşağıdaki
+bilinçli değişikliklerden biri olmalıdır; değilse test düşer:
+
+    gün_00   SKT günü 00: eski kod ayın 28'ini, yeni kod GS1 kuralına göre ayın son gününü verir.
+    bölme    Eski kod değişken uzunluklu alanı (21 seri, 10 parti) içinde geçen ilk "10"/"17"/"21"/"01"
+             rakam çiftinde kesiyor, GTIN/SKT'yi başka alanın içinden okuyabiliyor ya da GS ayracını
+             silip alanları birleştiriyordu. Kabul şartı: yeni sonucun alanları (AI + değer) karekodu
+             GS sınırlarına uyarak birebir yeniden oluşturur ve SKT geçerli bir tarihtir; eski sonuç
+             bunu yapamaz. İki sonuç da karekodu oluşturabiliyorsa (belirsiz karekod) fark kabul edilmez.
+
+Korpusta (1.746 karekod) parse_datamatrix için 1.385, parse_gs1_barcode için 1.369 karekod farklıdır;
+tamamı bu iki gruptadır (gün_00: 8 / 6, geri kalanı bölme).
+"""
+
+import calendar
+from datetime import datetime
+from itertools import permutations
+
+import pytest
+
+from tests import gs1_legacy
+
+GS = "\x1d"
+FIELD_AIS = {"gtin": "01", "serial_number": "21", "expiry_date": "17", "lot_number": "10", "quantity": "30"}
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    from scripts.benchmark_gs1_parser import load_corpus
+    return load_corpus()
+
+
+def _layout_matches(barcode: str, fields: dict) -> bool:
+    """
+    fields (alan -> ham değer) karekodu birebir oluşturuyor mu?
+    Alanlar herhangi bir sırada olabilir; GS sadece alan sınırlarında bulunabilir.
+    """
+    from utils.gs1 import _prepare
+    text = _prepare(barcode)
+    if "(" in text:
+        return False
+    chunks = [FIELD_AIS[name] + value for name, value in fields.items() if value]
+    if not chunks:
+        return not text
+    for order in permutations(chunks):
+        pos = 0
+        for chunk in order:
+            while text.startswith(GS, pos):
+                pos += 1
+            if not text.startswith(chunk, pos):
+                break
+            pos += len(chunk)
+        else:
+            if not text[pos:].strip(GS):
+                return True
+    return False
+
+
+def _valid_expiry(yymmdd) -> bool:
+    from utils.gs1 import parse_gs1_date
+    return yymmdd is None or parse_gs1_date(yymmdd) is not None
+
+
+def _yymmdd(iso_date):
+    """parse_datamatrix'in YYYY-MM-DD çıktısını karekoddaki YYMMDD'ye geri çevir"""
+    return iso_date[2:4] + iso_date[5:7] + iso_date[8:10] if iso_date else None
+
+
+def _as_date(result: dict):
+    value = result.get("expiry_date")
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def _is_day_00(barcode: str, legacy_date, new_date, raw_expiry) -> bool:
+    if not raw_expiry or raw_expiry[4:6] != "00":
+        return False
+    year, month = 2000 + int(raw_expiry[:2]), int(raw_expiry[2:4])
+    return (legacy_date == datetime(year, month, 28)
+            and new_date == datetime(year, month, calendar.monthrange(year, month)[1]))
+
+
+def _classify(barcode: str, legacy_fields: dict, new_fields: dict, date_pair) -> str:
+    """Farkın hangi bilinçli değişiklik olduğunu döndür; açıklanamıyorsa 'açıklanamayan'"""
+    legacy_date, new_date = date_pair
+    if legacy_fields == new_fields and legacy_date != new_date:
+        if _is_day_00(barcode, legacy_date, new_date, new_fields.get("expiry_date")):
+            return "gün_00"
+        return "açıklanamayan"
+
+    new_ok = _layout_matches(barcode, new_fields) and _valid_expiry(new_fields.get("expiry_date"))
+    if new_ok and not _layout_matches(barcode, legacy_fields):
+        return "bölme"
+    return "açıklanamayan"
+
+
+def _report(unexplained: list) -> str:
+    lines = [f"{len(unexplained)} açıklanamayan fark:"]
+    for barcode, legacy, new in unexplained[:10]:
+        lines.append(f"  {barcode!r}\n    eski: {legacy}\n    yeni: {new}")
+    return "\n".join(lines)
+
+
+def test_parse_datamatrix_matches_legacy(corpus):
+    from services.its_service import parse_datamatrix
+    from utils import gs1
+
+    unexplained = []
+    for barcode in corpus:
+        legacy = gs1_legacy.parse_datamatrix(barcode)
+        new = parse_datamatrix(barcode)
+        raw = gs1.parse(barcode)
+
+        # Genel çıktı ham alanlardan türetilmeli (SKT tarihe, adet sayıya çevrilir)
+        expiry = gs1.parse_gs1_date(raw.get("expiry_date"))
+        assert new["gtin"] == raw.get("gtin") and new["serial_number"] == raw.get("serial_number")
+        assert new["lot_number"] == raw.get("lot_number")
+        assert new["expiry_date"] == (expiry.strftime("%Y-%m-%d") if expiry else None)
+        if legacy == new:
+            continue
+
+        legacy_fields = {name: legacy.get(name) for name in FIELD_AIS}
+        legacy_fields["expiry_date"] = _yymmdd(legacy_fields["expiry_date"])
+        if legacy_fields["quantity"] is not None:
+            legacy_fields["quantity"] = str(legacy_fields["quantity"])
+        new_fields = {name: raw.get(name) for name in FIELD_AIS}
+
+        if ({k: v for k, v in legacy_fields.items() if k != "expiry_date"}
+                == {k: v for k, v in new_fields.items() if k != "expiry_date"}):
+            # Sadece tarih farklı: gün 00 kuralı dışında fark beklenmez
+            legacy_fields["expiry_date"] = new_fields["expiry_date"]
+        category = _classify(barcode, legacy_fields, new_fields, (_as_date(legacy), _as_date(new)))
+        if category == "açıklanamayan":
+            unexplained.append((barcode, legacy, new))
+
+    assert not unexplained, _report(unexplained)
+
+
+def test_parse_gs1_barcode_matches_legacy(corpus):
+    from routes.medications import parse_gs1_barcode
+    from utils import gs1
+
+    unexplained = []
+    for barcode in corpus:
+        legacy = gs1_legacy.parse_gs1_barcode(barcode).model_dump()
+        new = parse_gs1_barcode(barcode).model_dump()
+        if legacy == new:
+            continue
+
+        # Model adet (30) taşımaz; iki taraf için de karekoddaki ham adet kullanılır
+        quantity = gs1.parse(barcode).get("quantity")
+
+        def fields(result):
+            values = {name: result.get(name) or None for name in ("gtin", "serial_number", "expiry_date", "lot_number")}
+            values["quantity"] = quantity
+            return values
+
+        category = _classify(barcode, fields(legacy), fields(new),
+                             (legacy["expiry_date_parsed"], new["expiry_date_parsed"]))
+        if category == "açıklanamayan":
+            unexplained.append((barcode, legacy, new))
+
+    assert not unexplained, _report(unexplained)
+
+
+def test_warehouse_uses_shared_parser():
+    # parse_its_qr eskiden de parse_datamatrix'i çağırıyordu; ortak ayrıştırıcıya bağlı kalmalı
+    from routes import warehouse
+    from services import its_service
+    assert warehouse.parse_datamatrix is its_service.parse_datamatrix
+
+
+def test_parse_many_matches_single(corpus):
+    from services.its_service import parse_datamatrix, parse_datamatrix_many
+    barcodes = corpus + corpus[:50]
+    assert parse_datamatrix_many(barcodes) == [parse_datamatrix(b) for b in barcodes]
+
+
+@pytest.mark.parametrize("barcode,expected", [
+    # GS ayracı: adet, partiye eklenmemeli
+    ("010869978875002721ABC123\x1d17261231\x1d10LOT1\x1d3024",
+     {"gtin": "08699788750027", "serial_number": "ABC123", "expiry_date": "2026-12-31", "lot_number": "LOT1", "quantity": 24}),
+    # Ayraçsız: seri içindeki "10"/"17" rakam çiftleri alanı bölmemeli
+    ("0108699546010028216104371173451727013110ELB01350",
+     {"gtin": "08699546010028", "serial_number": "610437117345", "expiry_date": "2027-01-31", "lot_number": "ELB01350", "quantity": None}),
+    # Gün 00 -> ayın son günü
+    ("010869885661023221C006378005633717270400104E068A",
+     {"gtin": "08698856610232", "serial_number": "C0063780056337", "expiry_date": "2027-04-30", "lot_number": "4E068A", "quantity": None}),
+    # Parantezli format ve sembol öneki
+    ("(01)08699788750027(21)ABC123(17)261231(10)LOT 1",
+     {"gtin": "08699788750027", "serial_number": "ABC123", "expiry_date": "2026-12-31", "lot_number": "LOT 1", "quantity": None}),
+    ("]d2010869978875002721ABC123\x1d1726123110LOT1",
+     {"gtin": "08699788750027", "serial_number": "ABC123", "expiry_date": "2026-12-31", "lot_number": "LOT1", "quantity": None}),
+])
+def test_reviewed_examples(barcode, expected):
+    from services.its_service import parse_datamatrix
+    result = parse_datamatrix(barcode)
+    assert {name: result[name] for name in expected} == expected
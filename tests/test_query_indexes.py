@@ -0,0 +1,176 @@
+"""
+Sık kullanılan sorgu şekilleri index kullanıyor mu?
+database.COLLECTION_INDEXES, ensure_indexes() ile geçici bir veritabanına uygulanır ve her
+sorgu şekli explain() ile çalıştırılır; planın herhangi bir yerinde COLLSCAN varsa test düşer.
+
+Yeni bir sıcak sorgu eklerken buraya şeklini, registry'ye de index'ini ekleyin.
+Yerel mongod yoksa atlanır (bkz. conftest.py).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+NOW = datetime(2026, 3, 1, 9, 30)
+TODAY = NOW.replace(hour=0, minute=0, second=0, microsecond=0)
+TOMORROW = TODAY + timedelta(days=1)
+ACTIVE = ["pending", "started"]
+
+# (ad, koleksiyon, filtre, sıralama) - kaynak uç yorumda
+QUERY_SHAPES = [
+    # auth_utils.get_current_user
+    ("session_token", "user_sessions", {"session_token": "tok", "expires_at": {"$gt": NOW}}, None),
+    ("user_by_id", "users", {"_id": "u1"}, None),
+    # routes/auth.py login
+    ("user_by_email", "users", {"email": "a@b.c"}, None),
+    # token_directory / otp_service: rol bazlı kullanıcılar
+    ("users_by_role", "users", {"role": {"$in": ["merkez_ofis", "operasyon_muduru"]}, "is_active": True}, None),
+    # GET /cases - liste, durum filtresi, keyset sayfalama, tarih filtresi
+    ("cases_list", "cases", {}, [("case_number", -1), ("_id", -1)]),
+    ("cases_by_status", "cases", {"status": "acildi"}, [("case_number", -1), ("_id", -1)]),
+    ("cases_keyset", "cases", {"$or": [
+        {"case_number": {"$lt": "20260301-000010"}},
+        {"case_number": "20260301-000010", "_id": {"$lt": "c10"}},
+    ]}, [("case_number", -1), ("_id", -1)]),
+    ("cases_created_range", "cases", {"created_at": {"$gte": TODAY, "$lte": TOMORROW}}, None),
+    ("cases_by_vehicle", "cases", {"assigned_team.vehicle_id": "v1"}, None),
+    ("cases_by_creator", "cases", {"created_by": "u1"}, None),
+    # GET /shifts/assignments/today (active_assignments_query, 08:00 öncesi ve sonrası)
+    ("assignments_today", "shift_assignments",
+     {"status": {"$in": ACTIVE}, "shift_date": {"$gte": TODAY, "$lt": TOMORROW}}, None),
+    ("assignments_overnight", "shift_assignments", {"$or": [
+        {"status": {"$in": ACTIVE}, "shift_date": {"$gte": TODAY, "$lt": TOMORROW}, "end_date": None},
+        {"status": {"$in": ACTIVE}, "end_date": {"$gte": TODAY}, "shift_date": {"$lt": TOMORROW}},
+    ]}, None),
+    ("assignments_by_user", "shift_assignments",
+     {"user_id": "u1", "status": {"$in": ACTIVE}, "shift_date": {"$lte": TOMORROW}}, None),
+    ("assignments_by_vehicle", "shift_assignments", {"vehicle_id": "v1", "status": {"$in": ACTIVE}}, None),
+    # Vardiya başlat/bitir
+    ("active_shift_by_user", "shifts", {"user_id": "u1", "end_time": None}, None),
+    ("active_shift_by_vehicle", "shifts", {"vehicle_id": "v1", "end_time": None}, None),
+    # Karekod stok: tekil kayıt, toplu giriş, lokasyon listesi
+    ("barcode_serial_gtin", "barcode_stock", {"serial_number": "S1", "gtin": "08699999999999"}, None),
+    ("barcode_bulk_serials", "barcode_stock", {"serial_number": {"$in": ["S1", "S2", "S3"]}}, None),
+    ("barcode_by_location", "barcode_stock", {"location": "merkez_depo", "status": "available"}, None),
+    ("barcode_expiring", "barcode_stock",
+     {"status": "available", "expiry_date": {"$lte": NOW + timedelta(days=30)}}, [("expiry_date", 1)]),
+    ("its_drug_by_gtin", "its_drugs", {"gtin": "08699999999999"}, None),
+    # GPS
+    ("gps_history_window", "vehicle_gps_history",
+     {"vehicle_id": "v1", "created_at": {"$gte": TODAY, "$lte": TOMORROW}}, [("created_at", 1)]),
+    ("gps_latest", "vehicle_gps_history", {"vehicle_id": "v1"}, [("created_at", -1)]),
+    # services/gps_tracks.get_vehicle_track (cihaz zamanı, eski kayıtlarda created_at)
+    ("gps_track_window", "vehicle_gps_history", {"vehicle_id": "v1", "$or": [
+        {"recorded_at": {"$gte": TODAY, "$lte": TOMORROW}},
+        {"recorded_at": {"$exists": False}, "created_at": {"$gte": TODAY, "$lte": TOMORROW}},
+    ]}, [("recorded_at", 1)]),
+    # gps_ingest: time-series geçmişinde tekrar kontrolü
+    ("gps_dedup_window", "vehicle_gps_history",
+     {"vehicle_id": {"$in": ["v1"]}, "created_at": {"$gte": TODAY}, "_id": {"$in": ["gps_v1_a", "gps_v1_b"]}}, None),
+    ("vehicle_current_location", "vehicle_current_locations", {"vehicle_id": "v1"}, None),
+    # Bildirimler ve outbox
+    ("notifications_by_user", "notifications", {"user_id": "u1"}, [("created_at", -1)]),
+    ("outbox_claim", "notification_outbox", {"$or": [
+        {"status": "pending", "next_attempt_at": {"$lte": NOW}},
+        {"status": "sending", "lease_until": {"$lt": NOW}},
+    ]}, [("next_attempt_at", 1)]),
+    # Personel performans raporu
+    ("staff_rollups_range", "staff_daily_stats", {"day": {"$gte": "2026-02-01", "$lte": "2026-03-01"}}, None),
+    ("staff_late_cases", "cases", {"$or": [
+        {"updated_at": {"$gte": TODAY}}, {"updated_at": {"$gte": TODAY.isoformat()}},
+    ]}, None),
+    ("staff_late_shifts", "shifts", {"$or": [
+        {"end_time": {"$gte": TODAY}}, {"end_time": {"$gte": TODAY.isoformat()}},
+    ]}, None),
+    ("medication_usage_by_case", "medication_usage", {"case_id": "c1"}, None),
+]
+
+# Plan seçiminin gerçekçi olması için her koleksiyona birkaç örnek doküman
+SEED_DOCUMENTS = {
+    "user_sessions": [{"session_token": f"tok{i}", "user_id": "u1", "expires_at": NOW} for i in range(5)],
+    "users": [{"_id": f"u{i}", "email": f"u{i}@b.c", "role": "paramedik", "is_active": True} for i in range(5)],
+    "cases": [
+        {"_id": f"c{i}", "case_number": f"20260301-{i:06d}", "status": "acildi", "created_at": NOW,
+         "updated_at": NOW, "created_by": "u1", "assigned_team": {"vehicle_id": "v1"}}
+        for i in range(20)
+    ],
+    "shift_assignments": [
+        {"user_id": f"u{i}", "vehicle_id": "v1", "status": "pending", "shift_date": TODAY, "end_date": None}
+        for i in range(5)
+    ],
+    "shifts": [{"user_id": f"u{i}", "vehicle_id": "v1", "start_time": NOW, "end_time": None} for i in range(5)],
+    "barcode_stock": [
+        {"serial_number": f"S{i}", "gtin": "08699999999999", "location": "merkez_depo",
+         "status": "available", "expiry_date": NOW}
+        for i in range(5)
+    ],
+    "its_drugs": [{"gtin": f"0869999999999{i}", "name": f"İlaç {i}"} for i in range(5)],
+    "vehicle_gps_history": [
+        {"vehicle_id": "v1", "created_at": NOW + timedelta(seconds=i), "recorded_at": NOW + timedelta(seconds=i),
+         "latitude": 41.0, "longitude": 29.0}
+        for i in range(5)
+    ],
+    "vehicle_current_locations": [{"vehicle_id": f"v{i}"} for i in range(5)],
+    "notifications": [{"user_id": "u1", "created_at": NOW, "read": False} for _ in range(5)],
+    "notification_outbox": [{"status": "pending", "next_attempt_at": NOW} for _ in range(5)],
+    "staff_daily_stats": [{"_id": f"cases:2026-03-0{i}:u1", "day": f"2026-03-0{i}", "user_id": "u1"} for i in range(1, 6)],
+    "medication_usage": [{"case_id": f"c{i}", "name": "Parol"} for i in range(5)],
+}
+
+
+def _stages(plan):
+    """explain çıktısındaki tüm stage adları (iç içe planlar ve $or dalları dahil)"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def _ensure_indexes(database_name: str) -> dict:
+    """database.ensure_indexes() - startup'taki yolun aynısı (Motor, kendi event loop'unda)"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from database import ensure_indexes
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        try:
+            return await ensure_indexes(client[database_name])
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
+def _failures(report: dict) -> dict:
+    return {name: result["failed"] for name, result in report.items() if result["failed"]}
+
+
+@pytest.fixture(scope="module")
+def indexed_db(mongo_client, mongo_db_name):
+    report = _ensure_indexes(mongo_db_name)
+    assert not _failures(report), f"Index oluşturulamadı: {_failures(report)}"
+
+    database = mongo_client[mongo_db_name]
+    for collection_name, documents in SEED_DOCUMENTS.items():
+        database[collection_name].insert_many(documents)
+    return database
+
+
+def test_registry_is_idempotent(indexed_db, mongo_db_name):
+    # Veri varken ikinci çalıştırma da hatasız olmalı (startup her açılışta çalıştırır)
+    assert not _failures(_ensure_indexes(mongo_db_name))
+
+
+@pytest.mark.parametrize("name,collection,query,sort", QUERY_SHAPES, ids=[shape[0] for shape in QUERY_SHAPES])
+def test_query_uses_index(indexed_db, name, collection, query, sort):
+    cursor = indexed_db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    stages = set(_stages(cursor.explain()))
+    assert "COLLSCAN" not in stages, f"{name}: {collection} sorgusu COLLSCAN yapıyor ({sorted(stages)})"
@@ -0,0 +1,96 @@
+"""
+Lokasyon stoğu eşzamanlılık testi
+Aynı lokasyona yüzlerce eşzamanlı düşüm/ekleme gönderilir ve son miktarların doğru olduğu kontrol
+edilir. routes.stock_new'in lokasyon stoğu koleksiyonu geçici test veritabanına yönlendirilir.
+Yerel mongod yoksa atlanır (bkz. conftest.py).
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+WORKERS = 400          # Her senaryodaki eşzamanlı istek sayısı
+INITIAL_CLAMPED = 300  # /use: yetersizse 0'a çekilir
+INITIAL_EXACT = 50     # vaka kullanımı: yetersizse hata
+
+
+async def _run_contention(stock_new, database_name: str) -> dict:
+    from fastapi import HTTPException
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    original = stock_new.location_stocks
+    stock_new.location_stocks = collection = client[database_name].location_stocks_v2
+    location_id = f"contention_{uuid.uuid4().hex[:8]}"
+    doc_id = str(uuid.uuid4())
+    try:
+        await collection.insert_one({
+            "_id": doc_id,
+            "location_id": location_id,
+            "location_type": "vehicle",
+            "location_name": "Eşzamanlılık Testi",
+            "items": [
+                {"name": "Serum", "quantity": INITIAL_CLAMPED, "min_quantity": 1, "unit": "ADET", "category": "sarf"},
+                {"name": "Adrenalin", "quantity": INITIAL_EXACT, "min_quantity": 1, "unit": "ADET", "category": "ilac"},
+                {"name": "Eldiven", "quantity": 0, "min_quantity": 1, "unit": "ADET", "category": "sarf"},
+            ]
+        })
+
+        # 1. /use: Serum'dan WORKERS kez 1 adet düş (stok yetmeyince kalan 0'da kalmalı)
+        results = await asyncio.gather(*(stock_new.deduct_location_items(doc_id, {"Serum": 1}) for _ in range(WORKERS)))
+
+        # 2. Vaka kullanımı: Adrenalin'den WORKERS kez 1 adet (yalnızca INITIAL_EXACT tanesi başarılı olmalı)
+        async def use_exact():
+            try:
+                await stock_new.deduct_location_item_exact(doc_id, "Adrenalin", 1)
+                return True
+            except HTTPException:
+                return False
+        exact_ok = sum(await asyncio.gather(*(use_exact() for _ in range(WORKERS))))
+
+        # 3. Eşzamanlı iade ve yeni kalem ekleme (split/teslimat)
+        await asyncio.gather(
+            *(stock_new.increment_location_items(doc_id, {"Eldiven": 1}) for _ in range(WORKERS)),
+            *(stock_new.add_item_to_location(location_id, "vehicle", "Eşzamanlılık Testi",
+                                             {"name": "Maske", "min_quantity": 1, "unit": "ADET", "category": "sarf"}, 1)
+              for _ in range(WORKERS))
+        )
+
+        loc = await collection.find_one({"_id": doc_id})
+        quantities = {}
+        for item in loc["items"]:
+            quantities.setdefault(item["name"], []).append(item["quantity"])
+        return {
+            "serum_deducted": sum(r["deducted"].get("Serum", 0) for r in results),
+            "exact_ok": exact_ok,
+            "quantities": quantities,
+        }
+    finally:
+        stock_new.location_stocks = original
+        client.close()
+
+
+@pytest.fixture(scope="module")
+def contention_result(mongo_client, mongo_db_name):
+    from routes import stock_new
+    return asyncio.run(_run_contention(stock_new, mongo_db_name))
+
+
+def test_clamped_deduction_never_goes_negative(contention_result):
+    assert contention_result["serum_deducted"] == INITIAL_CLAMPED
+    assert contention_result["quantities"]["Serum"] == [0]
+
+
+def test_exact_deduction_succeeds_only_while_stock_lasts(contention_result):
+    assert contention_result["exact_ok"] == INITIAL_EXACT
+    assert contention_result["quantities"]["Adrenalin"] == [0]
+
+
+def test_concurrent_increments_are_not_lost(contention_result):
+    assert contention_result["quantities"]["Eldiven"] == [WORKERS]
+
+
+def test_concurrent_adds_create_a_single_item(contention_result):
+    assert contention_result["quantities"]["Maske"] == [WORKERS]
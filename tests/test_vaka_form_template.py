@@ -0,0 +1,191 @@
+"""
+VAKA FORMU export - derlenmiş şablona karşı baseline altın veri testi
+Beklenen xlsx'ler baseline export akışlarından (tests/vaka_form_legacy.py) o anda üretilir; yeni
+kodun kendi openpyxl yolu (render_with_openpyxl) referans olarak kullanılmaz.
+
+Yeni akış, uçların kullandığı yoldur: routes.cases.resolve_vaka_form_cells + VakaFormTemplates.render
+(derlenmiş şablon, gerekirse openpyxl'e düşer). Mapping şablondaki boş hücrelerden sabit olarak
+üretilir, alan anahtarları get_case_field_value'nun gerçek anahtarlarıdır.
+
+Zip'teki her parça bayt bayt aynı olmalıdır (docProps/core.xml kayıt zamanı içerdiğinden hariç).
+Bilinçli farklar:
+
+    hayalet_sütun  PDF: eski kod uzun değerde column_dimensions[harf] okuyarak F:H gibi bir gruptaki
+                   G sütunu için çakışan <col width="13"> kaydı ekliyordu. Yeni kod eklemez; satır
+                   yüksekliği hesabında aynı genişlik (13) kullanılır. Karşılaştırmada eski sheet
+                   XML'inden bu kayıtlar çıkarılır.
+    imza_excel     Excel: eski kodda BytesIO fonksiyonun sonunda import edildiği için imza görüntüsü
+                   hiç eklenemiyor (UnboundLocalError), hücreye ✓ yazılıyordu. Yeni kod PDF'teki
+                   gibi görüntüyü ekler; bu senaryo ayrı testte doğrulanır.
+"""
+
+import asyncio
+import base64
+import re
+from io import BytesIO
+from zipfile import ZipFile
+
+import pytest
+
+from tests import vaka_form_legacy
+
+SKIPPED_PARTS = {"docProps/core.xml"}
+COL_RE = re.compile(r'<col [^>]*?min="([0-9]+)" max="([0-9]+)"[^>]*/>')
+PHANTOM_COL_RE = re.compile(r'<col width="13" customWidth="1" min="([0-9]+)" max="\1" />')
+
+FIELD_KEYS = [
+    "caseNumber", "caseCode", "atn_no", "stationName", "pickupAddress", "aciklamalar", "onTani",
+    "transferHospital", "forensic.evet", "forensic.hayir", "outcome.taburcu", "bilinmeyen.alan",
+]
+LONG_NOTE = "Hasta bilinci açık, oryante; solunum düzenli & <özel> \"karakterler\". " * 3
+
+
+def _signature_url(seed: int) -> str:
+    from scripts.vaka_form_template_check import signature_png
+    return "data:image/png;base64," + base64.b64encode(signature_png(seed)).decode()
+
+
+@pytest.fixture(scope="module")
+def mapping():
+    """Şablondaki boş hücreler -> gerçek alan anahtarları (+ iki imza ve logo hücresi)"""
+    from openpyxl import load_workbook
+    from services.vaka_form_template import TEMPLATE_PATH
+
+    ws = load_workbook(TEMPLATE_PATH).active
+    empty = [
+        cell.coordinate
+        for row in ws.iter_rows(min_row=7, max_row=ws.max_row)
+        for cell in row
+        if cell.value is None and cell.coordinate not in ws.merged_cells
+    ]
+    flat = {address: FIELD_KEYS[i % len(FIELD_KEYS)] for i, address in enumerate(empty[:120])}
+    flat[empty[120]] = "sig.hekim_prm_imza"
+    flat[empty[121]] = "sig.saglik_per_imza"
+    flat["B2"] = "__LOGO__"
+    return flat
+
+
+BASE_CASE = {
+    "case_number": "20261017-000123",
+    "case_code": "KRM-7",
+    "atn_no": "ATN 55",
+    "station_name": "Merkez",
+    "location": {"address": "Çankaya"},
+    "on_tani": "J06.9",
+    "transfer_hospital": {"name": "Şehir Hastanesi", "province": "Ankara"},
+    "is_forensic": True,
+    "case_result": "taburcu",
+    "inline_consents": {"health_personnel_signature": "imzalandı"},
+}
+
+# (ad, vaka verisi, logo bilgisi, openpyxl'e düşmesi beklenen çıktı türleri)
+SCENARIOS = [
+    ("kısa değerler", BASE_CASE, {}, set()),
+    ("boş vaka", {}, {}, set()),
+    ("uzun metin", {
+        **BASE_CASE,
+        "aciklamalar": LONG_NOTE,
+        "location": {"address": "Atatürk Bulvarı No: 12 Kızılay Çankaya / Ankara, arka bina girişi"},
+        "transfer_hospital": {"name": "Ankara Bilkent Şehir Hastanesi Acil Servis", "province": "Ankara"},
+    }, {"cell": "A2"}, set()),
+    # get_case_field_value değerleri metne çevirir (55 -> "55"); openpyxl kontrol karakterini reddeder.
+    # PDF'te reddedilen hücre hizalanmadığından stil tablosu değişir ve openpyxl kullanılır
+    ("karışık tipler", {**BASE_CASE, "atn_no": 55, "case_code": 3.75, "station_name": "kontrol\x01karakteri"},
+     {}, {"pdf"}),
+    ("imzalı", {**BASE_CASE, "inline_consents": {
+        "doctor_paramedic_signature": _signature_url(3),
+        "health_personnel_signature": "imzalandı",
+    }}, {}, set()),
+]
+
+
+def _parts(content: bytes) -> dict:
+    with ZipFile(BytesIO(content)) as zf:
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+def _drop_phantom_cols(sheet_xml: str) -> str:
+    """Başka bir <col> aralığının içinde kalan tek sütunluk varsayılan genişlik kayıtları"""
+    ranges = [(int(m.group(1)), int(m.group(2))) for m in COL_RE.finditer(sheet_xml)]
+
+    def replace(match):
+        column = int(match.group(1))
+        covered = any(low <= column <= high and (low, high) != (column, column) for low, high in ranges)
+        return "" if covered else match.group(0)
+
+    return PHANTOM_COL_RE.sub(replace, sheet_xml)
+
+
+def _render_new(variant: str, mapping: dict, logo_info: dict, case_data: dict):
+    from routes.cases import resolve_vaka_form_cells
+    from services.vaka_form_template import VakaFormTemplates
+
+    templates = VakaFormTemplates()
+    values, images = resolve_vaka_form_cells(mapping, case_data, for_pdf=variant == "pdf")
+    mapping_doc = {"flat_mappings": mapping, "logo": logo_info}
+    content = asyncio.run(templates.render(variant, mapping_doc, values, images))
+    assert templates.stats["compile_errors"] == 0
+    return content, templates.stats["fallbacks"] > 0
+
+
+def _render_legacy(variant: str, mapping: dict, logo_info: dict, case_data: dict) -> bytes:
+    if variant == "excel":
+        return vaka_form_legacy.export_excel_mapped(mapping, logo_info, case_data)
+    return vaka_form_legacy.export_pdf_mapped_xlsx(mapping, logo_info, case_data)
+
+
+def _differences(variant: str, expected: bytes, actual: bytes) -> list:
+    expected_parts, actual_parts = _parts(expected), _parts(actual)
+    if set(expected_parts) != set(actual_parts):
+        return [f"eksik/fazla parça: {sorted(set(expected_parts) ^ set(actual_parts))}"]
+    diffs = []
+    for name in sorted(set(expected_parts) - SKIPPED_PARTS):
+        legacy, new = expected_parts[name], actual_parts[name]
+        if variant == "pdf" and name.startswith("xl/worksheets/"):
+            legacy = _drop_phantom_cols(legacy.decode("utf-8")).encode("utf-8")
+        if legacy != new:
+            diffs.append(f"{name} farklı")
+    return diffs
+
+
+@pytest.mark.parametrize("variant", ["excel", "pdf"])
+@pytest.mark.parametrize("name,case_data,logo_info,fallback_variants", SCENARIOS, ids=[s[0] for s in SCENARIOS])
+def test_matches_legacy_export(mapping, variant, name, case_data, logo_info, fallback_variants):
+    if variant == "excel" and name == "imzalı":
+        pytest.skip("imza_excel: test_excel_signature_is_embedded")
+    expected = _render_legacy(variant, mapping, logo_info, case_data)
+    actual, fell_back = _render_new(variant, mapping, logo_info, case_data)
+
+    # Derlenmiş şablon gerçekten sınanmalı; openpyxl'e sadece beklenen senaryolarda düşülür
+    assert fell_back == (variant in fallback_variants)
+    assert _differences(variant, expected, actual) == []
+
+
+def test_pdf_long_values_add_phantom_cols_only_in_legacy(mapping):
+    # hayalet_sütun farkı bu senaryoda gerçekten oluşuyor; normalleştirme boşa çalışmıyor
+    _, case_data, logo_info, _ = SCENARIOS[2]
+    legacy_sheet = _parts(_render_legacy("pdf", mapping, logo_info, case_data))["xl/worksheets/sheet1.xml"].decode()
+    new_sheet = _parts(_render_new("pdf", mapping, logo_info, case_data)[0])["xl/worksheets/sheet1.xml"].decode()
+    assert PHANTOM_COL_RE.search(legacy_sheet)
+    assert not PHANTOM_COL_RE.search(new_sheet)
+
+
+def test_excel_signature_is_embedded(mapping):
+    from openpyxl import load_workbook
+
+    _, case_data, logo_info, _ = SCENARIOS[-1]
+    signature_cell = next(address for address, key in mapping.items() if key == "sig.hekim_prm_imza")
+    legacy = load_workbook(BytesIO(_render_legacy("excel", mapping, logo_info, case_data))).active
+    new = load_workbook(BytesIO(_render_new("excel", mapping, logo_info, case_data)[0])).active
+
+    # Eski kod: görüntü eklenemedi, hücreye ✓ yazıldı
+    assert legacy[signature_cell].value == "✓"
+    assert len(legacy._images) == 1
+    # Yeni kod: hücre şablondaki gibi kalır, logodan sonra imza görüntüsü eklenir
+    assert new[signature_cell].value is None
+    assert len(new._images) == 2
+    # Diğer tüm hücreler aynı
+    for row_legacy, row_new in zip(legacy.iter_rows(), new.iter_rows()):
+        for cell_legacy, cell_new in zip(row_legacy, row_new):
+            if cell_legacy.coordinate != signature_cell:
+                assert cell_legacy.value == cell_new.value, cell_legacy.coordinate
@@ -0,0 +1,361 @@
+"""
+VAKA FORMU export akışlarının baseline (b4db7d8) kopyaları - sadece testler için
+services/vaka_form_template.py öncesinde routes/cases.py'deki iki uç şablonu her istekte openpyxl
+ile açıp dolduruyordu:
+    - export_case_with_vaka_form_mapping  (/{case_id}/export-excel-mapped)
+    - export_case_pdf_with_mapping        (/{case_id}/export-pdf-mapped, LibreOffice öncesi xlsx)
+
+Gövdeler değiştirilmeden alınmıştır; sadece istek/veritabanı kısmı (vaka ve mapping okuma) ile
+PDF'e dönüştürme çıkarıldı, şablon dizini backend/ kökünden okunur ve çıktı dosya yerine bayt
+olarak döner. test_vaka_form_template.py yeni akışı bunlarla karşılaştırır.
+"""
+import logging
+import os
+
+from services.dynamic_excel_export import get_case_field_value
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def export_excel_mapped(flat_mappings: dict, logo_info: dict, case_data: dict) -> bytes:
+    """export-excel-mapped: doldurulmuş xlsx baytları"""
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.drawing.image import Image as XLImage
+        import base64
+        import re
+        import os
+
+        # VAKA FORMU ŞABLONUNU YÜKLE
+        backend_dir = BACKEND_DIR
+        template_path = os.path.join(backend_dir, "templates", "VAKA_FORMU_TEMPLATE.xlsx")
+
+        if os.path.exists(template_path):
+            wb = load_workbook(template_path)
+            ws = wb.active
+            logger.info(f"Şablon yüklendi: {template_path}")
+        else:
+            # Şablon yoksa boş workbook
+            from openpyxl import Workbook
+            wb = Workbook()
+            ws = wb.active
+            ws.title = "Vaka Formu"
+            logger.warning(f"Şablon bulunamadı, boş oluşturuluyor: {template_path}")
+
+        # Logo - #VALUE! hatasını temizle ve logoyu düzgün ekle
+        # Logo - Önce dosyadan, yoksa mapping'den yükle
+        logo_cell = logo_info.get("cell", "A1") if logo_info else "A1"
+
+        # Logo hücrelerindeki içeriği temizle (A1:C6 arası - sadece logo alanı)
+        # D sütunundan başlayan metinlere dokunma
+        for row in range(1, 7):
+            for col in range(1, 4):  # A-C sütunları (D dahil değil)
+                try:
+                    cell = ws.cell(row=row, column=col)
+                    cell.value = None
+                except:
+                    pass
+
+        # Önce dosyadan logo yükle
+        logo_path = os.path.join(backend_dir, "templates", "healmedy_logo.png")
+        logo_added = False
+
+        if os.path.exists(logo_path):
+            try:
+                img = XLImage(logo_path)
+                img.width = 200   # Daha büyük ve net
+                img.height = 75   # Orantılı
+                img.anchor = logo_cell
+                ws.add_image(img, logo_cell)
+                logo_added = True
+            except Exception as e:
+                logger.warning(f"Logo dosyadan eklenemedi: {e}")
+
+        # Dosyadan eklenemezse mapping'deki base64'ü dene
+        if not logo_added and logo_info and logo_info.get("url"):
+            try:
+                logo_url = logo_info["url"]
+                if logo_url.startswith("data:image"):
+                    header, encoded = logo_url.split(",", 1)
+                    logo_data = base64.b64decode(encoded)
+                    from io import BytesIO
+                    img_buffer = BytesIO(logo_data)
+                    img = XLImage(img_buffer)
+                    img.width = 200   # Daha büyük ve net
+                    img.height = 75   # Orantılı
+                    img.anchor = logo_cell
+                    ws.add_image(img, logo_cell)
+            except Exception as e:
+                logger.warning(f"Logo base64'ten eklenemedi: {e}")
+
+        # Mapping'leri uygula - şablondaki hücrelere değer yaz
+        for cell_address, field_key in flat_mappings.items():
+            if field_key == "__LOGO__":
+                # Logo hücresini de temizle
+                match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
+                if match:
+                    try:
+                        ws[cell_address] = None
+                    except:
+                        pass
+                continue
+
+            value = get_case_field_value(case_data, field_key)
+
+            # İmza alanı ise ve base64 görüntü varsa, görüntü olarak ekle
+            if '_imza' in field_key or '_signature' in field_key:
+                # inline_consents'tan gerçek imza verisini al
+                sig_key_map = {
+                    'sig.hekim_prm_imza': 'doctor_paramedic_signature',
+                    'sig.saglik_per_imza': 'health_personnel_signature',
+                    'sig.sofor_teknisyen_imza': 'driver_pilot_signature',
+                    'sig.teslim_alan_imza': 'receiver_signature',
+                    'sig.hasta_yakin_imza': 'patient_info_consent_signature',
+                    'sig.hasta_reddi_imza': 'patient_rejection_signature',
+                    'sig.hastane_reddi_imza': 'hospital_rejection_doctor_signature',
+                }
+
+                inline_key = sig_key_map.get(field_key)
+                if inline_key:
+                    sig_data = case_data.get('inline_consents', {}).get(inline_key)
+                    if sig_data and isinstance(sig_data, str) and sig_data.startswith('data:image'):
+                        try:
+                            # Base64'ü görüntüye çevir
+                            header, encoded = sig_data.split(",", 1)
+                            sig_bytes = base64.b64decode(encoded)
+                            sig_buffer = BytesIO(sig_bytes)
+                            sig_img = XLImage(sig_buffer)
+                            sig_img.width = 150   # Büyütüldü
+                            sig_img.height = 55   # Büyütüldü
+                            ws.add_image(sig_img, cell_address)
+                            continue  # Görüntü eklendi, metin ekleme
+                        except Exception as e:
+                            logger.warning(f"İmza görüntüsü eklenemedi {cell_address}: {e}")
+                            # Fallback: ✓ yaz
+                            value = '✓'
+
+            match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
+            if match:
+                try:
+                    ws[cell_address] = value
+                except Exception as e:
+                    logger.warning(f"Hücre yazma hatası {cell_address}: {e}")
+
+        from io import BytesIO
+        output = BytesIO()
+        wb.save(output)
+        output.seek(0)
+
+        return output.getvalue()
+
+    except Exception as e:
+        logger.error(f"Mapped Excel export hatası: {str(e)}", exc_info=True)
+        raise
+
+
+def export_pdf_mapped_xlsx(flat_mappings: dict, logo_info: dict, case_data: dict) -> bytes:
+    """export-pdf-mapped: LibreOffice'e verilen xlsx baytları"""
+    from openpyxl import load_workbook
+    from openpyxl.drawing.image import Image as XLImage
+    from openpyxl.styles import Alignment
+    from io import BytesIO
+    import base64
+    import re
+    import os
+
+    backend_dir = BACKEND_DIR
+    template_path = os.path.join(backend_dir, "templates", "VAKA_FORMU_TEMPLATE.xlsx")
+    logger.info(f"Template path: {template_path}, exists: {os.path.exists(template_path)}")
+
+    if os.path.exists(template_path):
+        wb = load_workbook(template_path)
+        ws = wb.active
+    else:
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Vaka Formu"
+
+    # Logo - Önce dosyadan, yoksa mapping'den yükle
+    logo_cell = logo_info.get("cell", "A1") if logo_info else "A1"
+
+    # Logo hücrelerindeki tüm içeriği temizle (A1:C6 arası - sadece logo alanı)
+    # D sütunundan başlayan metinlere dokunma
+    for row in range(1, 7):  # 1-6 satırları
+        for col in range(1, 4):  # A-C sütunları (D dahil değil)
+            try:
+                cell = ws.cell(row=row, column=col)
+                cell.value = None
+            except:
+                pass
+
+    # Önce dosyadan logo yükle
+    logo_path = os.path.join(backend_dir, "templates", "healmedy_logo.png")
+    logo_added = False
+
+    if os.path.exists(logo_path):
+        try:
+            img = XLImage(logo_path)
+            # Logo boyutları - orantılı ve görünür (A1:C5 alanına sığacak)
+            # A4 Portrait için uygun boyut
+            img.width = 200   # ~4 sütun genişliği (daha büyük ve net)
+            img.height = 75   # ~5 satır yüksekliği (orantılı)
+
+            # Anchor ile konumlandır - sol üst köşeye sabitle
+            from openpyxl.drawing.spreadsheet_drawing import AnchorMarker, TwoCellAnchor
+            img.anchor = 'A1'  # A1 hücresine sabitle
+
+            ws.add_image(img, "A1")  # Sol üst köşeye sabitle
+            logger.info(f"Logo dosyadan eklendi: A1, {img.width}x{img.height}")
+            logo_added = True
+        except Exception as e:
+            logger.warning(f"Logo dosyadan eklenemedi: {e}")
+
+    # Dosyadan eklenemezse mapping'deki base64'ü dene
+    if not logo_added and logo_info and logo_info.get("url"):
+        try:
+            logo_url = logo_info["url"]
+            if logo_url.startswith("data:image"):
+                header, encoded = logo_url.split(",", 1)
+                logo_data = base64.b64decode(encoded)
+                img_buffer = BytesIO(logo_data)
+                img = XLImage(img_buffer)
+                img.width = 200   # Daha büyük ve net
+                img.height = 75   # Orantılı
+                img.anchor = 'A1'
+                ws.add_image(img, "A1")
+                logger.info(f"Logo base64'ten eklendi: A1, {img.width}x{img.height}")
+        except Exception as e:
+            logger.warning(f"Logo base64'ten eklenemedi: {e}")
+
+    # Mapping'leri uygula
+    logger.info(f"Mapping uygulanıyor: {len(flat_mappings)} hücre")
+    for cell_address, field_key in flat_mappings.items():
+        try:
+            if field_key == "__LOGO__":
+                # Logo hücresini de temizle
+                match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
+                if match:
+                    try:
+                        ws[cell_address] = None
+                    except:
+                        pass
+                continue
+
+            value = get_case_field_value(case_data, field_key)
+        except Exception as field_err:
+            logger.warning(f"Alan değeri alınamadı: {field_key} -> {cell_address}: {field_err}")
+            value = ""
+
+        # İmza alanı ise ve base64 görüntü varsa, görüntü olarak ekle
+        if '_imza' in field_key or '_signature' in field_key:
+            sig_key_map = {
+                'sig.hekim_prm_imza': 'doctor_paramedic_signature',
+                'sig.saglik_per_imza': 'health_personnel_signature',
+                'sig.sofor_teknisyen_imza': 'driver_pilot_signature',
+                'sig.teslim_alan_imza': 'receiver_signature',
+                'sig.hasta_yakin_imza': 'patient_info_consent_signature',
+                'sig.hasta_reddi_imza': 'patient_rejection_signature',
+                'sig.hastane_reddi_imza': 'hospital_rejection_doctor_signature',
+            }
+
+            inline_key = sig_key_map.get(field_key)
+            if inline_key:
+                sig_data = case_data.get('inline_consents', {}).get(inline_key)
+                if sig_data and isinstance(sig_data, str) and sig_data.startswith('data:image') and ',' in sig_data:
+                    try:
+                        header, encoded = sig_data.split(",", 1)
+                        if encoded:  # Base64 verisi var mı kontrol et
+                            sig_bytes = base64.b64decode(encoded)
+                            sig_buffer = BytesIO(sig_bytes)
+                            sig_img = XLImage(sig_buffer)
+                            # İmza boyutları - büyük (yazıcıda net görünsün)
+                            sig_img.width = 150   # ~5cm genişlik
+                            sig_img.height = 55   # ~1.7cm yükseklik
+                            ws.add_image(sig_img, cell_address)
+                            continue
+                    except Exception as e:
+                        logger.warning(f"İmza görüntüsü eklenemedi {cell_address}: {e}")
+                        value = '✓'
+                elif sig_data:
+                    # İmza var ama görüntü olarak eklenemedi
+                    value = '✓'
+
+        match = re.match(r'^([A-Z]+)(\d+)$', cell_address.upper())
+        if match:
+            try:
+                cell = ws[cell_address]
+                cell.value = value
+
+                from openpyxl.styles import Alignment
+
+                # Tüm hücrelere text wrap uygula (uzun içerik varsa satıra sığması için)
+                cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='left')
+
+                # Uzun içerik için satır yüksekliğini artır
+                if value and len(str(value)) > 25:
+                    row_num = int(match.group(2))
+
+                    # Sütun genişliğini hesapla (yaklaşık karakter sayısı)
+                    col_letter = match.group(1)
+                    col_width = ws.column_dimensions[col_letter].width or 10
+                    chars_per_line = int(col_width * 1.2)  # Yaklaşık
+
+                    # Gerekli satır sayısını hesapla
+                    content_lines = max(1, len(str(value)) // max(chars_per_line, 10) + 1)
+
+                    # Mevcut yüksekliği al
+                    current_height = ws.row_dimensions[row_num].height or 15
+
+                    # Yeni yükseklik hesapla (satır başına ~14px)
+                    needed_height = content_lines * 14
+                    new_height = max(current_height, needed_height, 15)
+
+                    # Maksimum sınır koy (çok uzun içerikler için)
+                    ws.row_dimensions[row_num].height = min(new_height, 100)
+
+            except Exception as e:
+                logger.warning(f"Hücre yazma hatası {cell_address}: {e}")
+
+    # SAYFA AYARLARI: A4 Dikey (Portrait), TEK SAYFAYA SIĞDIR
+    # Şablonun kendi boyutlandırmasını kullan - V4 şablonu A4'e uygun hazırlandı
+    try:
+        from openpyxl.worksheet.properties import PageSetupProperties
+
+        # Sayfa ayarları - A4 Portrait
+        ws.page_setup.orientation = 'portrait'  # Dikey
+        ws.page_setup.paperSize = 9  # A4 (9 = A4)
+        ws.page_setup.fitToWidth = 1  # 1 sayfa genişliğine sığdır
+        ws.page_setup.fitToHeight = 1  # 1 sayfa yüksekliğine sığdır
+        ws.page_setup.fitToPage = True  # FitToPage modunu etkinleştir
+
+        # Sheet properties
+        if ws.sheet_properties.pageSetUpPr is None:
+            ws.sheet_properties.pageSetUpPr = PageSetupProperties()
+        ws.sheet_properties.pageSetUpPr.fitToPage = True
+
+        # Print area: Tüm şablon alanı (şablondaki max satır/sütun)
+        from openpyxl.utils import get_column_letter
+        max_row = ws.max_row or 79
+        max_col = ws.max_column or 20
+        print_area = f"A1:{get_column_letter(max_col)}{max_row}"
+        ws.print_area = print_area
+
+        # Kenar boşlukları - minimum (sayfayı tam kullan)
+        ws.page_margins.left = 0.1    # ~0.25cm
+        ws.page_margins.right = 0.1
+        ws.page_margins.top = 0.1
+        ws.page_margins.bottom = 0.1
+        ws.page_margins.header = 0
+        ws.page_margins.footer = 0
+
+        logger.info(f"Sayfa ayarları: A4 Portrait, FitToPage=1x1, PrintArea={print_area}, MaxRow={max_row}")
+    except Exception as e:
+        logger.warning(f"Sayfa ayarları yapılamadı: {e}")
+
+    # Geçici Excel dosyası yerine bayt olarak döner (LibreOffice dönüşümü çıkarıldı)
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()